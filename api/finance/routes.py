@@ -21,6 +21,15 @@ from models.schemas.finance import (
 )
 from typing import List
 from pydantic import BaseModel
+import uuid
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
+from core.config import EXPORT_DIR
+from services.export_service import ExportService, MEDIA_TYPES as EXPORT_MEDIA_TYPES
+from services.reconciliation_service import ReconciliationService
+from services.balance_snapshot_service import BalanceSnapshotService
+from services.payout_simulator import PayoutSimulator
+from services import merchant_order_stats
 
 logger = get_logger(__name__)
 
@@ -195,6 +204,41 @@ async def adjust_unilevel_dividend(
         raise HTTPException(status_code=500, detail=f"调整失败: {str(e)}")
 
 
+# ========== 周补贴 / 联创分红参数模拟 ==========
+class SubsidySimulateRequest(BaseModel):
+    points_values: List[float]  # 候选积分值列表（0-0.02）
+
+
+class UnilevelSimulateRequest(BaseModel):
+    amounts_per_weight: List[float]  # 候选每权重分红金额列表
+
+
+@router.post("/api/simulate/subsidy", response_model=ResponseModel, summary="周补贴积分值批量模拟")
+def simulate_subsidy(request: SubsidySimulateRequest):
+    """一次评估多个积分值：发放总额、触顶人数、补贴池剩余、个人金额分位数"""
+    try:
+        data = PayoutSimulator.simulate_subsidy(request.points_values)
+        return ResponseModel(success=True, message=f"模拟完成: {len(data['scenarios'])}个场景", data=data)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logger.error(f"周补贴模拟失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/api/simulate/unilevel", response_model=ResponseModel, summary="联创分红金额批量模拟")
+def simulate_unilevel(request: UnilevelSimulateRequest):
+    """一次评估多个每权重金额：发放总额、达到1万上限人数、分红池剩余、个人金额分位数"""
+    try:
+        data = PayoutSimulator.simulate_unilevel(request.amounts_per_weight)
+        return ResponseModel(success=True, message=f"模拟完成: {len(data['scenarios'])}个场景", data=data)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logger.error(f"联创分红模拟失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ========== 执行联创分红接口（已增强） ==========
 @router.post("/api/unilevel/dividend", summary="发放联创星级分红（手动触发）")
 async def distribute_unilevel_dividend(
@@ -1207,6 +1251,210 @@ async def get_all_points_detail_report(
     except Exception as e:
         logger.error(f"查询总积分明细报表失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+# ==================== 流水报表流式导出 ====================
+class LedgerExportJobRequest(BaseModel):
+    export_type: str  # orders / account_flow / points_log / withdrawals
+    file_format: str = "xlsx"  # xlsx / csv
+    filters: Dict[str, Any] = {}  # 与同步导出接口的查询参数一致
+
+
+@router.get("/api/export/ledger/{export_type}", summary="流水报表导出（流式）")
+def export_ledger(
+    export_type: str = Path(..., pattern=r'^(account_flow|points_log|withdrawals)$',
+                            description="导出类型：account_flow资金流水/points_log积分流水/withdrawals提现记录"),
+    start_date: Optional[str] = Query(None, description="开始日期 yyyy-MM-dd"),
+    end_date: Optional[str] = Query(None, description="结束日期 yyyy-MM-dd（含当天）"),
+    user_id: Optional[int] = Query(None, gt=0, description="用户ID（可选）"),
+    account_type: Optional[str] = Query(None, description="资金池类型（仅 account_flow）"),
+    points_type: Optional[str] = Query(None, pattern=r'^(member|merchant|company)$', description="积分类型（仅 points_log）"),
+    status: Optional[str] = Query(None, description="提现状态（仅 withdrawals）"),
+    file_format: str = Query("csv", pattern=r'^(csv|xlsx)$', description="文件格式"),
+):
+    """
+    按条件导出资金流水、积分流水或提现记录
+
+    - csv：服务端游标分块读取，边查边输出，不限行数
+    - xlsx：write-only 工作表写入临时文件后分块发送；数据量很大时建议使用 /api/export/jobs 后台导出
+    """
+    filters = {
+        "start_date": start_date,
+        "end_date": end_date,
+        "user_id": user_id,
+        "account_type": account_type,
+        "points_type": points_type,
+        "status": status,
+    }
+    try:
+        ExportService.validate(export_type, file_format, filters)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    filename = f"{export_type}_{(start_date or 'all').replace('-', '')}_{(end_date or 'now').replace('-', '')}.{file_format}"
+    try:
+        if file_format == "csv":
+            return StreamingResponse(
+                ExportService.stream_csv(export_type, filters),
+                media_type=EXPORT_MEDIA_TYPES["csv"],
+                headers={"Content-Disposition": f"attachment; filename={filename}"}
+            )
+        tmp_path = EXPORT_DIR / f"tmp_{uuid.uuid4().hex}.xlsx"
+        ExportService.write_file(export_type, "xlsx", filters, tmp_path)
+        return FileResponse(
+            str(tmp_path),
+            media_type=EXPORT_MEDIA_TYPES["xlsx"],
+            filename=filename,
+            background=BackgroundTask(tmp_path.unlink, missing_ok=True)
+        )
+    except Exception as e:
+        logger.error(f"流水报表导出失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
+
+
+@router.post("/api/export/jobs", response_model=ResponseModel, summary="提交后台导出任务")
+def submit_export_job(request: LedgerExportJobRequest):
+    """提交后台导出任务，立即返回 job_id；任务在后台写文件，完成后通过下载接口获取"""
+    try:
+        job = ExportService.submit_job(request.export_type, request.file_format, request.filters)
+        return ResponseModel(success=True, message="导出任务已提交", data=job)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logger.error(f"提交导出任务失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/api/export/jobs/{job_id}", response_model=ResponseModel, summary="查询导出任务状态")
+def get_export_job(job_id: str = Path(..., pattern=r'^[0-9a-f]{32}$')):
+    job = ExportService.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="导出任务不存在或已过期")
+    data = {
+        "job_id": job["job_id"],
+        "export_type": job["export_type"],
+        "file_format": job["file_format"],
+        "status": job["status"],
+        "row_count": job["row_count"],
+        "file_name": job["file_name"],
+        "error_msg": job["error_msg"],
+        "created_at": job["created_at"].strftime("%Y-%m-%d %H:%M:%S") if job["created_at"] else None,
+        "finished_at": job["finished_at"].strftime("%Y-%m-%d %H:%M:%S") if job["finished_at"] else None,
+        "download_url": f"/api/export/jobs/{job_id}/download" if job["status"] == "success" else None,
+    }
+    return ResponseModel(success=True, message="查询成功", data=data)
+
+
+@router.get("/api/export/jobs/{job_id}/download", summary="下载导出文件")
+def download_export_job(job_id: str = Path(..., pattern=r'^[0-9a-f]{32}$')):
+    job = ExportService.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="导出任务不存在或已过期")
+    if job["status"] != "success" or not job["file_path"]:
+        raise HTTPException(status_code=409, detail=f"导出任务尚未完成，当前状态：{job['status']}")
+    return FileResponse(
+        job["file_path"],
+        media_type=EXPORT_MEDIA_TYPES.get(job["file_format"], "application/octet-stream"),
+        filename=job["file_name"]
+    )
+
+
+# ==================== 账本增量对账 ====================
+@router.post("/api/admin/reconcile/run", response_model=ResponseModel, summary="执行账本对账")
+def run_ledger_reconcile(
+    scope: Optional[str] = Query(None, pattern=r'^(pool|member_points|merchant_points|subsidy_points)$',
+                                 description="对账范围：pool资金池/member_points会员积分/merchant_points商家积分/subsidy_points周补贴点数，不传为全部"),
+    rebuild: bool = Query(False, description="是否忽略检查点从头全量校验")
+):
+    """只处理检查点之后的新流水；rebuild=true 时从第一条流水重新累计（subsidy_points 改为以当前余额重新初始化检查点）"""
+    try:
+        result = ReconciliationService.run(scope, rebuild)
+        mismatch_count = sum(r["mismatch_count"] for r in result.values())
+        return ResponseModel(
+            success=True,
+            message=f"对账完成，不一致账户 {mismatch_count} 个",
+            data=result
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"执行账本对账失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/api/admin/reconcile/status", response_model=ResponseModel, summary="账本对账进度")
+def get_ledger_reconcile_status():
+    try:
+        return ResponseModel(success=True, message="查询成功", data={"scopes": ReconciliationService.get_status()})
+    except Exception as e:
+        logger.error(f"查询对账进度失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/api/admin/reconcile/mismatches", response_model=ResponseModel, summary="账本对账差异列表")
+def get_ledger_reconcile_mismatches(
+    scope: Optional[str] = Query(None, pattern=r'^(pool|member_points|merchant_points|subsidy_points)$'),
+    resolved: Optional[bool] = Query(False, description="false=未处理，true=已恢复，不传为全部"),
+    page: int = Query(1, ge=1),
+    size: int = Query(20, ge=1, le=200)
+):
+    try:
+        data = ReconciliationService.list_mismatches(scope, resolved, page, size)
+        return ResponseModel(success=True, message=f"查询成功: 共{data['total']}条记录", data=data)
+    except Exception as e:
+        logger.error(f"查询对账差异失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ==================== 商家订单日汇总 ====================
+@router.post("/api/admin/merchant-order-stats/rebuild", response_model=ResponseModel, summary="重建商家订单日汇总")
+def rebuild_merchant_order_stats(
+    days: Optional[int] = Query(None, ge=1, description="只重建最近N天，不传为全量重建")
+):
+    """每晚定时任务只重建最近一段时间；发现更早的数据偏差时在此手动全量重建"""
+    try:
+        with get_conn() as conn:
+            rows = merchant_order_stats.rebuild_recent(conn, days) if days else merchant_order_stats.rebuild_all(conn)
+        return ResponseModel(success=True, message=f"重建完成，共{rows}行", data={"rows": rows, "days": days})
+    except Exception as e:
+        logger.error(f"重建商家订单日汇总失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ==================== 时点余额查询 ====================
+@router.get("/api/admin/balance-at", response_model=ResponseModel, summary="查询账户历史时点余额")
+def get_balance_at(
+    account: str = Query(..., description="资金池 account_type，或用户ID（积分类型时）"),
+    ts: str = Query(..., description="时点 yyyy-MM-dd HH:mm:ss"),
+    scope: str = Query("pool", pattern=r'^(pool|member_points|merchant_points)$',
+                       description="pool资金池/member_points会员积分/merchant_points商家积分")
+):
+    """最近的余额快照 + 快照与时点之间的流水，扫描量与历史总量无关"""
+    try:
+        at = datetime.strptime(ts, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        raise HTTPException(status_code=422, detail="时间格式应为 yyyy-MM-dd HH:mm:ss")
+    try:
+        balance = BalanceSnapshotService.balance_at(account, at, scope=scope)
+        return ResponseModel(
+            success=True,
+            message="查询成功",
+            data={"account": account, "scope": scope, "ts": ts, "balance": float(balance)}
+        )
+    except Exception as e:
+        logger.error(f"查询时点余额失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/api/admin/balance-snapshots", response_model=ResponseModel, summary="立即生成余额快照")
+def create_balance_snapshot():
+    try:
+        return ResponseModel(success=True, message="余额快照已生成", data=BalanceSnapshotService.take_snapshot())
+    except Exception as e:
+        logger.error(f"生成余额快照失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 def register_finance_routes(app: FastAPI):
     """注册财务管理系统路由到主应用"""
     app.include_router(router, tags=["财务系统"])
@@ -6,8 +6,8 @@ from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from fastapi import FastAPI
 
-from .cart import router as cart_router
-from .order import router as order_router, start_order_expire_task, start_wechat_status_sync_task  # 新增导入
+from .cart import router as cart_router, start_cart_flush_task
+from .order import router as order_router, start_order_expire_task, start_wechat_status_sync_task, start_receive_confirm_task, start_order_transition_task  # 新增导入
 from .refund import router as refund_router
 from .merchant import router as merchant_router
 from .logistics import register_logistics_routes
@@ -23,10 +23,13 @@ def register_routes(app: "FastAPI"):
     register_logistics_routes(app)
 
     # ==================== 新增：启动后台任务（确保只执行一次） ====================
-    # 注意：这些函数内部使用了 daemon thread，多次调用不会重复启动
+    # 注意：任务通过 core.job_lease 协调，同进程重复调用只启动一次，多 worker 下只有一个进程执行
     try:
         start_order_expire_task()
         start_wechat_status_sync_task()
+        start_receive_confirm_task()
+        start_cart_flush_task()
+        start_order_transition_task()
     except Exception as e:
         # 如果已经启动会抛出异常，忽略
         import logging
@@ -3,10 +3,26 @@ from pydantic import BaseModel, PositiveInt
 from core.database import get_conn
 from typing import List, Dict, Any, Optional
 import json
+from core.job_lease import run_as_leader
+from core.logging import get_logger
+from services.cart_store import CartStore, CartStoreUnavailable
 
+logger = get_logger(__name__)
 router = APIRouter()
 
+
+def start_cart_flush_task():
+    """启动购物车回写任务（多 worker 下只有取得租约的进程执行）"""
+    run_as_leader("cart_flush", CartStore.run_forever)
+    logger.info("[cart] 购物车回写任务已注册")
+
+
 class CartManager:
+    """
+    购物车：优先读写 Redis 热存储（CartStore，异步回写 cart 表），
+    Redis 不可用时直接读写 cart 表，并标记该用户的 Redis 哈希待丢弃
+    """
+
     @staticmethod
     def add(
         user_id: int,
@@ -14,6 +30,13 @@ class CartManager:
         quantity: int = 1,
         specifications: Optional[Dict[str, Any]] = None
     ) -> bool:
+        try:
+            return CartStore.add(user_id, product_id, quantity, specifications)
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except CartStoreUnavailable:
+            pass
+
         with get_conn() as conn:
             with conn.cursor() as cur:
                 # 1. 用户是否存在
@@ -57,11 +80,19 @@ class CartManager:
                         "VALUES (%s, %s, %s, %s, %s)",
                         (user_id, product_id, sku_id, quantity, spec_str),
                     )
+                CartStore.mark_stale(cur, user_id)
                 conn.commit()
                 return True
 
     @staticmethod
     def list_items(user_id: int) -> List[Dict[str, Any]]:
+        try:
+            return CartStore.list_items(user_id)
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except CartStoreUnavailable:
+            pass
+
         with get_conn() as conn:
             with conn.cursor() as cur:
                 sql = """
@@ -86,12 +117,20 @@ class CartManager:
 
     @staticmethod
     def remove(user_id: int, product_id: int) -> bool:
+        try:
+            return CartStore.remove(user_id, product_id)
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except CartStoreUnavailable:
+            pass
+
         with get_conn() as conn:
             with conn.cursor() as cur:
                 cur.execute(
                     "DELETE FROM cart WHERE user_id = %s AND product_id = %s",
                     (user_id, product_id),
                 )
+                CartStore.mark_stale(cur, user_id)
                 conn.commit()
                 return True
             
@@ -102,6 +141,13 @@ class CartManager:
         quantity: int = 1,
         specifications: Optional[Dict[str, Any]] = None
     ) -> bool:
+        try:
+            return CartStore.decrease(user_id, product_id, quantity, specifications)
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except CartStoreUnavailable:
+            pass
+
         # 1. 把规格转成 JSON 字符串（None -> 'null'）
         spec_str = json.dumps(specifications, ensure_ascii=False) if specifications else 'null'
 
@@ -129,6 +175,7 @@ class CartManager:
                         "UPDATE cart SET quantity = %s WHERE id = %s",
                         (new_qty, cart_id)
                     )
+                CartStore.mark_stale(cur, user_id)
                 conn.commit()
                 return True
 
@@ -4,10 +4,14 @@ from typing import Optional, List, Dict, Any, Annotated
 from core.database import get_conn
 from services.finance_service import get_balance, withdraw
 from decimal import Decimal
+from services.order_transitions import transition
+from services import order_detail_cache
 from .refund import RefundManager
-from .wechat_shipping import WechatShippingManager, WechatShippingService
+from .wechat_shipping import WechatShippingManager, WechatShippingService, DELIVERY_LIST_PATH
 from core.logging import get_logger
+from core.http_cache import conditional
 import time
+from datetime import datetime
 import json  # ==================== 新增：导入json用于记录日志 ====================
 
 router = APIRouter()
@@ -144,14 +148,13 @@ class MerchantManager:
                     else:
                         actual_tracking = ""
 
-                cur.execute(
-                    "UPDATE orders SET status='pending_recv', tracking_number=%s "
-                    "WHERE order_number=%s AND status='pending_ship'",
-                    (actual_tracking, order_number)
-                )
+                changed = transition(cur, 'pending_recv', order_numbers=[order_number],
+                                     from_statuses=('pending_ship',), reason="商家发货", source="ship",
+                                     extra_sets={"tracking_number": actual_tracking})
                 conn.commit()
+                order_detail_cache.invalidate(order_number)
 
-                updated = cur.rowcount > 0
+                updated = bool(changed)
                 result["local_updated"] = updated
 
                 if not updated:
@@ -308,6 +311,8 @@ class MerchantManager:
                     result["message"] += f"，缺少信息无法同步到微信：{', '.join(missing)}"
                     logger.warning(f"订单{order_number}缺少{', '.join(missing)}，无法同步到微信")
 
+                # 微信发货状态也在详情中展示
+                order_detail_cache.invalidate(order_number)
                 return result
 
     @staticmethod
@@ -475,7 +480,16 @@ def m_notify_confirm_receive(body: NotifyConfirmReceiveRequest):
 
 
 # ---------------- 微信发货管理相关接口 ----------------
+def _delivery_list_version():
+    """本地缓存文件的修改时间；文件不存在时由路由刷新缓存，不做校验"""
+    try:
+        return datetime.fromtimestamp(DELIVERY_LIST_PATH.stat().st_mtime)
+    except FileNotFoundError:
+        return None
+
+
 @router.get("/wechat/delivery-list", summary="获取快递公司列表")
+@conditional(_delivery_list_version)
 def get_delivery_list(start: int = 0, end: Optional[int] = None):
     """获取微信小程序支持的快递公司列表（使用本地缓存，支持分页切片）。"""
     logger.info("[delivery_list] start start=%s end=%s", start, end)
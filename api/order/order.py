@@ -1,271 +1,106 @@
-from services.finance_service import FinanceService
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any, cast
-from core.config import Settings, settings
+from core.config import Settings
 from core.database import get_conn
 from services.finance_service import split_order_funds
-from core.config import VALID_PAY_WAYS, POINTS_DISCOUNT_RATE
+from core.config import VALID_PAY_WAYS, POINTS_DISCOUNT_RATE, ORDER_EXPIRE_HOURS, WX_SYNC_INTERVAL_SECONDS
+from core.config import RECEIVE_CONFIRM_POLL_SECONDS
 from core.table_access import build_dynamic_select, get_table_structure, _quote_identifier
 from decimal import Decimal
+import asyncio
 import uuid
+import base64
 from datetime import datetime, timedelta
 from enum import Enum
-import json
 import threading
 import time
 from core.logging import get_logger
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
 from io import BytesIO
 from typing import List, Dict, Any
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from core.config import EXPORT_DIR
+from services.export_service import ExportService, MEDIA_TYPES as EXPORT_MEDIA_TYPES
+from services.order_expiry_service import OrderExpiryQueue
+from services.inventory_service import InventoryService, InsufficientStockError
+from services.merchant_order_stats import stats_added, day_totals
+from services import order_transitions
+from core import order_status_channel
+from services.cart_store import CartStore, CartStoreUnavailable
+from services import order_detail_cache, catalog_cache
+from core.json_response import DecimalJSONResponse
+from core.http_cache import etag_matches
+from core.redis_client import get_redis
+from core.job_lease import run_as_leader, report_job_stats
 
 # ==================== 新增：导入 Redis 用于分布式锁 ====================
 import redis
 import redis.exceptions
 
 # ==================== 新增：导入微信发货管理模块 ====================
-from .wechat_shipping import WechatShippingManager
+from .wechat_status_sync import WechatStatusSync
+from .receive_confirm import ReceiveConfirmVerifier
 
 logger = get_logger(__name__)
 router = APIRouter()
 
 
-# ==================== 新增：Redis 客户端初始化（带容错） ====================
-def _get_redis_client():
-    """获取 Redis 客户端，如果未配置则返回 None"""
-    try:
-        # 尝试从 settings 获取 Redis 配置，如果没有则使用默认本地配置
-        redis_host = getattr(settings, 'REDIS_HOST', 'localhost')
-        redis_port = getattr(settings, 'REDIS_PORT', 6379)
-        redis_db = getattr(settings, 'REDIS_DB', 0)
-
-        client = redis.Redis(
-            host=redis_host,
-            port=redis_port,
-            db=redis_db,
-            decode_responses=True,
-            socket_connect_timeout=2,
-            socket_timeout=2
-        )
-        # 测试连接
-        client.ping()
-        return client
-    except Exception as e:
-        logger.warning(f"Redis 连接失败（将使用数据库兜底）: {e}")
-        return None
-
-
-# 全局 Redis 客户端
-redis_client = _get_redis_client()
-
-
-# 在 order.py 的 _cancel_expire_orders 函数中
-def _cancel_expire_orders():
-    """每分钟扫描一次，把过期的 pending_pay 订单取消"""
-    while True:
-        try:
-            with get_conn() as conn:
-                with conn.cursor() as cur:
-                    now = datetime.now()
-                    cur.execute("""
-                        SELECT id, order_number
-                        FROM orders
-                        WHERE status='pending_pay'
-                          AND expire_at IS NOT NULL
-                          AND expire_at <= %s
-                    """, (now,))
-                    for o in cur.fetchall():
-                        oid, ono = o["id"], o["order_number"]
-
-                        # ✅ 新增：删除该订单的待发放奖励记录
-                        cur.execute(
-                            "SELECT id FROM pending_rewards WHERE order_id = %s AND status = 'pending'",
-                            (oid,)
-                        )
-                        rewards = cur.fetchall()
-                        for reward in rewards:
-                            cur.execute(
-                                "DELETE FROM pending_rewards WHERE id = %s",
-                                (reward['id'],)
-                            )
-                            print(f"[expire] 删除订单 {ono} 的待发放奖励记录: ID={reward['id']}")
-
-                        # 回滚库存
-                        cur.execute(
-                            "SELECT product_id,quantity FROM order_items WHERE order_id=%s",
-                            (oid,)
-                        )
-                        for it in cur.fetchall():
-                            cur.execute(
-                                "UPDATE product_skus SET stock=stock+%s WHERE product_id=%s",
-                                (it["quantity"], it["product_id"])
-                            )
-
-                        # 改状态
-                        cur.execute(
-                            "UPDATE orders SET status='cancelled',updated_at=NOW() WHERE id=%s",
-                            (oid,)
-                        )
-                        print(f"[expire] 订单 {ono} 已自动取消")
-                    conn.commit()
-        except Exception as e:
-            print(f"[expire] error: {e}")
-        time.sleep(60)
+# 全局 Redis 客户端（未部署 Redis 时为 None）
+redis_client = get_redis()
 
 
 def start_order_expire_task():
-    """由 api.order 包初始化时调用一次即可"""
-    t = threading.Thread(target=_cancel_expire_orders, daemon=True)
-    t.start()
-    print("[expire] 订单过期守护线程已启动")
+    """由 api.order 包初始化时调用；多 worker 下只有取得租约的进程执行"""
+    run_as_leader("order_expire", OrderExpiryQueue.run_forever)
+    logger.info("[expire] 订单超时取消队列已注册")
 
 
 # ==================== 新增：定时同步微信订单状态（解决资金结算问题） ====================
-def _sync_wechat_order_status():
+def _sync_wechat_order_status(stop_event: threading.Event):
     """
-    定时同步微信订单状态（每30分钟执行一次）
+    定时同步微信订单状态（每个周期处理全部待同步订单）
     解决用户通过微信确认收货组件确认收货后，后端状态未更新的问题
     """
-    while True:
+    engine = WechatStatusSync()
+    while not stop_event.is_set():
         try:
-            with get_conn() as conn:
-                with conn.cursor() as cur:
-                    # 查询已发货(pending_recv)且已同步到微信(wechat_shipping_status=1)的订单
-                    # 且最近1小时内未同步过的订单
-                    cur.execute("""
-                        SELECT id, order_number, transaction_id, status, user_id
-                        FROM orders
-                        WHERE status='pending_recv'
-                          AND wechat_shipping_status = 1
-                          AND transaction_id IS NOT NULL
-                          AND (
-                              wechat_last_sync_time IS NULL 
-                              OR wechat_last_sync_time <= DATE_SUB(NOW(), INTERVAL 1 HOUR)
-                          )
-                        LIMIT 50
-                    """)
-
-                    orders = cur.fetchall()
-
-                    for order in orders:
-                        try:
-                            # 查询微信侧的订单状态
-                            wx_result = WechatShippingManager.get_order(order['transaction_id'])
+            stats = engine.run_cycle()
+            report_job_stats("wechat_status_sync", stats)
+        except Exception as e:
+            logger.error(f"[wx_sync] 定时同步任务异常: {e}", exc_info=True)
 
-                            # 更新同步时间
-                            cur.execute(
-                                "UPDATE orders SET wechat_last_sync_time = NOW() WHERE id = %s",
-                                (order['id'],)
-                            )
+        stop_event.wait(WX_SYNC_INTERVAL_SECONDS)
 
-                            # 修复：errcode 转为字符串比较，防止微信返回字符串 "0"
-                            if str(wx_result.get('errcode', '')) == '0':
-                                # 修复：兼容 order_state 在顶层或嵌套在 order 对象中的情况，并转为整数
-                                raw_state = wx_result.get('order_state') or (wx_result.get('order') or {}).get(
-                                    'order_state')
-                                try:
-                                    order_state = int(raw_state) if raw_state is not None else None
-                                except (ValueError, TypeError):
-                                    order_state = None
-                                    logger.warning(f"[wx_sync] order_state 转换失败，原始值: {raw_state}")
-
-                                # 微信状态：1待发货 2已发货 3确认收货 4交易完成 5已退款
-                                if order_state == 3:
-                                    # 用户已确认收货，更新订单状态为已完成
-                                    logger.info(
-                                        f"[wx_sync] 订单 {order['order_number']} 微信状态已确认收货，更新本地状态")
-
-                                    # 更新订单状态
-                                    cur.execute("""
-                                        UPDATE orders 
-                                        SET status='completed', 
-                                            completed_at=NOW(),
-                                            updated_at=NOW()
-                                        WHERE id=%s
-                                    """, (order['id'],))
-
-                                    # 记录日志
-                                    cur.execute("""
-                                        INSERT INTO wechat_shipping_logs 
-                                        (order_id, order_number, transaction_id, action_type, is_success, response_data, created_at)
-                                        VALUES (%s, %s, %s, 'sync', 1, %s, NOW())
-                                    """, (
-                                        order['id'],
-                                        order['order_number'],
-                                        order['transaction_id'],
-                                        json.dumps(wx_result)
-                                    ))
-
-                                    # 可选：触发资金结算（如果之前未结算）
-                                    try:
-                                        fs = FinanceService()
-                                        # 这里可以调用资金结算逻辑，如果之前未在支付时结算的话
-                                        # 注意：根据业务逻辑，资金可能已经在支付时拆分，这里只是更新状态
-                                    except Exception as e:
-                                        logger.error(f"[wx_sync] 订单 {order['order_number']} 资金结算异常: {e}")
-
-                                    conn.commit()
-                                    logger.info(f"[wx_sync] 订单 {order['order_number']} 状态已同步为完成")
-
-                                elif order_state == 4:
-                                    # 交易完成（可能已过确认收货期）
-                                    cur.execute("""
-                                        UPDATE orders 
-                                        SET status='completed', 
-                                            completed_at=NOW(),
-                                            updated_at=NOW()
-                                        WHERE id=%s
-                                    """, (order['id'],))
-
-                                    # 补充：记录日志
-                                    cur.execute("""
-                                        INSERT INTO wechat_shipping_logs 
-                                        (order_id, order_number, transaction_id, action_type, is_success, remark, response_data, created_at)
-                                        VALUES (%s, %s, %s, 'sync', 1, %s, %s, NOW())
-                                    """, (
-                                        order['id'],
-                                        order['order_number'],
-                                        order['transaction_id'],
-                                        "微信状态同步：交易完成(4)",
-                                        json.dumps(wx_result)
-                                    ))
-                                    conn.commit()
-                                    logger.info(f"[wx_sync] 订单 {order['order_number']} 状态已同步为完成(交易完成)")
-
-                            else:
-                                # 查询失败记录日志
-                                logger.warning(
-                                    f"[wx_sync] 查询订单 {order['order_number']} 微信状态失败: {wx_result.get('errmsg')}")
-                                cur.execute("""
-                                    INSERT INTO wechat_shipping_logs 
-                                    (order_id, order_number, transaction_id, action_type, is_success, response_data, created_at)
-                                    VALUES (%s, %s, %s, 'sync', 0, %s, NOW())
-                                """, (
-                                    order['id'],
-                                    order['order_number'],
-                                    order['transaction_id'],
-                                    json.dumps(wx_result)
-                                ))
-                                conn.commit()
-
-                        except Exception as e:
-                            logger.error(f"[wx_sync] 同步订单 {order['order_number']} 状态异常: {e}", exc_info=True)
-                            conn.rollback()
 
-        except Exception as e:
-            logger.error(f"[wx_sync] 定时同步任务异常: {e}", exc_info=True)
+def start_receive_confirm_task():
+    """启动确认收货核验任务（多 worker 下只有取得租约的进程执行）"""
+    run_as_leader("receive_confirm", ReceiveConfirmVerifier().run_forever)
+    logger.info("[confirm_receive] 确认收货核验任务已注册")
+
+
+def _publish_status_events(events: List[Dict[str, Any]]):
+    """订单状态流转事件转发到订单状态通道（仅 PUBLISH，不覆盖确认收货结果）"""
+    for ev in events:
+        order_status_channel.publish(ev["order_number"], {
+            "event": "status_changed", "from_status": ev["from_status"], "status": ev["to_status"],
+            "source": ev["source"], "reason": ev["reason"], "changed_at": ev["created_at"],
+        }, keep_latest=False)
+
 
-        time.sleep(1800)  # 30分钟执行一次
+def start_order_transition_task():
+    """启动订单状态流转引擎（事件分发 + 超时自动收货；多 worker 下只有取得租约的进程执行）"""
+    order_transitions.register_handler("*", _publish_status_events)
+    order_transitions.register_handler("*", order_detail_cache.invalidate_events)
+    run_as_leader("order_transitions", order_transitions.run_forever)
+    logger.info("[transition] 订单状态流转引擎已注册")
 
 
 def start_wechat_status_sync_task():
-    """启动微信订单状态同步守护线程"""
-    t = threading.Thread(target=_sync_wechat_order_status, daemon=True)
-    t.start()
-    logger.info("[wx_sync] 微信订单状态同步守护线程已启动（每30分钟同步一次）")
+    """启动微信订单状态同步任务（多 worker 下只有取得租约的进程执行）"""
+    run_as_leader("wechat_status_sync", _sync_wechat_order_status)
+    logger.info(f"[wx_sync] 微信订单状态同步任务已注册（每{WX_SYNC_INTERVAL_SECONDS}秒同步一次）")
 
 
 class OrderManager:
@@ -331,6 +166,8 @@ class OrderManager:
                 # Redis 故障时降级，继续执行（依赖数据库唯一索引兜底）
                 lock_acquired = False
 
+        hot_reservation = None
+        committed = False
         try:
             with get_conn() as conn:
                 with conn.cursor() as cur:
@@ -418,21 +255,55 @@ class OrderManager:
                         if merchant_id is None:
                             merchant_id = product_merchant_ids.pop() if product_merchant_ids else 0
                     else:
-                        # 购物车结算
-                        cur.execute("""
-                            SELECT c.product_id,
-                                c.sku_id,
-                                c.quantity,
-                                s.price,
-                                p.is_member_product AS is_vip,
-                                p.user_id as merchant_id,
-                                c.specifications
-                            FROM cart c
-                            JOIN product_skus s ON s.id = c.sku_id
-                            JOIN products p ON p.id = c.product_id
-                            WHERE c.user_id = %s AND c.selected = 1
-                        """, (user_id,))
-                        items = cur.fetchall()
+                        # 购物车结算：勾选条目来自购物车热存储（与购物车接口同一份数据），
+                        # 价格、会员商品标记、商家在事务内按 SKU 一次查询
+                        try:
+                            cart_entries = CartStore.items(user_id, selected_only=True)
+                        except LookupError as e:
+                            raise HTTPException(status_code=404, detail=str(e))
+                        except CartStoreUnavailable:
+                            cart_entries = None
+
+                        if cart_entries is None:
+                            cur.execute("""
+                                SELECT c.product_id,
+                                    c.sku_id,
+                                    c.quantity,
+                                    s.price,
+                                    p.is_member_product AS is_vip,
+                                    p.user_id as merchant_id,
+                                    c.specifications
+                                FROM cart c
+                                JOIN product_skus s ON s.id = c.sku_id
+                                JOIN products p ON p.id = c.product_id
+                                WHERE c.user_id = %s AND c.selected = 1
+                            """, (user_id,))
+                            items = cur.fetchall()
+                        elif cart_entries:
+                            sku_ids = [e["sku_id"] for e in cart_entries]
+                            cur.execute(f"""
+                                SELECT s.id AS sku_id, s.price,
+                                    p.is_member_product AS is_vip,
+                                    p.user_id as merchant_id
+                                FROM product_skus s
+                                JOIN products p ON p.id = s.product_id
+                                WHERE s.id IN ({",".join(["%s"] * len(sku_ids))})
+                            """, tuple(sku_ids))
+                            catalog = {r["sku_id"]: r for r in cur.fetchall()}
+                            items = [
+                                {
+                                    "product_id": e["product_id"],
+                                    "sku_id": e["sku_id"],
+                                    "quantity": e["quantity"],
+                                    "price": catalog[e["sku_id"]]["price"],
+                                    "is_vip": catalog[e["sku_id"]]["is_vip"],
+                                    "merchant_id": catalog[e["sku_id"]]["merchant_id"],
+                                    "specifications": e.get("specifications"),
+                                }
+                                for e in cart_entries if e["sku_id"] in catalog
+                            ]
+                        else:
+                            items = []
                         if not items:
                             return None
 
@@ -451,6 +322,13 @@ class OrderManager:
                     # 确保 merchant_id 是整数
                     merchant_id = int(merchant_id or 0)
 
+                    # 热门 SKU 先在 Redis 预扣（锁定优惠券、扣减库存之前），售罄直接拒绝，不进入库存行锁竞争；
+                    # 事务回滚或异常时由 finally 中的 release 归还
+                    try:
+                        hot_reservation = InventoryService.pre_deduct(items)
+                    except InsufficientStockError as e:
+                        raise HTTPException(status_code=400, detail=str(e))
+
                     # ---------- 2. 优惠券商品类型验证（新增） ----------
                     has_vip = any(i["is_vip"] for i in items)
 
@@ -510,6 +388,7 @@ class OrderManager:
                     )
 
                     init_status = "pending_pay"
+                    expire_at = datetime.now() + timedelta(hours=ORDER_EXPIRE_HOURS)
 
                     # 修改后的 INSERT 语句，包含 merchant_id 字段
                     cur.execute("""
@@ -528,28 +407,20 @@ class OrderManager:
                         province, city, district, shipping_address, delivery_way,
                         datetime.now() + timedelta(days=7),
                         specifications,
-                        datetime.now() + timedelta(hours=12) if init_status == "pending_pay" else None,
+                        expire_at,
                         points_to_use or Decimal('0'),
                         coupon_id
                     ))
                     oid = cur.lastrowid
+                    stats_added(cur, [oid])
 
-                    # ---------- 5. 库存校验 & 扣减 ----------
+                    # ---------- 5. 库存校验 & 扣减（一条条件 UPDATE，全部满足才扣减） ----------
                     structure = get_table_structure(cur, "product_skus")
-                    has_stock_field = 'stock' in structure['fields']
-                    stock_select = (
-                        f"COALESCE({_quote_identifier('stock')}, 0) AS {_quote_identifier('stock')}"
-                        if has_stock_field and 'stock' in structure['asset_fields']
-                        else _quote_identifier('stock')
-                    ) if has_stock_field else "0 AS stock"
-
-                    for i in items:
-                        cur.execute(f"SELECT {stock_select} FROM {_quote_identifier('product_skus')} WHERE id=%s",
-                                    (i['sku_id'],))
-                        result = cur.fetchone()
-                        current_stock = result.get('stock', 0) if result else 0
-                        if current_stock < i["quantity"]:
-                            raise HTTPException(status_code=400, detail=f"SKU {i['sku_id']} 库存不足")
+                    if 'stock' in structure['fields']:
+                        try:
+                            InventoryService.reserve(cur, items)
+                        except InsufficientStockError as e:
+                            raise HTTPException(status_code=400, detail=str(e))
 
                     # ---------- 6. 写订单明细 ----------
                     for i in items:
@@ -561,15 +432,11 @@ class OrderManager:
                             i["price"], Decimal(str(i["quantity"])) * Decimal(str(i["price"]))
                         ))
 
-                    # ---------- 7. 扣库存 ----------
-                    if has_stock_field:
-                        for i in items:
-                            cur.execute("UPDATE product_skus SET stock = stock - %s WHERE id = %s",
-                                        (i["quantity"], i['sku_id']))
-
-                    # ---------- 8. 清空购物车（仅购物车结算场景） ----------
+                    # ---------- 7. 清空购物车（仅购物车结算场景） ----------
                     if not buy_now:
                         cur.execute("DELETE FROM cart WHERE user_id = %s AND selected = 1", (user_id,))
+                        if cart_entries is None:
+                            CartStore.mark_stale(cur, user_id)  # 条目来自 cart 表，Redis 中的旧哈希需丢弃
 
                     # ==================== 新增：记录幂等 Key 使用（如果提供了的话） ====================
                     if idempotency_key and redis_client:
@@ -577,10 +444,18 @@ class OrderManager:
                         redis_client.setex(used_key, 86400, order_number)  # 24小时过期
 
                     conn.commit()
+                    committed = True
+                    OrderExpiryQueue.schedule(oid, expire_at)
+                    catalog_cache.bump({i["product_id"] for i in items})  # 库存已变化
+                    if not buy_now and cart_entries:
+                        CartStore.remove_selected(user_id, [i["product_id"] for i in items])
                     logger.info(f"订单创建成功: {order_number}, 用户: {user_id}, 商家: {merchant_id}")
                     return order_number
 
         finally:
+            # 热门 SKU 预扣：成功下单只结束在途计数，失败则归还可售计数
+            if hot_reservation:
+                hot_reservation.release(committed)
             # ==================== 新增：无论成功与否都释放 Redis 锁 ====================
             if lock_acquired and redis_client:
                 try:
@@ -603,23 +478,113 @@ class OrderManager:
                 cur.execute(sql, tuple(params))
                 orders = cur.fetchall()
 
-                for o in orders:
-                    cur.execute(
-                        """
-                        SELECT oi.*, p.name
-                        FROM order_items oi
-                        JOIN products p ON oi.product_id = p.id
-                        WHERE oi.order_id = %s
-                        LIMIT 1
-                        """,
-                        (o["id"],)
-                    )
-                    first_item = cur.fetchone()
-                    o["first_product"] = first_item
-                    o["specifications"] = o.get("refund_reason")
-
+                OrderManager._attach_first_items(cur, orders)
                 return orders
 
+    @staticmethod
+    def _attach_first_items(cur, orders: List[Dict[str, Any]]) -> None:
+        """一次窗口查询为整页订单附带首件商品和规格字段"""
+        first_items = {}
+        if orders:
+            order_ids = [o["id"] for o in orders]
+            placeholders = ",".join(["%s"] * len(order_ids))
+            cur.execute(
+                f"""
+                SELECT * FROM (
+                    SELECT oi.*, p.name,
+                           ROW_NUMBER() OVER (PARTITION BY oi.order_id ORDER BY oi.id) AS rn
+                    FROM order_items oi
+                    JOIN products p ON oi.product_id = p.id
+                    WHERE oi.order_id IN ({placeholders})
+                ) t
+                WHERE t.rn = 1
+                """,
+                tuple(order_ids)
+            )
+            for item in cur.fetchall():
+                item.pop("rn", None)
+                first_items[item["order_id"]] = item
+
+        for o in orders:
+            o["first_product"] = first_items.get(o["id"])
+            o["specifications"] = o.get("refund_reason")
+
+    @staticmethod
+    def _encode_cursor(order: Dict[str, Any]) -> str:
+        raw = f"{order['created_at'].strftime('%Y-%m-%d %H:%M:%S.%f')}|{order['id']}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor: str):
+        try:
+            created_at, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            return datetime.strptime(created_at, "%Y-%m-%d %H:%M:%S.%f"), int(order_id)
+        except Exception:
+            raise ValueError("无效的分页游标")
+
+    @staticmethod
+    def list_by_user_paged(
+        user_id: int,
+        statuses: Optional[List[str]] = None,
+        cursor: Optional[str] = None,
+        limit: int = 20
+    ) -> Dict[str, Any]:
+        """
+        按用户分页查询订单（游标分页，按 created_at、id 倒序）
+
+        Args:
+            user_id: 用户ID
+            statuses: 订单状态筛选（可多选）
+            cursor: 上一页返回的 next_cursor，不传为第一页
+            limit: 每页数量
+
+        Returns:
+            list: 订单列表（附带首件商品），next_cursor: 下一页游标（没有更多时为 None），has_more
+        """
+        where = ["user_id = %s"]
+        params: List[Any] = [user_id]
+        if statuses:
+            where.append(f"status IN ({','.join(['%s'] * len(statuses))})")
+            params.extend(statuses)
+        if cursor:
+            created_at, last_id = OrderManager._decode_cursor(cursor)
+            where.append("(created_at < %s OR (created_at = %s AND id < %s))")
+            params.extend([created_at, created_at, last_id])
+
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                select_fields = OrderManager._build_orders_select(cur)
+                cur.execute(
+                    f"""SELECT {select_fields} FROM orders
+                        WHERE {" AND ".join(where)}
+                        ORDER BY created_at DESC, id DESC
+                        LIMIT %s""",
+                    tuple(params) + (limit + 1,)
+                )
+                orders = cur.fetchall()
+                has_more = len(orders) > limit
+                orders = orders[:limit]
+
+                OrderManager._attach_first_items(cur, orders)
+
+        return {
+            "list": orders,
+            "next_cursor": OrderManager._encode_cursor(orders[-1]) if has_more else None,
+            "has_more": has_more
+        }
+
+    @staticmethod
+    def count_by_status(user_id: int) -> Dict[str, Any]:
+        """按状态统计用户订单数（只读 (user_id, status) 覆盖索引）"""
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT status, COUNT(*) AS cnt FROM orders WHERE user_id = %s GROUP BY status",
+                    (user_id,)
+                )
+                counts = {r["status"]: int(r["cnt"]) for r in cur.fetchall()}
+        return {"counts": counts, "total": sum(counts.values())}
+
     @staticmethod
     def list_by_merchant(
         merchant_id: int,
@@ -643,42 +608,36 @@ class OrderManager:
         Returns:
             包含订单列表、分页信息、统计信息的字典
         """
+        start_day, end_day = OrderManager._day_range(start_date, end_date)
         with get_conn() as conn:
             with conn.cursor() as cur:
-                # 构建查询条件
+                # 构建查询条件（半开区间，可使用 (merchant_id, created_at) 索引）
                 where_conditions = ["merchant_id = %s"]
-                params = [merchant_id]
-                
+                params: List[Any] = [merchant_id]
+                if start_day:
+                    where_conditions.append("created_at >= %s")
+                    params.append(start_day)
+                if end_day:
+                    where_conditions.append("created_at < %s")
+                    params.append(end_day)
+                range_clause = " AND ".join(where_conditions)
+
+                # 数量与金额：按状态一次分组汇总
+                cur.execute(
+                    f"""SELECT status, COUNT(*) AS order_count, COALESCE(SUM(total_amount), 0) AS total_amount
+                        FROM orders WHERE {range_clause} GROUP BY status""",
+                    tuple(params)
+                )
+                by_status = {r["status"]: r for r in cur.fetchall()}
                 if status:
+                    by_status = {k: v for k, v in by_status.items() if k == status}
                     where_conditions.append("status = %s")
                     params.append(status)
-                
-                if start_date:
-                    where_conditions.append("DATE(created_at) >= %s")
-                    params.append(start_date)
-                
-                if end_date:
-                    where_conditions.append("DATE(created_at) <= %s")
-                    params.append(end_date)
-                
                 where_clause = " AND ".join(where_conditions)
-                
-                # 查询总数量
-                count_sql = f"SELECT COUNT(*) as total FROM orders WHERE {where_clause}"
-                cur.execute(count_sql, tuple(params))
-                total = cur.fetchone()["total"]
-                
-                # 查询总金额
-                amount_sql = f"""
-                    SELECT 
-                        COALESCE(SUM(total_amount), 0) as total_amount,
-                        COALESCE(SUM(CASE WHEN status = 'completed' THEN total_amount ELSE 0 END), 0) as completed_amount
-                    FROM orders 
-                    WHERE {where_clause}
-                """
-                cur.execute(amount_sql, tuple(params))
-                amount_stats = cur.fetchone()
-                
+                total = sum(int(r["order_count"]) for r in by_status.values())
+                total_amount = sum((r["total_amount"] for r in by_status.values()), Decimal("0"))
+                completed_amount = by_status["completed"]["total_amount"] if "completed" in by_status else 0
+
                 # 查询订单列表（分页）
                 select_fields = OrderManager._build_orders_select(cur)
                 offset = (page - 1) * page_size
@@ -692,29 +651,33 @@ class OrderManager:
                 query_params = params + [page_size, offset]
                 cur.execute(sql, tuple(query_params))
                 orders = cur.fetchall()
-                
-                # 为每个订单查询商品明细和用户信息
-                for o in orders:
-                    # 查询商品明细
+
+                # 商品明细和用户信息：整页各一次查询
+                if orders:
+                    order_ids = [o["id"] for o in orders]
                     cur.execute(
-                        """
+                        f"""
                         SELECT oi.*, p.name as product_name, p.cover as product_cover
                         FROM order_items oi
                         JOIN products p ON oi.product_id = p.id
-                        WHERE oi.order_id = %s
+                        WHERE oi.order_id IN ({",".join(["%s"] * len(order_ids))})
                         """,
-                        (o["id"],)
+                        tuple(order_ids)
                     )
-                    o["items"] = cur.fetchall()
-                    
-                    # 查询用户信息
+                    items_by_order: Dict[int, List[Dict[str, Any]]] = {}
+                    for it in cur.fetchall():
+                        items_by_order.setdefault(it["order_id"], []).append(it)
+
+                    user_ids = list({o["user_id"] for o in orders})
                     cur.execute(
-                        "SELECT id, name, mobile, avatar FROM users WHERE id = %s",
-                        (o["user_id"],)
+                        f"SELECT id, name, mobile, avatar FROM users WHERE id IN ({','.join(['%s'] * len(user_ids))})",
+                        tuple(user_ids)
                     )
-                    user_info = cur.fetchone()
-                    o["user_info"] = user_info
-                
+                    users = {u["id"]: u for u in cur.fetchall()}
+                    for o in orders:
+                        o["items"] = items_by_order.get(o["id"], [])
+                        o["user_info"] = users.get(o["user_id"])
+
                 return {
                     "list": orders,
                     "pagination": {
@@ -724,12 +687,50 @@ class OrderManager:
                         "total_pages": (total + page_size - 1) // page_size
                     },
                     "statistics": {
-                        "total_amount": float(amount_stats["total_amount"]),
-                        "completed_amount": float(amount_stats["completed_amount"]),
-                        "order_count": total
+                        "total_amount": float(total_amount),
+                        "completed_amount": float(completed_amount),
+                        "order_count": total,
+                        "status_counts": {k: int(v["order_count"]) for k, v in by_status.items()}
                     }
                 }
 
+    @staticmethod
+    def _day_range(start_date: Optional[str], end_date: Optional[str]):
+        """YYYY-MM-DD 起止日期 → 半开区间 [start_day, end_day + 1天)"""
+        try:
+            start_day = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
+            end_day = datetime.strptime(end_date, "%Y-%m-%d").date() + timedelta(days=1) if end_date else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="日期格式应为 YYYY-MM-DD")
+        return start_day, end_day
+
+    @staticmethod
+    def merchant_dashboard(merchant_id: int, start_date: Optional[str] = None,
+                           end_date: Optional[str] = None) -> Dict[str, Any]:
+        """
+        商家订单看板：订单数、金额及各状态分布
+
+        读取按 (商家, 日期) 增量维护的日汇总（merchant_order_day_stats），不扫描 orders
+        """
+        start_day, end_day = OrderManager._day_range(start_date, end_date)
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                rows = day_totals(cur, merchant_id, start_day, end_day)
+
+        by_status = {
+            r["status"]: {"order_count": int(r["order_count"]), "total_amount": float(r["total_amount"])}
+            for r in rows
+        }
+        return {
+            "merchant_id": merchant_id,
+            "start_date": start_date,
+            "end_date": end_date,
+            "order_count": sum(v["order_count"] for v in by_status.values()),
+            "total_amount": float(sum(Decimal(str(r["total_amount"])) for r in rows)),
+            "completed_amount": by_status.get("completed", {}).get("total_amount", 0.0),
+            "by_status": by_status,
+        }
+
     @staticmethod
     def detail(order_number: str) -> Optional[dict]:
         """查询单个订单详情（含用户、地址、商品明细、商家信息）。"""
@@ -806,33 +807,13 @@ class OrderManager:
     @staticmethod
     def update_status(order_number: str, new_status: str, reason: Optional[str] = None,
                       external_conn=None) -> bool:
-        """统一的订单状态更新，支持外部连接复用。"""
+        """统一的订单状态更新，支持外部连接复用（经状态流转引擎，记录流转历史并发出流转事件）。"""
 
         def _apply_update(cur) -> bool:
-            cur.execute("SHOW COLUMNS FROM orders")
-            cols = {row.get("Field") for row in cur.fetchall()}
-
-            updates = ["status=%s", "updated_at=NOW()"]
-            params: List[Any] = [new_status]
-
-            # 需要记录原因时，优先写入 status_reason / remark，避免覆盖 refund_reason
-            if reason:
-                for col in ("status_reason", "remark"):
-                    if col in cols:
-                        updates.append(f"{col}=%s")
-                        params.append(reason)
-                        break
-
-            if new_status in ("pending_ship", "pending_recv") and "paid_at" in cols:
-                updates.append("paid_at=COALESCE(paid_at, NOW())")
-            if new_status == "pending_recv" and "shipped_at" in cols:
-                updates.append("shipped_at=COALESCE(shipped_at, NOW())")
-            if new_status == "completed" and "completed_at" in cols:
-                updates.append("completed_at=COALESCE(completed_at, NOW())")
-
-            params.append(order_number)
-            cur.execute(f"UPDATE orders SET {', '.join(updates)} WHERE order_number=%s", tuple(params))
-            return cur.rowcount > 0
+            changed = order_transitions.transition(
+                cur, new_status, order_numbers=[order_number], reason=reason, source="manual"
+            )
+            return bool(changed)
 
         if external_conn:
             cur = external_conn.cursor()
@@ -845,7 +826,8 @@ class OrderManager:
                 with conn.cursor() as cur:
                     updated = _apply_update(cur)
                     conn.commit()
-                    return updated
+            order_detail_cache.invalidate(order_number)
+            return updated
 
     # ==================== 新增：确认收货处理（前端调用微信组件后回调） ====================
     @staticmethod
@@ -854,387 +836,26 @@ class OrderManager:
         """
         用户确认收货（前端调用微信确认收货组件成功后回调）
 
-        修复：增加重试机制处理微信状态同步延迟（最多3次，间隔1.5秒）
+        只登记确认意图并立即返回；微信状态由后台核验线程带退避查询，
+        完成后通过订单状态通道发布结果（见 receive_confirm.ReceiveConfirmVerifier）
         """
-        result = {
-            "ok": False,
-            "message": "",
-            "wx_verified": False
-        }
-
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                # 1. 查询订单信息
-                cur.execute(
-                    """SELECT id, user_id, status, transaction_id, order_number, total_amount
-                       FROM orders WHERE order_number=%s""",
-                    (order_number,)
-                )
-                order = cur.fetchone()
-
-                if not order:
-                    result["message"] = "订单不存在"
-                    return result
-
-                # 验证用户权限（如果提供了user_id）
-                if user_id and order['user_id'] != user_id:
-                    result["message"] = "无权操作该订单"
-                    return result
-
-                if order['status'] != 'pending_recv':
-                    result["message"] = f"订单状态不正确，当前状态：{order['status']}"
-                    return result
-
-                transaction_id = order.get('transaction_id')
-                if not transaction_id:
-                    result["message"] = "缺少微信支付单号，无法确认收货"
-                    return result
-
-                # 可选：验证前端传入的微信组件结果
-                if wx_confirm_result and wx_confirm_result.get('order_id') != transaction_id:
-                    logger.warning(f"[confirm_receive] 前端传入的transaction_id与订单不符")
-                    result["message"] = "验证失败：订单信息不匹配"
-                    return result
-
-                # ===== 核心修复：带重试的微信状态查询 =====
-                max_retries = 3
-                retry_delay = 1.5  # 秒
-                wx_result = None
-                order_state = None
-
-                for attempt in range(max_retries):
-                    try:
-                        wx_result = WechatShippingManager.get_order(transaction_id)
-
-                        # 修复：errcode 转为字符串比较
-                        if str(wx_result.get('errcode', '')) != '0':
-                            error_msg = wx_result.get('errmsg', '未知错误')
-                            result["message"] = f"查询微信订单状态失败：{error_msg}"
-                            return result
-
-                        # 修复：兼容 order_state 在顶层或嵌套在 order 对象中的情况，并转为整数
-                        raw_state = wx_result.get('order_state') or (wx_result.get('order') or {}).get('order_state')
-                        try:
-                            order_state = int(raw_state) if raw_state is not None else None
-                        except (ValueError, TypeError):
-                            order_state = None
-                            logger.warning(f"[confirm_receive] order_state 转换失败，原始值: {raw_state}")
-
-                        # 已确认收货(3)或交易完成(4)，立即通过
-                        if order_state in (3, 4):
-                            break
-
-                        # 【关键修复】只要不是3或4（包括None、1、2、5、6），且还有重试次数，就等待后重试
-                        if attempt < max_retries - 1:
-                            logger.info(
-                                f"[confirm_receive] 订单 {order_number} 微信状态 {order_state}，"
-                                f"第 {attempt + 1}/{max_retries} 次重试，等待 {retry_delay}s..."
-                            )
-                            time.sleep(retry_delay)
-                        else:
-                            # 最后一次了，必须break，否则死循环
-                            break
-
-                    except Exception as e:
-                        logger.error(f"[confirm_receive] 查询微信状态异常: {e}")
-                        if attempt == max_retries - 1:
-                            result["message"] = "校验微信收货状态失败，请稍后重试"
-                            return result
-                        time.sleep(retry_delay)
-
-                # 状态校验
-                if order_state == 3:
-                    result["wx_verified"] = True
-                    verify_msg = "微信已确认收货"
-                elif order_state == 4:
-                    result["wx_verified"] = True
-                    verify_msg = "微信交易已完成"
-                else:
-                    # 状态映射表
-                    state_map = {1: "待发货", 2: "已发货未收货", 5: "已退款", 6: "资金待结算"}
-
-                    if order_state is None:
-                        result["message"] = "微信状态尚未同步，请稍等2-3分钟后重试"
-                        logger.warning(f"[confirm_receive] 订单 {order_number} 微信返回状态为None")
-                    else:
-                        current_state_name = state_map.get(order_state, f"异常状态({order_state})")
-                        result["message"] = (
-                            f"微信端未确认收货，当前状态：{current_state_name}。"
-                            f"请确保在微信小程序内点击确认收货按钮。"
-                        )
-                    return result
-
-                # 更新订单状态
-                updated = OrderManager.update_status(
-                    order_number,
-                    "completed",
-                    f"用户确认收货({verify_msg})",
-                    external_conn=conn
-                )
-
-                if not updated:
-                    result["message"] = "更新订单状态失败"
-                    return result
-
-                # 记录确认收货日志（这里是你缺失的代码）
-                try:
-                    cur.execute("""
-                        INSERT INTO wechat_shipping_logs 
-                        (order_id, order_number, transaction_id, action_type, is_success, remark, response_data, created_at)
-                        VALUES (%s, %s, %s, 'sync', 1, %s, %s, NOW())
-                    """, (
-                        order['id'],
-                        order_number,
-                        transaction_id,
-                        f"用户确认收货, 微信验证: {result['wx_verified']}",
-                        json.dumps(wx_result)
-                    ))
-                    conn.commit()
-                except Exception as e:
-                    logger.error(f"[confirm_receive] 记录日志失败: {e}")
-                    # 日志记录失败不影响主流程，但最好回滚或记录
-                    conn.rollback()
-
-                result["ok"] = True
-                result["message"] = f"确认收货成功（{verify_msg}），资金将在微信侧结算"
-
-                # 可选：触发后续业务（如积分发放）
-                try:
-                    # 如果需要在确认收货时触发某些业务逻辑，可以在这里调用
-                    pass
-                except Exception as e:
-                    logger.error(f"[confirm_receive] 订单 {order_number} 后续处理异常: {e}")
-
-                return result
+        return ReceiveConfirmVerifier.submit(order_number, user_id, wx_confirm_result)
 
     @staticmethod
     def export_to_excel(order_numbers: List[str]) -> bytes:
         """
         导出订单详情（包含资金拆分明细）
         生成两个工作表：订单详情、资金拆分明细
-        """
-        # 账户类型中英文映射
-        account_type_map = {
-            "merchant_balance": "商家余额",
-            "public_welfare": "公益基金",
-            "maintain_pool": "平台维护",
-            "subsidy_pool": "周补贴池",
-            "director_pool": "联创奖励",
-            "shop_pool": "社区店",
-            "city_pool": "城市运营中心",
-            "branch_pool": "大区分公司",
-            "fund_pool": "事业发展基金",
-            "company_points": "公司积分账户",
-            "company_balance": "公司余额账户",
-            "platform_revenue_pool": "平台收入池（会员商品）",
-            "wx_applyment_fee": "微信进件手续费",
-            "income": "收入",
-            "expense": "支出"
-        }
-
-        wb = Workbook()
-
-        # ========== 第一个工作表：订单详情 ==========
-        ws1 = wb.active
-        ws1.title = "订单详情"
-
-        headers1 = [
-            "订单号", "商家ID", "商家名称", "订单状态", "总金额", "原始金额", "积分抵扣", "实付金额",
-            "支付方式", "配送方式", "是否会员订单",
-            "用户ID", "用户姓名", "用户手机号",
-            "收货人", "收货电话", "省份", "城市", "区县", "详细地址",
-            "商品信息", "商品规格", "下单时间", "支付时间", "发货时间"
-        ]
-
-        # 设置表头样式
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="2C3E50", end_color="2C3E50", fill_type="solid")
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        thin_border = Border(
-            left=Side(style='thin'), right=Side(style='thin'),
-            top=Side(style='thin'), bottom=Side(style='thin')
-        )
-
-        for col_idx, header in enumerate(headers1, 1):
-            cell = ws1.cell(row=1, column=col_idx, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-            cell.border = thin_border
-
-        # ========== 第二个工作表：资金拆分明细 ==========
-        ws2 = wb.create_sheet(title="资金拆分")
-        headers2 = [
-            "订单号", "商家ID", "账户类型", "变动金额", "变动后余额",
-            "流水类型", "备注", "创建时间"
-        ]
-
-        for col_idx, header in enumerate(headers2, 1):
-            cell = ws2.cell(row=1, column=col_idx, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-            cell.border = thin_border
-
-        # 查询数据并填充
-        row_idx1 = 2
-        row_idx2 = 2
 
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                for order_number in order_numbers:
-                    # 1. 查询订单详情
-                    order_data = OrderManager.detail(order_number)
-                    if not order_data:
-                        continue
-
-                    order_info = order_data["order_info"]
-                    user_info = order_data["user"]
-                    merchant_info = order_data.get("merchant")
-                    address = order_data["address"] or {}
-                    items = order_data["items"]
-                    specifications = order_data.get("specifications") or {}
-
-                    # 计算实付金额（用于计算20%平台抽成）
-                    total = Decimal(str(order_info.get("total_amount", 0)))
-                    points_discount = Decimal(str(order_info.get("points_discount", 0)))
-                    actual_pay = total - points_discount
-
-                    # 商品信息拼接
-                    product_info = "\n".join([
-                        f"{item.get('product_name', '')} x{item.get('quantity', 0)} @¥{item.get('unit_price', 0)}"
-                        for item in items
-                    ])
-
-                    # 规格信息
-                    spec_str = ""
-                    if isinstance(specifications, dict):
-                        spec_str = "\n".join([f"{k}: {v}" for k, v in specifications.items()])
-
-                    # 判断发货时间（自提订单=支付时间）
-                    shipped_at = order_info.get("shipped_at", "")
-                    if order_info.get("delivery_way") == "pickup":
-                        shipped_at = order_info.get("paid_at", "")
-
-                    # 填充订单详情行
-                    row_data1 = [
-                        order_info.get("order_number", ""),
-                        order_info.get("merchant_id", 0),
-                        merchant_info.get("store_name") or merchant_info.get("name", "平台自营") if merchant_info else "平台自营",
-                        order_info.get("status", ""),
-                        float(total),
-                        float(order_info.get("original_amount", 0)),
-                        float(points_discount),
-                        float(actual_pay),
-                        order_info.get("pay_way", "wechat"),
-                        order_info.get("delivery_way", "platform"),
-                        "是" if order_info.get("is_member_order") else "否",
-                        user_info.get("id", ""),
-                        user_info.get("name", ""),
-                        user_info.get("mobile", ""),
-                        address.get("consignee_name", ""),
-                        address.get("consignee_phone", ""),
-                        address.get("province", ""),
-                        address.get("city", ""),
-                        address.get("district", ""),
-                        address.get("detail", ""),
-                        product_info,
-                        spec_str,
-                        order_info.get("created_at", ""),
-                        order_info.get("paid_at", ""),
-                        shipped_at  # ← 使用修改后的发货时间
-                    ]
-
-                    for col_idx, value in enumerate(row_data1, 1):
-                        cell = ws1.cell(row=row_idx1, column=col_idx, value=value)
-                        cell.alignment = Alignment(vertical="center", wrap_text=True)
-                        cell.border = thin_border
-                        if col_idx in [5, 6, 7, 8]:  # 金额列
-                            cell.number_format = '¥#,##0.00'
-
-                    row_idx1 += 1
-
-                    # 2. 查询资金拆分明细（account_flow表）
-                    cur.execute("""
-                        SELECT account_type, change_amount, balance_after, 
-                               flow_type, remark, created_at
-                        FROM account_flow 
-                        WHERE remark LIKE %s
-                        ORDER BY created_at ASC
-                    """, (f"%{order_number}%",))
-
-                    flows = cur.fetchall()
-
-                    # 计算平台抽成总额（20%）
-                    platform_fee = float(actual_pay) * 0.2
-
-                    for flow in flows:
-                        account_type_en = flow.get("account_type", "")
-
-                        # 特殊处理：商家余额显示为X雨点（20%）
-                        if account_type_en == "merchant_balance":
-                            display_amount = f"{int(platform_fee)}雨点"
-                            account_type_cn = "商家余额"  # ← 改回"商家余额"
-                            balance_after_display = "-"
-                            is_platform_fee_row = True
-                        else:
-                            # 其他账户类型正常显示
-                            account_type_cn = account_type_map.get(account_type_en, account_type_en)
-                            display_amount = float(flow.get("change_amount", 0))
-                            balance_after_display = float(flow.get("balance_after", 0))
-                            is_platform_fee_row = False
-
-                        row_data2 = [
-                            order_number,
-                            order_info.get("merchant_id", 0),
-                            account_type_cn,
-                            display_amount,
-                            balance_after_display,
-                            flow.get("flow_type", ""),
-                            flow.get("remark", ""),
-                            flow.get("created_at", "")
-                        ]
-
-                        for col_idx, value in enumerate(row_data2, 1):
-                            cell = ws2.cell(row=row_idx2, column=col_idx, value=value)
-                            cell.alignment = Alignment(vertical="center")
-                            cell.border = thin_border
-
-                            # 只有非商家余额行才设置货币格式
-                            if col_idx in [4, 5] and not is_platform_fee_row:
-                                cell.number_format = '¥#,##0.00'
-
-                        row_idx2 += 1
-
-        # 调整列宽（订单详情表）
-        for column in ws1.columns:
-            max_length = 0
-            column_letter = get_column_letter(column[0].column)
-            for cell in column:
-                try:
-                    if cell.value and len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            ws1.column_dimensions[column_letter].width = min(max_length + 2, 50)
-
-        # 调整列宽（资金拆分表）
-        for column in ws2.columns:
-            max_length = 0
-            column_letter = get_column_letter(column[0].column)
-            for cell in column:
-                try:
-                    if cell.value and len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            ws2.column_dimensions[column_letter].width = min(max_length + 2, 50)
-
-        # 保存到内存
-        excel_data = BytesIO()
-        wb.save(excel_data)
-        excel_data.seek(0)
-        return excel_data.getvalue()
+        由流式导出引擎（services.export_service）按订单号集合一次查询生成，
+        不再逐单查询详情和流水。
+        """
+        tmp_path = EXPORT_DIR / f"tmp_{uuid.uuid4().hex}.xlsx"
+        try:
+            ExportService.write_file("orders", "xlsx", {"order_numbers": list(order_numbers)}, tmp_path)
+            return tmp_path.read_bytes()
+        finally:
+            tmp_path.unlink(missing_ok=True)
 
 
 # ---------------- 请求模型 ----------------
@@ -1332,12 +953,35 @@ def list_orders(user_id: int, status: Optional[str] = None):
     return OrderManager.list_by_user(user_id, status)
 
 
+@router.get("/{user_id}/page", summary="分页查询用户订单列表")
+def list_orders_paged(
+    user_id: int,
+    status: Optional[str] = Query(None, description="订单状态筛选，多个用逗号分隔"),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    limit: int = Query(20, ge=1, le=100, description="每页数量")
+):
+    statuses = [s.strip() for s in status.split(",") if s.strip()] if status else None
+    try:
+        return OrderManager.list_by_user_paged(user_id, statuses, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/{user_id}/status-counts", summary="用户订单各状态数量")
+def order_status_counts(user_id: int):
+    return OrderManager.count_by_status(user_id)
+
+
 @router.get("/detail/{order_number}", summary="查询订单详情")
-def order_detail(order_number: str):
-    d = OrderManager.detail(order_number)
-    if not d:
+def order_detail(order_number: str, request: Request):
+    cached = order_detail_cache.get_or_load(order_number, OrderManager.detail)
+    if not cached:
         raise HTTPException(status_code=404, detail="订单不存在")
-    return d
+    # 详情随订单状态变化，要求客户端每次带 If-None-Match 校验
+    headers = {"ETag": cached["etag"], "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), cached["etag"]):
+        return Response(status_code=304, headers=headers)
+    return DecimalJSONResponse(content=cached["data"], headers=headers)
 
 
 @router.post("/status", summary="更新订单状态")
@@ -1376,6 +1020,16 @@ def list_merchant_orders(
     return result
 
 
+@router.get("/merchant/{merchant_id}/dashboard", summary="商家订单看板")
+def merchant_order_dashboard(
+    merchant_id: int,
+    start_date: Optional[str] = Query(None, description="开始日期(YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="结束日期(YYYY-MM-DD)，包含当天")
+):
+    """商家在日期范围内的订单数、金额和各状态分布（读取按天增量维护的汇总）"""
+    return OrderManager.merchant_dashboard(merchant_id, start_date, end_date)
+
+
 # ==================== 新增：确认收货接口（前端调用微信组件后回调） ====================
 @router.post("/confirm-receive", summary="用户确认收货（微信组件回调）")
 def confirm_receive(body: ConfirmReceiveRequest):
@@ -1391,13 +1045,14 @@ def confirm_receive(body: ConfirmReceiveRequest):
     2. 【强制】微信侧订单状态必须为已确认收货或交易完成
 
     业务流程：
-    1. 验证订单状态和权限
-    2. 强制查询微信侧状态（必须为3或4）
-    3. 更新订单状态为 completed（已完成）
-    4. 触发资金结算（如果在支付时未结算）
+    1. 验证订单状态和权限，登记确认意图后立即返回 status=pending
+    2. 后台核验线程带退避查询微信侧状态（必须为3或4）
+    3. 核验通过后更新订单状态为 completed（已完成）
+    4. 结果发布到订单状态通道，前端通过 GET /order/confirm-receive/{order_number}/result 获取
 
     失败情况：
-    - 如果微信侧未确认收货，会返回错误，前端应引导用户去小程序订单列表确认收货
+    - 订单校验不通过时直接返回错误
+    - 微信侧一直未确认收货时，结果为 rejected，前端应引导用户去小程序订单列表确认收货
     """
     result = OrderManager.confirm_receive(
         body.order_number,
@@ -1410,50 +1065,30 @@ def confirm_receive(body: ConfirmReceiveRequest):
     return result
 
 
-def auto_receive_task(db_cfg: dict = None):
-    """自动收货守护进程（不再发放积分）"""
-    import threading
-    import time
-    from datetime import datetime
-
-    def run():
-        while True:
-            try:
-                from core.database import get_conn
-                with get_conn() as conn:
-                    with conn.cursor() as cur:
-                        now = datetime.now()
-                        cur.execute(
-                            "SELECT id, order_number, total_amount FROM orders "
-                            "WHERE status='pending_recv' AND auto_recv_time<=%s",
-                            (now,)
-                        )
-                        for row in cur.fetchall():
-                            order_id = row["id"]
-                            order_number = row["order_number"]
-
-                            # 更新订单状态为已完成
-                            cur.execute(
-                                "UPDATE orders SET status='completed' WHERE id=%s",
-                                (order_id,)
-                            )
+@router.get("/confirm-receive/{order_number}/result", summary="查询确认收货核验结果（长轮询）")
+async def confirm_receive_result(
+    order_number: str,
+    wait: int = Query(0, ge=0, le=25, description="结果仍为 pending 时最多等待的秒数")
+):
+    """
+    确认收货核验结果
 
-                            # ✅ **移除**：积分已在支付时发放，自动收货不再发放
-                            # try:
-                            #     fs = FinanceService()
-                            #     fs.grant_points_on_receive(order_number, external_conn=conn)
-                            # except Exception as e:
-                            #     logger.error(f"[auto_receive] 订单{order_number}积分发放失败: {e}", exc_info=True)
+    status: pending 核验中 / confirmed 已完成 / rejected 微信未确认 / failed 核验异常。
+    wait > 0 时在结果变化前挂起等待（不占用线程池），超时返回当前结果
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        result = await run_in_threadpool(ReceiveConfirmVerifier.result, order_number)
+        if result is None:
+            raise HTTPException(status_code=404, detail="没有该订单的确认收货记录")
+        if result["status"] != "pending" or time.monotonic() >= deadline:
+            return result
+        await asyncio.sleep(RECEIVE_CONFIRM_POLL_SECONDS)
 
-                            conn.commit()
-                            logger.debug(f"[auto_receive] 订单 {order_number} 已自动完成。")
-            except Exception as e:
-                logger.error(f"[auto_receive] 异常: {e}")
-            time.sleep(3600)  # 每小时检查一次
 
-    t = threading.Thread(target=run, daemon=True)
-    t.start()
-    logger.info("自动收货守护进程已启动（不再发放积分）")
+def auto_receive_task(db_cfg: dict = None):
+    """自动收货（不再发放积分）：由订单状态流转引擎按间隔批量执行，多 worker 下只有取得租约的进程执行"""
+    start_order_transition_task()
 
 
 class OrderExportRequest(BaseModel):
@@ -1464,6 +1099,9 @@ class OrderExportByTimeRequest(BaseModel):
     start_time: str  # 格式：2025-01-01 00:00:00
     end_time: str  # 格式：2025-01-31 23:59:59
     status: Optional[str] = None  # 可选：按订单状态筛选（如 pending_ship, completed 等）
+    merchant_id: Optional[int] = None  # 可选：按商家筛选
+    file_format: str = "xlsx"  # xlsx / csv（csv 边查边输出）
+    async_job: bool = False  # true：提交后台任务，返回 job_id，完成后通过下载接口获取
 
 
 @router.post("/export", summary="导出订单详情到Excel")
@@ -1494,95 +1132,55 @@ def export_orders(body: OrderExportRequest):
 @router.post("/export/by-time", summary="按时间范围导出订单")
 def export_orders_by_time(body: OrderExportByTimeRequest):
     """
-    按时间范围批量导出订单详情
+    按时间范围批量导出订单详情（流式导出，不再限制订单数和时间跨度）
     请求示例: {
         "start_time": "2025-01-01 00:00:00",
         "end_time": "2025-01-31 23:59:59",
-        "status": "completed"  // 可选，不填则导出所有状态
+        "status": "completed",  // 可选，不填则导出所有状态
+        "file_format": "xlsx",  // 可选，xlsx / csv
+        "async_job": false      // 可选，true 时返回 job_id，到 /api/export/jobs/{job_id} 查询并下载
     }
+
+    - csv：服务端游标分块读取，边查边输出，内存占用恒定
+    - xlsx：write-only 工作表写入临时文件后分块发送
     """
-    # 1. 时间格式校验
+    filters = {
+        "start_time": body.start_time,
+        "end_time": body.end_time,
+        "status": body.status,
+        "merchant_id": body.merchant_id,
+    }
     try:
-        start = datetime.strptime(body.start_time, "%Y-%m-%d %H:%M:%S")
-        end = datetime.strptime(body.end_time, "%Y-%m-%d %H:%M:%S")
-    except ValueError:
-        raise HTTPException(
-            status_code=422,
-            detail="时间格式错误，请使用：YYYY-MM-DD HH:MM:SS"
-        )
+        ExportService.validate("orders", body.file_format, filters)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
-    if end < start:
-        raise HTTPException(
-            status_code=422,
-            detail="结束时间不能早于开始时间"
-        )
+    start_str = body.start_time[:10].replace("-", "")
+    end_str = body.end_time[:10].replace("-", "")
+    filename = f"orders_{start_str}_to_{end_str}.{body.file_format}"
+    if body.status:
+        filename = f"orders_{body.status}_{start_str}_to_{end_str}.{body.file_format}"
 
-    # 2. 限制时间范围（防止导出数据量过大，最多31天）
-    if (end - start).days > 31:
-        raise HTTPException(
-            status_code=422,
-            detail="时间范围不能超过31天"
-        )
+    if body.async_job:
+        return ExportService.submit_job("orders", body.file_format, filters, file_name=filename)
 
-    # 3. 查询时间范围内的订单号
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            if body.status:
-                # 按状态筛选
-                sql = """
-                    SELECT order_number 
-                    FROM orders 
-                    WHERE created_at >= %s 
-                      AND created_at <= %s 
-                      AND status = %s 
-                    ORDER BY created_at DESC 
-                    LIMIT 500
-                """
-                cur.execute(sql, (body.start_time, body.end_time, body.status))
-            else:
-                # 不筛选状态，导出全部
-                sql = """
-                    SELECT order_number 
-                    FROM orders 
-                    WHERE created_at >= %s 
-                      AND created_at <= %s 
-                    ORDER BY created_at DESC 
-                    LIMIT 500
-                """
-                cur.execute(sql, (body.start_time, body.end_time))
-
-            rows = cur.fetchall()
-            order_numbers = [row["order_number"] for row in rows]
-
-    # 4. 检查是否有数据
-    if not order_numbers:
-        raise HTTPException(
-            status_code=404,
-            detail="该时间段内没有符合条件的订单"
-        )
-
-    # 5. 调用现有的导出方法生成Excel
     try:
-        excel_data = OrderManager.export_to_excel(order_numbers)
-
-        # 生成带时间范围的文件名
-        start_str = body.start_time[:10].replace("-", "")
-        end_str = body.end_time[:10].replace("-", "")
-        filename = f"orders_{start_str}_to_{end_str}.xlsx"
-        if body.status:
-            filename = f"orders_{body.status}_{start_str}_to_{end_str}.xlsx"
-
-        return StreamingResponse(
-            BytesIO(excel_data),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        if body.file_format == "csv":
+            return StreamingResponse(
+                ExportService.stream_csv("orders", filters),
+                media_type=EXPORT_MEDIA_TYPES["csv"],
+                headers={"Content-Disposition": f"attachment; filename={filename}"}
+            )
+
+        tmp_path = EXPORT_DIR / f"tmp_{uuid.uuid4().hex}.xlsx"
+        rows = ExportService.write_file("orders", "xlsx", filters, tmp_path)
+        logger.info(f"按时间导出订单完成: {filename}, 共 {rows} 行")
+        return FileResponse(
+            str(tmp_path),
+            media_type=EXPORT_MEDIA_TYPES["xlsx"],
+            filename=filename,
+            background=BackgroundTask(tmp_path.unlink, missing_ok=True)
         )
     except Exception as e:
         logger.error(f"按时间导出订单失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
-
-
-# ==================== 修改：模块导入时启动新增的后台任务 ====================
-start_order_expire_task()
-# 新增：启动微信状态同步任务
-start_wechat_status_sync_task()
\ No newline at end of file
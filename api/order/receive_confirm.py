@@ -0,0 +1,240 @@
+# api/order/receive_confirm.py - 确认收货异步核验
+"""
+用户确认收货
+
+- 请求内只做一次订单校验并写入确认意图（order_receive_confirms），立即返回，不再在请求线程里
+  sleep 重试、占用数据库连接
+- 后台核验线程（单实例租约）取出到期的待核验记录，查询微信订单状态：
+  已确认收货(3)/交易完成(4) 时在一个短事务内完成订单；否则按 RECEIVE_CONFIRM_BACKOFF_SECONDS 退避重查，
+  退避次数用完后记为 rejected（微信未确认）或 failed（查询异常）
+- 每次结果变化都发布到订单状态通道（core.order_status_channel），客户端通过结果接口长轮询获取
+"""
+import json
+import threading
+from typing import Dict, Any, List, Optional
+
+from core.config import (
+    RECEIVE_CONFIRM_POLL_SECONDS, RECEIVE_CONFIRM_BACKOFF_SECONDS, RECEIVE_CONFIRM_BATCH_SIZE
+)
+from core.database import get_conn
+from core.logging import get_logger
+from core import order_status_channel
+from services.order_transitions import transition
+from services import order_detail_cache
+from .wechat_shipping import WechatShippingManager
+
+logger = get_logger(__name__)
+
+# 微信状态：1待发货 2已发货 3确认收货 4交易完成 5已退款 6资金待结算
+_VERIFIED_STATES = {3: "微信已确认收货", 4: "微信交易已完成"}
+_STATE_NAMES = {1: "待发货", 2: "已发货未收货", 5: "已退款", 6: "资金待结算"}
+
+
+def _order_state(wx_result: Dict[str, Any]) -> Optional[int]:
+    # 兼容 order_state 在顶层或嵌套在 order 对象中的情况
+    raw_state = wx_result.get('order_state') or (wx_result.get('order') or {}).get('order_state')
+    try:
+        return int(raw_state) if raw_state is not None else None
+    except (ValueError, TypeError):
+        logger.warning(f"[confirm_receive] order_state 转换失败，原始值: {raw_state}")
+        return None
+
+
+def _payload(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "status": row["status"],
+        "ok": row["status"] != "failed" and row["status"] != "rejected",
+        "wx_verified": row["status"] == "confirmed",
+        "wx_state": row.get("wx_state"),
+        "attempts": row.get("attempts", 0),
+        "message": row.get("message") or "",
+    }
+
+
+class ReceiveConfirmVerifier:
+    """确认收货意图登记与后台核验"""
+
+    # ------------------------------------------------------------------ #
+    # 请求内：登记意图 / 查询结果
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def submit(order_number: str, user_id: Optional[int] = None,
+               wx_confirm_result: Optional[Dict] = None) -> Dict[str, Any]:
+        """校验订单并登记确认收货意图，立即返回（ok=True 表示已受理，最终结果见 result）"""
+        result = {"ok": False, "message": "", "wx_verified": False, "status": None}
+
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT id, user_id, status, transaction_id FROM orders WHERE order_number=%s",
+                    (order_number,)
+                )
+                order = cur.fetchone()
+                if not order:
+                    result["message"] = "订单不存在"
+                    return result
+                if user_id and order['user_id'] != user_id:
+                    result["message"] = "无权操作该订单"
+                    return result
+                if order['status'] != 'pending_recv':
+                    result["message"] = f"订单状态不正确，当前状态：{order['status']}"
+                    return result
+                transaction_id = order.get('transaction_id')
+                if not transaction_id:
+                    result["message"] = "缺少微信支付单号，无法确认收货"
+                    return result
+                if wx_confirm_result and wx_confirm_result.get('order_id') != transaction_id:
+                    logger.warning("[confirm_receive] 前端传入的transaction_id与订单不符")
+                    result["message"] = "验证失败：订单信息不匹配"
+                    return result
+
+                # 已在核验中的记录保持原有退避进度；此前被拒绝/失败的重新开始
+                cur.execute(
+                    """INSERT INTO order_receive_confirms
+                       (order_id, order_number, user_id, transaction_id, status, attempts, next_check_at, message)
+                       VALUES (%s, %s, %s, %s, 'pending', 0, NOW(), %s)
+                       ON DUPLICATE KEY UPDATE
+                           attempts = IF(status = 'pending', attempts, 0),
+                           next_check_at = IF(status = 'pending', next_check_at, NOW()),
+                           status = 'pending',
+                           message = VALUES(message)""",
+                    (order['id'], order_number, order['user_id'], transaction_id, "正在核验微信收货状态")
+                )
+                conn.commit()
+
+        pending = {"status": "pending", "wx_state": None, "attempts": 0, "message": "正在核验微信收货状态"}
+        order_status_channel.publish(order_number, _payload(pending))
+        result.update(ok=True, status="pending", message="已收到确认收货，正在核验微信收货状态")
+        return result
+
+    @staticmethod
+    def result(order_number: str) -> Optional[Dict[str, Any]]:
+        """确认收货核验结果：先读订单状态通道，没有时查数据库"""
+        cached = order_status_channel.latest(order_number)
+        if cached is not None:
+            return cached
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """SELECT order_number, status, attempts, wx_state, message
+                       FROM order_receive_confirms WHERE order_number=%s""",
+                    (order_number,)
+                )
+                row = cur.fetchone()
+        return {"order_number": order_number, **_payload(row)} if row else None
+
+    # ------------------------------------------------------------------ #
+    # 后台核验
+    # ------------------------------------------------------------------ #
+    def run_once(self) -> int:
+        """核验一批到期记录，返回处理数量"""
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """SELECT order_id, order_number, transaction_id, attempts
+                       FROM order_receive_confirms
+                       WHERE status = 'pending' AND next_check_at <= NOW()
+                       ORDER BY next_check_at LIMIT %s""",
+                    (RECEIVE_CONFIRM_BATCH_SIZE,)
+                )
+                rows: List[Dict[str, Any]] = cur.fetchall()
+
+        # 查询微信期间不持有数据库连接
+        for row in rows:
+            try:
+                wx_result = WechatShippingManager.get_order(row["transaction_id"])
+            except Exception as e:
+                logger.error(f"[confirm_receive] 查询订单 {row['order_number']} 微信状态异常: {e}")
+                self._retry_or_fail(row, None, "failed", "校验微信收货状态失败，请稍后重试")
+                continue
+
+            if str(wx_result.get('errcode', '')) != '0':
+                self._retry_or_fail(row, None, "failed",
+                                    f"查询微信订单状态失败：{wx_result.get('errmsg', '未知错误')}")
+                continue
+
+            order_state = _order_state(wx_result)
+            if order_state in _VERIFIED_STATES:
+                self._complete(row, order_state, wx_result)
+            elif order_state is None:
+                self._retry_or_fail(row, None, "rejected", "微信状态尚未同步，请稍等2-3分钟后重试")
+            else:
+                state_name = _STATE_NAMES.get(order_state, f"异常状态({order_state})")
+                self._retry_or_fail(row, order_state, "rejected",
+                                    f"微信端未确认收货，当前状态：{state_name}。请确保在微信小程序内点击确认收货按钮。")
+        return len(rows)
+
+    def run_forever(self, stop_event: Optional[threading.Event] = None) -> None:
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                if self.run_once() >= RECEIVE_CONFIRM_BATCH_SIZE:
+                    continue  # 还有积压，立即处理下一批
+            except Exception as e:
+                logger.error(f"[confirm_receive] 核验任务异常: {e}", exc_info=True)
+            stop_event.wait(RECEIVE_CONFIRM_POLL_SECONDS)
+
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _retry_or_fail(row: Dict[str, Any], wx_state: Optional[int], final_status: str, message: str) -> None:
+        """未确认：按退避表安排下次查询；次数用完后记为最终状态并发布"""
+        attempts = row["attempts"] + 1
+        finished = attempts > len(RECEIVE_CONFIRM_BACKOFF_SECONDS)
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                if finished:
+                    cur.execute(
+                        """UPDATE order_receive_confirms
+                           SET status = %s, attempts = %s, wx_state = %s, message = %s
+                           WHERE order_id = %s AND status = 'pending'""",
+                        (final_status, attempts, wx_state, message, row["order_id"])
+                    )
+                else:
+                    cur.execute(
+                        """UPDATE order_receive_confirms
+                           SET attempts = %s, wx_state = %s,
+                               next_check_at = DATE_ADD(NOW(), INTERVAL %s SECOND)
+                           WHERE order_id = %s AND status = 'pending'""",
+                        (attempts, wx_state, RECEIVE_CONFIRM_BACKOFF_SECONDS[attempts - 1], row["order_id"])
+                    )
+                conn.commit()
+        if finished:
+            logger.warning(f"[confirm_receive] 订单 {row['order_number']} 核验结束（{final_status}）: {message}")
+            order_status_channel.publish(row["order_number"], _payload(
+                {"status": final_status, "wx_state": wx_state, "attempts": attempts, "message": message}))
+
+    @staticmethod
+    def _complete(row: Dict[str, Any], order_state: int, wx_result: Dict[str, Any]) -> None:
+        """微信已确认：一个短事务内完成订单、记录核验结果和日志"""
+        verify_msg = _VERIFIED_STATES[order_state]
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                changed = transition(cur, 'completed', [row["order_id"]], from_statuses=('pending_recv',),
+                                     reason=f"用户确认收货({verify_msg})", source="confirm_receive")
+                status = "confirmed"
+                message = f"确认收货成功（{verify_msg}），资金将在微信侧结算"
+                if not changed:
+                    # 订单已被微信状态同步 / 自动收货完成，或已进入退款等其他状态
+                    cur.execute("SELECT status FROM orders WHERE id = %s", (row["order_id"],))
+                    current = (cur.fetchone() or {}).get("status")
+                    if current != "completed":
+                        status, message = "failed", f"订单状态已变更为：{current}"
+                cur.execute(
+                    """UPDATE order_receive_confirms
+                       SET status = %s, attempts = attempts + 1, wx_state = %s, message = %s
+                       WHERE order_id = %s""",
+                    (status, order_state, message, row["order_id"])
+                )
+                cur.execute(
+                    """INSERT INTO wechat_shipping_logs
+                       (order_id, order_number, transaction_id, action_type, is_success, remark, response_data, created_at)
+                       VALUES (%s, %s, %s, 'sync', 1, %s, %s, NOW())""",
+                    (row["order_id"], row["order_number"], row["transaction_id"],
+                     "用户确认收货, 微信验证: True", json.dumps(wx_result, ensure_ascii=False))
+                )
+                conn.commit()
+
+        order_detail_cache.invalidate(row["order_number"])
+        logger.info(f"[confirm_receive] 订单 {row['order_number']} {message}")
+        order_status_channel.publish(row["order_number"], _payload(
+            {"status": status, "wx_state": order_state, "attempts": row["attempts"] + 1, "message": message}))
@@ -4,6 +4,9 @@ from typing import Optional
 from core.database import get_conn
 from core.table_access import build_dynamic_select
 from services.finance_service import reverse_split_on_refund
+from services.order_transitions import transition
+from services import order_detail_cache
+from services.product_sales_stats import sales_changed
 from typing import Dict, Any
 
 router = APIRouter()
@@ -74,25 +77,21 @@ class RefundManager:
                     return False
 
                 # 4️⃣ 回写订单退款状态
+                sales_changed(cur, order_numbers=[order_number], new_refund_status=new_status)
                 cur.execute(
                     "UPDATE orders SET refund_status=%s WHERE order_number=%s",
                     (new_status, order_number)
                 )
 
                 if approve:
-                    cur.execute(
-                        "UPDATE orders SET status='refund' WHERE order_number=%s",
-                        (order_number,)
-                    )
+                    transition(cur, 'refund', order_numbers=[order_number], reason="退款审核通过", source="refund")
                     reverse_split_on_refund(order_number)
                 else:
-                    cur.execute(
-                        "UPDATE orders SET status='completed' WHERE order_number=%s",
-                        (order_number,)
-                    )
+                    transition(cur, 'completed', order_numbers=[order_number], reason="退款申请被拒绝", source="refund")
 
                 conn.commit()
-                return True
+        order_detail_cache.invalidate(order_number)
+        return True
 
     @staticmethod
     def progress(order_number: str) -> Optional[Dict[str, Any]]:
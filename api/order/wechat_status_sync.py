@@ -0,0 +1,196 @@
+# api/order/wechat_status_sync.py - 微信发货状态批量同步
+"""
+已发货订单的微信侧状态同步
+
+每个周期处理全部待同步订单：
+- 按主键分批从数据库取出订单（不在 HTTP 请求期间持有连接）
+- 每批用 httpx.AsyncClient 并发查询微信 get_order，并发数与整体 QPS 由信号量 + 令牌桶限制
+- 查询结果在一个短事务内落库：同步时间一条 UPDATE … WHERE id IN，状态变更经流转引擎批量执行，日志多行 INSERT
+- 每个周期的处理量、耗时、吞吐量写入日志并上报到后台任务租约信息
+"""
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+import httpx
+
+from core.config import WX_SYNC_PAGE_SIZE, WX_SYNC_CONCURRENCY, WX_SYNC_QPS
+from core.database import get_conn
+from core.logging import get_logger
+from core.rate_limiter import AsyncTokenBucket
+from services.order_transitions import transition
+from .wechat_shipping import WechatShippingManager
+
+logger = get_logger(__name__)
+
+# 微信状态：1待发货 2已发货 3确认收货 4交易完成 5已退款
+_COMPLETED_STATES = {3: "微信状态同步：确认收货(3)", 4: "微信状态同步：交易完成(4)"}
+_TOKEN_EXPIRED_ERRCODE = 40001
+
+
+def _order_state(wx_result: Dict[str, Any]) -> Optional[int]:
+    # 兼容 order_state 在顶层或嵌套在 order 对象中的情况
+    raw_state = wx_result.get('order_state') or (wx_result.get('order') or {}).get('order_state')
+    try:
+        return int(raw_state) if raw_state is not None else None
+    except (ValueError, TypeError):
+        logger.warning(f"[wx_sync] order_state 转换失败，原始值: {raw_state}")
+        return None
+
+
+def _placeholders(ids: List[int]) -> str:
+    return ",".join(["%s"] * len(ids))
+
+
+class WechatStatusSync:
+    """已发货订单微信状态同步引擎"""
+
+    def __init__(self, concurrency: int = WX_SYNC_CONCURRENCY, qps: float = WX_SYNC_QPS,
+                 page_size: int = WX_SYNC_PAGE_SIZE):
+        self.concurrency = concurrency
+        self.qps = qps
+        self.page_size = page_size
+
+    # ------------------------------------------------------------------ #
+    def run_cycle(self) -> Dict[str, Any]:
+        """处理全部待同步订单，返回本周期统计"""
+        started = time.monotonic()
+        stats = {"checked": 0, "completed": 0, "wx_failed": 0, "http_failed": 0,
+                 "batches": 0, "http_seconds": 0.0, "rate_wait_seconds": 0.0}
+        last_id = 0
+        while True:
+            orders = self._load_batch(last_id)
+            if not orders:
+                break
+            last_id = orders[-1]["id"]
+            stats["batches"] += 1
+
+            http_started = time.monotonic()
+            results, waited = asyncio.run(self._fetch_states(orders))
+            stats["http_seconds"] += time.monotonic() - http_started
+            stats["rate_wait_seconds"] += waited
+
+            self._apply(orders, results, stats)
+            if len(orders) < self.page_size:
+                break
+
+        elapsed = time.monotonic() - started
+        stats["elapsed_seconds"] = round(elapsed, 3)
+        stats["http_seconds"] = round(stats["http_seconds"], 3)
+        stats["rate_wait_seconds"] = round(stats["rate_wait_seconds"], 3)
+        stats["orders_per_second"] = round(stats["checked"] / elapsed, 2) if elapsed > 0 else 0.0
+        logger.info(
+            f"[wx_sync] 本周期同步 {stats['checked']} 单（完成 {stats['completed']}，微信返回失败 {stats['wx_failed']}，"
+            f"请求异常 {stats['http_failed']}），耗时 {stats['elapsed_seconds']}s，{stats['orders_per_second']} 单/秒"
+        )
+        return stats
+
+    def _load_batch(self, last_id: int) -> List[Dict[str, Any]]:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                # 已发货(pending_recv)且已同步到微信、最近1小时内未同步过的订单
+                cur.execute("""
+                    SELECT id, order_number, transaction_id
+                    FROM orders
+                    WHERE id > %s
+                      AND status = 'pending_recv'
+                      AND wechat_shipping_status = 1
+                      AND transaction_id IS NOT NULL
+                      AND (
+                          wechat_last_sync_time IS NULL
+                          OR wechat_last_sync_time <= DATE_SUB(NOW(), INTERVAL 1 HOUR)
+                      )
+                    ORDER BY id
+                    LIMIT %s
+                """, (last_id, self.page_size))
+                return cur.fetchall()
+
+    # ------------------------------------------------------------------ #
+    async def _fetch_states(self, orders: List[Dict[str, Any]]) -> Tuple[Dict[int, Any], float]:
+        """并发查询一批订单；返回 {order_id: 微信返回 dict 或 Exception}"""
+        bucket = AsyncTokenBucket(self.qps)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        token = {"value": WechatShippingManager._get_access_token()}
+        token_lock = asyncio.Lock()
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+
+        async def fetch(client: httpx.AsyncClient, order: Dict[str, Any]):
+            body = json.dumps({"transaction_id": order["transaction_id"]}, ensure_ascii=False).encode("utf-8")
+            async with semaphore:
+                for attempt in range(2):
+                    await bucket.acquire()
+                    used_token = token["value"]
+                    resp = await client.post(
+                        WechatShippingManager.GET_ORDER_URL,
+                        params={"access_token": used_token},
+                        content=body,
+                        headers={'Content-Type': 'application/json; charset=utf-8'}
+                    )
+                    resp.raise_for_status()
+                    result = resp.json()
+                    if result.get("errcode") != _TOKEN_EXPIRED_ERRCODE or attempt:
+                        return result
+                    # Token 过期：只由一个协程刷新，其余复用新 token
+                    async with token_lock:
+                        if token["value"] == used_token:
+                            token["value"] = await asyncio.to_thread(
+                                WechatShippingManager._get_access_token, True)
+            return result
+
+        async with httpx.AsyncClient(timeout=10, limits=limits) as client:
+            outcomes = await asyncio.gather(*(fetch(client, o) for o in orders), return_exceptions=True)
+        return {o["id"]: r for o, r in zip(orders, outcomes)}, bucket.waited_seconds
+
+    def _apply(self, orders: List[Dict[str, Any]], results: Dict[int, Any], stats: Dict[str, Any]) -> None:
+        """一个事务内批量落库"""
+        synced_ids, completed_ids, log_rows = [], [], []
+        for order in orders:
+            wx_result = results.get(order["id"])
+            if isinstance(wx_result, Exception) or wx_result is None:
+                # 请求异常不更新同步时间，下个周期重试
+                stats["http_failed"] += 1
+                logger.error(f"[wx_sync] 同步订单 {order['order_number']} 状态异常: {wx_result}")
+                continue
+
+            synced_ids.append(order["id"])
+            response_json = json.dumps(wx_result, ensure_ascii=False)
+            if str(wx_result.get('errcode', '')) == '0':
+                order_state = _order_state(wx_result)
+                if order_state in _COMPLETED_STATES:
+                    completed_ids.append(order["id"])
+                    log_rows.append((order["id"], order["order_number"], order["transaction_id"], 1,
+                                     _COMPLETED_STATES[order_state], response_json))
+            else:
+                stats["wx_failed"] += 1
+                logger.warning(f"[wx_sync] 查询订单 {order['order_number']} 微信状态失败: {wx_result.get('errmsg')}")
+                log_rows.append((order["id"], order["order_number"], order["transaction_id"], 0,
+                                 None, response_json))
+
+        stats["checked"] += len(synced_ids)
+        if not synced_ids:
+            return
+
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"UPDATE orders SET wechat_last_sync_time = NOW() WHERE id IN ({_placeholders(synced_ids)})",
+                    tuple(synced_ids)
+                )
+                if completed_ids:
+                    changed = transition(cur, 'completed', completed_ids, from_statuses=('pending_recv',),
+                                         reason="微信状态同步：确认收货/交易完成", source="wx_sync")
+                    stats["completed"] += len(changed)
+                if log_rows:
+                    # VALUES 中全部为 %s 占位符时，pymysql 才会把 executemany 合并为一条多行 INSERT
+                    now = datetime.now()
+                    cur.executemany("""
+                        INSERT INTO wechat_shipping_logs
+                        (order_id, order_number, transaction_id, is_success, remark, response_data, action_type, created_at)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    """, [row + ('sync', now) for row in log_rows])
+                conn.commit()
+
+        if completed_ids:
+            logger.info(f"[wx_sync] {len(completed_ids)} 个订单微信状态已确认收货/交易完成，本地状态已同步为完成")
@@ -1,13 +1,17 @@
 import json
-from pathlib import Path
 from typing import List, Optional, Dict, Any
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
 from pydantic import BaseModel, Field, field_validator
 
 from core.database import get_conn
-from core.config import BASE_PIC_DIR, CATEGORY_CHOICES
+from core.config import BASE_PIC_DIR, CATEGORY_CHOICES, PRODUCT_BATCH_MAX_IDS, SINGLEFLIGHT_BURST_TTL_SECONDS
 from core.table_access import build_dynamic_select, get_table_structure
-from pypinyin import lazy_pinyin, Style
+from core.http_cache import conditional
+from core.singleflight import singleflight
+from services import product_search, catalog_cache, image_pipeline, image_store, product_sales_stats
+from services.pinyin_service import to_pinyin
+from services.inventory_service import InventoryService
+from services.cart_store import CartStore
 
 
 # ProductStatus 枚举定义
@@ -28,10 +32,6 @@ def register_routes(app):
     app.include_router(product_ext_router, prefix="/api", tags=["商品管理"])
 
 
-def to_pinyin(text: str) -> str:
-    return " ".join(lazy_pinyin(text, style=Style.NORMAL)).upper()
-
-
 def _validate_placeholder_count(sql_fragment: Optional[str], params: List[Any]):
     """简单校验：确保 SQL 片段中的 `%s` 占位符数量与 params 数量一致。
 
@@ -130,6 +130,65 @@ def build_product_dict(product: Dict[str, Any], skus: List[Dict[str, Any]] = Non
     return base
 
 
+def hydrate_products(cur, products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """批量取 SKU、属性、图片尺寸与销量汇总（四条 IN 查询）并组装商品字典，保持 products 的顺序"""
+    if not products:
+        return []
+    ids = [p['id'] for p in products]
+    id_filter = f"product_id IN ({','.join(['%s'] * len(ids))})"
+
+    select_sql = build_dynamic_select(
+        cur,
+        "product_skus",
+        where_clause=id_filter,
+        order_by="id",
+        select_fields=["id", "product_id", "sku_code", "price", "original_price", "stock", "specifications"]
+    )
+    cur.execute(select_sql, tuple(ids))
+    skus_by_product: Dict[int, List[Dict[str, Any]]] = {}
+    for s in cur.fetchall():
+        skus_by_product.setdefault(s['product_id'], []).append(
+            {"id": s['id'], "sku_code": s['sku_code'], "price": float(s['price']),
+             "original_price": float(s['original_price']) if s['original_price'] else None,
+             "stock": s['stock'], "specifications": s['specifications']})
+
+    select_sql = build_dynamic_select(
+        cur,
+        "product_attributes",
+        where_clause=id_filter,
+        order_by="id",
+        select_fields=["product_id", "name", "value"]
+    )
+    cur.execute(select_sql, tuple(ids))
+    attributes_by_product: Dict[int, List[Dict[str, Any]]] = {}
+    for a in cur.fetchall():
+        attributes_by_product.setdefault(a['product_id'], []).append({"name": a['name'], "value": a['value']})
+
+    result = [build_product_dict(p, skus_by_product.get(p['id'], []), attributes_by_product.get(p['id'], []))
+              for p in products]
+
+    # 已处理完成的图片带上各尺寸地址；列表页用 list_image（360 宽缩略图），未处理完成时退回主图
+    variants = image_pipeline.get_variants(cur, [url for p in result for url in _image_urls(p)])
+    for p in result:
+        p["image_variants"] = {url: variants[url] for url in _image_urls(p) if url in variants}
+        main = p.get("main_image")
+        p["list_image"] = variants.get(main, {}).get("list", main) if main else None
+
+    # 销量读预计算的汇总，不扫描订单明细
+    sales = product_sales_stats.get_sales(cur, ids)
+    for p in result:
+        p["sold_quantity"] = int(sales[p["id"]]["sold_quantity"]) if p["id"] in sales else 0
+    return result
+
+
+def _image_urls(product: Dict[str, Any]) -> List[str]:
+    urls = [product.get("main_image")] + list(product.get("banner_images") or [])
+    detail = product.get("detail_images")
+    if isinstance(detail, list):
+        urls += detail
+    return [u for u in dict.fromkeys(urls) if isinstance(u, str) and u]
+
+
 class SkuCreate(BaseModel):
     sku_code: str
     price: float = Field(..., ge=0)  # 商品现价
@@ -152,6 +211,7 @@ class SkuUpdate(BaseModel):
     original_price: Optional[float] = Field(None, ge=0)
     stock: Optional[int] = Field(None, ge=0)
     specifications: Optional[Dict[str, Any]] = None
+    is_hot: Optional[bool] = None  # 热门SKU：下单时先在 Redis 预扣库存
 
 
 class ProductCreate(BaseModel):
@@ -232,105 +292,35 @@ def search_products(
 ):
     """
     1. 按空格拆词，所有词必须同时命中（AND）
-    2. SKU编码改为精确匹配（=），其他字段保持模糊搜索（LIKE）
-    3. 每个词再拆单字（OR）保证召回
-    4. 全品类返回，不影响原有环境
+    2. SKU编码精确匹配，其他字段（名称/描述/拼音及首字母/分类/商家名）走搜索索引 product_search
+    3. 按相关度排序（商品名命中优先），同分按新商品优先
+    4. 全品类返回，SKU 与属性批量取回
     """
     kw = keyword.strip()
     if not kw:
         return {"status": "success", "data": []}
 
-    # ---------- 拆词 ----------
-    words = [w for w in kw.split() if w]
-    if not words:
-        return {"status": "success", "data": []}
-
     with get_conn() as conn:
         with conn.cursor() as cur:
-            # 构建搜索条件：每个词在多个字段中搜索（OR），所有词必须同时命中（AND）
-            conditions = []
-            params = []
-
-            for word in words:
-                word_pattern = f"%{word}%"
-                word_conditions = []
-
-                # 商品信息模糊搜索
-                word_conditions.append("p.name LIKE %s")
-                params.append(word_pattern)
-                word_conditions.append("p.description LIKE %s")
-                params.append(word_pattern)
-                word_conditions.append("p.pinyin LIKE %s")
-                params.append(word_pattern)
-                word_conditions.append("p.category LIKE %s")
-                params.append(word_pattern)
-
-                # ✅ 修改：SKU编码改为精确搜索（不再是 LIKE %s）
-                word_conditions.append("ps.sku_code = %s")
-                params.append(word)  # 使用原始词，不带通配符
-
-                # 商家名称模糊搜索（仅商家用户）
-                word_conditions.append("(u.name LIKE %s AND u.is_merchant = 1)")
-                params.append(word_pattern)
-
-                # 每个词至少匹配一个字段
-                conditions.append("(" + _safe_concat_or(word_conditions) + ")")
-
-            # 所有词必须同时命中
-            where_clause = " AND ".join(conditions)
-
-            # 验证占位符数量与参数数量一致（防止不安全拼接）
-            _validate_placeholder_count(where_clause, params)
-
-            # 构建查询SQL
-            sql = f"""
-                SELECT DISTINCT p.*, u.name as merchant_name
-                FROM products p
-                INNER JOIN product_skus ps ON ps.product_id = p.id
-                LEFT JOIN users u ON u.id = p.user_id
-                WHERE {where_clause}
-                ORDER BY p.id DESC
-                LIMIT 200
-            """
-
-            cur.execute(sql, tuple(params))
-            products = cur.fetchall()
-
-            # 获取每个商品的 SKUs 和 attributes
-            result_data = []
-            for product in products:
-                product_id = product['id']
-
-                # 获取 SKUs
-                select_sql = build_dynamic_select(
-                    cur,
-                    "product_skus",
-                    where_clause="product_id = %s",
-                    select_fields=["id", "sku_code", "price", "original_price", "stock", "specifications"]
-                )
-                cur.execute(select_sql, (product_id,))
-                skus = cur.fetchall()
-                skus = [{"id": s['id'], "sku_code": s['sku_code'], "price": float(s['price']),
-                         "original_price": float(s['original_price']) if s['original_price'] else None,
-                         "stock": s['stock'], "specifications": s['specifications']} for s in skus]
-
-                # 获取 attributes
-                select_sql = build_dynamic_select(
-                    cur,
-                    "product_attributes",
-                    where_clause="product_id = %s",
-                    select_fields=["name", "value"]
-                )
-                cur.execute(select_sql, (product_id,))
-                attributes = cur.fetchall()
-                attributes = [{"name": a['name'], "value": a['value']} for a in attributes]
-
-                result_data.append(build_product_dict(product, skus, attributes))
+            product_ids = product_search.search(cur, kw)
+            if not product_ids:
+                return {"status": "success", "data": []}
+
+            cur.execute(
+                f"""SELECT p.*, u.name AS merchant_name
+                    FROM products p
+                    LEFT JOIN users u ON u.id = p.user_id
+                    WHERE p.id IN ({','.join(['%s'] * len(product_ids))})""",
+                tuple(product_ids)
+            )
+            by_id = {p['id']: p for p in cur.fetchall()}
+            products = [by_id[pid] for pid in product_ids if pid in by_id]
 
-            return {"status": "success", "data": result_data}
+            return {"status": "success", "data": hydrate_products(cur, products)}
 
 
 @router.get("/products", summary="📄 商品列表分页")
+@singleflight(ttl=SINGLEFLIGHT_BURST_TTL_SECONDS)
 def get_all_products(
         category: Optional[str] = Query(None, description="分类筛选"),
         status: Optional[int] = Query(None, description="状态筛选"),
@@ -339,129 +329,135 @@ def get_all_products(
         page: int = Query(1, ge=1, description="页码"),
         size: int = Query(10, ge=1, le=100, description="每页条数"),
 ):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            # 构建查询条件
-            where_clauses = []
-            params = []
-
-            if category:
-                where_clauses.append("category = %s")
-                params.append(category)
-            if status is not None:
-                where_clauses.append("status = %s")
-                params.append(status)
-            if is_member_product is not None:
-                where_clauses.append("is_member_product = %s")
-                params.append(is_member_product)
-            if user_id is not None:  # ✅ 新增：支持按商家筛选
-                where_clauses.append("user_id = %s")
-                params.append(user_id)
-
-            where_sql = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
-
-            # 验证占位符数量与参数数量一致（防止不安全拼接）
-            if where_clauses:
-                _validate_placeholder_count(" AND ".join(where_clauses), params)
-
-            # 查询总数
-            count_sql = f"SELECT COUNT(*) as total FROM products{where_sql}"
-            cur.execute(count_sql, tuple(params))
-            total = cur.fetchone()['total']
-
-            # 查询商品列表 - 使用动态表访问
-            offset = (page - 1) * size
-            where_clause_clean = " AND ".join(where_clauses) if where_clauses else None
-            # 构建基础 SQL（不包含 LIMIT）
-            select_sql_base = build_dynamic_select(
-                cur,
-                "products",
-                where_clause=where_clause_clean,
-                order_by="id DESC"
-            )
-            # 添加 LIMIT 和 OFFSET（使用参数化查询）
-            select_sql = f"{select_sql_base} LIMIT %s OFFSET %s"
-            cur.execute(select_sql, tuple(params + [size, offset]))
-            products = cur.fetchall()
-
-            # 获取每个商品的 SKUs 和 attributes
-            result_data = []
-            for product in products:
-                product_id = product['id']
-
-                # 获取 SKUs
-                select_sql = build_dynamic_select(
+    def _load():
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                # 构建查询条件
+                where_clauses = []
+                params = []
+
+                if category:
+                    where_clauses.append("category = %s")
+                    params.append(category)
+                if status is not None:
+                    where_clauses.append("status = %s")
+                    params.append(status)
+                if is_member_product is not None:
+                    where_clauses.append("is_member_product = %s")
+                    params.append(is_member_product)
+                if user_id is not None:  # ✅ 新增：支持按商家筛选
+                    where_clauses.append("user_id = %s")
+                    params.append(user_id)
+
+                where_sql = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+
+                # 验证占位符数量与参数数量一致（防止不安全拼接）
+                if where_clauses:
+                    _validate_placeholder_count(" AND ".join(where_clauses), params)
+
+                # 查询总数
+                count_sql = f"SELECT COUNT(*) as total FROM products{where_sql}"
+                cur.execute(count_sql, tuple(params))
+                total = cur.fetchone()['total']
+
+                # 查询商品列表 - 使用动态表访问
+                offset = (page - 1) * size
+                where_clause_clean = " AND ".join(where_clauses) if where_clauses else None
+                # 构建基础 SQL（不包含 LIMIT）
+                select_sql_base = build_dynamic_select(
                     cur,
-                    "product_skus",
-                    where_clause="product_id = %s",
-                    # ✅ 修改：查询新增字段 original_price 和 specifications
-                    select_fields=["id", "sku_code", "price", "original_price", "stock", "specifications"]
+                    "products",
+                    where_clause=where_clause_clean,
+                    order_by="id DESC"
                 )
-                cur.execute(select_sql, (product_id,))
-                skus = cur.fetchall()
-                # ✅ 修改：格式化新增字段
-                skus = [{"id": s['id'], "sku_code": s['sku_code'], "price": float(s['price']),
-                         "original_price": float(s['original_price']) if s['original_price'] else None,
-                         "stock": s['stock'], "specifications": s['specifications']} for s in skus]
+                # 添加 LIMIT 和 OFFSET（使用参数化查询）
+                select_sql = f"{select_sql_base} LIMIT %s OFFSET %s"
+                cur.execute(select_sql, tuple(params + [size, offset]))
+                products = cur.fetchall()
 
-                # 获取 attributes
-                select_sql = build_dynamic_select(
-                    cur,
-                    "product_attributes",
-                    where_clause="product_id = %s",
-                    select_fields=["name", "value"]
-                )
-                cur.execute(select_sql, (product_id,))
-                attributes = cur.fetchall()
-                attributes = [{"name": a['name'], "value": a['value']} for a in attributes]
+                # SKU 与属性整页批量取回（两条 IN 查询）
+                result_data = hydrate_products(cur, products)
 
-                result_data.append(build_product_dict(product, skus, attributes))
+                return {"status": "success", "total": total, "page": page, "size": size, "data": result_data}
 
-            return {"status": "success", "total": total, "page": page, "size": size, "data": result_data}
+    # 分类列表等读多写少，按筛选条件与分页缓存，任何商品变化后失效
+    return catalog_cache.cached_list(
+        "products",
+        {"category": category, "status": status, "is_member_product": is_member_product,
+         "user_id": user_id, "page": page, "size": size},
+        _load
+    )
 
 
-@router.get("/products/{id}", summary="📦 查询单个商品")
-def get_product(id: int):
+def load_products(product_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """按 id 批量查询并组装商品字典（目录缓存未命中时的加载函数）"""
     with get_conn() as conn:
         with conn.cursor() as cur:
-            # 查询商品
             select_sql = build_dynamic_select(
                 cur,
                 "products",
-                where_clause="id = %s"
+                where_clause=f"id IN ({','.join(['%s'] * len(product_ids))})"
             )
-            cur.execute(select_sql, (id,))
-            product = cur.fetchone()
-            if not product:
-                raise HTTPException(status_code=404, detail="商品不存在")
+            cur.execute(select_sql, tuple(product_ids))
+            return {p['id']: p for p in hydrate_products(cur, cur.fetchall())}
 
-            # 获取 SKUs
-            select_sql = build_dynamic_select(
-                cur,
-                "product_skus",
-                where_clause="product_id = %s",
-                # ✅ 修改：查询新增字段 original_price 和 specifications
-                select_fields=["id", "sku_code", "price", "original_price", "stock", "specifications"]
-            )
-            cur.execute(select_sql, (id,))
-            skus = cur.fetchall()
-            # ✅ 修改：格式化新增字段
-            skus = [{"id": s['id'], "sku_code": s['sku_code'], "price": float(s['price']),
-                     "original_price": float(s['original_price']) if s['original_price'] else None,
-                     "stock": s['stock'], "specifications": s['specifications']} for s in skus]
-
-            # 获取 attributes
-            select_sql = build_dynamic_select(
-                cur,
-                "product_attributes",
-                where_clause="product_id = %s",
-                select_fields=["name", "value"]
-            )
-            cur.execute(select_sql, (id,))
-            attributes = cur.fetchall()
-            attributes = [{"name": a['name'], "value": a['value']} for a in attributes]
 
-            return {"status": "success", "data": build_product_dict(product, skus, attributes)}
+# 稀疏字段中由 SKU / 图片派生的字段：价格取最低 SKU 价，库存为各 SKU 之和，缩略图优先用处理后的 thumb 尺寸
+_DERIVED_FIELDS = {
+    "price": lambda p: min((s["price"] for s in p.get("skus") or []), default=None),
+    "stock": lambda p: sum(s.get("stock") or 0 for s in p.get("skus") or []),
+    "thumbnail": lambda p: (p.get("image_variants") or {}).get(p.get("main_image"), {}).get("thumb")
+                           or p.get("list_image"),
+}
+
+# 可选的稀疏字段：商品列、hydrate_products 组装的字段与派生字段
+_SPARSE_FIELDS = set(PRODUCT_COLUMNS) | {"skus", "attributes", "merchant_name", "banner_images", "image_variants",
+                                         "list_image", "sold_quantity"} | set(_DERIVED_FIELDS)
+
+
+def _project(product: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """按 fields 取出商品的部分字段（None 表示完整商品）"""
+    if not fields:
+        return product
+    return {f: _DERIVED_FIELDS[f](product) if f in _DERIVED_FIELDS else product.get(f) for f in fields}
+
+
+@router.get("/products/batch", summary="📦 批量查询商品")
+def get_products_batch(
+        ids: str = Query(..., description=f"逗号分隔的商品ID，最多 {PRODUCT_BATCH_MAX_IDS} 个"),
+        fields: Optional[str] = Query(None, description="逗号分隔的返回字段，如 id,name,price,thumbnail,stock；不传返回完整商品")
+):
+    """按请求顺序返回商品（重复的ID只返回一次）；命中目录缓存的直接返回，未命中的一次批量加载"""
+    try:
+        product_ids = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids 必须是逗号分隔的整数")
+    if not product_ids:
+        raise HTTPException(status_code=400, detail="ids 不能为空")
+    if len(product_ids) > PRODUCT_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"单次最多查询 {PRODUCT_BATCH_MAX_IDS} 个商品")
+
+    field_list = [f.strip() for f in (fields or "").split(",") if f.strip()] or None
+    if field_list:
+        unknown = [f for f in field_list if f not in _SPARSE_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"不支持的字段: {', '.join(unknown)}")
+
+    products = catalog_cache.get_products(product_ids, load_products)
+    return {
+        "status": "success",
+        "data": [_project(products[pid], field_list) for pid in product_ids if pid in products],
+        "missing": [pid for pid in product_ids if pid not in products]
+    }
+
+
+@router.get("/products/{id}", summary="📦 查询单个商品")
+@conditional(lambda id: catalog_cache.product_version(id))  # 商品写入与销量变化提交后均递增
+def get_product(id: int):
+    product = catalog_cache.get_product(id, load_products)
+    if not product:
+        raise HTTPException(status_code=404, detail="商品不存在")
+    return {"status": "success", "data": product}
 
 
 @router.post("/products", summary="➕ 新增商品")
@@ -534,7 +530,9 @@ def add_product(payload: ProductCreate):
                             VALUES (%s, %s, %s)
                         """, (product_id, a_name, a_value))
 
+                product_search.reindex(cur, [product_id])
                 conn.commit()
+                catalog_cache.bump([product_id])
 
                 # 查询创建的商品
                 select_sql = build_dynamic_select(
@@ -545,32 +543,8 @@ def add_product(payload: ProductCreate):
                 cur.execute(select_sql, (product_id,))
                 product = cur.fetchone()
 
-                # 获取 SKUs
-                select_sql = build_dynamic_select(
-                    cur,
-                    "product_skus",
-                    where_clause="product_id = %s",
-                    select_fields=["id", "sku_code", "price", "original_price", "stock", "specifications"]
-                )
-                cur.execute(select_sql, (product_id,))
-                skus = cur.fetchall()
-                skus = [{"id": s['id'], "sku_code": s['sku_code'], "price": float(s['price']),
-                         "original_price": float(s['original_price']) if s['original_price'] else None,
-                         "stock": s['stock'], "specifications": s['specifications']} for s in skus]
-
-                # 获取 attributes
-                select_sql = build_dynamic_select(
-                    cur,
-                    "product_attributes",
-                    where_clause="product_id = %s",
-                    select_fields=["name", "value"]
-                )
-                cur.execute(select_sql, (product_id,))
-                attributes = cur.fetchall()
-                attributes = [{"name": a['name'], "value": a['value']} for a in attributes]
-
                 return {"status": "success", "message": "商品已创建",
-                        "data": build_product_dict(product, skus, attributes)}
+                        "data": hydrate_products(cur, [product])[0]}
             except Exception as e:
                 conn.rollback()
                 raise HTTPException(status_code=400, detail=f"创建商品失败: {str(e)}")
@@ -591,6 +565,8 @@ def update_product(id: int, payload: ProductUpdate):
                 product = cur.fetchone()
                 if not product:
                     raise HTTPException(status_code=404, detail="商品不存在")
+                cur.execute("SELECT id FROM product_skus WHERE product_id = %s", (id,))
+                old_sku_ids = [r["id"] for r in cur.fetchall()]
 
                 # 获取当前商品的会员状态
                 current_is_member = bool(product.get('is_member_product', 0))
@@ -601,6 +577,9 @@ def update_product(id: int, payload: ProductUpdate):
                 update_params = []
 
                 update_data = payload.dict(exclude_unset=True, exclude={"attributes", "skus"})
+                # 改名时同步拼音
+                if update_data.get("name"):
+                    update_data["pinyin"] = to_pinyin(update_data["name"])
 
                 for key, value in update_data.items():
                     if key == "freight":
@@ -640,8 +619,8 @@ def update_product(id: int, payload: ProductUpdate):
                             # 插入新SKU
                             cur.execute("""
                                 INSERT INTO product_skus 
-                                (product_id, sku_code, price, original_price, stock, specifications)
-                                VALUES (%s, %s, %s, %s, %s, %s)
+                                (product_id, sku_code, price, original_price, stock, specifications, is_hot)
+                                VALUES (%s, %s, %s, %s, %s, %s, %s)
                             """, (
                                 id,
                                 sku_update.sku_code,
@@ -649,7 +628,8 @@ def update_product(id: int, payload: ProductUpdate):
                                 sku_update.original_price,
                                 sku_update.stock,
                                 json.dumps(sku_update.specifications, ensure_ascii=False)
-                                if sku_update.specifications else None
+                                if sku_update.specifications else None,
+                                1 if sku_update.is_hot else 0
                             ))
                             # ✅ 修复：获取新插入的ID并加入列表，避免被删除
                             new_sku_id = cur.lastrowid
@@ -681,6 +661,9 @@ def update_product(id: int, payload: ProductUpdate):
                         if sku_update.specifications is not None:
                             sku_fields.append("specifications = %s")
                             sku_params.append(json.dumps(sku_update.specifications, ensure_ascii=False))
+                        if sku_update.is_hot is not None:
+                            sku_fields.append("is_hot = %s")
+                            sku_params.append(1 if sku_update.is_hot else 0)
 
                         if sku_fields:
                             # 验证SKU属于该商品
@@ -745,7 +728,12 @@ def update_product(id: int, payload: ProductUpdate):
                             VALUES (%s, %s, %s)
                         """, (id, a_name, a_value))
 
+                product_search.reindex(cur, [id])
                 conn.commit()
+                catalog_cache.bump([id])
+                CartStore.invalidate_product(id, old_sku_ids)  # 购物车中的名称、价格、默认SKU快照
+                if payload.skus is not None and any(s.is_hot is not None for s in payload.skus):
+                    InventoryService.invalidate_hot_ids()
 
                 # 查询更新后的商品
                 select_sql = build_dynamic_select(
@@ -756,32 +744,8 @@ def update_product(id: int, payload: ProductUpdate):
                 cur.execute(select_sql, (id,))
                 updated_product = cur.fetchone()
 
-                # 获取所有 SKUs
-                select_sql = build_dynamic_select(
-                    cur,
-                    "product_skus",
-                    where_clause="product_id = %s",
-                    select_fields=["id", "sku_code", "price", "original_price", "stock", "specifications"]
-                )
-                cur.execute(select_sql, (id,))
-                skus = cur.fetchall()
-                skus = [{"id": s['id'], "sku_code": s['sku_code'], "price": float(s['price']),
-                         "original_price": float(s['original_price']) if s['original_price'] else None,
-                         "stock": s['stock'], "specifications": s['specifications']} for s in skus]
-
-                # 获取 attributes
-                select_sql = build_dynamic_select(
-                    cur,
-                    "product_attributes",
-                    where_clause="product_id = %s",
-                    select_fields=["name", "value"]
-                )
-                cur.execute(select_sql, (id,))
-                attributes = cur.fetchall()
-                attributes = [{"name": a['name'], "value": a['value']} for a in attributes]
-
                 return {"status": "success", "message": "商品及SKU已更新",
-                        "data": build_product_dict(updated_product, skus, attributes)}
+                        "data": hydrate_products(cur, [updated_product])[0]}
             except HTTPException:
                 raise
             except Exception as e:
@@ -830,6 +794,9 @@ def delete_product(id: int):
                 except:
                     pass
 
+                cur.execute("SELECT id FROM product_skus WHERE product_id = %s", (id,))
+                sku_ids = [r["id"] for r in cur.fetchall()]
+
                 # 执行删除操作（外键会级联删除关联数据）
                 cur.execute("DELETE FROM products WHERE id = %s", (id,))
 
@@ -837,12 +804,19 @@ def delete_product(id: int):
                 if cur.rowcount == 0:
                     raise HTTPException(status_code=404, detail="商品删除失败或已被删除")
 
+                product_search.remove(cur, [id])
+                # 内容寻址的图片只释放引用（可能被其他商品共用），无人引用后由定时任务回收
+                image_pipeline.release(cur, image_pipeline.PRODUCT_KINDS, id)
                 conn.commit()
+                catalog_cache.bump([id])
+                CartStore.invalidate_product(id, sku_ids)
 
-                # ✅ 异步删除物理文件（不影响主流程）
+                # ✅ 异步删除物理文件（不影响主流程，仅历史上传的图片）
                 if image_urls_to_delete:
                     from pathlib import Path
                     for url in image_urls_to_delete:
+                        if image_store.name_from_url(url):
+                            continue
                         try:
                             relative_path = url.lstrip('/').replace('pic/', '', 1)
                             file_path = Path(str(BASE_PIC_DIR)) / relative_path
@@ -872,9 +846,6 @@ def upload_images(
         # ✅ 修改：将轮播图大小限制从<5MB改为<10MB
         banner_images: List[UploadFile] = File([], description="轮播图，最多10张，单张<10MB，仅JPG/PNG/WEBP"),
 ):
-    from PIL import Image
-    import uuid
-
     with get_conn() as conn:
         with conn.cursor() as cur:
             try:
@@ -917,28 +888,17 @@ def upload_images(
                 except Exception:
                     banner_urls = []
 
-                category = product['category']
-                cat_path = BASE_PIC_DIR / category
-                goods_path = cat_path / str(id)
-                goods_path.mkdir(parents=True, exist_ok=True)
-
+                # 原图按内容寻址落盘（重复上传不再存储），缩放与多尺寸编码提交后在进程池中完成
+                jobs = []
                 if detail_images:
                     if len(detail_images) > 10:
                         raise HTTPException(status_code=400, detail="详情图最多10张")
                     for f in detail_images:
-                        ext = Path(f.filename).suffix.lower()
-                        if ext not in {".jpg", ".jpeg", ".png", ".webp"}:
-                            raise HTTPException(status_code=400, detail="仅支持 JPG/PNG/WEBP")
                         # ✅ 修改：将详情图大小限制从3MB改为10MB
-                        if f.size > 10 * 1024 * 1024:
-                            raise HTTPException(status_code=400, detail="详情图单张大小不能超过 10MB")
-                        file_name = f"detail_{uuid.uuid4().hex}{ext}"
-                        file_path = goods_path / file_name
-                        with Image.open(f.file) as im:
-                            im = im.convert("RGB")
-                            im.thumbnail((750, 2000), Image.LANCZOS)
-                            im.save(file_path, "JPEG", quality=80, optimize=True)
-                        detail_urls.append(f"/pic/{category}/{id}/{file_name}")
+                        image_pipeline.check_upload(f, 10 * 1024 * 1024, "详情图")
+                        url, job = image_pipeline.ingest(cur, f, "product_detail", id)
+                        jobs.append(job)
+                        detail_urls.append(url)
 
                     # 更新商品详情图
                     cur.execute("UPDATE products SET detail_images = %s WHERE id = %s",
@@ -951,19 +911,10 @@ def upload_images(
                     # ✅ 修改：将上传的轮播图文件保存并追加到 banner_urls 列表
                     # 同时插入到 banner 表，实现追加逻辑而非覆盖
                     for f in banner_images:
-                        ext = Path(f.filename).suffix.lower()
-                        if ext not in {".jpg", ".jpeg", ".png", ".webp"}:
-                            raise HTTPException(status_code=400, detail="仅支持 JPG/PNG/WEBP")
                         # ✅ 修改：将轮播图大小限制从5MB改为10MB
-                        if f.size > 10 * 1024 * 1024:
-                            raise HTTPException(status_code=400, detail="轮播图单张大小不能超过 10MB")
-                        file_name = f"banner_{uuid.uuid4().hex}{ext}"
-                        file_path = goods_path / file_name
-                        with Image.open(f.file) as im:
-                            im = im.convert("RGB")
-                            im.thumbnail((1200, 1200), Image.LANCZOS)
-                            im.save(file_path, "JPEG", quality=85, optimize=True)
-                        url = f"/pic/{category}/{id}/{file_name}"
+                        image_pipeline.check_upload(f, 10 * 1024 * 1024, "轮播图")
+                        url, job = image_pipeline.ingest(cur, f, "product_banner", id)
+                        jobs.append(job)
                         banner_urls.append(url)
 
                         # ✅ 新增：同步插入到 banner 表，设置 status=1 和自动排序
@@ -978,6 +929,8 @@ def upload_images(
                                     (json.dumps(banner_urls, ensure_ascii=False), id))
 
                 conn.commit()
+                catalog_cache.bump([id])
+                image_pipeline.dispatch(jobs)
 
                 # 查询更新后的商品
                 select_sql = build_dynamic_select(
@@ -988,32 +941,8 @@ def upload_images(
                 cur.execute(select_sql, (id,))
                 updated_product = cur.fetchone()
 
-                # 获取 SKUs
-                select_sql = build_dynamic_select(
-                    cur,
-                    "product_skus",
-                    where_clause="product_id = %s",
-                    select_fields=["id", "sku_code", "price", "original_price", "stock", "specifications"]
-                )
-                cur.execute(select_sql, (id,))
-                skus = cur.fetchall()
-                skus = [{"id": s['id'], "sku_code": s['sku_code'], "price": float(s['price']),
-                         "original_price": float(s['original_price']) if s['original_price'] else None,
-                         "stock": s['stock'], "specifications": s['specifications']} for s in skus]
-
-                # 获取 attributes
-                select_sql = build_dynamic_select(
-                    cur,
-                    "product_attributes",
-                    where_clause="product_id = %s",
-                    select_fields=["name", "value"]
-                )
-                cur.execute(select_sql, (id,))
-                attributes = cur.fetchall()
-                attributes = [{"name": a['name'], "value": a['value']} for a in attributes]
-
                 return {"status": "success", "message": "图片上传完成",
-                        "data": build_product_dict(updated_product, skus, attributes)}
+                        "data": hydrate_products(cur, [updated_product])[0]}
             except HTTPException:
                 raise
             except Exception as e:
@@ -1022,60 +951,47 @@ def upload_images(
 
 
 @router.get("/banners", summary="🖼️ 轮播图列表")
+@conditional(lambda: catalog_cache.catalog_version())
+@singleflight(ttl=SINGLEFLIGHT_BURST_TTL_SECONDS)
 def get_banners(product_id: Optional[int] = Query(None, description="商品ID，留空返回全部")):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            if product_id:
-                cur.execute("""
-                    SELECT * FROM banner
-                    WHERE status = 1 AND product_id = %s
-                    ORDER BY sort_order
-                """, (product_id,))
-            else:
-                cur.execute("""
-                    SELECT * FROM banner
-                    WHERE status = 1
-                    ORDER BY sort_order
-                """)
-            banners = cur.fetchall()
-            return {"status": "success", "data": banners}
+    def _load():
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                if product_id:
+                    cur.execute("""
+                        SELECT * FROM banner
+                        WHERE status = 1 AND product_id = %s
+                        ORDER BY sort_order
+                    """, (product_id,))
+                else:
+                    cur.execute("""
+                        SELECT * FROM banner
+                        WHERE status = 1
+                        ORDER BY sort_order
+                    """)
+                return cur.fetchall()
+
+    # 轮播图只随商品图片接口变化，与商品一起走目录缓存
+    banners = [dict(b) for b in catalog_cache.cached_list("banners", {"product_id": product_id}, _load)]
+    products = catalog_cache.get_products([b['product_id'] for b in banners if b.get('product_id')],
+                                          load_products)
+    for b in banners:
+        b['product'] = products.get(b.get('product_id'))
+    return {"status": "success", "data": banners}
 
 
 @router.get("/products/{id}/sales", summary="📊 商品销售数据")
 def get_sales_data(id: int):
     with get_conn() as conn:
         with conn.cursor() as cur:
-            # ✅ 优化：统计所有有效订单（已支付/已发货/已完成），排除已成功退款的订单
-            cur.execute("""
-                SELECT 
-                    SUM(oi.quantity) AS qty, 
-                    SUM(oi.total_price) AS sales 
-                FROM order_items oi
-                INNER JOIN orders o ON oi.order_id = o.id
-                WHERE oi.product_id = %s 
-                AND o.status IN ('pending_ship', 'pending_recv', 'completed')
-                AND COALESCE(o.refund_status, '') != 'refund_success'
-            """, (id,))
-
-            row = cur.fetchone()
-            if not row or not row.get('qty'):
-                # 如果没有销售数据或查询结果为 NULL，返回 0 而不是 404
-                qty = int(row['qty']) if row and row.get('qty') else 0
-                sales = float(row['sales']) if row and row.get('sales') else 0.0
-
-                return {
-                    "status": "success",
-                    "data": {
-                        "total_quantity": qty,
-                        "total_sales": sales
-                    }
-                }
-
+            # 读预计算的销量汇总（已支付/已发货/已完成且未退款成功的订单）
+            sales = product_sales_stats.get_sales(cur, [id]).get(id) or {}
             return {
                 "status": "success",
                 "data": {
-                    "total_quantity": int(row['qty']),
-                    "total_sales": float(row['sales'])
+                    "total_quantity": int(sales.get("sold_quantity") or 0),
+                    "total_sales": float(sales.get("sold_amount") or 0),
+                    "refunded_quantity": int(sales.get("refunded_quantity") or 0)
                 }
             }
 
@@ -1157,9 +1073,15 @@ def delete_images(
                     cur.execute("UPDATE products SET detail_images = %s WHERE id = %s",
                                 (json.dumps(updated_images, ensure_ascii=False), id))
 
-                # ✅ 修复：物理删除文件（移除/pic/前缀）
+                # 内容寻址的图片只释放引用（可能被其他商品共用），无人引用后由定时任务回收
+                image_pipeline.release(cur, ["product_banner" if image_type == "banner" else "product_detail"],
+                                       id, images_to_delete)
+
+                # ✅ 修复：物理删除文件（移除/pic/前缀，仅历史上传的图片）
                 category = product['category']
                 for url in images_to_delete:
+                    if image_store.name_from_url(url):
+                        continue
                     try:
                         # 移除 /pic/ 前缀，构建正确路径
                         relative_path = url.lstrip('/').replace('pic/', '', 1)  # 只替换第一个 pic/
@@ -1175,6 +1097,7 @@ def delete_images(
                         print(f"⚠️ 删除文件失败 {url}: {e}")
 
                 conn.commit()
+                catalog_cache.bump([id])
 
                 # 查询更新后的商品
                 select_sql = build_dynamic_select(
@@ -1185,34 +1108,10 @@ def delete_images(
                 cur.execute(select_sql, (id,))
                 updated_product = cur.fetchone()
 
-                # 获取 SKUs
-                select_sql = build_dynamic_select(
-                    cur,
-                    "product_skus",
-                    where_clause="product_id = %s",
-                    select_fields=["id", "sku_code", "price", "original_price", "stock", "specifications"]
-                )
-                cur.execute(select_sql, (id,))
-                skus = cur.fetchall()
-                skus = [{"id": s['id'], "sku_code": s['sku_code'], "price": float(s['price']),
-                         "original_price": float(s['original_price']) if s['original_price'] else None,
-                         "stock": s['stock'], "specifications": s['specifications']} for s in skus]
-
-                # 获取 attributes
-                select_sql = build_dynamic_select(
-                    cur,
-                    "product_attributes",
-                    where_clause="product_id = %s",
-                    select_fields=["name", "value"]
-                )
-                cur.execute(select_sql, (id,))
-                attributes = cur.fetchall()
-                attributes = [{"name": a['name'], "value": a['value']} for a in attributes]
-
                 return {
                     "status": "success",
                     "message": f"已删除 {len(images_to_delete)} 张{image_type}图",
-                    "data": build_product_dict(updated_product, skus, attributes)
+                    "data": hydrate_products(cur, [updated_product])[0]
                 }
             except HTTPException:
                 raise
@@ -1235,9 +1134,6 @@ def update_images(
     - 上传的图片会追加到现有的对应图片列表
     - 未选择的图片类型保持原样不变
     """
-    from PIL import Image
-    import uuid
-
     with get_conn() as conn:
         with conn.cursor() as cur:
             try:
@@ -1252,16 +1148,12 @@ def update_images(
                 if not product:
                     raise HTTPException(status_code=404, detail="商品不存在")
 
-                category = product['category']
-                cat_path = BASE_PIC_DIR / category
-                goods_path = cat_path / str(id)
-                goods_path.mkdir(parents=True, exist_ok=True)
-
                 # 验证文件数量
                 if len(files) > 10:
                     raise HTTPException(status_code=400, detail=f"{image_type}图最多10张")
 
-                # 根据类型分别处理
+                # 根据类型分别处理（原图按内容寻址落盘，缩放与多尺寸编码提交后在进程池中完成）
+                jobs = []
                 if image_type == "detail":
                     # ✅ 处理详情图（追加模式）
                     raw_detail = product.get('detail_images')
@@ -1280,22 +1172,13 @@ def update_images(
 
                     # 处理每个文件
                     for f in files:
-                        # 验证文件类型
-                        ext = Path(f.filename).suffix.lower()
-                        if ext not in {".jpg", ".jpeg", ".png", ".webp"}:
-                            raise HTTPException(status_code=400, detail="仅支持 JPG/PNG/WEBP")
-                        # ✅ 修改：将详情图大小限制从3MB改为10MB
-                        if f.size > 10 * 1024 * 1024:
-                            raise HTTPException(status_code=400, detail="详情图单张大小不能超过 10MB")
+                        # 验证文件类型与大小（✅ 修改：将详情图大小限制从3MB改为10MB）
+                        image_pipeline.check_upload(f, 10 * 1024 * 1024, "详情图")
 
                         # 保存文件
-                        file_name = f"detail_{uuid.uuid4().hex}{ext}"
-                        file_path = goods_path / file_name
-                        with Image.open(f.file) as im:
-                            im = im.convert("RGB")
-                            im.thumbnail((750, 2000), Image.LANCZOS)
-                            im.save(file_path, "JPEG", quality=80, optimize=True)
-                        detail_urls.append(f"/pic/{category}/{id}/{file_name}")
+                        url, job = image_pipeline.ingest(cur, f, "product_detail", id)
+                        jobs.append(job)
+                        detail_urls.append(url)
 
                     # 更新详情图到数据库
                     cur.execute("UPDATE products SET detail_images = %s WHERE id = %s",
@@ -1319,22 +1202,12 @@ def update_images(
 
                     # 处理每个文件
                     for f in files:
-                        # 验证文件类型
-                        ext = Path(f.filename).suffix.lower()
-                        if ext not in {".jpg", ".jpeg", ".png", ".webp"}:
-                            raise HTTPException(status_code=400, detail="仅支持 JPG/PNG/WEBP")
-                        # ✅ 修改：将轮播图大小限制从5MB改为10MB
-                        if f.size > 10 * 1024 * 1024:
-                            raise HTTPException(status_code=400, detail="轮播图单张大小不能超过 10MB")
+                        # 验证文件类型与大小（✅ 修改：将轮播图大小限制从5MB改为10MB）
+                        image_pipeline.check_upload(f, 10 * 1024 * 1024, "轮播图")
 
                         # 保存文件
-                        file_name = f"banner_{uuid.uuid4().hex}{ext}"
-                        file_path = goods_path / file_name
-                        with Image.open(f.file) as im:
-                            im = im.convert("RGB")
-                            im.thumbnail((1200, 1200), Image.LANCZOS)
-                            im.save(file_path, "JPEG", quality=85, optimize=True)
-                        url = f"/pic/{category}/{id}/{file_name}"
+                        url, job = image_pipeline.ingest(cur, f, "product_banner", id)
+                        jobs.append(job)
                         banner_urls.append(url)
 
                         # 追加插入 banner 表记录
@@ -1348,6 +1221,8 @@ def update_images(
                                 (json.dumps(banner_urls, ensure_ascii=False), id))
 
                 conn.commit()
+                catalog_cache.bump([id])
+                image_pipeline.dispatch(jobs)
 
                 # 查询最终的商品数据
                 select_sql = build_dynamic_select(
@@ -1358,34 +1233,10 @@ def update_images(
                 cur.execute(select_sql, (id,))
                 updated_product = cur.fetchone()
 
-                # 获取 SKUs
-                select_sql = build_dynamic_select(
-                    cur,
-                    "product_skus",
-                    where_clause="product_id = %s",
-                    select_fields=["id", "sku_code", "price", "original_price", "stock", "specifications"]
-                )
-                cur.execute(select_sql, (id,))
-                skus_result = cur.fetchall()
-                skus = [{"id": s['id'], "sku_code": s['sku_code'], "price": float(s['price']),
-                         "original_price": float(s['original_price']) if s['original_price'] else None,
-                         "stock": s['stock'], "specifications": s['specifications']} for s in skus_result]
-
-                # 获取 attributes
-                select_sql = build_dynamic_select(
-                    cur,
-                    "product_attributes",
-                    where_clause="product_id = %s",
-                    select_fields=["name", "value"]
-                )
-                cur.execute(select_sql, (id,))
-                attributes_result = cur.fetchall()
-                attributes = [{"name": a['name'], "value": a['value']} for a in attributes_result]
-
                 return {
                     "status": "success",
                     "message": f"已上传 {len(files)} 张{image_type}图",
-                    "data": build_product_dict(updated_product, skus, attributes)
+                    "data": hydrate_products(cur, [updated_product])[0]
                 }
             except HTTPException:
                 raise
@@ -1456,36 +1307,8 @@ def get_user_products(
             """, tuple(params + [size, offset]))
             products = cur.fetchall()
 
-            # 6. 获取每个商品的 SKUs 和 attributes
-            result_data = []
-            for product in products:
-                product_id = product['id']
-
-                # 获取 SKUs
-                select_sql = build_dynamic_select(
-                    cur,
-                    "product_skus",
-                    where_clause="product_id = %s",
-                    select_fields=["id", "sku_code", "price", "original_price", "stock", "specifications"]
-                )
-                cur.execute(select_sql, (product_id,))
-                skus = cur.fetchall()
-                skus = [{"id": s['id'], "sku_code": s['sku_code'], "price": float(s['price']),
-                         "original_price": float(s['original_price']) if s['original_price'] else None,
-                         "stock": s['stock'], "specifications": s['specifications']} for s in skus]
-
-                # 获取 attributes
-                select_sql = build_dynamic_select(
-                    cur,
-                    "product_attributes",
-                    where_clause="product_id = %s",
-                    select_fields=["name", "value"]
-                )
-                cur.execute(select_sql, (product_id,))
-                attributes = cur.fetchall()
-                attributes = [{"name": a['name'], "value": a['value']} for a in attributes]
-
-                result_data.append(build_product_dict(product, skus, attributes))
+            # SKU 与属性整页批量取回（两条 IN 查询）
+            result_data = hydrate_products(cur, products)
 
             return {
                 "status": "success",
@@ -1,9 +1,10 @@
 from fastapi import (
     APIRouter, Depends, HTTPException,
-    UploadFile, File, Query, Form, FastAPI
+    UploadFile, File, Query, Form, FastAPI, Request
 )
 from typing import Optional
 
+from core.http_cache import file_response, conditional
 from core.logging import get_logger
 from core.exceptions import FinanceException
 from models.schemas.store_setup import *
@@ -71,6 +72,7 @@ async def update_store_info(
     summary="获取店铺信息",
     description="查询当前用户的店铺详细信息"
 )
+@conditional(lambda user_id, service: service.get_store_version(user_id))
 async def get_store_info(
         user_id: int = Query(..., description="用户ID"),
         service: StoreSetupService = Depends(get_store_service)
@@ -150,17 +152,20 @@ async def delete_store_logo(
     description="根据图片ID预览店铺LOGO"
 )
 async def preview_logo(
+        request: Request,
         image_id: str,
+        size: Optional[str] = Query(None, pattern="^(thumb|thumb_webp|detail_webp)$",
+                                    description="其他尺寸：thumb=缩略图, *_webp=WebP 格式；留空为 500×500 JPEG"),
         service: StoreSetupService = Depends(get_store_service)
 ):
-    """预览LOGO"""
+    """预览LOGO（处理完成后按 immutable 长期缓存，ETag 为内容哈希）"""
     try:
-        file_path = service.get_logo_url(image_id)
-        if not file_path:
+        found = service.get_logo_file(image_id, size)
+        if not found:
             raise HTTPException(status_code=404, detail="LOGO不存在")
 
-        from fastapi.responses import FileResponse
-        return FileResponse(file_path)
+        file_path, content_hash = found
+        return file_response(request, file_path, content_hash)
     except HTTPException:
         raise
     except Exception as e:
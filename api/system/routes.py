@@ -2,6 +2,9 @@
 from fastapi import APIRouter, HTTPException, Query
 from typing import Optional
 from core.database import get_conn
+from core.config import SINGLEFLIGHT_BURST_TTL_SECONDS
+from core.http_cache import conditional
+from core.singleflight import singleflight
 from core.logging import get_logger
 from models.schemas.system import SystemSentenceModel, SystemSentenceUpdate
 
@@ -15,7 +18,19 @@ def register_routes(app):
     app.include_router(router, prefix="/api", tags=["系统配置"])
 
 
+@singleflight(ttl=SINGLEFLIGHT_BURST_TTL_SECONDS)
+def _sentences_version():
+    """条件请求版本（在路由的 singleflight 之外执行，同样合并突发请求）"""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT updated_at FROM system_sentence ORDER BY id DESC LIMIT 1")
+            row = cur.fetchone()
+            return row["updated_at"] if row else None
+
+
 @router.get("/system/sentences", summary="📝 获取系统标语")
+@conditional(_sentences_version)
+@singleflight(ttl=SINGLEFLIGHT_BURST_TTL_SECONDS)
 def get_system_sentences():
     """
     获取轮播图语句和系统标语
@@ -190,3 +205,42 @@ def grant_system_permission(
             conn.commit()
             return {"msg": "is_merchant 已更新", "user_id": user_id, "is_merchant": is_merchant}
 
+
+
+@router.get("/system/background-jobs", summary="🛰️ 后台任务执行进程")
+def get_background_jobs():
+    """
+    查看各后台任务当前由哪个进程执行
+
+    每个任务在所有 worker 中只有取得租约的一个进程运行；scheduler 租约下列出其包含的定时任务；
+    singleflight 为处理本次请求的进程内各接口的请求合并计数（calls / executed / collapsed / ttl_hits / bypassed）
+    """
+    from core.job_lease import list_job_leases, HOLDER_ID
+    from core.scheduler import scheduler
+    from core.singleflight import stats as singleflight_stats
+
+    try:
+        jobs = list_job_leases()
+    except Exception as e:
+        logger.error(f"查询后台任务租约失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"查询后台任务租约失败: {str(e)}")
+
+    scheduled = [
+        {
+            "id": job.id,
+            "next_run_time": job.next_run_time.strftime("%Y-%m-%d %H:%M:%S") if job.next_run_time else None,
+        }
+        for job in scheduler.scheduler.get_jobs()
+    ]
+    for job in jobs:
+        if job["job_name"] == "scheduler":
+            job["scheduled_jobs"] = scheduled
+
+    return {
+        "status": "success",
+        "data": {
+            "this_process": HOLDER_ID,
+            "jobs": jobs,
+            "singleflight": singleflight_stats()
+        }
+    }
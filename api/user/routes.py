@@ -13,6 +13,7 @@ from models.schemas.user import (
 from core.config import WECHAT_APP_ID, WECHAT_APP_SECRET
 from core.database import get_conn
 from core.logging import get_logger
+from core.http_cache import conditional
 from core.table_access import build_dynamic_select, get_table_structure, _quote_identifier
 from core.auth import create_access_token  # ✅ 新增：导入 Token 创建函数
 from services.user_service import UserService, UserStatus, verify_pwd, hash_pwd
@@ -935,7 +936,21 @@ def return_addr_get(mobile: str):
 
 # ========== 新增：平台退货地址接口 ==========
 
+def _platform_return_address_version():
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT updated_at FROM addresses
+                WHERE user_id = 0 AND addr_type = 'return'
+                ORDER BY is_default DESC, id DESC
+                LIMIT 1
+            """)
+            row = cur.fetchone()
+            return row["updated_at"] if row else None
+
+
 @router.get("/address/platform-return", summary="查询平台退货地址（公开）")
+@conditional(_platform_return_address_version)
 def get_platform_return_address():
     """
     所有用户都能查看的平台退货地址
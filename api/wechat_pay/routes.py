@@ -5,6 +5,9 @@ from core.config import ENVIRONMENT, WECHAT_PAY_API_V3_KEY
 from core.response import success_response
 from core.database import get_conn
 from services.finance_service import FinanceService
+from services.points_ledger import record_points
+from services.order_transitions import transition
+from services import order_detail_cache
 from decimal import Decimal
 from services.wechat_applyment_service import WechatApplymentService
 from datetime import datetime
@@ -571,6 +574,8 @@ async def handle_transaction_success(data: dict):
                             if cur.rowcount == 0:
                                 logger.error("积分不足或并发冲突，扣减失败")
                                 return
+                            record_points(cur, user_id, 'member', -pending_points, None, 'points_deduction',
+                                          order_id=order_id, remark=f"订单{out_trade_no}积分抵扣")
 
                         if pending_coupon_id:
                             cur.execute(
@@ -648,11 +653,9 @@ async def handle_transaction_success(data: dict):
 
                     # 更新订单状态
                     next_status = "pending_recv" if order.get('delivery_way') == 'pickup' else "pending_ship"
-                    cur.execute(
-                        "UPDATE orders SET status=%s, updated_at=NOW() WHERE id=%s AND status='pending_pay'",
-                        (next_status, order_id)
-                    )
-                    if cur.rowcount == 0:
+                    changed = transition(cur, next_status, [order_id], from_statuses=('pending_pay',),
+                                         reason="微信支付成功", source="payment")
+                    if not changed:
                         logger.warning(f"订单 {out_trade_no} 状态更新未生效，可能已被并发处理")
 
                     logger.info(
@@ -660,6 +663,7 @@ async def handle_transaction_success(data: dict):
                         out_trade_no, user_id, pay_amount, pending_points, pending_coupon_id, next_status
                     )
                     conn.commit()
+            order_detail_cache.invalidate(out_trade_no)
 
         except Exception as e:
             logger.exception(f"支付成功业务处理异常: {e}")
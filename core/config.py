@@ -41,6 +41,12 @@ class Settings(BaseSettings):
     MYSQL_PASSWORD: str
     MYSQL_DATABASE: str
 
+    # Redis（未部署时各功能自动降级为数据库实现）
+    REDIS_HOST: str = "localhost"
+    REDIS_PORT: int = 6379
+    REDIS_DB: int = 0
+    REDIS_PASSWORD: str = ""
+
     # 微信/支付相关
     WECHAT_APP_ID: str = ""
     WECHAT_APP_SECRET: str = ""
@@ -217,6 +223,96 @@ LOG_DIR: Final[Path] = Path(__file__).resolve().parent.parent / 'logs'
 LOG_FILE: Final[Path] = LOG_DIR / 'api.log'
 LOG_DIR.mkdir(exist_ok=True)
 
+# ==================== 导出配置 ====================
+# 后台导出任务生成的文件存放目录（多 worker 共享同一磁盘）
+EXPORT_DIR: Final[Path] = Path(__file__).resolve().parent.parent / 'exports'
+EXPORT_DIR.mkdir(exist_ok=True)
+EXPORT_CHUNK_SIZE: Final[int] = 2000        # 服务端游标每次拉取行数
+EXPORT_FILE_KEEP_HOURS: Final[int] = 24     # 导出文件保留时长
+
+# ==================== 账本对账 ====================
+RECONCILE_GRACE_SECONDS: Final[int] = 60          # 检查点只推进到该时长之前的流水，避免漏掉提交较晚的事务
+RECONCILE_TOLERANCE: Final[Decimal] = Decimal('0.0001')  # 余额比对容差（与 DECIMAL(14,4) 精度一致）
+
+# ==================== 余额快照 ====================
+BALANCE_SNAPSHOT_INTERVAL_HOURS: Final[int] = 24   # 距上次快照超过该时长即生成新快照
+BALANCE_SNAPSHOT_EVERY_ROWS: Final[int] = 50000    # 或新增流水（account_flow + points_log）超过该行数
+BALANCE_SNAPSHOT_KEEP_DAYS: Final[int] = 90        # 超过该天数的快照只保留每月第一份
+
+# ==================== 订单超时取消 ====================
+ORDER_EXPIRE_HOURS: Final[int] = 12             # 待支付订单超时时长
+ORDER_EXPIRE_BATCH_SIZE: Final[int] = 50        # 每个取消事务处理的订单数（限制持锁时间）
+ORDER_EXPIRE_POLL_SECONDS: Final[float] = 1.0   # 延迟队列轮询间隔
+ORDER_EXPIRE_DB_SWEEP_SECONDS: Final[int] = 60  # 数据库兜底扫描间隔（Redis 不可用时即为主路径）
+
+# ==================== 后台任务单实例 ====================
+JOB_LEASE_RENEW_SECONDS: Final[int] = 10   # 持锁进程续约（心跳）间隔
+JOB_LEASE_RETRY_SECONDS: Final[int] = 15   # 待命进程尝试接管的间隔
+
+# ==================== 微信发货状态同步 ====================
+WX_SYNC_INTERVAL_SECONDS: Final[int] = 600   # 同步周期（每个周期处理全部待同步订单）
+WX_SYNC_PAGE_SIZE: Final[int] = 500          # 每批从数据库取出并在一个事务内落库的订单数
+WX_SYNC_CONCURRENCY: Final[int] = 10         # 同时进行的微信查询请求数
+WX_SYNC_QPS: Final[float] = 20.0             # 查询接口整体限速（令牌桶）
+
+# ==================== 库存预扣 ====================
+INVENTORY_HOT_REFRESH_SECONDS: Final[int] = 30   # 进程内热门SKU列表刷新间隔
+INVENTORY_RECONCILE_SECONDS: Final[int] = 30     # Redis 预扣计数与数据库库存的校准间隔
+INVENTORY_INFLIGHT_TTL_SECONDS: Final[int] = 300  # 在途预扣计数有效期（无新预扣后过期，兜底进程中途退出）
+
+# ==================== 确认收货核验 ====================
+RECEIVE_CONFIRM_POLL_SECONDS: Final[float] = 0.5                      # 核验线程取待核验记录的间隔
+RECEIVE_CONFIRM_BACKOFF_SECONDS: Final[tuple] = (1, 2, 4, 8, 15, 30, 60, 120)  # 第 N 次查询未确认后的等待
+RECEIVE_CONFIRM_BATCH_SIZE: Final[int] = 20                           # 每轮核验的记录数
+ORDER_STATUS_CHANNEL_TTL_SECONDS: Final[int] = 600                    # 订单状态通道中结果的保留时长
+
+# ==================== 购物车热存储 ====================
+CART_CACHE_TTL_SECONDS: Final[int] = 7 * 24 * 3600   # 用户购物车哈希在 Redis 中的保留时长（每次访问续期）
+CART_SNAPSHOT_TTL_SECONDS: Final[int] = 600          # 商品/SKU 展示快照的缓存时长
+CART_FLUSH_SECONDS: Final[float] = 1.0               # 回写线程间隔（同一用户的多次修改合并为一次写入）
+CART_FLUSH_BATCH_SIZE: Final[int] = 200              # 每次回写事务处理的用户数
+
+# ==================== 订单状态流转 ====================
+ORDER_TRANSITION_CHUNK_SIZE: Final[int] = 200    # 批量流转 / 事件分发每批的订单数
+ORDER_EVENT_POLL_SECONDS: Final[float] = 1.0     # 流转事件分发间隔
+ORDER_AUTO_RECEIVE_SECONDS: Final[int] = 3600    # 超时自动收货的检查间隔
+
+# ==================== 订单详情缓存 ====================
+ORDER_DETAIL_CACHE_SIZE: Final[int] = 2000          # 进程内 LRU 保留的订单数
+ORDER_DETAIL_LOCAL_TTL_SECONDS: Final[int] = 5      # 进程内副本有效期（其他进程的失效最多延迟这么久可见）
+ORDER_DETAIL_REDIS_TTL_SECONDS: Final[int] = 300    # Redis 副本有效期
+
+# ==================== 商品搜索 ====================
+PRODUCT_SEARCH_LIMIT: Final[int] = 200               # 单次搜索返回的最大商品数
+PRODUCT_SEARCH_REINDEX_CHUNK: Final[int] = 1000      # 全量重建索引时每个事务处理的商品数
+
+# ==================== 拼音 ====================
+PINYIN_CACHE_SIZE: Final[int] = 10000               # 按原文缓存拼音分词结果的条目数（商品名、分类名）
+PINYIN_BACKFILL_CHUNK: Final[int] = 500             # 补全商品拼音时每个事务处理的商品数
+
+# ==================== 请求合并 ====================
+SINGLEFLIGHT_CACHE_SIZE: Final[int] = 1000          # 每个合并函数保留的近期结果条目数（ttl > 0 时）
+SINGLEFLIGHT_BURST_TTL_SECONDS: Final[float] = 1.0  # 热点读接口的结果保留时长（吸收同一时刻的突发请求）
+
+# ==================== 商品目录缓存 ====================
+CATALOG_CACHE_SIZE: Final[int] = 5000               # 进程内 LRU 保留的条目数（商品 + 列表页）
+CATALOG_LOCAL_TTL_SECONDS: Final[int] = 60          # 进程内副本有效期（Redis 不可用时其他进程的写入最多延迟这么久可见）
+CATALOG_PRODUCT_TTL_SECONDS: Final[int] = 3600      # Redis 中单个商品的保留时长（版本变化后旧条目自然过期）
+CATALOG_LIST_TTL_SECONDS: Final[int] = 60           # 列表页的保留时长
+PRODUCT_BATCH_MAX_IDS: Final[int] = 50              # /products/batch 单次最多查询的商品数
+
+# ==================== 商家订单日汇总 ====================
+MERCHANT_ORDER_STATS_REBUILD_DAYS: Final[int] = 31  # 每晚只重建最近 N 天的汇总（全量重建为后台手动操作）
+
+# ==================== 商品销量汇总 ====================
+PRODUCT_SALES_REBUILD_CHUNK: Final[int] = 1000      # 重建销量汇总时每个事务覆盖的商品ID区间长度
+
+# ==================== 图片处理 ====================
+IMAGE_PIPELINE_WORKERS: Final[int] = 2              # 每个进程的图片处理进程池大小
+IMAGE_PIPELINE_RETRY_MINUTES: Final[int] = 5        # 超过该时长仍未处理完成的任务由定时任务重新派发
+IMAGE_PIPELINE_MAX_ATTEMPTS: Final[int] = 3         # 处理失败的重试次数上限
+IMAGE_BLOB_GC_GRACE_MINUTES: Final[int] = 60        # 引用数归零的图片文件保留多久后删除
+
 # ==================== 微信配置 ====================
 WECHAT_APP_ID: Final[str] = settings.WECHAT_APP_ID
 WECHAT_APP_SECRET: Final[str] = settings.WECHAT_APP_SECRET
@@ -4,8 +4,11 @@
 """
 import pymysql
 from contextlib import contextmanager
-from typing import Optional
+from typing import Callable, List, Optional
 from core.config import get_db_config
+from core.logging import get_logger
+
+logger = get_logger(__name__)
 
 # 全局连接配置缓存
 _db_config = None
@@ -19,6 +22,36 @@ def get_db_config_cached():
     return _db_config
 
 
+class _Connection(pymysql.connections.Connection):
+    """提交成功后依次执行登记的回调（缓存失效等须在数据可见后进行的操作），回滚时丢弃"""
+
+    def __init__(self, *args, **kwargs):
+        self._after_commit: List[Callable[[], None]] = []
+        super().__init__(*args, **kwargs)
+
+    def commit(self):
+        super().commit()
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"提交后回调执行失败: {e}")
+
+    def rollback(self):
+        self._after_commit = []
+        super().rollback()
+
+
+def after_commit(cur, callback: Callable[[], None]) -> None:
+    """当前事务提交后执行 callback；连接不是 get_conn() 创建的（无法感知提交）时立即执行"""
+    conn = cur.connection
+    if isinstance(conn, _Connection):
+        conn._after_commit.append(callback)
+    else:
+        callback()
+
+
 @contextmanager
 def get_conn():
     """
@@ -31,7 +64,7 @@ def get_conn():
                 result = cur.fetchone()
     """
     cfg = get_db_config_cached()
-    conn = pymysql.connect(
+    conn = _Connection(
         host=cfg['host'],
         port=cfg['port'],
         user=cfg['user'],
@@ -151,3 +184,35 @@ def execute_transaction(operations: list) -> bool:
                 return True
     except Exception:
         return False
+
+
+def stream_query(sql: str, params: Optional[tuple] = None, chunk_size: int = 1000):
+    """
+    使用服务端游标（SSDictCursor）分块读取查询结果，内存占用与结果集大小无关
+
+    适用于导出、对账等需要遍历大结果集的场景。注意：迭代期间独占一个连接，
+    同一连接上不能再执行其它语句。
+
+    使用示例:
+        for row in stream_query("SELECT * FROM account_flow WHERE id > %s", (0,)):
+            ...
+
+    Args:
+        sql: SQL 查询语句
+        params: 查询参数（元组或字典）
+        chunk_size: 每次从服务端拉取的行数
+
+    Yields:
+        单行结果（字典格式）
+    """
+    with get_conn() as conn:
+        cur = conn.cursor(pymysql.cursors.SSDictCursor)
+        try:
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cur.close()
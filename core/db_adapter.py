@@ -34,6 +34,14 @@ class PyMySQLAdapter:
                 self._conn.rollback()
             raise
     
+    @property
+    def cursor(self):
+        """当前事务的原生游标（供接收 cur 参数的服务函数在同一事务内写入）"""
+        if self._conn is None:
+            self._conn = get_conn().__enter__()
+            self._cursor = self._conn.cursor()
+        return self._cursor
+
     def execute(self, sql: str, params: Optional[Dict[str, Any]] = None):
         """
         执行 SQL 语句
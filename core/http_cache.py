@@ -0,0 +1,166 @@
+# core/http_cache.py - HTTP 缓存头与条件请求
+"""
+HTTP 缓存头与条件请求
+
+- 内容寻址的文件（文件名即内容 SHA-256）：Cache-Control immutable 一年，ETag 为内容哈希（强校验）
+- 其他文件：每次使用前重新验证（no-cache），ETag 沿用 Starlette 的 修改时间-大小 摘要，未变化时返回 304
+- 文件一律用 FileResponse 返回：按块读取、支持 Range，服务器支持 http.response.pathsend 扩展时
+  由服务器直接发送文件（sendfile），不经过 Python 读写
+- 读多写少的接口用 @conditional(版本函数) 声明廉价的版本号（缓存版本号、MAX(updated_at)、文件修改时间），
+  ETag 由 路径 + 查询参数 + 版本号 计算；If-None-Match / If-Modified-Since 命中时直接返回 304，
+  不执行路由函数，也不做序列化
+"""
+import functools
+import hashlib
+import inspect
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Callable, Optional, Dict
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.staticfiles import NotModifiedResponse
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否命中（支持多个值、弱校验前缀 W/ 与 *）"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+def cache_headers(content_hash: Optional[str] = None) -> Dict[str, str]:
+    """content_hash 非空表示文件内容与地址一一对应，可以长期缓存"""
+    if content_hash:
+        return {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "ETag": f'"{content_hash}"'}
+    return {"Cache-Control": REVALIDATE_CACHE_CONTROL}
+
+
+def file_response(request: Request, path, content_hash: Optional[str] = None) -> Response:
+    """带缓存头的文件响应，If-None-Match 命中时返回 304"""
+    # 显式传 stat_result：FileResponse 构造时即写入 修改时间-大小 ETag（无内容哈希的文件同样有 ETag）
+    response = FileResponse(path, stat_result=os.stat(path), headers=cache_headers(content_hash))
+    if etag_matches(request.headers.get("if-none-match"), response.headers["etag"]):
+        return NotModifiedResponse(response.headers)
+    return response
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles + 缓存头
+
+    content_addressed_dir 下的文件按内容寻址（文件名为内容哈希），返回 immutable 与内容哈希 ETag
+    """
+
+    def __init__(self, *args, content_addressed_dir: Optional[Path] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.content_addressed_dir = os.path.realpath(content_addressed_dir) if content_addressed_dir else None
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        content_hash = None
+        if self.content_addressed_dir and os.path.realpath(full_path).startswith(self.content_addressed_dir + os.sep):
+            content_hash = Path(full_path).stem
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result,
+                                headers=cache_headers(content_hash))
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+# ---------------------------------------------------------------------- #
+# 条件请求
+# ---------------------------------------------------------------------- #
+def _http_date(value: datetime) -> str:
+    """datetime → HTTP 日期；不带时区的按服务器本地时间处理（与数据库 DATETIME 一致）"""
+    return format_datetime(value.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def _modified_since(if_modified_since: Optional[str], last_modified: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return True
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return last_modified.astimezone(timezone.utc).replace(microsecond=0) > since
+
+
+def validator_headers(request: Request, version: Any,
+                      cache_control: str = REVALIDATE_CACHE_CONTROL) -> Dict[str, str]:
+    """按版本号生成 ETag（弱校验：只表示内容等价）与 Last-Modified（版本号为 datetime 时）"""
+    digest = hashlib.sha1(f"{request.url.path}?{request.url.query}|{version!r}".encode()).hexdigest()[:32]
+    headers = {"ETag": f'W/"{digest}"', "Cache-Control": cache_control}
+    if isinstance(version, datetime):
+        headers["Last-Modified"] = _http_date(version)
+    return headers
+
+
+def is_not_modified(request: Request, headers: Dict[str, str]) -> bool:
+    """If-None-Match 优先；没有 If-None-Match 时才看 If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        return etag_matches(if_none_match, headers["ETag"][2:])
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and "Last-Modified" in headers:
+        return not _modified_since(if_modified_since, parsedate_to_datetime(headers["Last-Modified"]))
+    return False
+
+
+def conditional(version: Callable[..., Any], cache_control: str = REVALIDATE_CACHE_CONTROL):
+    """
+    路由装饰器（写在 @router.get 下面）：执行路由函数前先取版本号，客户端缓存仍有效时直接返回 304
+
+    version 以路由函数的同名参数调用（只传它声明的参数），应只做廉价查询；返回 None 表示不校验，照常执行。
+    路由函数签名中追加 Request / Response 参数，由 FastAPI 注入，用于读取条件头与写入 ETag
+    """
+    wanted = set(inspect.signature(version).parameters)
+
+    def decorator(endpoint):
+        signature = inspect.signature(endpoint)
+        parameters = list(signature.parameters.values()) + [
+            inspect.Parameter("_conditional_request", inspect.Parameter.KEYWORD_ONLY, annotation=Request),
+            inspect.Parameter("_conditional_response", inspect.Parameter.KEYWORD_ONLY, annotation=Response),
+        ]
+
+        def _validate(kwargs: Dict[str, Any]) -> Optional[Response]:
+            request = kwargs.pop("_conditional_request")
+            response = kwargs.pop("_conditional_response")
+            current = version(**{k: v for k, v in kwargs.items() if k in wanted})
+            if current is None:
+                return None
+            headers = validator_headers(request, current, cache_control)
+            if is_not_modified(request, headers):
+                return Response(status_code=304, headers=headers)
+            response.headers.update(headers)
+            return None
+
+        if inspect.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def wrapper(*args, **kwargs):
+                not_modified = _validate(kwargs)
+                if not_modified is not None:
+                    return not_modified
+                return await endpoint(*args, **kwargs)
+        else:
+            @functools.wraps(endpoint)
+            def wrapper(*args, **kwargs):
+                not_modified = _validate(kwargs)
+                if not_modified is not None:
+                    return not_modified
+                return endpoint(*args, **kwargs)
+
+        wrapper.__signature__ = signature.replace(parameters=parameters)
+        return wrapper
+
+    return decorator
@@ -0,0 +1,166 @@
+"""
+后台任务单实例协调
+
+多个 uvicorn worker 各自启动后台任务时，每个任务通过 MySQL 命名锁（GET_LOCK）选出唯一的执行进程：
+- 持锁进程运行任务，并每隔 JOB_LEASE_RENEW_SECONDS 在持锁连接上续约（校验锁仍属于本连接并写心跳）
+- 其他进程待命，每隔 JOB_LEASE_RETRY_SECONDS 尝试取锁
+- 持锁进程退出或连接断开时 MySQL 自动释放命名锁，待命进程在下一次重试时接管
+- 当前持有者记录在 job_leases 表，可通过 list_job_leases() 查看
+"""
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Any, List
+
+from core.config import JOB_LEASE_RENEW_SECONDS, JOB_LEASE_RETRY_SECONDS
+from core.database import get_conn, get_db_config_cached
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+HOLDER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# 同一进程内每个任务只启动一次
+_started: Dict[str, "LeaderJob"] = {}
+_started_lock = threading.Lock()
+
+
+def _lock_name(job_name: str) -> str:
+    # 命名锁在整个 MySQL 实例内共享，按库名区分；MySQL 限制长度 64
+    return f"{get_db_config_cached()['database']}:job:{job_name}"[:64]
+
+
+class LeaderJob:
+    """单个后台任务的租约与运行状态"""
+
+    def __init__(self, name: str, target: Callable[[threading.Event], None]):
+        self.name = name
+        self.target = target
+        self.is_leader = False
+        self.acquired_at = None
+
+    def start(self) -> None:
+        threading.Thread(target=self._loop, name=f"lease-{self.name}", daemon=True).start()
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self._hold_and_run()
+            except Exception as e:
+                logger.error(f"[lease] 任务 {self.name} 租约异常: {e}", exc_info=True)
+            finally:
+                self.is_leader = False
+            time.sleep(JOB_LEASE_RETRY_SECONDS)
+
+    def _hold_and_run(self) -> None:
+        lock_name = _lock_name(self.name)
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT GET_LOCK(%s, 0) AS ok", (lock_name,))
+                if not cur.fetchone()["ok"]:
+                    return
+
+                self.is_leader = True
+                self.acquired_at = datetime.now()
+                cur.execute(
+                    """INSERT INTO job_leases (job_name, holder, acquired_at, heartbeat_at)
+                       VALUES (%s, %s, NOW(), NOW())
+                       ON DUPLICATE KEY UPDATE holder = VALUES(holder), acquired_at = NOW(), heartbeat_at = NOW()""",
+                    (self.name, HOLDER_ID)
+                )
+                conn.commit()
+                logger.info(f"[lease] {HOLDER_ID} 成为任务 {self.name} 的执行进程")
+
+                stop_event = threading.Event()
+                worker = threading.Thread(target=self.target, args=(stop_event,), name=f"job-{self.name}", daemon=True)
+                worker.start()
+                try:
+                    while worker.is_alive():
+                        worker.join(JOB_LEASE_RENEW_SECONDS)
+                        conn.ping(reconnect=False)
+                        cur.execute("SELECT IS_USED_LOCK(%s) = CONNECTION_ID() AS mine", (lock_name,))
+                        if not cur.fetchone()["mine"]:
+                            logger.warning(f"[lease] 任务 {self.name} 的命名锁已丢失，停止执行")
+                            break
+                        cur.execute(
+                            "UPDATE job_leases SET heartbeat_at = NOW() WHERE job_name = %s AND holder = %s",
+                            (self.name, HOLDER_ID)
+                        )
+                        conn.commit()
+                finally:
+                    stop_event.set()
+                    worker.join(JOB_LEASE_RENEW_SECONDS)
+                    try:
+                        cur.execute("SELECT RELEASE_LOCK(%s)", (lock_name,))
+                    except Exception:
+                        pass  # 连接已断开时锁已由 MySQL 释放
+                    logger.info(f"[lease] {HOLDER_ID} 释放任务 {self.name}")
+
+
+def run_as_leader(name: str, target: Callable[[threading.Event], None]) -> LeaderJob:
+    """
+    以单实例方式运行后台任务
+
+    target(stop_event) 在本进程取得租约后于独立线程中运行，租约丢失时 stop_event 被置位，
+    target 应在循环中用 stop_event.wait(间隔) 代替 time.sleep 并在置位后尽快返回。
+    同一进程内重复调用同名任务只会启动一次。
+    """
+    with _started_lock:
+        job = _started.get(name)
+        if job is not None:
+            logger.debug(f"[lease] 任务 {name} 已在本进程启动，忽略重复启动")
+            return job
+        job = LeaderJob(name, target)
+        _started[name] = job
+    job.start()
+    return job
+
+
+def report_job_stats(name: str, stats: Dict[str, Any]) -> None:
+    """任务在每次执行后上报统计，随租约信息一起展示"""
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE job_leases SET last_report = %s WHERE job_name = %s AND holder = %s",
+                    (json.dumps(stats, ensure_ascii=False, default=str), name, HOLDER_ID)
+                )
+                conn.commit()
+    except Exception as e:
+        logger.warning(f"[lease] 任务 {name} 上报统计失败: {e}")
+
+
+def list_job_leases() -> List[Dict[str, Any]]:
+    """各后台任务的当前执行进程（active 表示命名锁当前确实被持有）"""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT job_name, holder, acquired_at, heartbeat_at, last_report FROM job_leases ORDER BY job_name")
+            rows = cur.fetchall()
+            for r in rows:
+                cur.execute("SELECT IS_USED_LOCK(%s) IS NOT NULL AS active", (_lock_name(r["job_name"]),))
+                r["active"] = bool(cur.fetchone()["active"])
+
+    local = {name: job for name, job in _started.items()}
+    result = []
+    for r in rows:
+        job = local.pop(r["job_name"], None)
+        result.append({
+            "job_name": r["job_name"],
+            "holder": r["holder"] if r["active"] else None,
+            "last_holder": r["holder"],
+            "active": r["active"],
+            "acquired_at": r["acquired_at"].strftime("%Y-%m-%d %H:%M:%S") if r["acquired_at"] else None,
+            "heartbeat_at": r["heartbeat_at"].strftime("%Y-%m-%d %H:%M:%S") if r["heartbeat_at"] else None,
+            "this_process_is_leader": bool(job and job.is_leader),
+            "last_report": json.loads(r["last_report"]) if r["last_report"] else None,
+        })
+    for name, job in local.items():
+        result.append({
+            "job_name": name, "holder": None, "last_holder": None, "active": False,
+            "acquired_at": None, "heartbeat_at": None, "this_process_is_leader": job.is_leader,
+            "last_report": None,
+        })
+    return result
@@ -1,7 +1,7 @@
 # core/middleware.py - 统一中间件配置
 from pathlib import Path
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from core.http_cache import CachedStaticFiles
 from fastapi import FastAPI
 
 
@@ -21,6 +21,6 @@ def setup_static_files(app: FastAPI):
     static_dir = Path("static")
     if static_dir.exists() and static_dir.is_dir():
         try:
-            app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
+            app.mount("/static", CachedStaticFiles(directory=str(static_dir)), name="static")
         except Exception as e:
             print(f"⚠️ 静态文件目录挂载失败（可忽略）: {e}")
@@ -0,0 +1,48 @@
+"""
+订单状态通道
+
+后台任务完成订单状态流转后把结果发布到通道：
+- Redis 中保存每个订单的最新结果（order:status:{order_number}，带过期时间），客户端长轮询读取
+- 同时 PUBLISH 到 order:status 频道，供其他订阅方（推送网关等）实时转发
+Redis 不可用时 publish 为空操作，读取方回落到数据库中的结果记录
+"""
+import json
+from typing import Dict, Any, Optional
+
+from core.config import ORDER_STATUS_CHANNEL_TTL_SECONDS
+from core.logging import get_logger
+from core.redis_client import get_redis, mark_redis_failed
+
+logger = get_logger(__name__)
+
+CHANNEL = "order:status"
+LATEST_KEY = "order:status:{}"
+
+
+def publish(order_number: str, payload: Dict[str, Any], keep_latest: bool = True) -> None:
+    """发布订单状态结果（失败不影响业务，读取方回落到数据库）；keep_latest=False 时只 PUBLISH"""
+    client = get_redis()
+    if client is None:
+        return
+    message = json.dumps({"order_number": order_number, **payload}, ensure_ascii=False, default=str)
+    try:
+        pipe = client.pipeline(transaction=False)
+        if keep_latest:
+            pipe.set(LATEST_KEY.format(order_number), message, ex=ORDER_STATUS_CHANNEL_TTL_SECONDS)
+        pipe.publish(CHANNEL, message)
+        pipe.execute()
+    except Exception as e:
+        mark_redis_failed(e)
+
+
+def latest(order_number: str) -> Optional[Dict[str, Any]]:
+    """订单最近一次发布的结果；没有或 Redis 不可用时返回 None"""
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        raw = client.get(LATEST_KEY.format(order_number))
+    except Exception as e:
+        mark_redis_failed(e)
+        return None
+    return json.loads(raw) if raw else None
@@ -173,4 +173,32 @@ class RateLimiter:
 # 全局限流器实例
 # 建议：结算账户类接口更严格（5次/秒），查询类可放宽（10次/秒）
 settlement_rate_limiter = RateLimiter(max_calls=5, period=1)
-query_rate_limiter = RateLimiter(max_calls=10, period=1)
\ No newline at end of file
+query_rate_limiter = RateLimiter(max_calls=10, period=1)
+
+class AsyncTokenBucket:
+    """令牌桶限流（asyncio 协程间共享）
+
+    以 rate 个/秒的速度补充令牌，最多积累 capacity 个；acquire() 取不到令牌时等待补充，
+    用于批量并发调用外部接口时把整体 QPS 限制在 rate 以内
+    """
+
+    def __init__(self, rate: float, capacity: Optional[int] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, int(rate)))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.waited_seconds = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+                self.waited_seconds += wait
+                await asyncio.sleep(wait)
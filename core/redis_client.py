@@ -0,0 +1,61 @@
+"""
+统一的 Redis 客户端
+
+Redis 为可选依赖：未部署或连接失败时 get_redis() 返回 None，调用方降级为数据库实现；
+连接失败后按固定间隔重试，避免每次调用都等待连接超时
+"""
+import threading
+import time
+from typing import Optional
+
+import redis
+
+from core.config import settings
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+_RETRY_INTERVAL_SECONDS = 30
+
+_client: Optional[redis.Redis] = None
+_last_failed_at = 0.0
+_lock = threading.Lock()
+
+
+def get_redis() -> Optional[redis.Redis]:
+    """获取 Redis 客户端，不可用时返回 None"""
+    global _client, _last_failed_at
+    if _client is not None:
+        return _client
+    if time.time() - _last_failed_at < _RETRY_INTERVAL_SECONDS:
+        return None
+
+    with _lock:
+        if _client is not None:
+            return _client
+        try:
+            client = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB,
+                password=settings.REDIS_PASSWORD or None,
+                decode_responses=True,
+                socket_connect_timeout=2,
+                socket_timeout=2
+            )
+            client.ping()
+            _client = client
+            logger.info(f"Redis 已连接: {settings.REDIS_HOST}:{settings.REDIS_PORT}/{settings.REDIS_DB}")
+        except Exception as e:
+            _last_failed_at = time.time()
+            logger.warning(f"Redis 连接失败（将使用数据库兜底）: {e}")
+    return _client
+
+
+def mark_redis_failed(e: Exception) -> None:
+    """调用方遇到连接类错误时调用，下次 get_redis() 按重试间隔重新连接"""
+    global _client, _last_failed_at
+    with _lock:
+        _client = None
+        _last_failed_at = time.time()
+    logger.warning(f"Redis 操作失败，暂时降级为数据库实现: {e}")
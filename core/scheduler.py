@@ -3,6 +3,7 @@ import asyncio
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from core.database import get_conn
+from core.config import INVENTORY_RECONCILE_SECONDS
 from core.wx_pay_client import WeChatPayClient  # ✅ 修复：WechatPayClient → WeChatPayClient
 import logging
 from datetime import datetime, timedelta
@@ -16,9 +17,19 @@ class TaskScheduler:
         self.pay_client = WeChatPayClient()  # ✅ 修复：WechatPayClient → WeChatPayClient
 
     def start(self):
-        """启动所有定时任务"""
+        """
+        注册所有定时任务
+
+        调度器以暂停状态启动，只有取得 "scheduler" 租约的进程恢复执行，
+        其他 worker 待命，租约持有进程退出后自动接管
+        """
+        if self.scheduler.running:
+            logger.debug("定时任务管理器已启动，忽略重复启动")
+            return
+
         # 延迟导入，避免启动时循环依赖
         from api.order.wechat_shipping import WechatShippingManager
+        from core.job_lease import run_as_leader
 
         # 每天凌晨4点清理过期草稿
         self.scheduler.add_job(
@@ -71,8 +82,125 @@ class TaskScheduler:
             misfire_grace_time=3600
         )
 
-        self.scheduler.start()
-        logger.info("定时任务管理器已启动")
+        # 每天凌晨4点半清理过期导出文件
+        self.scheduler.add_job(
+            self.clean_expired_exports,
+            CronTrigger(hour=4, minute=30),
+            id="clean_expired_exports",
+            replace_existing=True,
+            misfire_grace_time=3600
+        )
+
+        # 每小时检查是否需要生成余额快照（满24小时或新增流水超过阈值）
+        self.scheduler.add_job(
+            self.snapshot_balances,
+            CronTrigger(minute=10),
+            id="snapshot_balances",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+
+        # 每5分钟增量对账（只处理上次检查点之后的新流水）
+        self.scheduler.add_job(
+            self.reconcile_ledgers,
+            CronTrigger(minute="*/5"),
+            id="reconcile_ledgers",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+
+        # 每30秒校准热门SKU的 Redis 预扣计数（数据库库存 - 在途预扣）
+        self.scheduler.add_job(
+            self.reconcile_hot_inventory,
+            CronTrigger(second=f"*/{INVENTORY_RECONCILE_SECONDS}"),
+            id="reconcile_hot_inventory",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+
+        # 每天凌晨3点重建最近一段时间的商家订单日汇总（修正增量维护的偏差）
+        self.scheduler.add_job(
+            self.rebuild_merchant_order_stats,
+            CronTrigger(hour=3, minute=0),
+            id="rebuild_merchant_order_stats",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=3600
+        )
+
+        # 每天凌晨3点15分重建商品销量汇总（修正增量维护的偏差）
+        self.scheduler.add_job(
+            self.rebuild_product_sales_stats,
+            CronTrigger(hour=3, minute=15),
+            id="rebuild_product_sales_stats",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=3600
+        )
+
+        # 每天凌晨3点半重建商品搜索索引（商家改名等间接变更）；启动后索引为空时先全量构建一次
+        self.scheduler.add_job(
+            self.rebuild_product_search,
+            CronTrigger(hour=3, minute=30),
+            id="rebuild_product_search",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=3600
+        )
+        self.scheduler.add_job(
+            self.backfill_product_search,
+            id="backfill_product_search",
+            replace_existing=True,
+            misfire_grace_time=None
+        )
+
+        # 启动后补全缺失的商品拼音（分段批量写回，不阻塞启动）
+        self.scheduler.add_job(
+            self.backfill_product_pinyin,
+            id="backfill_product_pinyin",
+            replace_existing=True,
+            misfire_grace_time=None
+        )
+
+        # 每5分钟重新派发未完成的图片处理任务（上传进程退出、进程池崩溃、处理失败）
+        self.scheduler.add_job(
+            self.retry_image_variants,
+            CronTrigger(minute="*/5"),
+            id="retry_image_variants",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+
+        # 每小时回收引用数归零超过宽限期的图片文件
+        self.scheduler.add_job(
+            self.collect_image_blobs,
+            CronTrigger(minute=40),
+            id="collect_image_blobs",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+
+        self.scheduler.start(paused=True)
+        run_as_leader("scheduler", self._run_while_leader)
+        logger.info("定时任务管理器已启动（等待取得执行租约）")
+
+    def _run_while_leader(self, stop_event):
+        """持有租约期间恢复调度，租约丢失后暂停"""
+        self.scheduler.resume()
+        logger.info("[定时任务] 本进程开始执行定时任务")
+        try:
+            stop_event.wait()
+        finally:
+            self.scheduler.pause()
+            logger.info("[定时任务] 本进程暂停执行定时任务")
 
     # ==================== 新增方法：执行周补贴发放 ====================
     def auto_distribute_weekly_subsidy(self):
@@ -137,6 +265,109 @@ class TaskScheduler:
         except Exception as e:
             logger.error(f"清理过期草稿失败: {str(e)}", exc_info=True)
 
+    def clean_expired_exports(self):
+        """清理过期导出文件及任务记录"""
+        try:
+            from services.export_service import ExportService
+            removed = ExportService.clean_expired_files()
+            logger.info(f"清理了 {removed} 个过期导出文件")
+        except Exception as e:
+            logger.error(f"清理过期导出文件失败: {str(e)}", exc_info=True)
+
+    def snapshot_balances(self):
+        """按需生成资金池 / 用户积分余额快照"""
+        try:
+            from services.balance_snapshot_service import BalanceSnapshotService
+            result = BalanceSnapshotService.maybe_snapshot()
+            if result:
+                logger.info(f"[定时任务] 余额快照已生成: {result}")
+        except Exception as e:
+            logger.error(f"[定时任务] 生成余额快照失败: {str(e)}", exc_info=True)
+
+    def reconcile_ledgers(self):
+        """增量对账：资金池余额 / 用户积分 与流水累计比对"""
+        try:
+            from services.reconciliation_service import ReconciliationService
+            result = ReconciliationService.run()
+            mismatch_count = sum(r["mismatch_count"] for r in result.values())
+            if mismatch_count:
+                logger.warning(f"[定时任务] 账本对账发现 {mismatch_count} 个不一致账户")
+        except RuntimeError as e:
+            logger.info(f"[定时任务] 跳过本轮对账: {e}")
+        except Exception as e:
+            logger.error(f"[定时任务] 账本对账失败: {str(e)}", exc_info=True)
+
+    def reconcile_hot_inventory(self):
+        """热门SKU Redis 预扣计数校准"""
+        try:
+            from services.inventory_service import InventoryService
+            InventoryService.reconcile()
+        except Exception as e:
+            logger.error(f"[定时任务] 热门SKU库存校准失败: {str(e)}", exc_info=True)
+
+    def rebuild_merchant_order_stats(self):
+        """按订单表重建最近 MERCHANT_ORDER_STATS_REBUILD_DAYS 天的商家订单日汇总"""
+        try:
+            from services.merchant_order_stats import rebuild_recent
+            with get_conn() as conn:
+                rebuild_recent(conn)
+        except Exception as e:
+            logger.error(f"[定时任务] 重建商家订单日汇总失败: {str(e)}", exc_info=True)
+
+    def rebuild_product_sales_stats(self):
+        """按订单重建商品销量汇总"""
+        try:
+            from services.product_sales_stats import rebuild_all
+            with get_conn() as conn:
+                rebuild_all(conn)
+        except Exception as e:
+            logger.error(f"[定时任务] 重建商品销量汇总失败: {str(e)}", exc_info=True)
+
+    def rebuild_product_search(self):
+        """全量重建商品搜索索引"""
+        try:
+            from services.product_search import rebuild_all
+            with get_conn() as conn:
+                rebuild_all(conn)
+        except Exception as e:
+            logger.error(f"[定时任务] 重建商品搜索索引失败: {str(e)}", exc_info=True)
+
+    def backfill_product_search(self):
+        """商品搜索索引为空时全量构建"""
+        try:
+            from services.product_search import backfill_product_search
+            with get_conn() as conn:
+                backfill_product_search(conn)
+        except Exception as e:
+            logger.error(f"[定时任务] 构建商品搜索索引失败: {str(e)}", exc_info=True)
+
+    def backfill_product_pinyin(self):
+        """补全缺失的商品拼音"""
+        try:
+            from services.pinyin_service import backfill_missing
+            with get_conn() as conn:
+                backfill_missing(conn)
+        except Exception as e:
+            logger.error(f"[定时任务] 补全商品拼音失败: {str(e)}", exc_info=True)
+
+    def retry_image_variants(self):
+        """重新派发超时未完成的图片处理任务"""
+        try:
+            from services.image_pipeline import retry_pending
+            with get_conn() as conn:
+                retry_pending(conn)
+        except Exception as e:
+            logger.error(f"[定时任务] 重新派发图片处理任务失败: {str(e)}", exc_info=True)
+
+    def collect_image_blobs(self):
+        """删除无人引用的内容寻址图片文件"""
+        try:
+            from services.image_store import collect_garbage
+            with get_conn() as conn:
+                collect_garbage(conn)
+        except Exception as e:
+            logger.error(f"[定时任务] 回收图片文件失败: {str(e)}", exc_info=True)
+
     def poll_applyment_status(self):
         """轮询审核中的进件状态"""
         try:
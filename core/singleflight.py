@@ -0,0 +1,171 @@
+"""
+进程内请求合并（single-flight）
+
+@singleflight(ttl=…)：同一进程内参数相同的并发调用共享一次执行——第一个调用执行，其余等待并拿到同一结果
+（或同一异常）；ttl > 0 时成功结果再保留 ttl 秒，吸收紧随其后的突发请求
+- 同步函数（含 FastAPI 线程池中执行的路由）与 async 函数均可使用
+- 参数按函数签名规整（位置参数 / 关键字参数 / 默认值视为同一调用）；ignore 中的参数（如依赖注入的 service）
+  不参与合并键；参数不可哈希时不合并，直接执行
+- 结果在调用方之间共享，调用方不要修改返回的对象
+- stats() 返回每个函数的调用数、实际执行数、合并数（等待进行中的执行）与 ttl 命中数，
+  随 GET /api/system/background-jobs 返回（按进程统计）
+"""
+import asyncio
+import functools
+import inspect
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+from core.cache import LRUCache
+from core.config import SINGLEFLIGHT_CACHE_SIZE
+
+_MISSING = object()
+
+_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"calls": 0, "executed": 0, "collapsed": 0,
+                                                          "ttl_hits": 0, "bypassed": 0})
+_stats_lock = threading.Lock()
+
+
+def _count(name: str, field: str) -> None:
+    with _stats_lock:
+        _stats[name]["calls"] += 1
+        _stats[name][field] += 1
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """{函数名: {calls, executed, collapsed, ttl_hits, bypassed}}"""
+    with _stats_lock:
+        return {name: dict(counters) for name, counters in _stats.items()}
+
+
+def _freeze(value: Any) -> Hashable:
+    """把参数值转成可哈希的规整形式（dict 按键排序，list / tuple / set 逐项转换）"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(v) for v in value)
+    hash(value)
+    return value
+
+
+class _Call:
+    """一次进行中的同步执行"""
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+def singleflight(ttl: float = 0, ignore: Iterable[str] = (), name: Optional[str] = None,
+                 cache_size: int = SINGLEFLIGHT_CACHE_SIZE):
+    """
+    合并参数相同的并发调用
+
+    Args:
+        ttl: 成功结果保留的秒数（0 表示只合并同时进行的调用）
+        ignore: 不参与合并键的参数名
+        name: 统计中使用的名称（默认 模块.函数名）
+    """
+    ignored = set(ignore)
+
+    def decorator(fn: Callable):
+        signature = inspect.signature(fn)
+        label = name or f"{fn.__module__}.{fn.__qualname__}"
+        recent = LRUCache(cache_size, ttl) if ttl > 0 else None
+        lock = threading.Lock()
+
+        def _key(args, kwargs) -> Optional[Hashable]:
+            try:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                return tuple((k, _freeze(v)) for k, v in bound.arguments.items() if k not in ignored)
+            except TypeError:
+                return None
+
+        if inspect.iscoroutinefunction(fn):
+            pending: Dict[Hashable, asyncio.Future] = {}
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                key = _key(args, kwargs)
+                if key is None:
+                    _count(label, "bypassed")
+                    return await fn(*args, **kwargs)
+                if recent is not None:
+                    cached = recent.get(key, _MISSING)
+                    if cached is not _MISSING:
+                        _count(label, "ttl_hits")
+                        return cached
+
+                loop = asyncio.get_running_loop()
+                slot = (id(loop), key)
+                future = pending.get(slot)
+                if future is not None:
+                    _count(label, "collapsed")
+                    return await asyncio.shield(future)
+
+                _count(label, "executed")
+                future = pending[slot] = loop.create_future()
+                try:
+                    result = await fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                    future.exception()  # 已由本调用抛出，避免无人等待时的 "never retrieved" 警告
+                    raise
+                else:
+                    if recent is not None:
+                        recent.set(key, result)
+                    future.set_result(result)
+                    return result
+                finally:
+                    pending.pop(slot, None)
+        else:
+            calls: Dict[Hashable, _Call] = {}
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                key = _key(args, kwargs)
+                if key is None:
+                    _count(label, "bypassed")
+                    return fn(*args, **kwargs)
+
+                with lock:
+                    if recent is not None:
+                        cached = recent.get(key, _MISSING)
+                        if cached is not _MISSING:
+                            _count(label, "ttl_hits")
+                            return cached
+                    call = calls.get(key)
+                    leader = call is None
+                    if leader:
+                        call = calls[key] = _Call()
+
+                if not leader:
+                    _count(label, "collapsed")
+                    call.done.wait()
+                    if call.error is not None:
+                        raise call.error
+                    return call.result
+
+                _count(label, "executed")
+                try:
+                    call.result = fn(*args, **kwargs)
+                    if recent is not None:
+                        recent.set(key, call.result)
+                    return call.result
+                except BaseException as e:
+                    call.error = e
+                    raise
+                finally:
+                    with lock:
+                        calls.pop(key, None)
+                    call.done.set()
+
+        return wrapper
+
+    return decorator
@@ -58,6 +58,29 @@ class DatabaseManager:
             # 如果表不存在，会在创建表时处理
             logger.debug(f"表 {table_name} 可能不存在，将在创建表时处理: {e}")
 
+    def _ensure_table_indexes(self, cursor, table_name: str, required_indexes: dict):
+        """
+        确保表的必需索引存在，如果不存在则添加
+
+        Args:
+            cursor: 数据库游标
+            table_name: 表名
+            required_indexes: 必需索引字典，格式为 {索引名: 索引列定义}
+        """
+        try:
+            cursor.execute(f"SHOW INDEX FROM {table_name}")
+            existing_indexes = {row['Key_name'] for row in cursor.fetchall()}
+
+            for index_name, index_cols in required_indexes.items():
+                if index_name not in existing_indexes:
+                    try:
+                        cursor.execute(f"ALTER TABLE {table_name} ADD INDEX {index_name} ({index_cols})")
+                        logger.info(f"✅ 已添加索引 {table_name}.{index_name}")
+                    except Exception as e:
+                        logger.warning(f"⚠️ 添加索引 {table_name}.{index_name} 失败: {e}")
+        except Exception as e:
+            logger.debug(f"表 {table_name} 可能不存在，跳过索引检查: {e}")
+
     def init_all_tables(self, cursor):
         logger.info("初始化数据库表结构")
 
@@ -396,6 +419,12 @@ class DatabaseManager:
                     INDEX idx_product_id (product_id)
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
             """,
+            'cart_redis_stale': """
+                CREATE TABLE IF NOT EXISTS cart_redis_stale (
+                    user_id BIGINT UNSIGNED PRIMARY KEY COMMENT '用户ID',
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Redis 不可用期间直接修改过 cart 表的用户（其 Redis 购物车哈希待丢弃）'
+            """,
             # 注意：Cart 表的外键约束在表创建后单独添加，避免类型不匹配问题
             # 注意：Orders 和 Order_Items 表已整合到统一的 orders 和 order_items 表中
             'refunds': """
@@ -483,6 +512,7 @@ class DatabaseManager:
                     -- ✅ 新增字段：商品原价（市场价/划线价）
                     original_price DECIMAL(12,2) NULL COMMENT '商品原价',
                     stock INT NULL DEFAULT 0 COMMENT '库存数量',
+                    is_hot TINYINT(1) NOT NULL DEFAULT 0 COMMENT '热门SKU：下单时先在 Redis 预扣库存',
                     -- ✅ 新增字段：商品规格（存储颜色、尺码等）
                     specifications JSON DEFAULT NULL COMMENT '商品规格（如：{"颜色": "红色", "尺码": "XL"}）',
                     created_at DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
@@ -767,6 +797,195 @@ class DatabaseManager:
                 CONSTRAINT fk_store_logos_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
         """,
+            'export_jobs': """
+                CREATE TABLE IF NOT EXISTS export_jobs (
+                    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+                    job_id VARCHAR(32) NOT NULL UNIQUE COMMENT '任务ID（下载凭证）',
+                    export_type VARCHAR(50) NOT NULL COMMENT '导出类型：orders/account_flow/points_log/withdrawals',
+                    file_format VARCHAR(10) NOT NULL DEFAULT 'xlsx' COMMENT '文件格式：xlsx/csv',
+                    params JSON NULL COMMENT '导出筛选参数',
+                    status ENUM('pending','running','success','failed') NOT NULL DEFAULT 'pending',
+                    row_count INT NOT NULL DEFAULT 0 COMMENT '已写入行数',
+                    file_path VARCHAR(500) NULL COMMENT '生成文件路径',
+                    file_name VARCHAR(200) NULL COMMENT '下载文件名',
+                    error_msg VARCHAR(500) NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    finished_at DATETIME NULL,
+                    INDEX idx_status (status),
+                    INDEX idx_created_at (created_at)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """,
+            'ledger_reconcile_checkpoints': """
+                CREATE TABLE IF NOT EXISTS ledger_reconcile_checkpoints (
+                    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+                    scope VARCHAR(30) NOT NULL COMMENT '对账范围：pool资金池/member_points会员积分/merchant_points商家积分',
+                    subject_key VARCHAR(64) NOT NULL COMMENT '账户标识：资金池 account_type 或用户ID；* 表示该范围的全局游标',
+                    last_flow_id BIGINT UNSIGNED NOT NULL DEFAULT 0 COMMENT '已校验到的最后一条流水ID',
+                    running_sum DECIMAL(18,4) NOT NULL DEFAULT 0.0000 COMMENT '截至 last_flow_id 的流水累计',
+                    last_balance DECIMAL(18,4) NULL COMMENT '最近一次对账时读取的账户余额',
+                    status ENUM('ok','mismatch') NOT NULL DEFAULT 'ok',
+                    verified_at DATETIME NULL COMMENT '最近一次对账时间',
+                    UNIQUE KEY uk_scope_subject (scope, subject_key),
+                    INDEX idx_status (status)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='账本增量对账检查点'
+            """,
+            'ledger_reconcile_mismatches': """
+                CREATE TABLE IF NOT EXISTS ledger_reconcile_mismatches (
+                    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+                    scope VARCHAR(30) NOT NULL,
+                    subject_key VARCHAR(64) NOT NULL,
+                    expected_balance DECIMAL(18,4) NOT NULL COMMENT '按流水累计应有余额',
+                    actual_balance DECIMAL(18,4) NOT NULL COMMENT '账户实际余额',
+                    diff DECIMAL(18,4) NOT NULL COMMENT '实际 - 应有',
+                    first_bad_flow_id BIGINT UNSIGNED NULL COMMENT '第一条 balance_after 与累计不符的流水ID',
+                    detail VARCHAR(500) NULL,
+                    resolved TINYINT(1) NOT NULL DEFAULT 0,
+                    detected_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    INDEX idx_scope_subject (scope, subject_key, resolved),
+                    INDEX idx_detected_at (detected_at)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='账本对账差异记录'
+            """,
+            'points_ledger': """
+                CREATE TABLE IF NOT EXISTS points_ledger (
+                    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+                    user_id BIGINT UNSIGNED NOT NULL COMMENT '用户ID（公司积分池为平台ID）',
+                    points_type VARCHAR(20) NOT NULL COMMENT 'member/merchant/company/subsidy/referral/team/unilevel/true_total',
+                    delta DECIMAL(14,4) NOT NULL COMMENT '变动值，扣减为负',
+                    balance_after DECIMAL(14,4) NULL COMMENT '变动后余额',
+                    source_kind VARCHAR(30) NOT NULL COMMENT '来源类别，见 services/points_ledger.SOURCE_KINDS',
+                    order_id BIGINT UNSIGNED NULL COMMENT '关联订单ID',
+                    remark VARCHAR(255) NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    INDEX idx_user_type_created (user_id, points_type, created_at),
+                    INDEX idx_type_created (points_type, created_at),
+                    INDEX idx_kind_created (source_kind, created_at),
+                    INDEX idx_order (order_id)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='统一积分/点数账本'
+            """,
+            'balance_snapshot_runs': """
+                CREATE TABLE IF NOT EXISTS balance_snapshot_runs (
+                    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+                    snapshot_at DATETIME NOT NULL COMMENT '快照时刻',
+                    account_flow_id BIGINT UNSIGNED NOT NULL DEFAULT 0 COMMENT '快照包含的最后一条 account_flow ID',
+                    points_log_id BIGINT UNSIGNED NOT NULL DEFAULT 0 COMMENT '快照包含的最后一条 points_log ID',
+                    row_count INT NOT NULL DEFAULT 0,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    INDEX idx_snapshot_at (snapshot_at)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='余额快照批次'
+            """,
+            'balance_snapshots': """
+                CREATE TABLE IF NOT EXISTS balance_snapshots (
+                    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+                    run_id BIGINT UNSIGNED NOT NULL,
+                    scope VARCHAR(30) NOT NULL COMMENT 'pool资金池/member_points会员积分/merchant_points商家积分',
+                    subject_key VARCHAR(64) NOT NULL COMMENT '资金池 account_type 或用户ID',
+                    balance DECIMAL(18,4) NOT NULL,
+                    UNIQUE KEY uk_scope_subject_run (scope, subject_key, run_id),
+                    INDEX idx_run (run_id)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='余额快照（批次内未出现的用户积分视为0）'
+            """,
+            'job_leases': """
+                CREATE TABLE IF NOT EXISTS job_leases (
+                    job_name VARCHAR(64) PRIMARY KEY COMMENT '后台任务名',
+                    holder VARCHAR(128) NOT NULL COMMENT '执行进程（主机名:进程号）',
+                    acquired_at DATETIME NOT NULL COMMENT '取得租约时间',
+                    heartbeat_at DATETIME NOT NULL COMMENT '最近一次续约时间',
+                    last_report JSON NULL COMMENT '最近一次执行的统计（由任务自行上报）'
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='后台任务执行进程（互斥由 MySQL 命名锁保证）'
+            """,
+            'order_receive_confirms': """
+                CREATE TABLE IF NOT EXISTS order_receive_confirms (
+                    order_id BIGINT UNSIGNED PRIMARY KEY COMMENT '订单ID',
+                    order_number VARCHAR(50) NOT NULL COMMENT '订单号',
+                    user_id BIGINT UNSIGNED NOT NULL COMMENT '确认收货的用户',
+                    transaction_id VARCHAR(64) NOT NULL COMMENT '微信支付单号',
+                    status ENUM('pending','confirmed','rejected','failed') NOT NULL DEFAULT 'pending'
+                        COMMENT 'pending待核验/confirmed已完成/rejected微信未确认/failed核验异常',
+                    attempts INT NOT NULL DEFAULT 0 COMMENT '已查询微信次数',
+                    next_check_at DATETIME NOT NULL COMMENT '下次查询时间（退避）',
+                    wx_state TINYINT NULL COMMENT '最近一次查询到的微信订单状态',
+                    message VARCHAR(255) NULL COMMENT '核验结果说明',
+                    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    UNIQUE KEY uk_order_number (order_number),
+                    INDEX idx_status_next (status, next_check_at)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='用户确认收货意图（后台核验微信状态后完成订单）'
+            """,
+            'merchant_order_day_stats': """
+                CREATE TABLE IF NOT EXISTS merchant_order_day_stats (
+                    merchant_id BIGINT UNSIGNED NOT NULL COMMENT '商家ID（0=平台自营）',
+                    stat_date DATE NOT NULL COMMENT '下单日期',
+                    status VARCHAR(30) NOT NULL COMMENT '订单状态',
+                    order_count INT NOT NULL DEFAULT 0 COMMENT '订单数',
+                    total_amount DECIMAL(14,2) NOT NULL DEFAULT 0.00 COMMENT '订单金额合计',
+                    PRIMARY KEY (merchant_id, stat_date, status)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='商家订单日汇总（随订单状态变更增量维护）'
+            """,
+            'product_sales_stats': """
+                CREATE TABLE IF NOT EXISTS product_sales_stats (
+                    product_id BIGINT UNSIGNED PRIMARY KEY COMMENT '商品ID',
+                    sold_quantity BIGINT NOT NULL DEFAULT 0 COMMENT '已售数量（已支付/已发货/已完成且未退款成功）',
+                    sold_amount DECIMAL(14,2) NOT NULL DEFAULT 0.00 COMMENT '销售额',
+                    refunded_quantity BIGINT NOT NULL DEFAULT 0 COMMENT '退款成功数量',
+                    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='商品销量汇总（随订单状态与退款状态变更增量维护）'
+            """,
+            'product_search': """
+                CREATE TABLE IF NOT EXISTS product_search (
+                    product_id BIGINT UNSIGNED PRIMARY KEY COMMENT '商品ID',
+                    user_id BIGINT UNSIGNED NULL COMMENT '商家ID',
+                    status TINYINT NULL COMMENT '商品状态',
+                    title VARCHAR(255) NOT NULL DEFAULT '' COMMENT '商品名',
+                    keywords TEXT COMMENT '分类、商家名、SKU编码、拼音全拼与首字母',
+                    body TEXT COMMENT '商品描述',
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='商品搜索索引（全文索引建表后补建）'
+            """,
+            'image_variants': """
+                CREATE TABLE IF NOT EXISTS image_variants (
+                    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+                    source VARCHAR(100) NOT NULL COMMENT '原图文件名（内容哈希.扩展名）',
+                    kind VARCHAR(30) NOT NULL COMMENT '用途：product_detail/product_banner/avatar/store_logo',
+                    owner_id BIGINT UNSIGNED NOT NULL COMMENT '所属商品ID/用户ID',
+                    url VARCHAR(500) NOT NULL COMMENT '业务记录中保存的地址（处理前为原图，处理后为 detail 尺寸）',
+                    status ENUM('pending','done','failed') NOT NULL DEFAULT 'pending',
+                    attempts INT NOT NULL DEFAULT 0 COMMENT '失败次数',
+                    variants JSON NULL COMMENT '各尺寸URL {detail, list, thumb, *_webp}',
+                    error VARCHAR(500) NULL,
+                    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    UNIQUE KEY uk_source_owner (source, kind, owner_id),
+                    INDEX idx_owner (kind, owner_id),
+                    INDEX idx_url (url),
+                    INDEX idx_status_updated (status, updated_at)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='上传图片的多尺寸处理任务与结果（每个所属记录一行）'
+            """,
+            'image_blobs': """
+                CREATE TABLE IF NOT EXISTS image_blobs (
+                    name VARCHAR(100) PRIMARY KEY COMMENT '内容哈希.扩展名（磁盘路径 cas/前2位/3-4位/name）',
+                    size BIGINT UNSIGNED NULL COMMENT '文件字节数',
+                    refcount INT NOT NULL DEFAULT 0 COMMENT '引用数（引用该文件的 image_variants 行数）',
+                    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    INDEX idx_refcount_updated (refcount, updated_at)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='内容寻址图片文件及引用计数'
+            """,
+            'order_status_history': """
+                CREATE TABLE IF NOT EXISTS order_status_history (
+                    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+                    order_id BIGINT UNSIGNED NOT NULL COMMENT '订单ID',
+                    order_number VARCHAR(50) NOT NULL COMMENT '订单号',
+                    from_status VARCHAR(30) NOT NULL COMMENT '原状态',
+                    to_status VARCHAR(30) NOT NULL COMMENT '新状态',
+                    source VARCHAR(30) NOT NULL COMMENT '触发来源：payment/ship/auto_receive/wx_sync/expire/confirm_receive/refund/manual',
+                    reason VARCHAR(255) NULL COMMENT '原因说明',
+                    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    dispatched_at DATETIME NULL COMMENT '事件已分发给下游的时间（NULL 为待分发）',
+                    INDEX idx_order (order_id),
+                    INDEX idx_dispatch (dispatched_at, id)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='订单状态流转记录（兼作流转事件队列）'
+            """,
         }
 
         # 定义必需字段（用于检查和更新已存在的表）
@@ -832,6 +1051,12 @@ class DatabaseManager:
             'products': {
                 'cover': "cover VARCHAR(500) NULL COMMENT '商品封面图'",
             },
+            'product_skus': {
+                'is_hot': "is_hot TINYINT(1) NOT NULL DEFAULT 0 COMMENT '热门SKU：下单时先在 Redis 预扣库存'",
+            },
+            'job_leases': {
+                'last_report': "last_report JSON NULL COMMENT '最近一次执行的统计（由任务自行上报）'",
+            },
             'wx_applyment': {
                 'is_timeout_alerted': "is_timeout_alerted TINYINT(1) NOT NULL DEFAULT 0 COMMENT '审核超时提醒是否已发送'",
                 'card_period_begin': "card_period_begin VARCHAR(32) NULL COMMENT '身份证有效期开始（可存长期）'",
@@ -839,6 +1064,22 @@ class DatabaseManager:
             }
         }
         
+        # 定义必需索引（已存在的表按需补建）
+        required_indexes = {
+            'account_flow': {
+                'idx_account_type_created': 'account_type, created_at',
+            },
+            'points_log': {
+                'idx_user_type_created': 'user_id, type, created_at',
+            },
+            'orders': {
+                'idx_status_expire': 'status, expire_at',
+                'idx_user_created': 'user_id, created_at, id',
+                'idx_user_status': 'user_id, status',
+                'idx_merchant_created': 'merchant_id, created_at',
+            },
+        }
+
         for table_name, sql in tables.items():
             cursor.execute(sql)
             logger.debug(f"表 `{table_name}` 已创建/确认")
@@ -846,6 +1087,8 @@ class DatabaseManager:
             # 检查并更新表结构（添加缺失的字段）
             if table_name in required_columns:
                 self._ensure_table_columns(cursor, table_name, required_columns[table_name])
+            if table_name in required_indexes:
+                self._ensure_table_indexes(cursor, table_name, required_indexes[table_name])
 
         # 在表创建后添加外键约束（避免类型不匹配问题）
         self._add_cart_foreign_keys(cursor)
@@ -880,6 +1123,35 @@ class DatabaseManager:
                 logger.warning(f"⚠️ 创建索引失败: {e}")
 
         self._init_finance_accounts(cursor)
+
+        # 统一积分账本：首次建表后从历史流水回填
+        try:
+            from core.config import PLATFORM_MERCHANT_ID
+            from services.points_ledger import backfill_points_ledger
+            backfill_points_ledger(cursor, PLATFORM_MERCHANT_ID)
+        except Exception as e:
+            logger.warning(f"⚠️ 统一积分账本回填失败: {e}")
+
+        # 商品搜索：补建 ngram 全文索引（不支持时搜索退回 LIKE 扫描，首次构建由定时任务执行）
+        try:
+            from services.product_search import ensure_fulltext
+            ensure_fulltext(cursor)
+        except Exception as e:
+            logger.warning(f"⚠️ 商品搜索全文索引检查失败: {e}")
+
+        # 商家订单日汇总：首次建表后从订单回填
+        try:
+            from services.merchant_order_stats import backfill_merchant_order_stats
+            backfill_merchant_order_stats(cursor)
+        except Exception as e:
+            logger.warning(f"⚠️ 商家订单日汇总回填失败: {e}")
+
+        # 商品销量汇总：首次建表后从订单回填
+        try:
+            from services.product_sales_stats import backfill_product_sales_stats
+            backfill_product_sales_stats(cursor)
+        except Exception as e:
+            logger.warning(f"⚠️ 商品销量汇总回填失败: {e}")
         logger.info("数据库表结构初始化完成")
 
     def _add_cart_foreign_keys(self, cursor):
@@ -1561,72 +1833,12 @@ def auto_receive_task(db_cfg: dict = None):
         这是一个守护进程，会在后台持续运行。
         需要在应用启动时调用此函数。
     """
-    import threading
-    import time
-    from datetime import datetime
-    
-    def run():
-        while True:
-            try:
-                from core.database import get_conn
-                with get_conn() as conn:
-                    with conn.cursor() as cur:
-                        now = datetime.now()
-                        cur.execute(
-                            "SELECT id, order_number, total_amount FROM orders "
-                            "WHERE status='pending_recv' AND auto_recv_time<=%s",
-                            (now,)
-                        )
-                        for row in cur.fetchall():
-                            cur.execute(
-                                "UPDATE orders SET status='completed' WHERE id=%s",
-                                (row["id"],)
-                            )
-                            # 注意：settle_to_merchant 函数需要从 order 模块导入
-                            # 这里只做订单状态更新，结算逻辑需要单独处理
-                            conn.commit()
-                            logger.debug(f"[auto_receive] 订单 {row['order_number']} 已自动完成。")
-            except Exception as e:
-                logger.error(f"[auto_receive] 异常: {e}")
-            time.sleep(3600)  # 每小时检查一次
-    
-    t = threading.Thread(target=run, daemon=True)
-    t.start()
-    logger.info("自动收货守护进程已启动")
-
-
-# ==================== Product 模块相关功能（已移除 SQLAlchemy ORM） ====================
-
-def _fix_pinyin():
-    """补全商品拼音
-    
-    该函数会检查所有商品，如果 pinyin 字段为空，则自动生成拼音。
-    可重复执行，幂等操作。
-    """
-    try:
-        from pypinyin import lazy_pinyin, Style
-        from core.database import get_conn
-        
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                # 查询所有商品
-                cur.execute("SELECT id, name, pinyin FROM products")
-                products = cur.fetchall()
-                
-                updated_count = 0
-                for product in products:
-                    if not product.get('pinyin'):
-                        pinyin = ' '.join(lazy_pinyin(product['name'], style=Style.NORMAL)).upper()
-                        cur.execute("UPDATE products SET pinyin = %s WHERE id = %s", (pinyin, product['id']))
-                        updated_count += 1
-                
-                conn.commit()
-                logger.debug(f"商品拼音补全完成，更新了 {updated_count} 条记录")
-    except ImportError:
-        logger.warning("⚠️ pypinyin 未安装，跳过拼音补全功能")
-    except Exception as e:
-        logger.error(f"❌ 拼音补全失败: {e}")
+    from services.order_transitions import run_forever
+    from core.job_lease import run_as_leader
 
+    # 超时自动收货由订单状态流转引擎批量执行（与 api.order 中注册的是同一个单实例任务）
+    run_as_leader("order_transitions", run_forever)
+    logger.info("自动收货任务已注册")
 
 
 # 在文件末尾添加
@@ -8,7 +8,7 @@ import pymysql
 from fastapi import FastAPI
 from fastapi.openapi.docs import get_swagger_ui_html, get_swagger_ui_oauth2_redirect_html, get_redoc_html
 from core.json_response import DecimalJSONResponse, register_exception_handlers
-from fastapi.staticfiles import StaticFiles
+from core.http_cache import CachedStaticFiles
 from core.middleware import setup_cors, setup_static_files
 from core.config import get_db_config, PIC_PATH, AVATAR_UPLOAD_DIR,UVICORN_PORT
 from core.logging import setup_logging
@@ -143,8 +143,10 @@ tags_metadata = [
 app.openapi_tags = tags_metadata
 
 # 按优先级先挂载 avatars（用户头像），再挂载 /pic 到商品图片目录
-app.mount("/pic/avatars", StaticFiles(directory=str(AVATAR_UPLOAD_DIR)), name="avatars")
-app.mount("/pic", StaticFiles(directory=str(PIC_PATH)), name="pic")
+# /pic/cas/ 下为内容寻址的图片（新上传的商品图、头像、LOGO），按 immutable 长期缓存
+from services.image_store import CAS_DIR
+app.mount("/pic/avatars", CachedStaticFiles(directory=str(AVATAR_UPLOAD_DIR)), name="avatars")
+app.mount("/pic", CachedStaticFiles(directory=str(PIC_PATH), content_addressed_dir=CAS_DIR), name="pic")
 # 添加 CORS 中间件和静态文件（统一配置）pic_path
 setup_cors(app)
 setup_static_files(app)
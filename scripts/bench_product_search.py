@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""商品搜索基准：在临时表中生成 10 万个商品的检索文档，对比 ngram 全文索引与 LIKE 扫描的查询耗时。
+
+用法：python scripts/bench_product_search.py [--rows 100000] [--queries 200]
+
+- 临时表 product_search_bench 与 product_search 结构相同（CREATE TABLE … LIKE，全文索引一并复制），结束后删除
+- 查询形状与 services.product_search 一致：每个关键词一个必须命中的短语，按标题相关度 ×3 + 全文相关度排序
+- 需要先执行过 database_setup（product_search 及其全文索引已存在）
+"""
+import argparse
+import pathlib
+import random
+import statistics
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import pymysql  # noqa: E402
+
+from core.config import get_db_config  # noqa: E402
+from services.pinyin_service import keywords as pinyin_keywords  # noqa: E402
+from services.product_search import _boolean_term  # noqa: E402
+
+TABLE = "product_search_bench"
+
+BRANDS = ["华为", "小米", "苹果", "海尔", "美的", "格力", "联想", "李宁", "安踏", "三只松鼠", "良品铺子", "百草味"]
+NOUNS = ["手机", "平板", "耳机", "冰箱", "空调", "洗衣机", "笔记本", "运动鞋", "卫衣", "坚果", "牛肉干", "茶叶",
+         "保温杯", "电饭煲", "充电宝", "数据线", "护肤品", "面膜", "大米", "食用油"]
+ADJECTIVES = ["新款", "旗舰", "轻薄", "大容量", "无线", "智能", "有机", "礼盒装", "加厚", "夏季", "限量", "家用"]
+CATEGORIES = ["数码", "家电", "服饰", "食品", "美妆", "家居"]
+MERCHANTS = [f"优选商家{i}号店" for i in range(200)]
+
+
+def _name() -> str:
+    return random.choice(BRANDS) + random.choice(ADJECTIVES) + random.choice(NOUNS)
+
+
+def _fill(cur, rows: int) -> None:
+    batch = []
+    for i in range(1, rows + 1):
+        name = _name()
+        full, initials = pinyin_keywords(name)
+        keywords = " ".join([random.choice(CATEGORIES), random.choice(MERCHANTS), f"SKU{i:08d}", full, initials])
+        body = "，".join(_name() for _ in range(6))
+        batch.append((i, i % 500, 1, name, keywords, body))
+        if len(batch) == 2000:
+            cur.executemany(f"INSERT INTO {TABLE} (product_id, user_id, status, title, keywords, body) "
+                            f"VALUES (%s, %s, %s, %s, %s, %s)", batch)
+            batch.clear()
+    if batch:
+        cur.executemany(f"INSERT INTO {TABLE} (product_id, user_id, status, title, keywords, body) "
+                        f"VALUES (%s, %s, %s, %s, %s, %s)", batch)
+
+
+def _fulltext(cur, words):
+    query = " ".join(filter(None, (_boolean_term(w) for w in words)))
+    cur.execute(
+        f"""SELECT product_id,
+                   MATCH(title) AGAINST(%s IN BOOLEAN MODE) * 3
+                   + MATCH(title, keywords, body) AGAINST(%s IN BOOLEAN MODE) AS score
+            FROM {TABLE}
+            WHERE MATCH(title, keywords, body) AGAINST(%s IN BOOLEAN MODE)
+            ORDER BY score DESC, product_id DESC LIMIT 200""",
+        (query, query, query)
+    )
+    return cur.fetchall()
+
+
+def _like(cur, words):
+    conditions, params = [], []
+    for w in words:
+        conditions.append("(title LIKE %s OR keywords LIKE %s OR body LIKE %s)")
+        params += [f"%{w}%"] * 3
+    cur.execute(
+        f"""SELECT product_id FROM {TABLE} WHERE {' AND '.join(conditions)}
+            ORDER BY product_id DESC LIMIT 200""",
+        tuple(params)
+    )
+    return cur.fetchall()
+
+
+def _measure(cur, fn, queries):
+    timings, hits = [], 0
+    for words in queries:
+        start = time.perf_counter()
+        hits += len(fn(cur, words))
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "p50": statistics.median(timings),
+        "p95": timings[int(len(timings) * 0.95) - 1],
+        "avg_hits": hits / len(queries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(42)
+    queries = []
+    for _ in range(args.queries):
+        kind = random.random()
+        if kind < 0.5:
+            queries.append([random.choice(NOUNS)])
+        elif kind < 0.8:
+            queries.append([random.choice(BRANDS), random.choice(NOUNS)])
+        else:
+            queries.append([pinyin_keywords(random.choice(NOUNS))[0]])
+
+    conn = pymysql.connect(**get_db_config(), cursorclass=pymysql.cursors.DictCursor)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+            cur.execute(f"CREATE TABLE {TABLE} LIKE product_search")
+            print(f"生成 {args.rows} 条检索文档 ...")
+            start = time.perf_counter()
+            _fill(cur, args.rows)
+            conn.commit()
+            print(f"写入耗时 {time.perf_counter() - start:.1f}s")
+
+            for label, fn in (("FULLTEXT ngram", _fulltext), ("LIKE 扫描", _like)):
+                fn(cur, queries[0])  # 预热
+                r = _measure(cur, fn, queries)
+                print(f"{label:<16} p50={r['p50']:.1f}ms  p95={r['p95']:.1f}ms  平均命中={r['avg_hits']:.0f}")
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
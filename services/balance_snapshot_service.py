@@ -0,0 +1,246 @@
+# services/balance_snapshot_service.py - 余额快照与时点余额查询
+"""
+资金池余额 / 用户积分的周期快照
+
+- 快照：按天（或每新增 N 行流水）把 finance_accounts.balance 与 users.member_points / merchant_points
+  写入 balance_snapshots，同一批次记录在 balance_snapshot_runs（含当时两张流水表的最大ID）
+- 时点余额：balance_at(account, ts) = 最近的快照 ± 快照与 ts 之间的流水，
+  扫描范围只取决于快照间隔，与历史总量无关；ts 距现在更近时直接用当前余额倒推
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Optional, Dict, Any
+
+from core.config import (
+    BALANCE_SNAPSHOT_INTERVAL_HOURS, BALANCE_SNAPSHOT_EVERY_ROWS, BALANCE_SNAPSHOT_KEEP_DAYS
+)
+from core.database import get_conn
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+SNAPSHOT_SCOPES: Dict[str, Dict[str, Any]] = {
+    "pool": {
+        "flow_table": "account_flow",
+        "run_flow_column": "account_flow_id",
+        "flow_filter": "account_type = %s",
+    },
+    "member_points": {
+        "flow_table": "points_log",
+        "run_flow_column": "points_log_id",
+        "flow_filter": "user_id = %s AND type = 'member'",
+        "balance_column": "member_points",
+    },
+    "merchant_points": {
+        "flow_table": "points_log",
+        "run_flow_column": "points_log_id",
+        "flow_filter": "user_id = %s AND type = 'merchant'",
+        "balance_column": "merchant_points",
+    },
+}
+
+# 流水 created_at 与 ID 顺序之间允许的偏差（长事务先取ID后提交），用于限定按时间走索引的扫描范围
+_FLOW_TIME_SLACK = timedelta(hours=1)
+_USER_PAGE = 2000
+
+
+def _dec(value) -> Decimal:
+    return Decimal(str(value)) if value is not None else Decimal("0")
+
+
+class BalanceSnapshotService:
+    """余额快照"""
+
+    @staticmethod
+    def take_snapshot() -> Dict[str, Any]:
+        """在一致性快照内读取所有资金池余额与非零用户积分，写入一个新批次"""
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                cur.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+                cur.execute(
+                    """SELECT NOW() AS snapshot_at,
+                              (SELECT COALESCE(MAX(id), 0) FROM account_flow) AS account_flow_id,
+                              (SELECT COALESCE(MAX(id), 0) FROM points_log) AS points_log_id"""
+                )
+                head = cur.fetchone()
+                cur.execute(
+                    "INSERT INTO balance_snapshot_runs (snapshot_at, account_flow_id, points_log_id) VALUES (%s, %s, %s)",
+                    (head["snapshot_at"], head["account_flow_id"], head["points_log_id"])
+                )
+                run_id = cur.lastrowid
+                insert_sql = "INSERT INTO balance_snapshots (run_id, scope, subject_key, balance) VALUES (%s, %s, %s, %s)"
+
+                cur.execute("SELECT account_type, balance FROM finance_accounts")
+                rows = [(run_id, "pool", r["account_type"], _dec(r["balance"])) for r in cur.fetchall()]
+                if rows:
+                    cur.executemany(insert_sql, rows)
+                row_count = len(rows)
+
+                # 用户积分只记录非零值，批次内缺失即为 0
+                last_id = 0
+                while True:
+                    cur.execute(
+                        """SELECT id, member_points, merchant_points FROM users
+                           WHERE id > %s AND (member_points <> 0 OR merchant_points <> 0)
+                           ORDER BY id LIMIT %s""",
+                        (last_id, _USER_PAGE)
+                    )
+                    users = cur.fetchall()
+                    if not users:
+                        break
+                    rows = []
+                    for u in users:
+                        if u["member_points"]:
+                            rows.append((run_id, "member_points", str(u["id"]), _dec(u["member_points"])))
+                        if u["merchant_points"]:
+                            rows.append((run_id, "merchant_points", str(u["id"]), _dec(u["merchant_points"])))
+                    cur.executemany(insert_sql, rows)
+                    row_count += len(rows)
+                    last_id = int(users[-1]["id"])
+
+                cur.execute("UPDATE balance_snapshot_runs SET row_count = %s WHERE id = %s", (row_count, run_id))
+                conn.commit()
+
+        logger.info(f"余额快照已生成: run_id={run_id}, 时刻={head['snapshot_at']}, 共{row_count}条")
+        return {
+            "run_id": run_id,
+            "snapshot_at": head["snapshot_at"].strftime("%Y-%m-%d %H:%M:%S"),
+            "row_count": row_count,
+        }
+
+    @staticmethod
+    def maybe_snapshot() -> Optional[Dict[str, Any]]:
+        """距上次快照超过设定时长或新增流水超过设定行数时生成快照，并清理过期快照"""
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """SELECT snapshot_at, account_flow_id, points_log_id
+                       FROM balance_snapshot_runs ORDER BY snapshot_at DESC LIMIT 1"""
+                )
+                last = cur.fetchone()
+                if last:
+                    cur.execute(
+                        """SELECT (SELECT COALESCE(MAX(id), 0) FROM account_flow) AS account_flow_id,
+                                  (SELECT COALESCE(MAX(id), 0) FROM points_log) AS points_log_id"""
+                    )
+                    now_ids = cur.fetchone()
+                    new_rows = (int(now_ids["account_flow_id"]) - int(last["account_flow_id"])
+                                + int(now_ids["points_log_id"]) - int(last["points_log_id"]))
+                    due = (datetime.now() - last["snapshot_at"] >= timedelta(hours=BALANCE_SNAPSHOT_INTERVAL_HOURS)
+                           or new_rows >= BALANCE_SNAPSHOT_EVERY_ROWS)
+                    if not due:
+                        return None
+
+        result = BalanceSnapshotService.take_snapshot()
+        BalanceSnapshotService.prune()
+        return result
+
+    @staticmethod
+    def prune() -> int:
+        """超过保留期的快照批次只保留每月第一份（按批次整体删除，保证“缺失即为0”的语义）"""
+        cutoff = datetime.now() - timedelta(days=BALANCE_SNAPSHOT_KEEP_DAYS)
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """SELECT r.id FROM balance_snapshot_runs r
+                       WHERE r.snapshot_at < %s
+                         AND r.id NOT IN (
+                             SELECT first_id FROM (
+                                 SELECT MIN(id) AS first_id FROM balance_snapshot_runs
+                                 GROUP BY DATE_FORMAT(snapshot_at, '%%Y-%%m')
+                             ) m
+                         )""",
+                    (cutoff,)
+                )
+                run_ids = [r["id"] for r in cur.fetchall()]
+                for run_id in run_ids:
+                    cur.execute("DELETE FROM balance_snapshots WHERE run_id = %s", (run_id,))
+                    cur.execute("DELETE FROM balance_snapshot_runs WHERE id = %s", (run_id,))
+                    conn.commit()
+        if run_ids:
+            logger.info(f"清理了 {len(run_ids)} 个过期余额快照批次")
+        return len(run_ids)
+
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def balance_at(account, ts: datetime, scope: str = "pool", cur=None) -> Decimal:
+        """
+        查询账户在 ts 时刻的余额
+
+        Args:
+            account: 资金池 account_type（scope=pool）或用户ID（scope=member_points/merchant_points）
+            ts: 时点（该时刻及之前的流水计入）
+            scope: pool / member_points / merchant_points
+            cur: 可复用调用方的游标
+        """
+        if scope not in SNAPSHOT_SCOPES:
+            raise ValueError(f"不支持的余额类型: {scope}")
+        if cur is None:
+            with get_conn() as conn:
+                with conn.cursor() as own_cur:
+                    return BalanceSnapshotService._balance_at(own_cur, scope, str(account), ts)
+        return BalanceSnapshotService._balance_at(cur, scope, str(account), ts)
+
+    @staticmethod
+    def _balance_at(cur, scope: str, key: str, ts: datetime) -> Decimal:
+        cfg = SNAPSHOT_SCOPES[scope]
+        table, flow_filter, flow_col = cfg["flow_table"], cfg["flow_filter"], cfg["run_flow_column"]
+
+        cur.execute(
+            f"""SELECT id, snapshot_at, {flow_col} AS flow_id FROM balance_snapshot_runs
+                WHERE snapshot_at <= %s ORDER BY snapshot_at DESC LIMIT 1""",
+            (ts,)
+        )
+        prev = cur.fetchone()
+        cur.execute(
+            f"""SELECT id, snapshot_at, {flow_col} AS flow_id FROM balance_snapshot_runs
+                WHERE snapshot_at > %s ORDER BY snapshot_at ASC LIMIT 1""",
+            (ts,)
+        )
+        nxt = cur.fetchone()
+
+        # 选择距离 ts 最近的基准：前一个快照正推，或后一个快照（没有则当前余额）倒推
+        next_at = nxt["snapshot_at"] if nxt else datetime.now()
+        if prev and ts - prev["snapshot_at"] <= next_at - ts:
+            base = BalanceSnapshotService._snapshot_balance(cur, prev["id"], scope, key)
+            cur.execute(
+                f"""SELECT COALESCE(SUM(change_amount), 0) AS delta FROM {table}
+                    WHERE {flow_filter} AND created_at >= %s AND created_at <= %s AND id > %s""",
+                (key, prev["snapshot_at"] - _FLOW_TIME_SLACK, ts, prev["flow_id"])
+            )
+            return base + _dec(cur.fetchone()["delta"])
+
+        if nxt:
+            base = BalanceSnapshotService._snapshot_balance(cur, nxt["id"], scope, key)
+            cur.execute(
+                f"""SELECT COALESCE(SUM(change_amount), 0) AS delta FROM {table}
+                    WHERE {flow_filter} AND created_at > %s AND created_at <= %s AND id <= %s""",
+                (key, ts, nxt["snapshot_at"] + _FLOW_TIME_SLACK, nxt["flow_id"])
+            )
+            return base - _dec(cur.fetchone()["delta"])
+
+        base = BalanceSnapshotService._live_balance(cur, scope, key)
+        cur.execute(
+            f"SELECT COALESCE(SUM(change_amount), 0) AS delta FROM {table} WHERE {flow_filter} AND created_at > %s",
+            (key, ts)
+        )
+        return base - _dec(cur.fetchone()["delta"])
+
+    @staticmethod
+    def _snapshot_balance(cur, run_id: int, scope: str, key: str) -> Decimal:
+        cur.execute(
+            "SELECT balance FROM balance_snapshots WHERE scope = %s AND subject_key = %s AND run_id = %s",
+            (scope, key, run_id)
+        )
+        row = cur.fetchone()
+        return _dec(row["balance"]) if row else Decimal("0")
+
+    @staticmethod
+    def _live_balance(cur, scope: str, key: str) -> Decimal:
+        if scope == "pool":
+            cur.execute("SELECT balance FROM finance_accounts WHERE account_type = %s", (key,))
+        else:
+            cur.execute(f"SELECT {SNAPSHOT_SCOPES[scope]['balance_column']} AS balance FROM users WHERE id = %s", (key,))
+        row = cur.fetchone()
+        return _dec(row["balance"]) if row else Decimal("0")
@@ -0,0 +1,475 @@
+# services/cart_store.py - 购物车热存储
+"""
+购物车热存储（Redis 哈希 + 异步回写 MySQL）
+
+- 每个用户的购物车是一个 Redis 哈希 cart:{user_id}，字段为 product_id，值为条目 JSON
+  （sku_id、数量、规格、是否勾选、加入时间）；字段 _loaded 标记哈希已从数据库加载（空购物车同样有效）
+- 商品名称、价格等展示数据来自目录快照 cart:sku:{sku_id} / cart:product:{product_id}（短 TTL），
+  多个条目一次 MGET，缺失的快照一次 IN 查询补齐
+- 写操作只改 Redis（CAS 脚本保证并发点击不丢数量）并把用户加入 cart:dirty；后台回写线程按用户合并，
+  一次事务把该用户整份购物车同步到 cart 表（upsert 现有条目 + 删除已移除的条目）
+- 只有哈希不存在（首次访问 / 过期）时才读 MySQL；Redis 不可用时调用方回落到直接读写 cart 表，
+  并在同一事务内把用户记入 cart_redis_stale：回写线程先丢弃这些用户残留的哈希（下次访问从数据库重新加载），
+  避免 Redis 恢复后旧哈希回写覆盖期间的修改
+"""
+import json
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from core.config import (
+    CART_CACHE_TTL_SECONDS, CART_SNAPSHOT_TTL_SECONDS, CART_FLUSH_SECONDS, CART_FLUSH_BATCH_SIZE
+)
+from core.database import get_conn
+from core.logging import get_logger
+from core.redis_client import get_redis, mark_redis_failed
+
+logger = get_logger(__name__)
+
+CART_KEY = "cart:{}"
+DIRTY_KEY = "cart:dirty"
+SKU_SNAPSHOT_KEY = "cart:sku:{}"
+PRODUCT_SNAPSHOT_KEY = "cart:product:{}"
+_LOADED_FIELD = "_loaded"
+_CAS_RETRIES = 5
+
+# 条目比较并设置：KEYS[1] 购物车哈希，KEYS[2] 待回写集合
+# ARGV: 字段、期望旧值（'' 表示不存在）、新值（'' 表示删除）、user_id、TTL
+# 返回 1 成功，0 期间被并发修改，-1 哈希已不存在（需重新加载）
+_CAS_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], '_loaded') == 0 then return -1 end
+local current = redis.call('HGET', KEYS[1], ARGV[1]) or ''
+if current ~= ARGV[2] then return 0 end
+if ARGV[3] == '' then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+else
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('SADD', KEYS[2], ARGV[4])
+return 1
+"""
+
+# 结算后移除条目：删除字段与加入待回写集合须原子完成，否则并发回写可能把已结算的条目写回 cart 表
+# ARGV: user_id，之后为待删除的字段；哈希未加载时无需处理
+_REMOVE_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], '_loaded') == 0 then return 0 end
+redis.call('HDEL', KEYS[1], unpack(ARGV, 2))
+redis.call('SADD', KEYS[2], ARGV[1])
+return 1
+"""
+
+
+# 整份加载：哈希已被其他请求加载时不覆盖（写操作只在 _loaded 存在后进行）
+# ARGV: TTL，之后为 字段、值 成对出现（含 _loaded）
+_LOAD_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], '_loaded') == 1 then return 0 end
+for i = 2, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+class CartStoreUnavailable(RuntimeError):
+    """Redis 不可用，调用方改为直接读写 cart 表"""
+
+
+def _spec_json(specifications: Optional[Dict[str, Any]]) -> Optional[str]:
+    return json.dumps(specifications, ensure_ascii=False, sort_keys=True) if specifications else None
+
+
+class CartStore:
+    """购物车热存储"""
+
+    _cas = None
+    _load_script = None
+    _remove_script = None
+
+    # ------------------------------------------------------------------ #
+    # 加载 / 读取
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _client():
+        client = get_redis()
+        if client is None:
+            raise CartStoreUnavailable("Redis 不可用")
+        return client
+
+    @classmethod
+    def _load(cls, client, user_id: int) -> None:
+        """缓存未命中：从 cart 表加载整份购物车（同时校验用户存在）"""
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1 FROM users WHERE id = %s", (user_id,))
+                if not cur.fetchone():
+                    raise LookupError(f"users 表中不存在 id={user_id}")
+                cur.execute(
+                    """SELECT product_id, sku_id, quantity, specifications, selected, added_at
+                       FROM cart WHERE user_id = %s""",
+                    (user_id,)
+                )
+                rows = cur.fetchall()
+
+        args: List[Any] = [CART_CACHE_TTL_SECONDS, _LOADED_FIELD, "1"]
+        for r in rows:
+            if not r["sku_id"]:
+                continue  # 无 SKU 的历史条目无法结算，回写时清除
+            args += [str(r["product_id"]), json.dumps({
+                "product_id": r["product_id"],
+                "sku_id": r["sku_id"],
+                "quantity": r["quantity"],
+                "specifications": json.loads(r["specifications"]) if r["specifications"] else None,
+                "selected": r["selected"] if r["selected"] is not None else 1,
+                "added_at": r["added_at"].strftime("%Y-%m-%d %H:%M:%S") if r["added_at"] else None,
+            }, ensure_ascii=False)]
+        if cls._load_script is None:
+            cls._load_script = client.register_script(_LOAD_SCRIPT)
+        cls._load_script(keys=[CART_KEY.format(user_id)], args=args, client=client)
+
+    @classmethod
+    def _entries(cls, client, user_id: int) -> Dict[str, Dict[str, Any]]:
+        key = CART_KEY.format(user_id)
+        raw = client.hgetall(key)
+        if not raw:
+            cls._load(client, user_id)
+            raw = client.hgetall(key)
+        raw.pop(_LOADED_FIELD, None)
+        return {field: json.loads(value) for field, value in raw.items()}
+
+    @classmethod
+    def items(cls, user_id: int, selected_only: bool = False) -> List[Dict[str, Any]]:
+        """购物车条目（不含商品展示数据），按加入时间倒序"""
+        client = cls._client()
+        try:
+            entries = list(cls._entries(client, user_id).values())
+        except LookupError:
+            raise
+        except Exception as e:
+            mark_redis_failed(e)
+            raise CartStoreUnavailable(str(e))
+        if selected_only:
+            entries = [e for e in entries if e.get("selected", 1)]
+        entries.sort(key=lambda e: e.get("added_at") or "", reverse=True)
+        return entries
+
+    @classmethod
+    def list_items(cls, user_id: int) -> List[Dict[str, Any]]:
+        """购物车列表：条目 + 目录快照（商品名称、单价）"""
+        entries = cls.items(user_id)
+        snapshots = cls.sku_snapshots([e["sku_id"] for e in entries if e.get("sku_id")])
+        rows = []
+        for e in entries:
+            snap = snapshots.get(e.get("sku_id"))
+            if not snap:
+                continue  # 商品或 SKU 已删除
+            unit_price = float(snap["price"])
+            rows.append({
+                "user_id": user_id,
+                "product_id": e["product_id"],
+                "sku_id": e["sku_id"],
+                "quantity": e["quantity"],
+                "specifications": e.get("specifications"),
+                "selected": e.get("selected", 1),
+                "added_at": e.get("added_at"),
+                "product_name": snap["product_name"],
+                "unit_price": unit_price,
+                "total_price": unit_price * e["quantity"],
+            })
+        return rows
+
+    # ------------------------------------------------------------------ #
+    # 目录快照
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def sku_snapshots(cls, sku_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """SKU 展示快照 {sku_id: {...}}：先 MGET 缓存，缺失的一次查询补齐"""
+        sku_ids = list(dict.fromkeys(int(s) for s in sku_ids))
+        if not sku_ids:
+            return {}
+        client = cls._client()
+        result: Dict[int, Dict[str, Any]] = {}
+        try:
+            cached = client.mget([SKU_SNAPSHOT_KEY.format(s) for s in sku_ids])
+        except Exception as e:
+            mark_redis_failed(e)
+            cached = [None] * len(sku_ids)
+        missing = []
+        for sku_id, raw in zip(sku_ids, cached):
+            if raw:
+                result[sku_id] = json.loads(raw)
+            else:
+                missing.append(sku_id)
+        if not missing:
+            return result
+
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""SELECT s.id AS sku_id, s.product_id, s.price, p.name AS product_name,
+                               p.is_member_product AS is_vip, p.user_id AS merchant_id
+                        FROM product_skus s JOIN products p ON p.id = s.product_id
+                        WHERE s.id IN ({','.join(['%s'] * len(missing))})""",
+                    tuple(missing)
+                )
+                rows = cur.fetchall()
+        fresh = {}
+        for r in rows:
+            snap = {
+                "sku_id": r["sku_id"], "product_id": r["product_id"], "price": str(r["price"]),
+                "product_name": r["product_name"], "is_vip": r["is_vip"], "merchant_id": r["merchant_id"] or 0,
+            }
+            result[r["sku_id"]] = snap
+            fresh[SKU_SNAPSHOT_KEY.format(r["sku_id"])] = json.dumps(snap, ensure_ascii=False)
+        if fresh:
+            try:
+                pipe = client.pipeline(transaction=False)
+                for key, value in fresh.items():
+                    pipe.set(key, value, ex=CART_SNAPSHOT_TTL_SECONDS)
+                pipe.execute()
+            except Exception as e:
+                mark_redis_failed(e)
+        return result
+
+    @classmethod
+    def default_sku(cls, product_id: int) -> Optional[int]:
+        """商品的默认 SKU（加入购物车时使用），缓存在 cart:product:{product_id}"""
+        client = cls._client()
+        key = PRODUCT_SNAPSHOT_KEY.format(product_id)
+        try:
+            cached = client.get(key)
+        except Exception as e:
+            mark_redis_failed(e)
+            raise CartStoreUnavailable(str(e))
+        if cached:
+            return int(cached) or None
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """SELECT p.id, (SELECT s.id FROM product_skus s WHERE s.product_id = p.id LIMIT 1) AS sku_id
+                       FROM products p WHERE p.id = %s""",
+                    (product_id,)
+                )
+                row = cur.fetchone()
+        if not row:
+            raise LookupError(f"products 表中不存在 id={product_id}")
+        sku_id = row["sku_id"] or 0
+        try:
+            client.set(key, sku_id, ex=CART_SNAPSHOT_TTL_SECONDS)
+        except Exception as e:
+            mark_redis_failed(e)
+        return sku_id or None
+
+    @staticmethod
+    def invalidate_product(product_id: int, sku_ids: Optional[List[int]] = None) -> None:
+        """商品 / SKU 变更后清除快照"""
+        client = get_redis()
+        if client is None:
+            return
+        keys = [PRODUCT_SNAPSHOT_KEY.format(product_id)] + [SKU_SNAPSHOT_KEY.format(s) for s in (sku_ids or [])]
+        try:
+            client.delete(*keys)
+        except Exception as e:
+            mark_redis_failed(e)
+
+    # ------------------------------------------------------------------ #
+    # 写入（只改 Redis，标记待回写）
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def _update(cls, user_id: int, product_id: int, change) -> Any:
+        """
+        对单个条目做读-改-写：change(旧条目或 None) 返回 (新条目或 None, 返回值)，
+        由 CAS 脚本保证并发修改不丢失
+        """
+        client = cls._client()
+        key, field = CART_KEY.format(user_id), str(product_id)
+        try:
+            if cls._cas is None:
+                cls._cas = client.register_script(_CAS_SCRIPT)
+            for _ in range(_CAS_RETRIES):
+                if not client.hexists(key, _LOADED_FIELD):
+                    cls._load(client, user_id)
+                old_raw = client.hget(key, field) or ""
+                new_item, ret = change(json.loads(old_raw) if old_raw else None)
+                new_raw = json.dumps(new_item, ensure_ascii=False) if new_item else ""
+                if new_raw == old_raw:
+                    return ret
+                code = int(cls._cas(keys=[key, DIRTY_KEY],
+                                    args=[field, old_raw, new_raw, user_id, CART_CACHE_TTL_SECONDS], client=client))
+                if code == 1:
+                    return ret
+            raise RuntimeError(f"购物车 {user_id} 并发修改冲突")
+        except (LookupError, RuntimeError):
+            raise
+        except Exception as e:
+            cls._cas = None
+            mark_redis_failed(e)
+            raise CartStoreUnavailable(str(e))
+
+    @classmethod
+    def add(cls, user_id: int, product_id: int, quantity: int,
+            specifications: Optional[Dict[str, Any]] = None) -> bool:
+        sku_id = cls.default_sku(product_id)
+        if not sku_id:
+            raise LookupError(f"product_skus 里找不到 product_id={product_id} 的记录")
+
+        def change(item):
+            if item:
+                item["quantity"] += quantity
+                item["specifications"] = specifications
+                return item, True
+            return {
+                "product_id": product_id, "sku_id": sku_id, "quantity": quantity,
+                "specifications": specifications, "selected": 1,
+                "added_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }, True
+
+        return cls._update(user_id, product_id, change)
+
+    @classmethod
+    def remove(cls, user_id: int, product_id: int) -> bool:
+        return cls._update(user_id, product_id, lambda item: (None, True))
+
+    @classmethod
+    def decrease(cls, user_id: int, product_id: int, quantity: int,
+                 specifications: Optional[Dict[str, Any]] = None) -> bool:
+        def change(item):
+            if not item or _spec_json(item.get("specifications")) != _spec_json(specifications):
+                return item, False
+            item["quantity"] -= quantity
+            return (item if item["quantity"] > 0 else None), True
+
+        return cls._update(user_id, product_id, change)
+
+    @classmethod
+    def remove_selected(cls, user_id: int, product_ids: List[int]) -> None:
+        """
+        下单成功后移除已结算的条目（订单事务已删除 cart 表中的行）
+
+        只删除这些字段（脚本内同时记入待回写），其余条目未回写的修改保留；Redis 不可用时记为待丢弃，
+        避免旧哈希把已结算的条目回写到 cart 表
+        """
+        if not product_ids:
+            return
+        try:
+            client = cls._client()
+            if cls._remove_script is None:
+                cls._remove_script = client.register_script(_REMOVE_SCRIPT)
+            cls._remove_script(keys=[CART_KEY.format(user_id), DIRTY_KEY],
+                               args=[user_id] + [str(p) for p in product_ids], client=client)
+        except Exception as e:
+            if not isinstance(e, CartStoreUnavailable):
+                mark_redis_failed(e)
+            logger.warning(f"[cart] 用户 {user_id} 结算后清理购物车缓存失败，记为待丢弃: {e}")
+            with get_conn() as conn:
+                with conn.cursor() as cur:
+                    cls.mark_stale(cur, user_id)
+                    conn.commit()
+
+    # ------------------------------------------------------------------ #
+    # Redis 不可用期间的直接写入
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def mark_stale(cur, user_id: int) -> None:
+        """绕过 Redis 直接修改 cart 表时调用（同一事务），该用户的哈希在下次回写前丢弃"""
+        cur.execute("INSERT IGNORE INTO cart_redis_stale (user_id) VALUES (%s)", (user_id,))
+
+    @staticmethod
+    def _drop_stale(client) -> int:
+        """丢弃被标记用户的哈希及待回写标记，返回处理的用户数"""
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT user_id FROM cart_redis_stale LIMIT %s", (CART_FLUSH_BATCH_SIZE,))
+                user_ids = [r["user_id"] for r in cur.fetchall()]
+                if not user_ids:
+                    return 0
+                pipe = client.pipeline(transaction=False)
+                for uid in user_ids:
+                    pipe.delete(CART_KEY.format(uid))
+                pipe.srem(DIRTY_KEY, *user_ids)
+                pipe.execute()
+                cur.execute(
+                    f"DELETE FROM cart_redis_stale WHERE user_id IN ({','.join(['%s'] * len(user_ids))})",
+                    tuple(user_ids)
+                )
+                conn.commit()
+        logger.info(f"[cart] 丢弃 {len(user_ids)} 个用户在 Redis 不可用期间失效的购物车缓存")
+        return len(user_ids)
+
+    # ------------------------------------------------------------------ #
+    # 异步回写
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def flush(cls, limit: int = CART_FLUSH_BATCH_SIZE) -> int:
+        """把待回写用户的购物车同步到 cart 表，返回处理的用户数"""
+        client = get_redis()
+        if client is None:
+            return 0
+        try:
+            cls._drop_stale(client)
+        except Exception as e:
+            # 未能丢弃失效哈希时本轮不回写，避免覆盖 cart 表
+            logger.error(f"[cart] 丢弃失效购物车缓存失败，稍后重试: {e}")
+            return 0
+        try:
+            user_ids = client.spop(DIRTY_KEY, limit) or []
+            snapshots: List[Tuple[int, Dict[str, str]]] = []
+            for uid in user_ids:
+                raw = client.hgetall(CART_KEY.format(uid))
+                if raw:
+                    raw.pop(_LOADED_FIELD, None)
+                    snapshots.append((int(uid), raw))
+        except Exception as e:
+            mark_redis_failed(e)
+            return 0
+        if not snapshots:
+            return 0
+
+        try:
+            with get_conn() as conn:
+                with conn.cursor() as cur:
+                    for uid, raw in snapshots:
+                        cls._write_user(cur, uid, [json.loads(v) for v in raw.values()])
+                    conn.commit()
+        except Exception as e:
+            logger.error(f"[cart] 购物车回写失败，稍后重试: {e}", exc_info=True)
+            try:
+                client.sadd(DIRTY_KEY, *[uid for uid, _ in snapshots])
+            except Exception as re:
+                mark_redis_failed(re)
+            return 0
+        return len(snapshots)
+
+    @staticmethod
+    def _write_user(cur, user_id: int, entries: List[Dict[str, Any]]) -> None:
+        """用一次多行 upsert + 一次删除把 cart 表同步为 entries"""
+        if entries:
+            cur.executemany(
+                """INSERT INTO cart (user_id, product_id, sku_id, quantity, specifications, selected, added_at)
+                   VALUES (%s, %s, %s, %s, %s, %s, %s)
+                   ON DUPLICATE KEY UPDATE quantity = VALUES(quantity),
+                                           specifications = VALUES(specifications),
+                                           selected = VALUES(selected)""",
+                [(user_id, e["product_id"], e["sku_id"], e["quantity"], _spec_json(e.get("specifications")),
+                  e.get("selected", 1), e.get("added_at")) for e in entries]
+            )
+            keep = [(e["product_id"], e["sku_id"]) for e in entries]
+            cur.execute(
+                f"""DELETE FROM cart WHERE user_id = %s
+                    AND (product_id, IFNULL(sku_id, 0)) NOT IN ({','.join(['(%s, %s)'] * len(keep))})""",
+                (user_id, *[v for pid, sid in keep for v in (pid, sid or 0)])
+            )
+        else:
+            cur.execute("DELETE FROM cart WHERE user_id = %s", (user_id,))
+
+    @classmethod
+    def run_forever(cls, stop_event: Optional[threading.Event] = None) -> None:
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                if cls.flush() >= CART_FLUSH_BATCH_SIZE:
+                    continue  # 还有积压，立即处理下一批
+            except Exception as e:
+                logger.error(f"[cart] 回写任务异常: {e}", exc_info=True)
+            stop_event.wait(CART_FLUSH_SECONDS)
@@ -0,0 +1,188 @@
+# services/catalog_cache.py - 商品目录缓存
+"""
+商品目录缓存（商品详情、购买规则、分类列表、轮播图）
+
+- 每个商品一个版本号 catalog:ver:{product_id}，整个目录一个版本号 catalog:ver；
+  写入方提交后调用 bump(product_ids)，两者同时 +1
+- 单个商品：键 (product_id, 版本号)，两级副本（进程内 LRU + Redis catalog:product:{id}:{ver}）；
+  版本变化后旧条目不再被读到，随有效期淘汰，不需要逐个删除
+- 列表页：键 (名称, 参数, 目录版本号)，任何商品变化后整体失效
+- Redis 不可用时版本号退回进程内计数（只反映本进程的写入），条目只放进程内，依靠较短的有效期收敛
+- 缓存的是已编码的 JSON 数据（与路由直接返回 dict 时的编码一致），调用方不要修改返回的对象
+"""
+import hashlib
+import json
+import threading
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Callable, Iterable
+
+from fastapi.encoders import jsonable_encoder
+
+from core.cache import LRUCache
+from core.config import (
+    CATALOG_CACHE_SIZE, CATALOG_LOCAL_TTL_SECONDS, CATALOG_PRODUCT_TTL_SECONDS, CATALOG_LIST_TTL_SECONDS
+)
+from core.logging import get_logger
+from core.redis_client import get_redis, mark_redis_failed
+
+logger = get_logger(__name__)
+
+CATALOG_VERSION_KEY = "catalog:ver"
+PRODUCT_VERSION_KEY = "catalog:ver:{}"
+PRODUCT_KEY = "catalog:product:{}:{}"
+LIST_KEY = "catalog:list:{}:{}:{}"
+
+_local = LRUCache(CATALOG_CACHE_SIZE, CATALOG_LOCAL_TTL_SECONDS)
+_local_versions: Dict[str, int] = defaultdict(int)
+_versions_lock = threading.Lock()
+
+
+def _versions(keys: List[str]) -> List[int]:
+    client = get_redis()
+    if client is not None:
+        try:
+            return [int(v or 0) for v in client.mget(keys)]
+        except Exception as e:
+            mark_redis_failed(e)
+    with _versions_lock:
+        return [_local_versions[k] for k in keys]
+
+
+def _shared_version(key: str) -> Optional[int]:
+    """Redis 中的版本号；Redis 不可用时返回 None（进程内计数重启后归零，不能对外作为版本号）"""
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        return int(client.get(key) or 0)
+    except Exception as e:
+        mark_redis_failed(e)
+        return None
+
+
+def catalog_version() -> Optional[int]:
+    """整个目录的版本号（任何商品写入后变化），用作列表类接口的条件请求版本"""
+    return _shared_version(CATALOG_VERSION_KEY)
+
+
+def product_version(product_id: int) -> Optional[int]:
+    """单个商品的版本号，用作商品详情的条件请求版本"""
+    return _shared_version(PRODUCT_VERSION_KEY.format(int(product_id)))
+
+
+def bump(product_ids: Iterable[int] = (), catalog: bool = True) -> None:
+    """
+    商品写入提交后调用：相关商品与整个目录的版本号 +1
+
+    catalog=False 只递增商品版本号（销量变化：详情随之刷新，列表页仍随缓存有效期刷新）
+    """
+    keys = [PRODUCT_VERSION_KEY.format(int(i)) for i in set(product_ids)]
+    if catalog:
+        keys.append(CATALOG_VERSION_KEY)
+    if not keys:
+        return
+    with _versions_lock:
+        for k in keys:
+            _local_versions[k] += 1
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for k in keys:
+            pipe.incr(k)
+        pipe.execute()
+    except Exception as e:
+        mark_redis_failed(e)
+
+
+def _redis_mget(keys: List[str]) -> List[Optional[str]]:
+    client = get_redis()
+    if client is None:
+        return [None] * len(keys)
+    try:
+        return client.mget(keys)
+    except Exception as e:
+        mark_redis_failed(e)
+        return [None] * len(keys)
+
+
+def _redis_set_many(values: Dict[str, Any], ttl: int) -> None:
+    client = get_redis()
+    if client is None or not values:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for key, value in values.items():
+            pipe.set(key, json.dumps(value, ensure_ascii=False), ex=ttl)
+        pipe.execute()
+    except Exception as e:
+        mark_redis_failed(e)
+
+
+def get_products(product_ids: List[int],
+                 loader: Callable[[List[int]], Dict[int, Dict[str, Any]]]) -> Dict[int, Dict[str, Any]]:
+    """
+    批量读取商品 {product_id: 商品字典}，不存在的商品不出现在结果中
+
+    loader(缺失的 id 列表) 返回 {product_id: 商品字典}，一次补齐所有未命中的商品
+    """
+    ids = list(dict.fromkeys(int(i) for i in product_ids))
+    if not ids:
+        return {}
+    versions = dict(zip(ids, _versions([PRODUCT_VERSION_KEY.format(i) for i in ids])))
+
+    result: Dict[int, Dict[str, Any]] = {}
+    missing = []
+    for pid in ids:
+        cached = _local.get(("product", pid, versions[pid]))
+        if cached is not None:
+            result[pid] = cached
+        else:
+            missing.append(pid)
+    if not missing:
+        return result
+
+    raws = _redis_mget([PRODUCT_KEY.format(pid, versions[pid]) for pid in missing])
+    still_missing = []
+    for pid, raw in zip(missing, raws):
+        if raw:
+            result[pid] = json.loads(raw)
+            _local.set(("product", pid, versions[pid]), result[pid])
+        else:
+            still_missing.append(pid)
+    if not still_missing:
+        return result
+
+    loaded = {int(pid): jsonable_encoder(p) for pid, p in loader(still_missing).items()}
+    for pid, product in loaded.items():
+        result[pid] = product
+        _local.set(("product", pid, versions[pid]), product)
+    _redis_set_many({PRODUCT_KEY.format(pid, versions[pid]): p for pid, p in loaded.items()},
+                    CATALOG_PRODUCT_TTL_SECONDS)
+    return result
+
+
+def get_product(product_id: int,
+                loader: Callable[[List[int]], Dict[int, Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    return get_products([product_id], loader).get(int(product_id))
+
+
+def cached_list(name: str, params: Dict[str, Any], loader: Callable[[], Any]) -> Any:
+    """列表页缓存：name 区分接口，params 为筛选与分页参数；任何商品变化后失效"""
+    version = _versions([CATALOG_VERSION_KEY])[0]
+    digest = hashlib.md5(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    local_key = ("list", name, digest, version)
+    cached = _local.get(local_key)
+    if cached is not None:
+        return cached
+
+    redis_key = LIST_KEY.format(name, version, digest)
+    raw = _redis_mget([redis_key])[0]
+    if raw:
+        value = json.loads(raw)
+    else:
+        value = jsonable_encoder(loader())
+        _redis_set_many({redis_key: value}, CATALOG_LIST_TTL_SECONDS)
+    _local.set(local_key, value, ttl=min(CATALOG_LOCAL_TTL_SECONDS, CATALOG_LIST_TTL_SECONDS))
+    return value
@@ -0,0 +1,635 @@
+# services/export_service.py - 流式导出引擎
+"""
+订单 / 资金流水 / 积分流水 / 提现记录的流式导出
+
+- 数据源：服务端游标（core.database.stream_query）分块读取，内存占用恒定
+- CSV：边查边写，直接作为 StreamingResponse 的迭代器返回
+- XLSX：openpyxl write-only 工作表写入磁盘文件，不在内存中构建整个工作簿
+- 大数据量：提交后台任务（export_jobs 表记录状态），完成后凭 job_id 下载
+"""
+import csv
+import io
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Iterator, Callable
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.utils import get_column_letter
+
+from core.config import EXPORT_DIR, EXPORT_CHUNK_SIZE, EXPORT_FILE_KEEP_HOURS
+from core.database import get_conn, stream_query
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+# 账户类型中英文映射（与 OrderManager.export_to_excel 保持一致）
+ACCOUNT_TYPE_LABELS: Dict[str, str] = {
+    "merchant_balance": "商家余额",
+    "public_welfare": "公益基金",
+    "maintain_pool": "平台维护",
+    "subsidy_pool": "周补贴池",
+    "director_pool": "联创奖励",
+    "shop_pool": "社区店",
+    "city_pool": "城市运营中心",
+    "branch_pool": "大区分公司",
+    "fund_pool": "事业发展基金",
+    "company_points": "公司积分账户",
+    "company_balance": "公司余额账户",
+    "platform_revenue_pool": "平台收入池（会员商品）",
+    "wx_applyment_fee": "微信进件手续费",
+    "income": "收入",
+    "expense": "支出"
+}
+
+FILE_FORMATS = ("xlsx", "csv")
+MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+}
+
+# 同时运行的后台导出任务上限，避免大导出占满数据库连接
+_job_slots = threading.BoundedSemaphore(2)
+
+
+def _fmt(value: Any) -> Any:
+    """单元格取值规范化：Decimal 转 float，时间转字符串"""
+    if value is None:
+        return ""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+
+def _parse_range(start: Optional[str], end: Optional[str]) -> tuple:
+    """
+    解析时间范围为半开区间 [start, end)
+
+    支持 'YYYY-MM-DD' 与 'YYYY-MM-DD HH:MM:SS' 两种格式；
+    仅给出日期的结束时间视为包含当天（即次日零点为开区间上界）。
+    """
+    def _parse(value: str, is_end: bool) -> datetime:
+        try:
+            return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            day = datetime.strptime(value, "%Y-%m-%d")
+            return day + timedelta(days=1) if is_end else day
+
+    try:
+        start_dt = _parse(start, False) if start else None
+        end_dt = _parse(end, True) if end else None
+    except ValueError:
+        raise ValueError("时间格式错误，请使用：YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS")
+    if start_dt and end_dt and end_dt < start_dt:
+        raise ValueError("结束时间不能早于开始时间")
+    return start_dt, end_dt
+
+
+class ExportDataset:
+    """一个可导出的数据集：表头 + 查询构造 + 行映射"""
+
+    def __init__(self, name: str, sheet_title: str, headers: List[str],
+                 build_query: Callable[[Dict[str, Any]], tuple],
+                 map_row: Callable[[Dict[str, Any]], list],
+                 money_columns: tuple = ()):
+        self.name = name
+        self.sheet_title = sheet_title
+        self.headers = headers
+        self.build_query = build_query
+        self.map_row = map_row
+        self.money_columns = money_columns  # 从0开始的金额列下标
+
+    def iter_rows(self, filters: Dict[str, Any]) -> Iterator[list]:
+        sql, params = self.build_query(filters)
+        for row in stream_query(sql, tuple(params), chunk_size=EXPORT_CHUNK_SIZE):
+            yield [_fmt(v) for v in self.map_row(row)]
+
+
+# ==================== 订单 ====================
+def _orders_query(filters: Dict[str, Any]) -> tuple:
+    start_dt, end_dt = _parse_range(filters.get("start_time"), filters.get("end_time"))
+    where, params = [], []
+    if start_dt:
+        where.append("o.created_at >= %s")
+        params.append(start_dt)
+    if end_dt:
+        where.append("o.created_at < %s")
+        params.append(end_dt)
+    if filters.get("status"):
+        where.append("o.status = %s")
+        params.append(filters["status"])
+    if filters.get("merchant_id") is not None:
+        where.append("o.merchant_id = %s")
+        params.append(filters["merchant_id"])
+    if filters.get("order_numbers"):
+        where.append(f"o.order_number IN ({','.join(['%s'] * len(filters['order_numbers']))})")
+        params.extend(filters["order_numbers"])
+
+    # 商品信息用相关子查询聚合，一次查询得到整行，避免逐单再查明细
+    sql = f"""
+        SELECT o.order_number, o.merchant_id, o.status, o.total_amount, o.original_amount,
+               COALESCE(o.points_discount, 0) AS points_discount, o.pay_way, o.delivery_way,
+               o.is_member_order, o.user_id, u.name AS user_name, u.mobile AS user_mobile,
+               o.consignee_name, o.consignee_phone, o.province, o.city, o.district, o.shipping_address,
+               o.refund_reason, o.created_at, o.paid_at, o.shipped_at,
+               COALESCE(ms.store_name, mu.name) AS merchant_name,
+               (SELECT GROUP_CONCAT(CONCAT(COALESCE(p.name, ''), ' x', oi.quantity, ' @¥', oi.unit_price)
+                                    SEPARATOR '\\n')
+                  FROM order_items oi
+                  LEFT JOIN products p ON p.id = oi.product_id
+                 WHERE oi.order_id = o.id) AS product_info
+        FROM orders o
+        LEFT JOIN users u ON u.id = o.user_id
+        LEFT JOIN users mu ON mu.id = o.merchant_id AND o.merchant_id > 0
+        LEFT JOIN merchant_stores ms ON ms.user_id = o.merchant_id AND o.merchant_id > 0
+        {('WHERE ' + ' AND '.join(where)) if where else ''}
+        ORDER BY o.id
+    """
+    return sql, params
+
+
+def _orders_row(row: Dict[str, Any]) -> list:
+    total = Decimal(str(row.get("total_amount") or 0))
+    points_discount = Decimal(str(row.get("points_discount") or 0))
+    shipped_at = row.get("shipped_at")
+    if row.get("delivery_way") == "pickup":
+        shipped_at = row.get("paid_at")
+    spec = row.get("refund_reason") or ""
+    if spec:
+        try:
+            parsed = json.loads(spec)
+            if isinstance(parsed, dict):
+                spec = "\n".join(f"{k}: {v}" for k, v in parsed.items())
+        except (ValueError, TypeError):
+            pass
+    return [
+        row.get("order_number"),
+        row.get("merchant_id") or 0,
+        row.get("merchant_name") or "平台自营",
+        row.get("status"),
+        total,
+        row.get("original_amount"),
+        points_discount,
+        total - points_discount,
+        row.get("pay_way") or "wechat",
+        row.get("delivery_way") or "platform",
+        "是" if row.get("is_member_order") else "否",
+        row.get("user_id"),
+        row.get("user_name"),
+        row.get("user_mobile"),
+        row.get("consignee_name"),
+        row.get("consignee_phone"),
+        row.get("province"),
+        row.get("city"),
+        row.get("district"),
+        row.get("shipping_address"),
+        row.get("product_info"),
+        spec,
+        row.get("created_at"),
+        row.get("paid_at"),
+        shipped_at,
+    ]
+
+
+def _earliest_order_time(order_numbers: List[str]) -> Optional[datetime]:
+    """指定订单中最早的下单时间（按 order_number 唯一索引查询）"""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT MIN(created_at) AS first_at FROM orders WHERE order_number IN ({','.join(['%s'] * len(order_numbers))})",
+                tuple(order_numbers)
+            )
+            row = cur.fetchone()
+    return row["first_at"] if row else None
+
+
+def _order_splits_query(filters: Dict[str, Any]) -> tuple:
+    """
+    订单资金拆分明细：从流水备注中提取订单号后按唯一索引关联订单
+
+    备注中的订单号无法走索引，先用 account_flow.created_at 索引把流水限定在订单创建之后
+    （按时间筛选时取开始时间，按订单号导出时取这些订单中最早的下单时间），再解析备注
+    """
+    start_dt, end_dt = _parse_range(filters.get("start_time"), filters.get("end_time"))
+    where, params = ["af.remark IS NOT NULL"], []
+    flow_from = start_dt
+    if filters.get("order_numbers"):
+        first_at = _earliest_order_time(filters["order_numbers"])
+        if first_at is None:
+            where.append("1 = 0")  # 订单不存在
+        elif flow_from is None or first_at > flow_from:
+            flow_from = first_at
+    if flow_from:
+        # 流水一定晚于订单创建
+        where.append("af.created_at >= %s")
+        params.append(flow_from)
+    if start_dt:
+        where.append("o.created_at >= %s")
+        params.append(start_dt)
+    if end_dt:
+        where.append("o.created_at < %s")
+        params.append(end_dt)
+    if filters.get("status"):
+        where.append("o.status = %s")
+        params.append(filters["status"])
+    if filters.get("merchant_id") is not None:
+        where.append("o.merchant_id = %s")
+        params.append(filters["merchant_id"])
+    if filters.get("order_numbers"):
+        where.append(f"o.order_number IN ({','.join(['%s'] * len(filters['order_numbers']))})")
+        params.extend(filters["order_numbers"])
+
+    sql = f"""
+        SELECT o.order_number, o.merchant_id, o.total_amount,
+               COALESCE(o.points_discount, 0) AS points_discount,
+               af.account_type, af.change_amount, af.balance_after, af.flow_type, af.remark, af.created_at
+        FROM account_flow af
+        JOIN orders o
+          ON o.order_number = REGEXP_SUBSTR(af.remark, '[0-9]{{14}}[0-9]+[0-9a-f]{{16}}')
+        WHERE {' AND '.join(where)}
+        ORDER BY af.id
+    """
+    return sql, params
+
+
+def _order_splits_row(row: Dict[str, Any]) -> list:
+    account_type = row.get("account_type") or ""
+    if account_type == "merchant_balance":
+        # 商家余额行按实付金额的20%显示为雨点（与原导出口径一致）
+        actual_pay = Decimal(str(row.get("total_amount") or 0)) - Decimal(str(row.get("points_discount") or 0))
+        amount = f"{int(float(actual_pay) * 0.2)}雨点"
+        balance_after = "-"
+    else:
+        amount = row.get("change_amount")
+        balance_after = row.get("balance_after")
+    return [
+        row.get("order_number"),
+        row.get("merchant_id") or 0,
+        ACCOUNT_TYPE_LABELS.get(account_type, account_type),
+        amount,
+        balance_after,
+        row.get("flow_type"),
+        row.get("remark"),
+        row.get("created_at"),
+    ]
+
+
+# ==================== 资金流水 / 积分流水 / 提现 ====================
+def _ledger_where(filters: Dict[str, Any], alias: str, user_column: str) -> tuple:
+    start_dt, end_dt = _parse_range(filters.get("start_date"), filters.get("end_date"))
+    where, params = [], []
+    if start_dt:
+        where.append(f"{alias}.created_at >= %s")
+        params.append(start_dt)
+    if end_dt:
+        where.append(f"{alias}.created_at < %s")
+        params.append(end_dt)
+    if filters.get("user_id"):
+        where.append(f"{alias}.{user_column} = %s")
+        params.append(filters["user_id"])
+    return where, params
+
+
+def _account_flow_query(filters: Dict[str, Any]) -> tuple:
+    where, params = _ledger_where(filters, "af", "related_user")
+    if filters.get("account_type"):
+        where.append("af.account_type = %s")
+        params.append(filters["account_type"])
+    sql = f"""
+        SELECT af.id, af.account_type, af.related_user, u.name AS user_name,
+               af.change_amount, af.balance_after, af.flow_type, af.remark, af.created_at
+        FROM account_flow af
+        LEFT JOIN users u ON u.id = af.related_user
+        {('WHERE ' + ' AND '.join(where)) if where else ''}
+        ORDER BY af.id
+    """
+    return sql, params
+
+
+def _account_flow_row(row: Dict[str, Any]) -> list:
+    account_type = row.get("account_type") or ""
+    flow_type = row.get("flow_type") or ""
+    return [
+        row.get("id"),
+        account_type,
+        ACCOUNT_TYPE_LABELS.get(account_type, account_type),
+        row.get("related_user"),
+        row.get("user_name"),
+        row.get("change_amount"),
+        row.get("balance_after"),
+        ACCOUNT_TYPE_LABELS.get(flow_type, flow_type),
+        row.get("remark"),
+        row.get("created_at"),
+    ]
+
+
+def _points_log_query(filters: Dict[str, Any]) -> tuple:
+    where, params = _ledger_where(filters, "pl", "user_id")
+    if filters.get("points_type"):
+        where.append("pl.type = %s")
+        params.append(filters["points_type"])
+    sql = f"""
+        SELECT pl.id, pl.user_id, u.name AS user_name, pl.type, pl.change_amount,
+               pl.balance_after, pl.reason, pl.related_order, pl.created_at
+        FROM points_log pl
+        LEFT JOIN users u ON u.id = pl.user_id
+        {('WHERE ' + ' AND '.join(where)) if where else ''}
+        ORDER BY pl.id
+    """
+    return sql, params
+
+
+def _points_log_row(row: Dict[str, Any]) -> list:
+    type_labels = {"member": "会员积分", "merchant": "商家积分", "company": "公司积分"}
+    return [
+        row.get("id"),
+        row.get("user_id"),
+        row.get("user_name"),
+        type_labels.get(row.get("type"), row.get("type")),
+        row.get("change_amount"),
+        row.get("balance_after"),
+        row.get("reason"),
+        row.get("related_order"),
+        row.get("created_at"),
+    ]
+
+
+def _withdrawals_query(filters: Dict[str, Any]) -> tuple:
+    where, params = _ledger_where(filters, "w", "user_id")
+    if filters.get("status"):
+        where.append("w.status = %s")
+        params.append(filters["status"])
+    sql = f"""
+        SELECT w.id, w.user_id, u.name AS user_name, u.mobile AS user_mobile,
+               w.amount, w.tax_amount, w.actual_amount, w.status, w.audit_remark,
+               w.created_at, w.processed_at
+        FROM withdrawals w
+        LEFT JOIN users u ON u.id = w.user_id
+        {('WHERE ' + ' AND '.join(where)) if where else ''}
+        ORDER BY w.id
+    """
+    return sql, params
+
+
+def _withdrawals_row(row: Dict[str, Any]) -> list:
+    status_labels = {
+        "pending_auto": "待自动审核", "pending_manual": "待人工审核",
+        "approved": "已通过", "rejected": "已拒绝"
+    }
+    return [
+        row.get("id"),
+        row.get("user_id"),
+        row.get("user_name"),
+        row.get("user_mobile"),
+        row.get("amount"),
+        row.get("tax_amount"),
+        row.get("actual_amount"),
+        status_labels.get(row.get("status"), row.get("status")),
+        row.get("audit_remark"),
+        row.get("created_at"),
+        row.get("processed_at"),
+    ]
+
+
+DATASETS: Dict[str, ExportDataset] = {
+    "orders": ExportDataset(
+        "orders", "订单详情",
+        ["订单号", "商家ID", "商家名称", "订单状态", "总金额", "原始金额", "积分抵扣", "实付金额",
+         "支付方式", "配送方式", "是否会员订单",
+         "用户ID", "用户姓名", "用户手机号",
+         "收货人", "收货电话", "省份", "城市", "区县", "详细地址",
+         "商品信息", "商品规格", "下单时间", "支付时间", "发货时间"],
+        _orders_query, _orders_row, money_columns=(4, 5, 6, 7)
+    ),
+    "order_splits": ExportDataset(
+        "order_splits", "资金拆分",
+        ["订单号", "商家ID", "账户类型", "变动金额", "变动后余额", "流水类型", "备注", "创建时间"],
+        _order_splits_query, _order_splits_row, money_columns=(3, 4)
+    ),
+    "account_flow": ExportDataset(
+        "account_flow", "资金流水",
+        ["流水ID", "账户类型", "账户名称", "关联用户ID", "用户姓名", "变动金额", "变动后余额",
+         "流水类型", "备注", "创建时间"],
+        _account_flow_query, _account_flow_row, money_columns=(5, 6)
+    ),
+    "points_log": ExportDataset(
+        "points_log", "积分流水",
+        ["流水ID", "用户ID", "用户姓名", "积分类型", "变动积分", "变动后余额", "原因", "关联订单", "创建时间"],
+        _points_log_query, _points_log_row
+    ),
+    "withdrawals": ExportDataset(
+        "withdrawals", "提现记录",
+        ["提现ID", "用户ID", "用户姓名", "用户手机号", "申请金额", "个税", "实际到账",
+         "状态", "审核备注", "申请时间", "处理时间"],
+        _withdrawals_query, _withdrawals_row, money_columns=(4, 5, 6)
+    ),
+}
+
+# 导出类型 -> 包含的数据集（订单导出附带资金拆分工作表）
+EXPORT_TYPES: Dict[str, List[str]] = {
+    "orders": ["orders", "order_splits"],
+    "account_flow": ["account_flow"],
+    "points_log": ["points_log"],
+    "withdrawals": ["withdrawals"],
+}
+
+
+class ExportService:
+    """流式导出：CSV 直接流式返回，XLSX 写入磁盘文件，大导出走后台任务"""
+
+    @staticmethod
+    def _check(export_type: str, file_format: str) -> None:
+        if export_type not in EXPORT_TYPES:
+            raise ValueError(f"不支持的导出类型: {export_type}")
+        if file_format not in FILE_FORMATS:
+            raise ValueError(f"不支持的文件格式: {file_format}，可选: {', '.join(FILE_FORMATS)}")
+
+    @staticmethod
+    def validate(export_type: str, file_format: str, filters: Dict[str, Any]) -> None:
+        """提前校验参数（时间格式等），便于路由层在开始流式输出前返回 422"""
+        ExportService._check(export_type, file_format)
+        _parse_range(filters.get("start_time") or filters.get("start_date"),
+                     filters.get("end_time") or filters.get("end_date"))
+
+    @staticmethod
+    def stream_csv(export_type: str, filters: Dict[str, Any],
+                   counter: Optional[List[int]] = None) -> Iterator[bytes]:
+        """
+        CSV 流式生成器：边从服务端游标读取边输出，适合直接交给 StreamingResponse
+
+        多数据集（如订单+资金拆分）依次输出，中间以空行和数据集标题分隔。
+        counter 若传入单元素列表，会累加写出的数据行数。
+        """
+        ExportService._check(export_type, "csv")
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # UTF-8 BOM，保证 Excel 直接打开中文不乱码
+        yield "\ufeff".encode("utf-8")
+        for idx, name in enumerate(EXPORT_TYPES[export_type]):
+            dataset = DATASETS[name]
+            if idx > 0:
+                writer.writerow([])
+                writer.writerow([f"# {dataset.sheet_title}"])
+            writer.writerow(dataset.headers)
+            pending = 0
+            for values in dataset.iter_rows(filters):
+                writer.writerow(values)
+                pending += 1
+                if counter is not None:
+                    counter[0] += 1
+                if pending >= 500:
+                    yield buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate(0)
+                    pending = 0
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    @staticmethod
+    def write_file(export_type: str, file_format: str, filters: Dict[str, Any], path: Path,
+                   progress: Optional[Callable[[int], None]] = None) -> int:
+        """
+        将导出内容写入文件，返回写入的数据行数
+
+        XLSX 使用 write-only 工作表，单元格逐行落盘，不保留在内存中。
+        """
+        ExportService._check(export_type, file_format)
+        total = 0
+        if file_format == "csv":
+            counter = [0]
+            with open(path, "wb") as f:
+                for chunk in ExportService.stream_csv(export_type, filters, counter):
+                    f.write(chunk)
+            return counter[0]
+
+        header_font = Font(bold=True, color="FFFFFF")
+        header_fill = PatternFill(start_color="2C3E50", end_color="2C3E50", fill_type="solid")
+        header_alignment = Alignment(horizontal="center", vertical="center")
+
+        wb = Workbook(write_only=True)
+        for name in EXPORT_TYPES[export_type]:
+            dataset = DATASETS[name]
+            ws = wb.create_sheet(title=dataset.sheet_title)
+            # write-only 模式需在写入数据前设置列宽
+            for col_idx in range(len(dataset.headers)):
+                ws.column_dimensions[get_column_letter(col_idx + 1)].width = 20
+
+            header_cells = []
+            for header in dataset.headers:
+                cell = WriteOnlyCell(ws, value=header)
+                cell.font = header_font
+                cell.fill = header_fill
+                cell.alignment = header_alignment
+                header_cells.append(cell)
+            ws.append(header_cells)
+
+            for values in dataset.iter_rows(filters):
+                if dataset.money_columns:
+                    row_cells = []
+                    for col_idx, value in enumerate(values):
+                        if col_idx in dataset.money_columns and isinstance(value, float):
+                            cell = WriteOnlyCell(ws, value=value)
+                            cell.number_format = '¥#,##0.00'
+                            row_cells.append(cell)
+                        else:
+                            row_cells.append(value)
+                    ws.append(row_cells)
+                else:
+                    ws.append(values)
+                total += 1
+                if progress and total % 5000 == 0:
+                    progress(total)
+        wb.save(str(path))
+        return total
+
+    # ==================== 后台任务 ====================
+    @staticmethod
+    def submit_job(export_type: str, file_format: str, filters: Dict[str, Any],
+                   file_name: Optional[str] = None) -> Dict[str, Any]:
+        """提交后台导出任务，立即返回下载凭证 job_id"""
+        ExportService.validate(export_type, file_format, filters)
+        job_id = uuid.uuid4().hex
+        file_name = file_name or f"{export_type}_{datetime.now().strftime('%Y%m%d%H%M%S')}.{file_format}"
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """INSERT INTO export_jobs (job_id, export_type, file_format, params, status, file_name)
+                       VALUES (%s, %s, %s, %s, 'pending', %s)""",
+                    (job_id, export_type, file_format, json.dumps(filters, ensure_ascii=False, default=str),
+                     file_name)
+                )
+                conn.commit()
+
+        t = threading.Thread(
+            target=ExportService._run_job,
+            args=(job_id, export_type, file_format, filters),
+            daemon=True
+        )
+        t.start()
+        logger.info(f"[export] 已提交导出任务 {job_id}: {export_type}/{file_format}")
+        return {"job_id": job_id, "status": "pending", "file_name": file_name}
+
+    @staticmethod
+    def _update_job(job_id: str, **fields) -> None:
+        sets = ", ".join(f"{k} = %s" for k in fields)
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"UPDATE export_jobs SET {sets} WHERE job_id = %s", (*fields.values(), job_id))
+                conn.commit()
+
+    @staticmethod
+    def _run_job(job_id: str, export_type: str, file_format: str, filters: Dict[str, Any]) -> None:
+        with _job_slots:
+            path = EXPORT_DIR / f"{job_id}.{file_format}"
+            try:
+                ExportService._update_job(job_id, status="running")
+                rows = ExportService.write_file(
+                    export_type, file_format, filters, path,
+                    progress=lambda n: ExportService._update_job(job_id, row_count=n)
+                )
+                ExportService._update_job(job_id, status="success", row_count=rows,
+                                          file_path=str(path), finished_at=datetime.now())
+                logger.info(f"[export] 导出任务 {job_id} 完成，共 {rows} 行")
+            except Exception as e:
+                logger.error(f"[export] 导出任务 {job_id} 失败: {e}", exc_info=True)
+                path.unlink(missing_ok=True)
+                ExportService._update_job(job_id, status="failed", error_msg=str(e)[:500],
+                                          finished_at=datetime.now())
+
+    @staticmethod
+    def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """SELECT job_id, export_type, file_format, params, status, row_count,
+                              file_path, file_name, error_msg, created_at, finished_at
+                       FROM export_jobs WHERE job_id = %s""",
+                    (job_id,)
+                )
+                return cur.fetchone()
+
+    @staticmethod
+    def clean_expired_files() -> int:
+        """删除超过保留时长的导出文件（由定时任务调用）"""
+        deadline = datetime.now() - timedelta(hours=EXPORT_FILE_KEEP_HOURS)
+        removed = 0
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT job_id, file_path FROM export_jobs WHERE created_at < %s AND file_path IS NOT NULL",
+                    (deadline,)
+                )
+                for row in cur.fetchall():
+                    Path(row["file_path"]).unlink(missing_ok=True)
+                    removed += 1
+                cur.execute("DELETE FROM export_jobs WHERE created_at < %s", (deadline,))
+                conn.commit()
+        return removed
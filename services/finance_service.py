@@ -24,6 +24,12 @@ from core.logging import get_logger
 from core.table_access import build_dynamic_select, get_table_structure, _quote_identifier
 from core.table_access import build_dynamic_select, get_table_structure, _quote_identifier, build_select_list
 from core.db_adapter import build_in_placeholders
+from services.balance_snapshot_service import BalanceSnapshotService
+from services.points_ledger import SOURCE_KINDS, record_points, mirror_points_log, mirror_account_flow
+from services.merchant_order_stats import stats_added, stats_removed
+from services.product_sales_stats import sales_changed
+from services.order_transitions import transition
+from services import order_detail_cache
 
 logger = get_logger(__name__)
 
@@ -210,6 +216,8 @@ class FinanceService:
             delivery_way = order_row.get("delivery_way")
             next_status = "pending_recv" if delivery_way == "pickup" else "pending_ship"
 
+            stats_removed(cur, order_numbers=[order_no])
+            sales_changed(cur, order_numbers=[order_no], new_status=next_status)
             cur.execute(
                 """UPDATE orders SET 
                    merchant_id=%s, total_amount=%s, original_amount=%s,
@@ -217,6 +225,7 @@ class FinanceService:
                    WHERE order_number=%s""",
                 (PLATFORM_MERCHANT_ID, final_amount, total_amount, total_discount, next_status, order_no)
             )
+            stats_added(cur, order_numbers=[order_no])
 
             # 7. 处理会员商品（整个订单级别一次性处理奖励）
             if member_items:
@@ -250,6 +259,7 @@ class FinanceService:
                            VALUES (%s, %s, (SELECT COALESCE(member_points,0) FROM users WHERE id = %s), 'member', %s, %s, NOW())""",
                         (user_id, member_points_earned, user_id, '购买会员商品获得积分', order_id)
                     )
+                    mirror_points_log(cur, cur.lastrowid, 'order_reward')
                     logger.debug(f"用户{user_id}获得积分: +{member_points_earned:.4f}")
 
                 # 发放推荐和团队奖励（传递单件价格和总数量）
@@ -291,6 +301,7 @@ class FinanceService:
                            VALUES (%s, %s, (SELECT COALESCE(member_points,0) FROM users WHERE id = %s), 'member', %s, %s, NOW())""",
                         (user_id, normal_points_earned, user_id, '购买普通商品获得积分', order_id)
                     )
+                    mirror_points_log(cur, cur.lastrowid, 'order_reward')
                     logger.debug(f"用户{user_id}获得积分: +{normal_points_earned:.4f}")
             # 9. 记录完整用户支付链路（100% 收入 → 80% 商家 + 20% 各池）
             allocs = self.get_pool_allocations()
@@ -370,6 +381,7 @@ class FinanceService:
                        VALUES (%s, %s, %s, %s, %s, %s, NOW())""",
                     ('company_points', PLATFORM_MERCHANT_ID, company_points, cp_new_balance, 'income', f"订单#{order_id} 公司积分池+20% ¥{company_points:.4f}")
                 )
+                mirror_account_flow(cur, cur.lastrowid, 'company', 'company_income', order_id=order_id)
                 logger.debug(f"公司积分池增加: ¥{company_points:.4f}（订单#{order_id}）")
                 # 在积分流水中记录公司积分池的变动（便于积分报表追踪）
                 try:
@@ -420,6 +432,7 @@ class FinanceService:
                VALUES (%s, %s, %s, 'member', %s, %s, NOW())""",
             (user_id, -points_to_use, new_balance, '积分抵扣支付', order_id)
         )
+        mirror_points_log(cur, cur.lastrowid, 'points_deduction')
 
         # 更新公司积分池（累计到公司积分）
         cur.execute(
@@ -435,6 +448,8 @@ class FinanceService:
                       %s, %s, NOW())""",
             ('company_points', user_id, points_to_use, 'income', f"用户{user_id}积分抵扣转入")
         )
+        mirror_account_flow(cur, cur.lastrowid, 'company', 'points_deduction',
+                            order_id=order_id, user_id=user_id)
 
         # 同步写入积分流水表，记录公司积分池的增加（设 user_id 为平台ID以示系统入账）
         try:
@@ -693,6 +708,7 @@ class FinanceService:
                         ('referral_points', referrer['referrer_id'], reward_amount,
                          new_balance, 'income', f"推荐奖励 - 订单#{order_id}")
                     )
+                    mirror_account_flow(cur, cur.lastrowid, 'referral', 'referral_reward', order_id=order_id)
 
                     logger.info(f"推荐奖励发放: 用户{referrer['referrer_id']}({referrer_level}星) +{reward_amount:.2f}")
                     total_distributed += reward_amount
@@ -827,6 +843,7 @@ class FinanceService:
                 ('team_reward_points', recipient_id, reward_amount,
                  new_balance, 'income', f"团队L{target_layer}奖励（来自第{actual_layer}层）- 订单#{order_id}")
             )
+            mirror_account_flow(cur, cur.lastrowid, 'team', 'team_reward', order_id=order_id)
 
             total_distributed += reward_amount
             logger.info(
@@ -1247,6 +1264,9 @@ class FinanceService:
                                VALUES (%s, %s, %s, 'member', %s, NULL, NOW())""",
                             (user_id, -points_to_deduct, new_balance, f"周补贴扣减积分（本次积分值:{points_value:.4f}）")
                         )
+                        mirror_points_log(cur, cur.lastrowid, 'subsidy_deduction')
+                        record_points(cur, user_id, 'subsidy', points_to_add, new_subsidy_points, 'weekly_subsidy',
+                                      remark=f"周补贴发放（本次积分值:{points_value:.4f}）")
                         # ====== 将扣除的积分转入公司积分池(已删除) ======
                         # self._add_pool_balance(
                         #     cur, 'company_points', points_to_deduct,
@@ -1349,6 +1369,7 @@ class FinanceService:
                                     (26, platform_subsidy_amount, user26_subsidy_balance,
                                      f"平台积分池补贴发放（company_points基数:{company_points_current:.4f} × 积分值:{points_value:.4f} = 发放{platform_subsidy_amount:.4f}点数，扣除积分{company_points_to_deduct:.4f}）")
                                 )
+                                mirror_points_log(cur, cur.lastrowid, 'weekly_subsidy', points_type='subsidy')
 
                                 # 5. 记录 company_points 的积分变动到 points_log（便于追踪）
                                 try:
@@ -1362,6 +1383,7 @@ class FinanceService:
                                         (PLATFORM_MERCHANT_ID, -company_points_to_deduct, cp_after_balance, 'company',
                                          f"用户26平台积分补贴发放，扣除积分{company_points_to_deduct:.4f}（发放点数等额）")
                                     )
+                                    mirror_points_log(cur, cur.lastrowid, 'weekly_subsidy')
                                 except Exception as e:
                                     logger.debug(f"记录平台积分池积分流水失败: {e}")
 
@@ -1415,49 +1437,46 @@ class FinanceService:
     # ==================== 关键修改4：退款逻辑使用member_points ====================
     def refund_order(self, order_no: str) -> bool:
         try:
-            # 先读取订单信息（只读），随后通过条件更新来避免长时间持有行锁
-            result = self.session.execute(
-                "SELECT order_number, status, is_member_order, user_id, total_amount, merchant_id, original_amount FROM orders WHERE order_number = %s",
-                {"order_number": order_no}
-            )
-            order = result.fetchone()
+            with get_conn() as conn:
+                with conn.cursor() as cur:
+                    # 先读取订单信息，随后通过条件更新来避免长时间持有行锁
+                    cur.execute(
+                        "SELECT id, order_number, status, is_member_order, user_id, total_amount, merchant_id, original_amount FROM orders WHERE order_number = %s",
+                        (order_no,)
+                    )
+                    order = cur.fetchone()
 
-            if not order or order.status == 'refunded':
-                raise FinanceException("订单不存在或已退款")
+                    if not order or order['status'] == 'refunded':
+                        raise FinanceException("订单不存在或已退款")
 
-            # 尝试将订单状态置为 refunded（条件更新保证并发安全且不会长时间锁行）
-            res = self.session.execute(
-                "UPDATE orders SET status = 'refunded' WHERE order_number = %s AND status != 'refunded'",
-                {"order_number": order_no}
-            )
-            if res.rowcount == 0:
-                raise FinanceException("订单已被并发处理或状态已改变")
+                    # 经流转引擎置为 refunded（带状态条件，同时写流转记录、维护商家日汇总与商品销量）
+                    if not transition(cur, 'refunded', order_numbers=[order_no],
+                                      reason=f"订单退款 - 订单#{order_no}", source="refund"):
+                        raise FinanceException("订单已被并发处理或状态已改变")
 
-            is_member = order.is_member_order
-            user_id = order.user_id
-            amount = Decimal(str(order.total_amount))
-            merchant_id = order.merchant_id
+                    order_id = order['id']
+                    is_member = order['is_member_order']
+                    user_id = order['user_id']
+                    amount = Decimal(str(order['total_amount']))
+                    merchant_id = order['merchant_id']
 
-            logger.debug(f"订单退款: {order_no} (会员商品: {is_member})")
+                    logger.debug(f"订单退款: {order_no} (会员商品: {is_member})")
 
-            if is_member:
-                result = self.session.execute(
-                    "SELECT referrer_id FROM user_referrals WHERE user_id = %s",
-                    {"user_id": user_id}
-                )
-                referrer = result.fetchone()
-                if referrer and referrer.referrer_id:
-                    reward_amount = Decimal(str(order.original_amount)) * Decimal('0.50')
-                    self.session.execute(
-                        """UPDATE users SET promotion_balance = promotion_balance - %s
-                           WHERE id = %s AND promotion_balance >= %s""",
-                        {"amount": reward_amount, "user_id": referrer.referrer_id}
-                    )
+                    if is_member:
+                        cur.execute(
+                            "SELECT referrer_id FROM user_referrals WHERE user_id = %s",
+                            (user_id,)
+                        )
+                        referrer = cur.fetchone()
+                        if referrer and referrer['referrer_id']:
+                            reward_amount = Decimal(str(order['original_amount'])) * Decimal('0.50')
+                            cur.execute(
+                                """UPDATE users SET promotion_balance = promotion_balance - %s
+                                   WHERE id = %s AND promotion_balance >= %s""",
+                                (reward_amount, referrer['referrer_id'], reward_amount)
+                            )
 
-                    # 动态构造 SELECT 语句（使用临时连接获取表结构，不影响当前事务）
-                    with get_conn() as temp_conn:
-                        with temp_conn.cursor() as temp_cur:
-                            select_fields, existing_columns = _build_team_rewards_select(temp_cur, ['reward_amount'])
+                            select_fields, existing_columns = _build_team_rewards_select(cur, ['reward_amount'])
                             # 确保包含 user_id 字段（如果不存在则添加默认值 0）
                             if 'user_id' not in existing_columns:
                                 select_fields = "0 AS user_id, " + select_fields
@@ -1469,52 +1488,67 @@ class FinanceService:
                                                f != 'user_id' and not f.startswith('user_id ')]
                                 select_fields = "user_id, " + ", ".join(fields_list)
 
-                    result = self.session.execute(
-                        f"SELECT {select_fields} FROM team_rewards WHERE order_id = %s",
-                        {"order_id": order.id}
-                    )
-                    rewards = result.fetchall()
-                    for reward in rewards:
-                        self.session.execute(
-                            """UPDATE users SET promotion_balance = promotion_balance - %s
-                               WHERE id = %s AND promotion_balance >= %s""",
-                            {"amount": reward.reward_amount, "user_id": reward.user_id}
-                        )
+                            cur.execute(
+                                f"SELECT {select_fields} FROM team_rewards WHERE order_id = %s",
+                                (order_id,)
+                            )
+                            rewards = cur.fetchall()
+                            for reward in rewards:
+                                cur.execute(
+                                    """UPDATE users SET promotion_balance = promotion_balance - %s
+                                       WHERE id = %s AND promotion_balance >= %s""",
+                                    (reward['reward_amount'], reward['user_id'], reward['reward_amount'])
+                                )
 
-                    # 关键修改：退款时扣减member_points（不再是points）
-                    user_points = Decimal(str(order.original_amount))
-                    self.session.execute(
-                        "UPDATE users SET member_points = GREATEST(member_points - %s, 0) WHERE id = %s",
-                        {"points": user_points, "user_id": user_id}
-                    )
-                    self.session.execute(
-                        "UPDATE users SET member_level = GREATEST(member_level - 1, 0) WHERE id = %s",
-                        {"user_id": user_id}
-                    )
-                    logger.info(f"⚠️ 用户{user_id}退款后降级")
+                            # 关键修改：退款时扣减member_points（不再是points）
+                            user_points = Decimal(str(order['original_amount']))
+                            cur.execute(
+                                "SELECT member_points FROM users WHERE id = %s FOR UPDATE",
+                                (user_id,)
+                            )
+                            old_points = Decimal(str(cur.fetchone()['member_points'] or 0))
+                            deducted = min(user_points, old_points)
+                            cur.execute(
+                                "UPDATE users SET member_points = member_points - %s WHERE id = %s",
+                                (deducted, user_id)
+                            )
+                            record_points(cur, user_id, 'member', -deducted, old_points - deducted, 'refund',
+                                          order_id=order_id, remark=f"退款 - 订单#{order_no}")
+                            cur.execute(
+                                "UPDATE users SET member_level = GREATEST(member_level - 1, 0) WHERE id = %s",
+                                (user_id,)
+                            )
+                            logger.info(f"⚠️ 用户{user_id}退款后降级")
 
-                merchant_amount = amount * Decimal('0.80')
+                    # 会员/普通订单都要回收结算给商家（或平台）的 80%
+                    merchant_amount = amount * Decimal('0.80')
 
-                if is_member:
-                    self._check_pool_balance('platform_revenue_pool', merchant_amount)
-                    # 从平台收入池扣减并记录流水
-                    self._add_pool_balance('platform_revenue_pool', -merchant_amount, f"退款 - 订单#{order_no}")
-                else:
-                    if merchant_id == PLATFORM_MERCHANT_ID:
-                        self._add_pool_balance('platform_revenue_pool', -merchant_amount, f"退款 - 订单#{order_no}")
+                    if is_member or merchant_id == PLATFORM_MERCHANT_ID:
+                        # 从平台收入池扣减并记录流水（_add_pool_balance 内校验余额）
+                        self._add_pool_balance(cur, 'platform_revenue_pool', -merchant_amount, f"退款 - 订单#{order_no}")
                     else:
-                        self._check_user_balance(merchant_id, merchant_amount, 'merchant_balance')
-                        self.session.execute(
+                        # 同一事务内锁定商家余额后校验，避免跨连接读到旧值
+                        cur.execute("SELECT merchant_balance FROM users WHERE id = %s FOR UPDATE", (merchant_id,))
+                        row = cur.fetchone()
+                        balance = Decimal(str(row['merchant_balance'] or 0)) if row else Decimal('0')
+                        if balance < merchant_amount:
+                            raise InsufficientBalanceException(f"user:{merchant_id}:merchant_balance", merchant_amount, balance)
+                        cur.execute(
                             "UPDATE users SET merchant_balance = merchant_balance - %s WHERE id = %s",
-                            {"amount": merchant_amount, "merchant_id": merchant_id}
+                            (merchant_amount, merchant_id)
                         )
 
-                self.session.execute(
-                    "UPDATE orders SET refund_status = 'refunded', updated_at = NOW() WHERE id = %s",
-                    {"order_id": order.id}
-                )
+                    # refund_status 为 ENUM，退款完成取 refund_success；先维护商品销量再更新
+                    sales_changed(cur, order_ids=[order_id], new_refund_status='refund_success')
+                    cur.execute(
+                        "UPDATE orders SET refund_status = 'refund_success', updated_at = NOW() WHERE id = %s",
+                        (order_id,)
+                    )
+
+                conn.commit()
 
             logger.debug(f"订单退款成功: {order_no}")
+            order_detail_cache.invalidate(order_no)
             return True
 
         except Exception as e:
@@ -2012,12 +2046,21 @@ class FinanceService:
                 )
                 details = cur.fetchall()
 
+                range_start = datetime.strptime(start_date, "%Y-%m-%d")
+                range_end = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+                opening_balance = BalanceSnapshotService.balance_at(
+                    'public_welfare', range_start - timedelta(seconds=1), cur=cur)
+                closing_balance = BalanceSnapshotService.balance_at(
+                    'public_welfare', min(range_end - timedelta(seconds=1), datetime.now()), cur=cur)
+
                 return {
                     "summary": {
                         "total_transactions": summary['total_transactions'] or 0,
                         "total_income": float(summary['total_income'] or 0),
                         "total_expense": float(summary['total_expense'] or 0),
-                        "net_balance": float((summary['total_income'] or 0) - (summary['total_expense'] or 0))
+                        "net_balance": float((summary['total_income'] or 0) - (summary['total_expense'] or 0)),
+                        "opening_balance": float(opening_balance),
+                        "closing_balance": float(closing_balance)
                     },
                     "details": [{
                         "id": d['id'],
@@ -2779,6 +2822,8 @@ class FinanceService:
                             VALUES (%s, %s, %s, %s, %s, %s, NOW())
                         """, ('director_pool', user_id, points_to_add, 0, 'income',
                               f"联创{weight}星级分红（权重{weight}/{total_weight}）"))
+                        record_points(cur, user_id, 'unilevel', points_to_add, None, 'unilevel_dividend',
+                                      remark=f"联创{weight}星级分红（权重{weight}/{total_weight}）")
 
                         # 【关键修复】从 honor_director 池扣除发放的 points_to_add
                         # 使用 _add_pool_balance（带余额保护）
@@ -3147,6 +3192,7 @@ class FinanceService:
                         ('true_total_points', user_id, -coupon_amount, new_balance, 'expense',
                          f"发放优惠券扣除 - 优惠券#{coupon_id}，金额¥{coupon_amount:.2f}，类型:{applicable_product_type}")
                     )
+                    mirror_account_flow(cur, cur.lastrowid, 'true_total', 'coupon_issue')
 
                     conn.commit()
 
@@ -3715,6 +3761,14 @@ class FinanceService:
                 total_expense = Decimal(str(summary['total_expense'] or 0))
                 net_change = total_income - total_expense
 
+                # 期初/期末余额：最近的余额快照 + 区间流水，不再依赖全部历史
+                range_start = datetime.strptime(start_date, "%Y-%m-%d")
+                range_end = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+                opening_balance = BalanceSnapshotService.balance_at(
+                    account_type, range_start - timedelta(seconds=1), cur=cur)
+                closing_balance = BalanceSnapshotService.balance_at(
+                    account_type, min(range_end - timedelta(seconds=1), datetime.now()), cur=cur)
+
                 # 账户类型中文名称映射
                 account_name_map = {
                     "public_welfare": "公益基金",
@@ -3741,6 +3795,8 @@ class FinanceService:
                         "total_income": total_income,  # 保持Decimal类型
                         "total_expense": total_expense,  # 保持Decimal类型
                         "net_change": net_change,  # 保持Decimal类型
+                        "opening_balance": opening_balance,  # 区间开始时余额
+                        "closing_balance": closing_balance,  # 区间结束时余额
                         "ending_balance": actual_current_balance,  # 保持Decimal类型
                         "query_date_range": f"{start_date} 至 {end_date}"
                     },
@@ -5076,10 +5132,8 @@ class FinanceService:
         """
         查询所有点数类型的流水报表（仅包含点数，不包含积分）
 
-        数据来源：
-        1. account_flow: 推荐、团队、联创、true_total_points 流水（收入和支出）
-        2. weekly_subsidy_records: 周补贴点数发放记录（补贴点数收入）
-        3. 不包含 points_log（这是积分流水，不是点数流水）
+        数据来源：统一积分账本 points_ledger（周补贴、推荐、团队、联创、true_total_points 点数），
+        不包含会员/商家积分流水
 
         Args:
             user_id: 用户ID（可选，不传则查询所有用户）
@@ -5120,61 +5174,40 @@ class FinanceService:
                         "users": []
                     }
 
-                # 批量查询各类点数收入
-                user_ids = [u['id'] for u in users]
-                income_map = {uid: {
+                # 统一账本按 (points_type, user_id) 一次聚合，走 idx_user_type_created / idx_type_created
+                income_map = {u['id']: {
                     'subsidy_points': Decimal('0'),
                     'referral_points': Decimal('0'),
                     'team_reward_points': Decimal('0'),
                     'honor_director': Decimal('0'),
                     'true_total_points': Decimal('0')  # 支出用负数表示
-                } for uid in [u['id'] for u in users]}
-
-                if user_ids:
-                    placeholders, params_dict = build_in_placeholders(user_ids)
-                    params_tuple = tuple(params_dict[f"id{i}"] for i in range(len(user_ids)))
-
-                    # 从 account_flow 查询点数收入（flow_type='income'）
-                    # account_type: referral_points, team_reward_points, honor_director, true_total_points
-                    cur.execute(f"""
-                        SELECT 
-                            related_user,
-                            account_type,
-                            SUM(CASE WHEN flow_type = 'income' THEN change_amount ELSE 0 END) as total_income,
-                            SUM(CASE WHEN flow_type = 'expense' THEN change_amount ELSE 0 END) as total_expense
-                        FROM account_flow
-                        WHERE related_user IN ({placeholders})
-                            AND account_type IN ('referral_points', 'team_reward_points', 'honor_director', 'true_total_points')
-                        GROUP BY related_user, account_type
-                    """, params_tuple)
-
-                    for row in cur.fetchall():
-                        uid = row['related_user']
-                        account_type = row['account_type']
-                        net_change = Decimal(str(row['total_income'] or 0)) - Decimal(
-                            str(abs(row['total_expense'] or 0)))
-
-                        if uid in income_map:
-                            # true_total_points 的支出是负数
-                            if account_type == 'true_total_points':
-                                income_map[uid][account_type] = -Decimal(str(abs(row['total_expense'] or 0)))
-                            else:
-                                income_map[uid][account_type] = Decimal(str(row['total_income'] or 0))
-
-                    # 从 weekly_subsidy_records 查询周补贴点数收入
-                    cur.execute(f"""
-                        SELECT 
-                            user_id,
-                            SUM(subsidy_amount) as total_subsidy_income
-                        FROM weekly_subsidy_records
-                        WHERE user_id IN ({placeholders})
-                        GROUP BY user_id
-                    """, params_tuple)
+                } for u in users}
+                ledger_key = {
+                    'subsidy': 'subsidy_points',
+                    'referral': 'referral_points',
+                    'team': 'team_reward_points',
+                    'unilevel': 'honor_director',
+                }
 
-                    for row in cur.fetchall():
-                        uid = row['user_id']
-                        if uid in income_map:
-                            income_map[uid]['subsidy_points'] = Decimal(str(row['total_subsidy_income'] or 0))
+                ledger_where = "AND user_id = %s" if user_id else ""
+                cur.execute(f"""
+                    SELECT user_id, points_type,
+                           SUM(CASE WHEN delta > 0 THEN delta ELSE 0 END) AS total_income,
+                           SUM(CASE WHEN delta < 0 THEN -delta ELSE 0 END) AS total_expense
+                    FROM points_ledger
+                    WHERE points_type IN ('subsidy', 'referral', 'team', 'unilevel', 'true_total')
+                      {ledger_where}
+                    GROUP BY user_id, points_type
+                """, tuple(user_params))
+
+                for row in cur.fetchall():
+                    uid = row['user_id']
+                    if uid not in income_map:
+                        continue
+                    if row['points_type'] == 'true_total':
+                        income_map[uid]['true_total_points'] = -Decimal(str(row['total_expense'] or 0))
+                    else:
+                        income_map[uid][ledger_key[row['points_type']]] = Decimal(str(row['total_income'] or 0))
 
                 # 组装结果（不包含积分流水）
                 result = []
@@ -5423,30 +5456,21 @@ class FinanceService:
                 if not users:
                     return {"summary": {"total_users": 0, "report_type": "referral_and_team_points"}, "users": []}
 
-                # 批量查询累计收入
-                user_ids = [u['id'] for u in users]
+                # 累计收入：统一账本按 (points_type, user_id) 一次聚合
                 income_map = {}
-
-                if user_ids:
-                    placeholders, params_dict = build_in_placeholders(user_ids)
-                    params_tuple = tuple(params_dict[f"id{i}"] for i in range(len(user_ids)))
-                    cur.execute(f"""
-                        SELECT 
-                            related_user,
-                            account_type,
-                            COALESCE(SUM(change_amount), 0) as total_income
-                        FROM account_flow
-                        WHERE related_user IN ({placeholders})
-                            AND account_type IN ('referral_points', 'team_reward_points')
-                            AND flow_type = 'income'
-                        GROUP BY related_user, account_type
-                    """, params_tuple)
-
-                    for row in cur.fetchall():
-                        uid = row['related_user']
-                        if uid not in income_map:
-                            income_map[uid] = {}
-                        income_map[uid][row['account_type']] = Decimal(str(row['total_income']))
+                ledger_where = "AND user_id = %s" if user_id else ""
+                cur.execute(f"""
+                    SELECT user_id, points_type, COALESCE(SUM(delta), 0) AS total_income
+                    FROM points_ledger
+                    WHERE points_type IN ('referral', 'team') AND delta > 0
+                      {ledger_where}
+                    GROUP BY user_id, points_type
+                """, tuple(user_params))
+
+                ledger_key = {'referral': 'referral_points', 'team': 'team_reward_points'}
+                for row in cur.fetchall():
+                    income_map.setdefault(row['user_id'], {})[ledger_key[row['points_type']]] = \
+                        Decimal(str(row['total_income']))
 
                 result = []
                 for user in users:
@@ -5519,220 +5543,79 @@ class FinanceService:
 
         with get_conn() as conn:
             with conn.cursor() as cur:
-                # ==================== 1. 构建查询参数（统一处理） ====================
-                params_account_flow = []
-                params_wsr = []
-                where_af = []
-                where_wsr = []
-
+                # ==================== 1. 构建查询条件（统一账本，半开区间走索引） ====================
+                where = ["pl.points_type IN ('subsidy', 'referral', 'team', 'unilevel', 'true_total')"]
+                params: List[Any] = []
                 if user_id:
-                    where_af.append("af.related_user = %s")
-                    params_account_flow.append(user_id)
-                    where_wsr.append("wsr.user_id = %s")
-                    params_wsr.append(user_id)
-
+                    where.append("pl.user_id = %s")
+                    params.append(user_id)
                 if start_date:
-                    where_af.append("DATE(af.created_at) >= %s")
-                    params_account_flow.append(start_date)
-                    where_wsr.append("DATE(wsr.week_start) >= %s")
-                    params_wsr.append(start_date)
-
+                    where.append("pl.created_at >= %s")
+                    params.append(start_date)
                 if end_date:
-                    where_af.append("DATE(af.created_at) <= %s")
-                    params_account_flow.append(end_date)
-                    where_wsr.append("DATE(wsr.week_start) <= %s")
-                    params_wsr.append(end_date)
-
-                # 为 account_flow 构建 WHERE 子句
-                base_where_account = "WHERE account_type IN ('subsidy_points', 'referral_points', 'team_reward_points', 'honor_director', 'true_total_points')"
-                if where_af:
-                    account_where = base_where_account + " AND " + " AND ".join(where_af)
-                else:
-                    account_where = base_where_account
-
-                # 为 weekly_subsidy_records 构建 WHERE 子句
-                base_where_wsr = "WHERE 1=1"
-                if where_wsr:
-                    wsr_where = base_where_wsr + " AND " + " AND ".join(where_wsr)
-                else:
-                    wsr_where = base_where_wsr
+                    where.append("pl.created_at < DATE_ADD(%s, INTERVAL 1 DAY)")
+                    params.append(end_date)
+                ledger_where = "WHERE " + " AND ".join(where)
 
-                # ==================== 2. 查询 account_flow 数据 ====================
-                # 先查询总数
-                count_sql = f"SELECT COUNT(*) as total FROM account_flow af {account_where}"
-                cur.execute(count_sql, tuple(params_account_flow))
-                af_total = cur.fetchone()['total'] or 0
+                # ==================== 2. 汇总（一次聚合得到总数与分类合计） ====================
+                cur.execute(f"""
+                    SELECT COUNT(*) AS total,
+                           SUM(CASE WHEN delta > 0 THEN delta ELSE 0 END) AS total_income,
+                           SUM(CASE WHEN delta < 0 THEN delta ELSE 0 END) AS total_expense,
+                           SUM(CASE WHEN points_type = 'subsidy' AND delta > 0 THEN delta ELSE 0 END) AS total_subsidy,
+                           SUM(CASE WHEN points_type = 'referral' AND delta > 0 THEN delta ELSE 0 END) AS total_referral,
+                           SUM(CASE WHEN points_type = 'team' AND delta > 0 THEN delta ELSE 0 END) AS total_team,
+                           SUM(CASE WHEN points_type = 'unilevel' AND delta > 0 THEN delta ELSE 0 END) AS total_unilevel,
+                           SUM(CASE WHEN points_type = 'true_total' AND delta < 0 THEN delta ELSE 0 END) AS total_coupon_deduction
+                    FROM points_ledger pl
+                    {ledger_where}
+                """, tuple(params))
+                summary = cur.fetchone()
+                total_count = int(summary['total'] or 0)
 
-                # 查询明细
+                # ==================== 3. 明细分页 ====================
                 offset = (page - 1) * page_size
-                detail_sql = f"""
-                    SELECT 
-                        af.id as flow_id,
-                        af.related_user as user_id,
-                        u.name as user_name,
-                        af.account_type,
-                        af.change_amount,
-                        af.balance_after,
-                        af.flow_type,
-                        af.remark,
-                        af.created_at
-                    FROM account_flow af
-                    JOIN users u ON af.related_user = u.id
-                    {account_where}
-                    ORDER BY af.created_at DESC
+                cur.execute(f"""
+                    SELECT pl.id AS flow_id, pl.user_id, u.name AS user_name, pl.points_type,
+                           pl.delta, pl.balance_after, pl.source_kind, pl.remark, pl.created_at
+                    FROM points_ledger pl
+                    LEFT JOIN users u ON pl.user_id = u.id
+                    {ledger_where}
+                    ORDER BY pl.created_at DESC, pl.id DESC
                     LIMIT %s OFFSET %s
-                """
-                # 确保参数是列表，最后添加分页参数
-                af_params = list(params_account_flow) + [page_size, offset]
-                cur.execute(detail_sql, tuple(af_params))
-                # 强制转换为列表
-                af_records = list(cur.fetchall())
-
-                # ==================== 3. 查询 weekly_subsidy_records 补充数据 ====================
-                # 查询补充数据源的总数
-                count_wsr_sql = f"SELECT COUNT(*) as total FROM weekly_subsidy_records wsr {wsr_where}"
-                cur.execute(count_wsr_sql, tuple(params_wsr))
-                wsr_total = cur.fetchone()['total'] or 0
-
-                # 如果 account_flow 的记录不足一页，从 wsr 补充
-                wsr_records = []
-                if len(af_records) < page_size:
-                    # 计算在 wsr 中的偏移量
-                    wsr_offset = max(0, offset - af_total)
-                    wsr_limit = page_size - len(af_records)
-
-                    # 查询 wsr 数据
-                    wsr_sql = f"""
-                        SELECT 
-                            wsr.id as record_id,
-                            wsr.user_id,
-                            u.name as user_name,
-                            wsr.subsidy_amount as change_amount,
-                            wsr.week_start as created_at,
-                            wsr.points_deducted,
-                            wsr.points_before
-                        FROM weekly_subsidy_records wsr
-                        JOIN users u ON wsr.user_id = u.id
-                        {wsr_where}
-                        ORDER BY wsr.week_start DESC, wsr.id DESC
-                        LIMIT %s OFFSET %s
-                    """
-                    wsr_params = list(params_wsr) + [wsr_limit, wsr_offset]
-                    cur.execute(wsr_sql, tuple(wsr_params))
-                    wsr_raw = list(cur.fetchall())
-
-                    # 转换格式：将 wsr 记录转换为与 account_flow 一致的格式
-                    for r in wsr_raw:
-                        # 查询该用户的当前 subsidy_points 余额
-                        cur.execute(
-                            "SELECT COALESCE(subsidy_points, 0) as balance FROM users WHERE id = %s",
-                            (r['user_id'],)
-                        )
-                        balance_row = cur.fetchone()
-                        current_balance = Decimal(str(balance_row['balance'] if balance_row else 0))
-
-                        # 转换记录格式
-                        wsr_records.append({
-                            'flow_id': f"wsr_{r['record_id']}",  # 构造唯一ID
-                            'user_id': r['user_id'],
-                            'user_name': r['user_name'],
-                            'account_type': 'subsidy_points',
-                            'change_amount': Decimal(str(r['change_amount'] or 0)),  # 补贴金额即点数
-                            'balance_after': current_balance,
-                            'flow_type': 'income',
-                            'remark': f"周补贴发放（扣减积分{r['points_before'] or 0:.4f}分，发放点数{r['change_amount'] or 0:.4f}点）",
-                            'created_at': r['created_at']
-                        })
+                """, tuple(params) + (page_size, offset))
 
-                # ==================== 4. 合并并排序结果（确保都是列表） ====================
-                # 强制转换为列表（即使 cur.fetchall 返回 tuple）
-                all_records = list(af_records) + list(wsr_records)
-
-                # 统一 created_at 类型：将 date 转换为 datetime
-                for record in all_records:
-                    created_at = record['created_at']
-                    if hasattr(created_at, 'year') and hasattr(created_at, 'month') and hasattr(created_at, 'day'):
-                        # 如果是 date 类型，转换为 datetime
-                        if not hasattr(created_at, 'hour'):
-                            from datetime import datetime
-                            record['created_at'] = datetime.combine(created_at, datetime.min.time())
-
-                # 按创建时间降序排序
-                all_records.sort(key=lambda x: x['created_at'], reverse=True)
-
-                # ==================== 5. 汇总统计（双表合并） ====================
-                # account_flow 汇总
-                summary_af_sql = f"""
-                    SELECT 
-                        SUM(CASE WHEN flow_type = 'income' THEN change_amount ELSE 0 END) as total_income,
-                        SUM(CASE WHEN flow_type = 'expense' THEN change_amount ELSE 0 END) as total_expense,
-                        SUM(CASE WHEN account_type = 'subsidy_points' THEN change_amount ELSE 0 END) as total_subsidy,
-                        SUM(CASE WHEN account_type = 'referral_points' THEN change_amount ELSE 0 END) as total_referral,
-                        SUM(CASE WHEN account_type = 'team_reward_points' THEN change_amount ELSE 0 END) as total_team,
-                        SUM(CASE WHEN account_type = 'honor_director' THEN change_amount ELSE 0 END) as total_unilevel,
-                        SUM(CASE WHEN account_type = 'true_total_points' THEN change_amount ELSE 0 END) as total_coupon_deduction
-                    FROM account_flow af
-                    {account_where}
-                """
-                cur.execute(summary_af_sql, tuple(params_account_flow))
-                af_summary = cur.fetchone()
-
-                # weekly_subsidy_records 汇总（补贴收入）
-                summary_wsr_sql = f"""
-                    SELECT COALESCE(SUM(subsidy_amount), 0) as total_subsidy
-                    FROM weekly_subsidy_records wsr
-                    {wsr_where}
-                """
-                cur.execute(summary_wsr_sql, tuple(params_wsr))
-                wsr_summary = cur.fetchone()
-
-                total_count = af_total + wsr_total
-
-                # ==================== 6. 格式化返回数据 ====================
-                flow_type_base_mapping = {
-                    'subsidy_points': '周补贴收入',
-                    'referral_points': '推荐奖励收入',
-                    'team_reward_points': '团队奖励收入',
-                    'honor_director': '联创星级收入',
-                    'true_total_points': '优惠券扣减'  # 默认值
+                income_labels = {
+                    'subsidy': '周补贴收入',
+                    'referral': '推荐奖励收入',
+                    'team': '团队奖励收入',
+                    'unilevel': '联创星级收入',
                 }
-
                 detailed_records = []
-                for r in all_records:
-                    account_type = r['account_type']
-                    remark = r.get('remark', '')
-
-                    # 智能识别flow_type：如果是true_total_points且remark包含"捐赠"，显示为"用户捐赠"
-                    if account_type == 'true_total_points' and '捐赠' in remark:
+                for r in cur.fetchall():
+                    delta = float(r['delta'])
+                    if r['source_kind'] == 'donation':
                         flow_type_label = '用户捐赠'
-                        flow_category = '支出'
-                        # 确保change_amount为负值
-                        change_amount = -abs(float(r['change_amount']))
-                    else:
-                        flow_type_label = flow_type_base_mapping.get(account_type, account_type)
-                        flow_category = '支出' if account_type == 'true_total_points' else '收入'
-                        change_amount = float(r['change_amount'])
-
-                    # 确保 created_at 是 datetime 对象
-                    created_at = r['created_at']
-                    if hasattr(created_at, 'strftime'):
-                        created_at_str = created_at.strftime("%Y-%m-%d %H:%M:%S")
+                    elif r['source_kind'] == 'coupon_issue':
+                        flow_type_label = '优惠券扣减'
+                    elif delta >= 0 and r['points_type'] in income_labels:
+                        flow_type_label = income_labels[r['points_type']]
                     else:
-                        created_at_str = str(created_at)
+                        flow_type_label = SOURCE_KINDS.get(r['source_kind'], r['source_kind'])
 
                     detailed_records.append({
                         'flow_id': str(r['flow_id']),
                         'user_id': r['user_id'],
                         'user_name': r['user_name'],
                         'flow_type': flow_type_label,
-                        'flow_category': flow_category,
-                        'change_amount': change_amount,
+                        'flow_category': '收入' if delta >= 0 else '支出',
+                        'change_amount': delta,
                         'balance_after': float(r['balance_after']) if r['balance_after'] is not None else None,
                         'remark': r['remark'],
-                        'created_at': created_at_str
+                        'created_at': r['created_at'].strftime("%Y-%m-%d %H:%M:%S")
                     })
 
-                # ==================== 7. 获取当前余额快照（单用户查询时） ====================
+                # ==================== 4. 获取当前余额快照（单用户查询时） ====================
                 current_balances = {}
                 if user_id:
                     cur.execute("""
@@ -5753,17 +5636,15 @@ class FinanceService:
                     'summary': {
                         'report_type': 'all_points_flow_combined',
                         'total_records': total_count,
-                        'total_income': float((af_summary['total_income'] or 0) + (wsr_summary['total_subsidy'] or 0)),
-                        'total_expense': float(af_summary['total_expense'] or 0),
-                        'net_flow': float((af_summary['total_income'] or 0) + (af_summary['total_expense'] or 0) + (
-                                    wsr_summary['total_subsidy'] or 0)),
+                        'total_income': float(summary['total_income'] or 0),
+                        'total_expense': float(summary['total_expense'] or 0),
+                        'net_flow': float((summary['total_income'] or 0) + (summary['total_expense'] or 0)),
                         'breakdown': {
-                            'subsidy_points_income': float(
-                                (af_summary.get('total_subsidy', 0) or 0) + (wsr_summary['total_subsidy'] or 0)),
-                            'referral_points_income': float(af_summary.get('total_referral', 0) or 0),
-                            'team_reward_points_income': float(af_summary.get('total_team', 0) or 0),
-                            'unilevel_points_income': float(af_summary.get('total_unilevel', 0) or 0),
-                            'coupon_deduction_expense': float(af_summary.get('total_coupon_deduction', 0) or 0)
+                            'subsidy_points_income': float(summary['total_subsidy'] or 0),
+                            'referral_points_income': float(summary['total_referral'] or 0),
+                            'team_reward_points_income': float(summary['total_team'] or 0),
+                            'unilevel_points_income': float(summary['total_unilevel'] or 0),
+                            'coupon_deduction_expense': float(summary['total_coupon_deduction'] or 0)
                         },
                         'current_balances': current_balances
                     },
@@ -5774,12 +5655,12 @@ class FinanceService:
                         'total_pages': (total_count + page_size - 1) // page_size if total_count > 0 else 1
                     },
                     'data_sources': {
-                        'account_flow_records': af_total,
-                        'weekly_subsidy_records': wsr_total,
+                        'points_ledger_records': total_count,
                         'merged_records': len(detailed_records)
                     },
                     'records': detailed_records
                 }
+
     def donate_true_total_points(self, user_id: int, amount: float) -> Dict[str, Any]:
         """
         用户捐赠 true_total_points 到公益基金账户（1:1兑换为资金）
@@ -5852,6 +5733,7 @@ class FinanceService:
                          f"用户捐赠true_total_points到公益基金 - 捐赠金额¥{donation_amount:.4f}")
                     )
                     expense_flow_id = cur.lastrowid
+                    mirror_account_flow(cur, expense_flow_id, 'true_total', 'donation')
 
                     # 7. 记录公益基金账户收入流水
                     cur.execute(
@@ -6295,166 +6177,58 @@ class FinanceService:
         """
         总积分明细报表（包含用户积分、商家积分、公司积分池）
 
-        整合三类积分流水，提供总余额合计
+        三类积分流水统一从 points_ledger 读取，提供总余额合计
         """
         logger.info(f"生成总积分明细报表: 用户={user_id or '所有用户'}, 日期范围={start_date}至{end_date}")
 
         with get_conn() as conn:
             with conn.cursor() as cur:
-                # ==================== 1. 查询 member_points 流水 ====================
-                member_where = ["pl.type = 'member'"]
-                member_params = []
-
+                # ==================== 1. 构建查询条件（统一账本，半开区间走索引） ====================
+                where = ["pl.points_type IN ('member', 'merchant', 'company')"]
+                params: List[Any] = []
                 if user_id:
-                    member_where.append("pl.user_id = %s")
-                    member_params.append(user_id)
-                if start_date:
-                    member_where.append("DATE(pl.created_at) >= %s")
-                    member_params.append(start_date)
-                if end_date:
-                    member_where.append("DATE(pl.created_at) <= %s")
-                    member_params.append(end_date)
-
-                member_sql = f"""
-                    SELECT 
-                        pl.id as flow_id,
-                        pl.user_id,
-                        u.name as user_name,
-                        pl.change_amount,
-                        pl.balance_after,
-                        pl.reason as remark,
-                        pl.created_at,
-                        'member_points' as points_type
-                    FROM points_log pl
-                    JOIN users u ON pl.user_id = u.id
-                    WHERE {" AND ".join(member_where)}
-                """
-
-                # ==================== 2. 查询 merchant_points 流水 ====================
-                merchant_where = ["pl.type = 'merchant'"]
-                merchant_params = []
-
-                if user_id:
-                    merchant_where.append("pl.user_id = %s")
-                    merchant_params.append(user_id)
-                if start_date:
-                    merchant_where.append("DATE(pl.created_at) >= %s")
-                    merchant_params.append(start_date)
-                if end_date:
-                    merchant_where.append("DATE(pl.created_at) <= %s")
-                    merchant_params.append(end_date)
-
-                merchant_sql = f"""
-                    SELECT 
-                        pl.id as flow_id,
-                        pl.user_id,
-                        u.name as user_name,
-                        pl.change_amount,
-                        pl.balance_after,
-                        pl.reason as remark,
-                        pl.created_at,
-                        'merchant_points' as points_type
-                    FROM points_log pl
-                    JOIN users u ON pl.user_id = u.id
-                    WHERE {" AND ".join(merchant_where)}
-                """
-
-                # ==================== 3. 查询 company_points 流水 ====================
-                company_where = ["af.account_type = 'company_points'"]
-                company_params = []
-
-                if user_id:
-                    company_where.append("af.related_user = %s")
-                    company_params.append(user_id)
+                    where.append("pl.user_id = %s")
+                    params.append(user_id)
                 if start_date:
-                    company_where.append("DATE(af.created_at) >= %s")
-                    company_params.append(start_date)
+                    where.append("pl.created_at >= %s")
+                    params.append(start_date)
                 if end_date:
-                    company_where.append("DATE(af.created_at) <= %s")
-                    company_params.append(end_date)
-
-                company_sql = f"""
-                    SELECT 
-                        af.id as flow_id,
-                        af.related_user as user_id,
-                        COALESCE(u.name, '平台') as user_name,
-                        af.change_amount,
-                        af.balance_after,
-                        af.remark,
-                        af.created_at,
-                        'company_points' as points_type
-                    FROM account_flow af
-                    LEFT JOIN users u ON af.related_user = u.id
-                    WHERE {" AND ".join(company_where)}
-                """
-
-                # ==================== 4. 合并查询（UNION ALL）====================
-                union_sql = f"""
-                    ({member_sql})
-                    UNION ALL
-                    ({merchant_sql})
-                    UNION ALL
-                    ({company_sql})
-                    ORDER BY created_at DESC
-                """
-
-                # 计算总数
-                count_sql = f"SELECT COUNT(*) as total FROM ({union_sql}) as combined"
-                cur.execute(count_sql, tuple(member_params + merchant_params + company_params))
-                total_count = cur.fetchone()['total'] or 0
-
-                # 分页查询
-                offset = (page - 1) * page_size
-                paged_sql = union_sql + f" LIMIT %s OFFSET %s"
-                all_params = member_params + merchant_params + company_params + [page_size, offset]
-
-                cur.execute(paged_sql, tuple(all_params))
-                records = cur.fetchall()
-
-                # ==================== 5. 汇总统计（各类型分别统计）====================
-                # member 汇总
-                member_count_params = [p for p in [user_id, start_date, end_date] if p]
-                cur.execute(f"""
-                    SELECT 
-                        COUNT(*) as count,
-                        SUM(CASE WHEN change_amount > 0 THEN change_amount ELSE 0 END) as income,
-                        SUM(CASE WHEN change_amount < 0 THEN ABS(change_amount) ELSE 0 END) as expense,
-                        SUM(change_amount) as net_change
-                    FROM points_log pl
-                    WHERE type = 'member' {"AND user_id = %s" if user_id else ""} 
-                    {"AND DATE(created_at) >= %s" if start_date else ""}
-                    {"AND DATE(created_at) <= %s" if end_date else ""}
-                """, tuple(member_count_params))
-                member_summary = cur.fetchone()
+                    where.append("pl.created_at < DATE_ADD(%s, INTERVAL 1 DAY)")
+                    params.append(end_date)
+                ledger_where = "WHERE " + " AND ".join(where)
 
-                # merchant 汇总
+                # ==================== 2. 分类型汇总（一次 GROUP BY）====================
                 cur.execute(f"""
-                    SELECT 
-                        COUNT(*) as count,
-                        SUM(CASE WHEN change_amount > 0 THEN change_amount ELSE 0 END) as income,
-                        SUM(CASE WHEN change_amount < 0 THEN ABS(change_amount) ELSE 0 END) as expense,
-                        SUM(change_amount) as net_change
-                    FROM points_log pl
-                    WHERE type = 'merchant' {"AND user_id = %s" if user_id else ""}
-                    {"AND DATE(created_at) >= %s" if start_date else ""}
-                    {"AND DATE(created_at) <= %s" if end_date else ""}
-                """, tuple(member_count_params))
-                merchant_summary = cur.fetchone()
-
-                # company_points 汇总
-                company_count_params = [p for p in [user_id, start_date, end_date] if p]
+                    SELECT pl.points_type,
+                           COUNT(*) as count,
+                           SUM(CASE WHEN pl.delta > 0 THEN pl.delta ELSE 0 END) as income,
+                           SUM(CASE WHEN pl.delta < 0 THEN -pl.delta ELSE 0 END) as expense,
+                           SUM(pl.delta) as net_change
+                    FROM points_ledger pl
+                    {ledger_where}
+                    GROUP BY pl.points_type
+                """, tuple(params))
+                empty_summary = {'count': 0, 'income': 0, 'expense': 0, 'net_change': 0}
+                summaries = {r['points_type']: r for r in cur.fetchall()}
+                member_summary = summaries.get('member', empty_summary)
+                merchant_summary = summaries.get('merchant', empty_summary)
+                company_summary = summaries.get('company', empty_summary)
+                total_count = sum(int(r['count'] or 0) for r in summaries.values())
+
+                # ==================== 3. 明细分页 ====================
+                offset = (page - 1) * page_size
                 cur.execute(f"""
-                    SELECT 
-                        COUNT(*) as count,
-                        SUM(CASE WHEN change_amount > 0 THEN change_amount ELSE 0 END) as income,
-                        SUM(CASE WHEN change_amount < 0 THEN ABS(change_amount) ELSE 0 END) as expense,
-                        SUM(change_amount) as net_change
-                    FROM account_flow
-                    WHERE account_type = 'company_points' {"AND related_user = %s" if user_id else ""}
-                    {"AND DATE(created_at) >= %s" if start_date else ""}
-                    {"AND DATE(created_at) <= %s" if end_date else ""}
-                """, tuple(company_count_params))
-                company_summary = cur.fetchone()
+                    SELECT pl.id as flow_id, pl.user_id,
+                           COALESCE(u.name, '平台') as user_name,
+                           pl.delta as change_amount, pl.balance_after, pl.remark, pl.created_at,
+                           CONCAT(pl.points_type, '_points') as points_type
+                    FROM points_ledger pl
+                    LEFT JOIN users u ON pl.user_id = u.id
+                    {ledger_where}
+                    ORDER BY pl.created_at DESC, pl.id DESC
+                    LIMIT %s OFFSET %s
+                """, tuple(params) + (page_size, offset))
+                records = cur.fetchall()
 
                 # ==================== 6. 查询当前余额（关键：三种积分余额合计）====================
                 current_balances = {}
@@ -0,0 +1,324 @@
+# services/image_pipeline.py - 图片异步处理
+"""
+图片上传处理流水线
+
+- 请求内只做格式校验（只读文件头，不解码像素），原图按内容寻址落盘（services.image_store），
+  随业务事务在 image_variants 登记（每个所属记录一行，状态 pending），业务记录先保存原图地址
+- 提交后 dispatch：解码、缩放、编码（services.image_render）放到进程池执行，不占用请求线程，也不受 GIL 限制
+- 处理完成后在本进程回调：登记各尺寸文件的引用、释放原图引用，并把所属记录中的原图地址改为 detail 尺寸地址
+  （商品图片 / 轮播图表、用户头像、店铺 LOGO），商品同时刷新目录缓存版本号，列表接口随之带出缩略图
+- 去重：同一内容、同一用途已处理过时直接复用结果，不再派发；同一内容同时被多处上传时只处理一次
+- 进程退出 / 进程池崩溃时未完成的任务留在 pending，由定时任务重新派发；失败的任务重试有限次数
+- 图片被删除时 release：删除 image_variants 行并释放它引用的文件，文件在无人引用后才会被回收
+"""
+import json
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+
+from core.config import IMAGE_PIPELINE_WORKERS, IMAGE_PIPELINE_RETRY_MINUTES, IMAGE_PIPELINE_MAX_ATTEMPTS
+from core.database import get_conn
+from core.logging import get_logger
+from services import catalog_cache, image_store
+from services.image_render import render_variants
+
+logger = get_logger(__name__)
+
+ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+FORMAT_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp"}
+PRODUCT_KINDS = ("product_detail", "product_banner")
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn：请求线程、数据库连接池等状态不带进子进程
+            _executor = ProcessPoolExecutor(max_workers=IMAGE_PIPELINE_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def _reset_executor(broken: ProcessPoolExecutor) -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _placeholders(values) -> str:
+    return ",".join(["%s"] * len(values))
+
+
+def _loads(value) -> Dict[str, str]:
+    return json.loads(value) if isinstance(value, str) else (value or {})
+
+
+# ---------------------------------------------------------------------- #
+# 请求内
+# ---------------------------------------------------------------------- #
+def check_upload(upload: UploadFile, max_bytes: int, label: str = "图片") -> str:
+    """校验扩展名与大小，返回小写扩展名"""
+    ext = Path(upload.filename or "").suffix.lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="仅支持 JPG/PNG/WEBP")
+    if upload.size is not None and upload.size > max_bytes:
+        raise HTTPException(status_code=400, detail=f"{label}单张大小不能超过 {max_bytes // 1024 // 1024}MB")
+    return ext
+
+
+def ingest(cur, upload: UploadFile, kind: str, owner_id: int) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    在业务事务内保存上传的图片，返回 (业务记录中应保存的地址, 待派发任务或 None)
+
+    任务在事务提交后交给 dispatch
+    """
+    try:
+        with Image.open(upload.file) as im:
+            ext = FORMAT_EXTENSIONS.get(im.format)
+    except Exception:
+        raise HTTPException(status_code=400, detail="无法识别的图片文件")
+    if not ext:
+        raise HTTPException(status_code=400, detail="仅支持 JPG/PNG/WEBP")
+    upload.file.seek(0)
+    source = image_store.save_stream(cur, upload.file, ext)
+
+    # 同一记录重复上传同一张图：沿用已有的行，本次加的引用退回
+    cur.execute("SELECT url FROM image_variants WHERE source = %s AND kind = %s AND owner_id = %s FOR UPDATE",
+                (source, kind, owner_id))
+    existing = cur.fetchone()
+    if existing:
+        image_store.release(cur, [source])
+        return existing["url"], None
+
+    # 其他记录已处理过同一内容：直接复用结果
+    cur.execute("SELECT variants FROM image_variants WHERE source = %s AND kind = %s AND status = 'done' LIMIT 1",
+                (source, kind))
+    done = cur.fetchone()
+    if done:
+        variants = _loads(done["variants"])
+        image_store.acquire(cur, [image_store.name_from_url(u) for u in variants.values()])
+        image_store.release(cur, [source])
+        cur.execute(
+            """INSERT INTO image_variants (source, kind, owner_id, url, status, variants)
+               VALUES (%s, %s, %s, %s, 'done', %s)""",
+            (source, kind, owner_id, variants["detail"], json.dumps(variants, ensure_ascii=False))
+        )
+        return variants["detail"], None
+
+    cur.execute("SELECT 1 FROM image_variants WHERE source = %s AND kind = %s AND status = 'pending' LIMIT 1",
+                (source, kind))
+    in_flight = cur.fetchone() is not None
+    url = image_store.blob_url(source)
+    cur.execute(
+        """INSERT INTO image_variants (source, kind, owner_id, url, status)
+           VALUES (%s, %s, %s, %s, 'pending')""",
+        (source, kind, owner_id, url)
+    )
+    # 同一内容正在处理中：完成时会一并更新本行
+    return url, None if in_flight else {"source": source, "kind": kind}
+
+
+def release(cur, kinds: Iterable[str], owner_id: int, urls: Optional[Iterable[str]] = None,
+            keep: Iterable[str] = ()) -> None:
+    """
+    所属记录不再使用这些图片（在业务事务内调用）：删除 image_variants 行并释放引用的文件
+
+    urls 为 None 时释放该记录的全部图片；keep 中的地址保留
+    """
+    kinds = list(kinds)
+    sql = f"SELECT id, source, status, variants, url FROM image_variants WHERE kind IN ({_placeholders(kinds)}) " \
+          f"AND owner_id = %s"
+    params: List[Any] = [*kinds, owner_id]
+    if urls is not None:
+        urls = [u for u in urls if u]
+        if not urls:
+            return
+        sql += f" AND url IN ({_placeholders(urls)})"
+        params += urls
+    cur.execute(sql + " FOR UPDATE", tuple(params))
+    keep = set(keep)
+    rows = [r for r in cur.fetchall() if r["url"] not in keep]
+    if not rows:
+        return
+
+    names = []
+    for r in rows:
+        if r["status"] == "done":
+            names += [image_store.name_from_url(u) for u in _loads(r["variants"]).values()]
+        else:
+            names.append(r["source"])
+    image_store.release(cur, names)
+    cur.execute(f"DELETE FROM image_variants WHERE id IN ({_placeholders(rows)})", tuple(r["id"] for r in rows))
+
+
+def dispatch(jobs: Iterable[Optional[Dict[str, Any]]]) -> None:
+    """提交到进程池（业务事务提交之后调用）；提交失败的任务留给定时任务重新派发"""
+    for job in jobs:
+        if not job:
+            continue
+        executor = _get_executor()
+        try:
+            future = executor.submit(render_variants, str(image_store.blob_path(job["source"])), job["kind"],
+                                     str(image_store.CAS_DIR))
+        except Exception as e:
+            logger.warning(f"图片处理任务提交失败，等待重试: {job['source']}: {e}")
+            _reset_executor(executor)
+            continue
+        future.add_done_callback(lambda f, job=job: _on_done(job, f))
+
+
+# ---------------------------------------------------------------------- #
+# 处理完成
+# ---------------------------------------------------------------------- #
+def _replace_in_list(cur, table: str, column: str, row_id: int, old: str, new: str) -> None:
+    """JSON 列表列（或单个地址）中的 old 替换为 new"""
+    cur.execute(f"SELECT {column} FROM {table} WHERE id = %s FOR UPDATE", (row_id,))
+    row = cur.fetchone()
+    if not row or not row[column]:
+        return
+    value = row[column]
+    if isinstance(value, str) and value.strip().startswith("["):
+        value = json.loads(value)
+    if isinstance(value, list):
+        updated = json.dumps([new if u == old else u for u in value], ensure_ascii=False)
+    elif value == old:
+        updated = new
+    else:
+        return
+    cur.execute(f"UPDATE {table} SET {column} = %s WHERE id = %s", (updated, row_id))
+
+
+def _rewrite_owner(cur, kind: str, owner_id: int, old_url: str, new_url: str) -> None:
+    """所属记录中的原图地址改为处理后的地址"""
+    if kind == "product_detail":
+        _replace_in_list(cur, "products", "detail_images", owner_id, old_url, new_url)
+    elif kind == "product_banner":
+        _replace_in_list(cur, "products", "main_image", owner_id, old_url, new_url)
+        cur.execute("UPDATE banner SET image_url = %s WHERE product_id = %s AND image_url = %s",
+                    (new_url, owner_id, old_url))
+    elif kind == "avatar":
+        _replace_in_list(cur, "users", "avatar_path", owner_id, old_url, new_url)
+    elif kind == "store_logo":
+        new_path = image_store.blob_path(image_store.name_from_url(new_url))
+        cur.execute("UPDATE store_logos SET file_path = %s, file_size = %s WHERE user_id = %s AND file_path = %s",
+                    (str(new_path), new_path.stat().st_size, owner_id,
+                     str(image_store.blob_path(image_store.name_from_url(old_url)))))
+
+
+def _on_done(job: Dict[str, Any], future) -> None:
+    try:
+        names = future.result()
+    except Exception as e:
+        logger.warning(f"图片处理失败: {job['source']}: {e}")
+        _mark_failed(job, str(e))
+        return
+
+    variants = {size: image_store.blob_url(name) for size, name in names.items()}
+    source_url = image_store.blob_url(job["source"])
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """SELECT id, owner_id FROM image_variants
+                       WHERE source = %s AND kind = %s AND status = 'pending' FOR UPDATE""",
+                    (job["source"], job["kind"])
+                )
+                rows = cur.fetchall()
+                if not rows:
+                    # 处理期间图片已被删除：结果无人引用，交给回收
+                    image_store.touch(cur, names.values())
+                    conn.commit()
+                    return
+
+                image_store.acquire(cur, list(names.values()) * len(rows))
+                lost = image_store.missing(names.values())
+                if lost:
+                    # 与回收交错（极少见）：放弃本次结果，等待重新派发
+                    conn.rollback()
+                    logger.warning(f"图片处理结果文件已被回收，等待重试: {job['source']}: {lost}")
+                    return
+                image_store.release(cur, [job["source"]] * len(rows))
+                cur.execute(
+                    f"""UPDATE image_variants SET status = 'done', url = %s, variants = %s, error = NULL
+                        WHERE id IN ({_placeholders(rows)})""",
+                    (variants["detail"], json.dumps(variants, ensure_ascii=False), *(r["id"] for r in rows))
+                )
+                for r in rows:
+                    _rewrite_owner(cur, job["kind"], r["owner_id"], source_url, variants["detail"])
+            conn.commit()
+    except Exception as e:
+        logger.error(f"图片处理结果写库失败: {job['source']}: {e}", exc_info=True)
+        return
+
+    if job["kind"] in PRODUCT_KINDS:
+        catalog_cache.bump(r["owner_id"] for r in rows)
+
+
+def _mark_failed(job: Dict[str, Any], error: str) -> None:
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """UPDATE image_variants
+                       SET attempts = attempts + 1, error = %s,
+                           status = IF(attempts >= %s, 'failed', 'pending')
+                       WHERE source = %s AND kind = %s AND status = 'pending'""",
+                    (error[:500], IMAGE_PIPELINE_MAX_ATTEMPTS, job["source"], job["kind"])
+                )
+            conn.commit()
+    except Exception as e:
+        logger.error(f"图片处理失败状态写库失败: {job['source']}: {e}")
+
+
+def retry_pending(conn) -> int:
+    """重新派发超时未完成的任务（进程退出、进程池崩溃、上次处理失败）"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """SELECT DISTINCT source, kind FROM image_variants
+               WHERE status = 'pending' AND updated_at < NOW() - INTERVAL %s MINUTE
+               LIMIT 500""",
+            (IMAGE_PIPELINE_RETRY_MINUTES,)
+        )
+        jobs = [dict(r) for r in cur.fetchall()]
+        # 刷新 updated_at，下一轮扫描前不会重复派发
+        for job in jobs:
+            cur.execute("UPDATE image_variants SET updated_at = NOW() WHERE source = %s AND kind = %s "
+                        "AND status = 'pending'", (job["source"], job["kind"]))
+    conn.commit()
+    jobs = [j for j in jobs if image_store.blob_path(j["source"]).exists()]
+    dispatch(jobs)
+    if jobs:
+        logger.info(f"重新派发图片处理任务 {len(jobs)} 个")
+    return len(jobs)
+
+
+# ---------------------------------------------------------------------- #
+# 查询
+# ---------------------------------------------------------------------- #
+def get_variants(cur, urls: Iterable[str]) -> Dict[str, Dict[str, str]]:
+    """已处理完成的图片 {地址: {尺寸名: 地址}}，未完成的不出现在结果中"""
+    urls = list(dict.fromkeys(u for u in urls if u))
+    if not urls:
+        return {}
+    cur.execute(
+        f"SELECT url, variants FROM image_variants WHERE status = 'done' AND url IN ({_placeholders(urls)})",
+        tuple(urls)
+    )
+    return {r["url"]: _loads(r["variants"]) for r in cur.fetchall()}
+
+
+def get_owner_variants(cur, kind: str, owner_id: int) -> Dict[str, Dict[str, str]]:
+    """某条记录已处理完成的图片 {地址: {尺寸名: 地址}}"""
+    cur.execute("SELECT url, variants FROM image_variants WHERE kind = %s AND owner_id = %s AND status = 'done'",
+                (kind, owner_id))
+    return {r["url"]: _loads(r["variants"]) for r in cur.fetchall()}
@@ -0,0 +1,69 @@
+# services/image_render.py - 图片多尺寸渲染（在进程池中执行）
+"""
+图片多尺寸渲染：由 services.image_pipeline 在进程池中调用
+
+- 只依赖 Pillow，不导入数据库 / 配置模块，子进程（spawn）启动开销小
+- 每种用途（kind）一组尺寸，每个尺寸出 JPEG 与 WebP 两份；detail 为业务记录中保存的主图
+- 输出按内容寻址：文件名为内容的 SHA-256，存放在 {根目录}/{前2位}/{3-4位}/ 下；
+  相同内容只存一份，已存在时不再写入（引用计数由主进程在数据库中维护）
+"""
+import hashlib
+import io
+import os
+from pathlib import Path
+from typing import Dict, Tuple
+
+from PIL import Image, ImageOps
+
+# 用途 → {尺寸名: ((最大宽, 最大高), JPEG 质量)}
+VARIANT_SPECS: Dict[str, Dict[str, Tuple[Tuple[int, int], int]]] = {
+    "product_detail": {"detail": ((750, 2000), 80), "list": ((360, 360), 80), "thumb": ((160, 160), 75)},
+    "product_banner": {"detail": ((1200, 1200), 85), "list": ((750, 750), 80), "thumb": ((240, 240), 75)},
+    "avatar": {"detail": ((300, 300), 85), "thumb": ((96, 96), 80)},
+    "store_logo": {"detail": ((500, 500), 85), "thumb": ((120, 120), 80)},
+}
+
+WEBP_QUALITY = 80
+
+
+def shard_path(root: Path, name: str) -> Path:
+    """内容寻址文件的磁盘路径：{root}/ab/cd/abcd….ext"""
+    return Path(root) / name[:2] / name[2:4] / name
+
+
+def write_blob(root: Path, data: bytes, ext: str) -> str:
+    """按内容写入（已存在则跳过），返回文件名 {sha256}.{ext}"""
+    name = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+    path = shard_path(root, name)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{name}.{os.getpid()}.part")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    return name
+
+
+def _encode(im: Image.Image, fmt: str, **params) -> bytes:
+    buf = io.BytesIO()
+    im.save(buf, fmt, **params)
+    return buf.getvalue()
+
+
+def render_variants(src_path: str, kind: str, root: str) -> Dict[str, str]:
+    """
+    读取 src_path 的原图，按 kind 生成全部尺寸写入 root，返回 {尺寸名: 文件名}
+
+    尺寸名为 detail / list / thumb 及对应的 *_webp
+    """
+    names: Dict[str, str] = {}
+    with Image.open(src_path) as im:
+        im = ImageOps.exif_transpose(im).convert("RGB")
+        # 从大到小逐级缩放，小尺寸不必再从原图全尺寸开始
+        for size, (box, quality) in sorted(VARIANT_SPECS[kind].items(),
+                                           key=lambda kv: kv[1][0][0] * kv[1][0][1], reverse=True):
+            im = im.copy()
+            im.thumbnail(box, Image.LANCZOS)
+            names[size] = write_blob(root, _encode(im, "JPEG", quality=quality, optimize=True, progressive=True),
+                                     "jpg")
+            names[f"{size}_webp"] = write_blob(root, _encode(im, "WEBP", quality=WEBP_QUALITY, method=4), "webp")
+    return names
@@ -0,0 +1,149 @@
+# services/image_store.py - 内容寻址图片存储
+"""
+内容寻址图片存储
+
+- 文件名为内容的 SHA-256（{hash}.{ext}），存放在 PIC_PATH/cas/{前2位}/{3-4位}/ 下，经 /pic/cas/… 访问；
+  同一内容只存一份，重复上传不再写盘。文件内容与地址一一对应，可以按 immutable 长期缓存
+- image_blobs 记录每个文件的引用数（引用它的 image_variants 行数），acquire / release 在业务事务内增减
+- 引用数归零的文件不立即删除，由定时任务在宽限期后回收：回收时先删行再删文件、最后提交，
+  并发的 acquire 会等在该行的锁上，提交后重新插入并写回文件，不会引用到已删除的文件
+"""
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from core.config import PIC_PATH, IMAGE_BLOB_GC_GRACE_MINUTES
+from core.logging import get_logger
+from services.image_render import shard_path
+
+logger = get_logger(__name__)
+
+CAS_DIR = PIC_PATH / "cas"
+CAS_URL_PREFIX = "/pic/cas/"
+
+
+def blob_path(name: str) -> Path:
+    return shard_path(CAS_DIR, name)
+
+
+def blob_url(name: str) -> str:
+    return f"{CAS_URL_PREFIX}{name[:2]}/{name[2:4]}/{name}"
+
+
+def name_from_url(url: Optional[str]) -> Optional[str]:
+    """内容寻址地址中的文件名，其他地址（历史上传的图片）返回 None"""
+    if not url or not url.startswith(CAS_URL_PREFIX):
+        return None
+    return url.rsplit("/", 1)[-1]
+
+
+def name_from_path(path) -> Optional[str]:
+    """内容寻址文件的文件名，其他路径返回 None"""
+    try:
+        Path(path).resolve().relative_to(CAS_DIR.resolve())
+    except (ValueError, OSError):
+        return None
+    return Path(path).name
+
+
+def save_stream(cur, stream, ext: str) -> str:
+    """
+    边写临时文件边计算哈希，登记引用后移入内容寻址目录，返回文件名
+
+    引用（refcount + 1）随 cur 的事务提交
+    """
+    CAS_DIR.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=CAS_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+        name = f"{digest.hexdigest()}.{ext}"
+        # 先登记引用（持有该行的锁），再放文件，避免与回收交错
+        acquire(cur, [name], sizes={name: os.path.getsize(tmp)})
+        path = blob_path(name)
+        if path.exists():
+            os.unlink(tmp)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp, path)
+        return name
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def acquire(cur, names: Iterable[str], sizes: Optional[dict] = None) -> None:
+    """引用数 +1（同一文件名出现几次加几次）"""
+    rows = []
+    for name in names:
+        size = (sizes or {}).get(name)
+        if size is None and blob_path(name).exists():
+            size = blob_path(name).stat().st_size
+        rows.append((name, size))
+    if rows:
+        cur.executemany(
+            """INSERT INTO image_blobs (name, size, refcount) VALUES (%s, %s, 1)
+               ON DUPLICATE KEY UPDATE refcount = refcount + 1, size = COALESCE(VALUES(size), size)""",
+            rows
+        )
+
+
+def release(cur, names: Iterable[str]) -> None:
+    """引用数 -1；归零的文件由 collect_garbage 在宽限期后删除"""
+    names = list(names)
+    if names:
+        cur.executemany("UPDATE image_blobs SET refcount = refcount - 1 WHERE name = %s", [(n,) for n in names])
+
+
+def touch(cur, names: Iterable[str]) -> None:
+    """登记未被引用的文件（如处理结果已无人使用），交给回收流程清理"""
+    names = list(dict.fromkeys(names))
+    if names:
+        cur.executemany(
+            """INSERT INTO image_blobs (name, refcount) VALUES (%s, 0)
+               ON DUPLICATE KEY UPDATE updated_at = NOW()""",
+            [(n,) for n in names]
+        )
+
+
+def missing(names: Iterable[str]) -> List[str]:
+    return [n for n in names if not blob_path(n).exists()]
+
+
+def collect_garbage(conn, grace_minutes: int = IMAGE_BLOB_GC_GRACE_MINUTES, limit: int = 1000) -> int:
+    """删除引用数归零超过宽限期的文件"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """SELECT name FROM image_blobs
+               WHERE refcount <= 0 AND updated_at < NOW() - INTERVAL %s MINUTE
+               LIMIT %s""",
+            (grace_minutes, limit)
+        )
+        names = [r["name"] for r in cur.fetchall()]
+    conn.commit()
+
+    removed = 0
+    for name in names:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM image_blobs WHERE name = %s AND refcount <= 0", (name,))
+            if cur.rowcount:
+                try:
+                    blob_path(name).unlink(missing_ok=True)
+                    removed += 1
+                except Exception as e:
+                    logger.warning(f"删除图片文件失败 {name}: {e}")
+                    conn.rollback()
+                    continue
+        conn.commit()
+    if removed:
+        logger.info(f"回收未引用的图片文件 {removed} 个")
+    return removed
@@ -0,0 +1,262 @@
+# services/inventory_service.py - 库存预占
+"""
+下单库存预占
+
+- 数据库：一笔订单的所有 SKU 用一条条件 UPDATE 扣减
+  （SET stock = stock - CASE id … END WHERE id IN (…) AND stock >= CASE id … END，按 id 顺序加锁），
+  受影响行数不等于 SKU 数即为库存不足，整笔订单随事务回滚；不再逐个 SELECT 校验再逐个 UPDATE
+- 热门 SKU（product_skus.is_hot = 1，由商品更新接口的 SKU is_hot 字段设置）：在订单事务内、
+  加锁读写之前先用 Lua 在 Redis 原子预扣，已售罄的请求直接拒绝，不再排队等待行锁；
+  事务提交后结束在途计数，回滚 / 异常时在 finally 中归还可售计数；数据库条件扣减仍是最终依据，Redis 只做前置闸门
+- 预扣计数的校准：inv:stock:{sku} = 数据库库存 - 在途预扣(inv:inflight:{sku})，由定时任务异步执行，
+  订单取消 / 退款回补库存后也由校准同步到 Redis；进程在事务中途退出时未归还的在途计数
+  在 INVENTORY_INFLIGHT_TTL_SECONDS 内无新预扣后过期，随后由校准恢复可售计数
+"""
+import threading
+import time
+from typing import Dict, Any, List, Optional, Iterable
+
+from core.config import INVENTORY_HOT_REFRESH_SECONDS, INVENTORY_INFLIGHT_TTL_SECONDS
+from core.database import get_conn
+from core.logging import get_logger
+from core.redis_client import get_redis, mark_redis_failed
+
+logger = get_logger(__name__)
+
+STOCK_KEY = "inv:stock:{}"
+INFLIGHT_KEY = "inv:inflight:{}"
+
+# KEYS: 每个 SKU 依次为 stock、inflight 两个 key；ARGV: 对应数量，最后一个为在途计数有效期（秒）
+# 返回 0 成功；>0 为第几个 SKU 库存不足；<0 为第几个 SKU 尚未加载
+_PRE_DEDUCT_SCRIPT = """
+local n = #ARGV - 1
+local ttl = ARGV[#ARGV]
+for i = 1, n do
+    local stock = redis.call('GET', KEYS[i * 2 - 1])
+    if not stock then return -i end
+    if tonumber(stock) < tonumber(ARGV[i]) then return i end
+end
+for i = 1, n do
+    redis.call('DECRBY', KEYS[i * 2 - 1], ARGV[i])
+    redis.call('INCRBY', KEYS[i * 2], ARGV[i])
+    redis.call('EXPIRE', KEYS[i * 2], ttl)
+end
+return 0
+"""
+
+# 在途结束：committed=1 只减少在途，committed=0 同时把数量还给可售计数
+# （在途计数已过期时不再扣减，避免出现负数）
+_RELEASE_SCRIPT = """
+local committed = tonumber(ARGV[1])
+for i = 2, #ARGV do
+    local k = (i - 1) * 2
+    local inflight = redis.call('GET', KEYS[k])
+    if inflight and tonumber(inflight) > tonumber(ARGV[i]) then
+        redis.call('DECRBY', KEYS[k], ARGV[i])
+    elseif inflight then
+        redis.call('DEL', KEYS[k])
+    end
+    if committed == 0 then redis.call('INCRBY', KEYS[k - 1], ARGV[i]) end
+end
+return 1
+"""
+
+# 校准：可售 = 数据库库存 - 在途
+_RECONCILE_SCRIPT = """
+local inflight = tonumber(redis.call('GET', KEYS[2]) or '0')
+local value = tonumber(ARGV[1]) - inflight
+if value < 0 then value = 0 end
+local old = redis.call('GET', KEYS[1])
+redis.call('SET', KEYS[1], value)
+if old and tonumber(old) == value then return 0 end
+return 1
+"""
+
+
+class InsufficientStockError(ValueError):
+    """库存不足"""
+
+    def __init__(self, sku_ids: List[int]):
+        self.sku_ids = sku_ids
+        super().__init__(f"SKU {', '.join(str(s) for s in sku_ids)} 库存不足")
+
+
+def aggregate_lines(items: Iterable[Dict[str, Any]]) -> Dict[int, int]:
+    """按 SKU 合并订单行数量（同一 SKU 可能出现多次）"""
+    lines: Dict[int, int] = {}
+    for it in items:
+        sku_id = int(it["sku_id"])
+        lines[sku_id] = lines.get(sku_id, 0) + int(it["quantity"])
+    return lines
+
+
+class HotReservation:
+    """热门 SKU 的 Redis 预扣，订单事务结束后调用 release"""
+
+    def __init__(self, lines: Dict[int, int]):
+        self.lines = lines
+        self.released = False
+
+    def release(self, committed: bool) -> None:
+        if self.released or not self.lines:
+            return
+        self.released = True
+        client = get_redis()
+        if client is None:
+            return  # Redis 已不可用，计数由下次校准修正
+        keys, args = [], [1 if committed else 0]
+        for sku_id, qty in self.lines.items():
+            keys += [STOCK_KEY.format(sku_id), INFLIGHT_KEY.format(sku_id)]
+            args.append(qty)
+        try:
+            InventoryService._script(client, "release", _RELEASE_SCRIPT)(keys=keys, args=args, client=client)
+        except Exception as e:
+            mark_redis_failed(e)
+
+
+class InventoryService:
+    """库存预占"""
+
+    _hot_ids: frozenset = frozenset()
+    _hot_loaded_at = 0.0
+    _hot_lock = threading.Lock()
+    _scripts: Dict[str, Any] = {}
+
+    @classmethod
+    def _script(cls, client, name: str, source: str):
+        if name not in cls._scripts:
+            cls._scripts[name] = client.register_script(source)
+        return cls._scripts[name]
+
+    @classmethod
+    def hot_sku_ids(cls) -> frozenset:
+        """热门 SKU 列表（进程内缓存，定期刷新）"""
+        if time.time() - cls._hot_loaded_at < INVENTORY_HOT_REFRESH_SECONDS:
+            return cls._hot_ids
+        with cls._hot_lock:
+            if time.time() - cls._hot_loaded_at >= INVENTORY_HOT_REFRESH_SECONDS:
+                try:
+                    with get_conn() as conn:
+                        with conn.cursor() as cur:
+                            cur.execute("SELECT id FROM product_skus WHERE is_hot = 1")
+                            cls._hot_ids = frozenset(int(r["id"]) for r in cur.fetchall())
+                except Exception as e:
+                    logger.warning(f"读取热门SKU失败，沿用上次列表: {e}")
+                cls._hot_loaded_at = time.time()
+        return cls._hot_ids
+
+    @classmethod
+    def invalidate_hot_ids(cls) -> None:
+        """热门标记变更后调用，下次读取时重新加载（其他进程按刷新间隔生效）"""
+        cls._hot_loaded_at = 0.0
+
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def pre_deduct(cls, items: Iterable[Dict[str, Any]]) -> Optional[HotReservation]:
+        """
+        热门 SKU 的 Redis 预扣（在订单事务内、锁定优惠券和扣减库存之前调用）
+
+        调用方必须在 finally 中调用返回值的 release(committed)：事务回滚或抛出异常时归还可售计数；
+        售罄时抛出 InsufficientStockError；订单中没有热门 SKU 或 Redis 不可用时返回 None，
+        此时完全由数据库条件扣减把关
+        """
+        hot = cls.hot_sku_ids()
+        lines = {k: v for k, v in aggregate_lines(items).items() if k in hot}
+        if not lines:
+            return None
+        client = get_redis()
+        if client is None:
+            return None
+
+        sku_ids = list(lines)
+        keys: List[str] = []
+        for sku_id in sku_ids:
+            keys += [STOCK_KEY.format(sku_id), INFLIGHT_KEY.format(sku_id)]
+        try:
+            script = cls._script(client, "pre_deduct", _PRE_DEDUCT_SCRIPT)
+            for _ in range(2):
+                code = int(script(keys=keys, args=[lines[s] for s in sku_ids] + [INVENTORY_INFLIGHT_TTL_SECONDS],
+                                  client=client))
+                if code == 0:
+                    return HotReservation(lines)
+                if code > 0:
+                    raise InsufficientStockError([sku_ids[code - 1]])
+                # 计数尚未加载：从数据库加载后重试一次
+                cls.reconcile([sku_ids[-code - 1]])
+            return None
+        except InsufficientStockError:
+            raise
+        except Exception as e:
+            mark_redis_failed(e)
+            return None
+
+    @staticmethod
+    def reserve(cur, items: Iterable[Dict[str, Any]]) -> None:
+        """
+        在订单事务内一次扣减所有 SKU 库存（全部满足才扣减）
+
+        库存不足时抛出 InsufficientStockError，调用方回滚事务
+        """
+        lines = aggregate_lines(items)
+        if not lines:
+            return
+        sku_ids = sorted(lines)
+        case_sql = "CASE id " + " ".join(["WHEN %s THEN %s"] * len(sku_ids)) + " END"
+        case_params: List[int] = []
+        for sku_id in sku_ids:
+            case_params += [sku_id, lines[sku_id]]
+        placeholders = ",".join(["%s"] * len(sku_ids))
+
+        cur.execute(
+            f"""UPDATE product_skus
+                SET stock = stock - {case_sql}
+                WHERE id IN ({placeholders}) AND stock >= {case_sql}
+                ORDER BY id""",
+            tuple(case_params) + tuple(sku_ids) + tuple(case_params)
+        )
+        if cur.rowcount == len(sku_ids):
+            return
+
+        # 部分行未满足条件：找出库存不足的 SKU 用于提示（已扣减的行随事务回滚）
+        cur.execute(f"SELECT id, stock FROM product_skus WHERE id IN ({placeholders})", tuple(sku_ids))
+        stocks = {int(r["id"]): r["stock"] for r in cur.fetchall()}
+        short = [s for s in sku_ids if s not in stocks or (stocks[s] or 0) < lines[s]]
+        raise InsufficientStockError(short or sku_ids)
+
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def reconcile(cls, sku_ids: Optional[List[int]] = None) -> Dict[str, int]:
+        """把热门 SKU 的 Redis 可售计数校准为 数据库库存 - 在途预扣"""
+        client = get_redis()
+        if client is None:
+            return {"checked": 0, "adjusted": 0}
+        ids = list(sku_ids) if sku_ids is not None else sorted(cls.hot_sku_ids())
+        if not ids:
+            return {"checked": 0, "adjusted": 0}
+
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                placeholders = ",".join(["%s"] * len(ids))
+                cur.execute(f"SELECT id, COALESCE(stock, 0) AS stock FROM product_skus WHERE id IN ({placeholders})",
+                            tuple(ids))
+                stocks = {int(r["id"]): int(r["stock"]) for r in cur.fetchall()}
+
+        adjusted = 0
+        try:
+            script = cls._script(client, "reconcile", _RECONCILE_SCRIPT)
+            for sku_id in ids:
+                adjusted += int(script(
+                    keys=[STOCK_KEY.format(sku_id), INFLIGHT_KEY.format(sku_id)],
+                    args=[stocks.get(sku_id, 0)], client=client
+                ))
+            # 已取消热门标记的 SKU 清理计数
+            if sku_ids is None:
+                for key in client.scan_iter(match=STOCK_KEY.format("*"), count=500):
+                    sku_id = int(key.rsplit(":", 1)[-1])
+                    if sku_id not in stocks and not int(client.get(INFLIGHT_KEY.format(sku_id)) or 0):
+                        client.delete(key, INFLIGHT_KEY.format(sku_id))
+        except Exception as e:
+            mark_redis_failed(e)
+        if adjusted:
+            logger.info(f"热门SKU库存计数校准: 检查 {len(ids)} 个，修正 {adjusted} 个")
+        return {"checked": len(ids), "adjusted": adjusted}
@@ -0,0 +1,176 @@
+# services/merchant_order_stats.py - 商家订单日汇总
+"""
+merchant_order_day_stats：每个 (商家, 下单日, 状态) 的订单数与金额
+
+- 新订单写入后调用 stats_added，订单状态变更前调用 stats_moved（与状态 UPDATE 同一事务、同样的状态条件），
+  计数从原状态移到新状态，商家看板无需再扫描 orders
+- 首次建表时从 orders 回填；定时任务每晚重建最近 MERCHANT_ORDER_STATS_REBUILD_DAYS 天，修正遗漏的写入点造成的偏差，
+  全量重建只在后台手动触发（/api/admin/merchant-order-stats/rebuild）
+"""
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional, Sequence
+
+from core.config import MERCHANT_ORDER_STATS_REBUILD_DAYS
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+_REBUILD_CHUNK_DAYS = 31
+
+
+def _order_filter(order_ids: Optional[Sequence[int]], order_numbers: Optional[Sequence[str]]):
+    if order_ids:
+        return f"id IN ({','.join(['%s'] * len(order_ids))})", list(order_ids)
+    if order_numbers:
+        return f"order_number IN ({','.join(['%s'] * len(order_numbers))})", list(order_numbers)
+    return None, []
+
+
+def _subtract(cur, where: str, params: List[Any]) -> None:
+    cur.execute(
+        f"""UPDATE merchant_order_day_stats s
+            JOIN (SELECT merchant_id, DATE(created_at) AS stat_date, status,
+                         COUNT(*) AS cnt, COALESCE(SUM(total_amount), 0) AS amount
+                  FROM orders WHERE {where}
+                  GROUP BY merchant_id, DATE(created_at), status) x
+              ON s.merchant_id = x.merchant_id AND s.stat_date = x.stat_date AND s.status = x.status
+            SET s.order_count = s.order_count - x.cnt, s.total_amount = s.total_amount - x.amount""",
+        tuple(params)
+    )
+
+
+def stats_added(cur, order_ids: Optional[Sequence[int]] = None,
+                order_numbers: Optional[Sequence[str]] = None) -> None:
+    """新订单计入当前状态（在插入订单的同一事务内调用）"""
+    where, params = _order_filter(order_ids, order_numbers)
+    if where is None:
+        return
+    cur.execute(
+        f"""INSERT INTO merchant_order_day_stats (merchant_id, stat_date, status, order_count, total_amount)
+            SELECT merchant_id, DATE(created_at), status, COUNT(*), COALESCE(SUM(total_amount), 0)
+            FROM orders WHERE {where}
+            GROUP BY merchant_id, DATE(created_at), status
+            ON DUPLICATE KEY UPDATE order_count = order_count + VALUES(order_count),
+                                    total_amount = total_amount + VALUES(total_amount)""",
+        tuple(params)
+    )
+
+
+def stats_removed(cur, order_ids: Optional[Sequence[int]] = None,
+                  order_numbers: Optional[Sequence[str]] = None) -> None:
+    """从汇总中扣除订单（修改订单商家 / 金额前调用，修改后再调用 stats_added）"""
+    where, params = _order_filter(order_ids, order_numbers)
+    if where is not None:
+        _subtract(cur, where, params)
+
+
+def stats_moved(cur, new_status: str, order_ids: Optional[Sequence[int]] = None,
+                order_numbers: Optional[Sequence[str]] = None,
+                from_statuses: Optional[Sequence[str]] = None) -> None:
+    """
+    订单状态变更：把计数从原状态移到 new_status
+
+    必须在状态 UPDATE 之前、同一事务内调用；from_statuses 与状态 UPDATE 的条件保持一致
+    （如 UPDATE … WHERE status = 'pending_pay' 传 ('pending_pay',)），已是 new_status 的订单不计
+    """
+    where, params = _order_filter(order_ids, order_numbers)
+    if where is None:
+        return
+    conditions = [where, "status <> %s"]
+    params.append(new_status)
+    if from_statuses:
+        conditions.append(f"status IN ({','.join(['%s'] * len(from_statuses))})")
+        params.extend(from_statuses)
+    where_sql = " AND ".join(conditions)
+
+    _subtract(cur, where_sql, params)
+    cur.execute(
+        f"""INSERT INTO merchant_order_day_stats (merchant_id, stat_date, status, order_count, total_amount)
+            SELECT merchant_id, DATE(created_at), %s, COUNT(*), COALESCE(SUM(total_amount), 0)
+            FROM orders WHERE {where_sql}
+            GROUP BY merchant_id, DATE(created_at)
+            ON DUPLICATE KEY UPDATE order_count = order_count + VALUES(order_count),
+                                    total_amount = total_amount + VALUES(total_amount)""",
+        (new_status, *params)
+    )
+
+
+def day_totals(cur, merchant_id: int, start_day: Optional[date], end_day: Optional[date]) -> List[Dict[str, Any]]:
+    """[start_day, end_day) 内各状态的订单数与金额"""
+    conditions, params = ["merchant_id = %s"], [merchant_id]
+    if start_day:
+        conditions.append("stat_date >= %s")
+        params.append(start_day)
+    if end_day:
+        conditions.append("stat_date < %s")
+        params.append(end_day)
+    cur.execute(
+        f"""SELECT status, SUM(order_count) AS order_count, SUM(total_amount) AS total_amount
+            FROM merchant_order_day_stats
+            WHERE {' AND '.join(conditions)}
+            GROUP BY status""",
+        tuple(params)
+    )
+    return [r for r in cur.fetchall() if r["order_count"]]
+
+
+def rebuild_range(cur, start_day: date, end_day: date) -> int:
+    """按 orders 重建 [start_day, end_day) 的汇总"""
+    cur.execute("DELETE FROM merchant_order_day_stats WHERE stat_date >= %s AND stat_date < %s",
+                (start_day, end_day))
+    cur.execute(
+        """INSERT INTO merchant_order_day_stats (merchant_id, stat_date, status, order_count, total_amount)
+           SELECT merchant_id, DATE(created_at), status, COUNT(*), COALESCE(SUM(total_amount), 0)
+           FROM orders
+           WHERE created_at >= %s AND created_at < %s
+           GROUP BY merchant_id, DATE(created_at), status""",
+        (start_day, end_day)
+    )
+    return cur.rowcount
+
+
+def _rebuild_from(conn, start_day: date) -> int:
+    """重建 start_day 至今的汇总（每 _REBUILD_CHUNK_DAYS 天一个事务，避免长时间锁住 orders）"""
+    total = 0
+    day, end = start_day, date.today() + timedelta(days=1)
+    while day < end:
+        chunk_end = min(day + timedelta(days=_REBUILD_CHUNK_DAYS), end)
+        with conn.cursor() as cur:
+            total += rebuild_range(cur, day, chunk_end)
+        conn.commit()
+        day = chunk_end
+    return total
+
+
+def rebuild_recent(conn, days: int = MERCHANT_ORDER_STATS_REBUILD_DAYS) -> int:
+    """重建最近 days 天（含今天）的汇总，供每晚定时任务使用"""
+    total = _rebuild_from(conn, date.today() - timedelta(days=days - 1))
+    logger.info(f"商家订单日汇总重建完成（最近{days}天）: {total} 行")
+    return total
+
+
+def rebuild_all(conn) -> int:
+    """全量重建（后台手动操作）"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT MIN(created_at) AS first_at FROM orders")
+        first_at = cur.fetchone()["first_at"]
+    if not first_at:
+        return 0
+    total = _rebuild_from(conn, first_at.date())
+    logger.info(f"商家订单日汇总全量重建完成: {total} 行")
+    return total
+
+
+def backfill_merchant_order_stats(cur) -> int:
+    """汇总表为空时从 orders 回填（在建表后调用一次）"""
+    cur.execute("SELECT 1 FROM merchant_order_day_stats LIMIT 1")
+    if cur.fetchone():
+        return 0
+    cur.execute(
+        """INSERT INTO merchant_order_day_stats (merchant_id, stat_date, status, order_count, total_amount)
+           SELECT merchant_id, DATE(created_at), status, COUNT(*), COALESCE(SUM(total_amount), 0)
+           FROM orders
+           GROUP BY merchant_id, DATE(created_at), status"""
+    )
+    logger.info(f"商家订单日汇总回填完成: {cur.rowcount} 行")
+    return cur.rowcount
@@ -16,6 +16,8 @@ from pathlib import Path
 from core.config import settings
 from core.logging import get_logger
 from core.database import get_conn
+from services.points_ledger import record_points
+from services import order_detail_cache
 
 # 给全局变量加类型标注（仅静态检查用）
 wxpay: WeChatPay | None
@@ -335,6 +337,8 @@ async def _handle_online_pay_notify(order_no: str, wx_total: int, data: dict) ->
                         "UPDATE users SET member_points=member_points-%s WHERE id=%s",
                         (order["pending_points"], order["user_id"])
                     )
+                    record_points(cur, order["user_id"], 'member', -Decimal(str(order["pending_points"])), None,
+                                  'points_deduction', order_id=order["id"], remark=f"订单{order_no}积分抵扣")
 
                 # 记录优惠券和积分抵扣金额到订单表（关键修复）
                 cur.execute("""
@@ -366,6 +370,7 @@ async def _handle_online_pay_notify(order_no: str, wx_total: int, data: dict) ->
                 OrderManager.update_status(order_no, next_status, external_conn=conn)
 
                 conn.commit()
+        order_detail_cache.invalidate(order_no)
 
         logger.info(f"[online-pay] 线上订单支付成功: {order_no}")
         return "<xml><return_code><![CDATA[SUCCESS]]></return_code></xml>"
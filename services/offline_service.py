@@ -12,6 +12,8 @@ from core.config import settings
 from core.logging import get_logger
 from services.finance_service import FinanceService
 from services.notify_service import notify_merchant
+from services.merchant_order_stats import stats_added
+from services.order_transitions import transition
 from pathlib import Path
 import pymysql
 import xmltodict
@@ -283,9 +285,12 @@ class OfflineService:
                     "UPDATE offline_order SET status=4 WHERE order_no=%s AND merchant_id=%s",
                     (order_no, current_user_id)
                 )
+                # 支付回调写入的 orders 镜像单同事务置为 refunded，保持商家统计与流转记录一致；
+                # 线下单不走 FinanceService.refund_order（其按线上会员/商品单分账口径回收资金）
+                transition(cur, 'refunded', order_numbers=[order_no], from_statuses=('completed',),
+                           reason=f"线下订单退款 - 订单#{order_no}", source="refund")
                 conn.commit()
 
-        await FinanceService.refund_order(order_no)
         logger.info(f"[Offline] 退款 {order_no} 金额 {money} 商户={current_user_id}")
         return {"refund_no": f"REF{order_no}"}
 
@@ -351,6 +356,7 @@ class OfflineService:
                     VALUES (%s, %s, %s, %s, 'completed', 1, 'wechat', NOW(), %s)""",
                     (order_no, order["user_id"], order["merchant_id"], amount, coupon_discount)
                 )
+                stats_added(cur, [cur.lastrowid])
                 
                 # 2️⃣ 资金分账（简化版：只分池子，不发奖励）
                 finance = FinanceService()
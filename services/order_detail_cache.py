@@ -0,0 +1,99 @@
+# services/order_detail_cache.py - 订单详情缓存
+"""
+订单详情缓存（小程序轮询最频繁的接口）
+
+- 两级副本：进程内 LRU（短有效期）+ Redis（order:detail:{order_number}，跨进程共享）；Redis 不可用时只用进程内副本
+- 缓存内容是序列化后的详情与 ETag；ETag 由订单 updated_at 与详情内容摘要组成，
+  客户端带 If-None-Match 且未变化时直接 304，不查数据库
+- 写入方在提交后调用 invalidate：状态更新、支付回调、发货、退款、确认收货；
+  状态流转事件分发时再失效一次（覆盖定时任务类写入，以及提交前读到旧数据又写回缓存的情况）
+"""
+import hashlib
+import json
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable, List
+
+from fastapi.encoders import jsonable_encoder
+
+from core.cache import LRUCache
+from core.config import (
+    ORDER_DETAIL_CACHE_SIZE, ORDER_DETAIL_LOCAL_TTL_SECONDS, ORDER_DETAIL_REDIS_TTL_SECONDS
+)
+from core.logging import get_logger
+from core.redis_client import get_redis, mark_redis_failed
+
+logger = get_logger(__name__)
+
+DETAIL_KEY = "order:detail:{}"
+
+_local = LRUCache(ORDER_DETAIL_CACHE_SIZE, ORDER_DETAIL_LOCAL_TTL_SECONDS)
+
+
+def _build_entry(detail: Dict[str, Any]) -> Dict[str, Any]:
+    # 与路由直接返回 dict 时相同的编码（datetime → ISO 格式、Decimal → 数字），缓存命中与否返回内容一致
+    data = jsonable_encoder(detail)
+    body = json.dumps(data, ensure_ascii=False, sort_keys=True)
+    updated_at = (detail.get("order_info") or {}).get("updated_at")
+    version = int(updated_at.timestamp()) if isinstance(updated_at, datetime) else 0
+    digest = hashlib.md5(body.encode("utf-8")).hexdigest()[:12]
+    return {"etag": f'"{version}-{digest}"', "data": data}
+
+
+def get(order_number: str) -> Optional[Dict[str, Any]]:
+    """缓存中的 {"etag", "data"}，未命中返回 None"""
+    entry = _local.get(order_number)
+    if entry is not None:
+        return entry
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        raw = client.get(DETAIL_KEY.format(order_number))
+    except Exception as e:
+        mark_redis_failed(e)
+        return None
+    if not raw:
+        return None
+    entry = json.loads(raw)
+    _local.set(order_number, entry)
+    return entry
+
+
+def get_or_load(order_number: str, loader: Callable[[str], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """读缓存，未命中时调用 loader 查库并写入两级缓存；订单不存在返回 None"""
+    entry = get(order_number)
+    if entry is not None:
+        return entry
+    detail = loader(order_number)
+    if not detail:
+        return None
+    entry = _build_entry(detail)
+    _local.set(order_number, entry)
+    client = get_redis()
+    if client is not None:
+        try:
+            client.set(DETAIL_KEY.format(order_number), json.dumps(entry, ensure_ascii=False),
+                       ex=ORDER_DETAIL_REDIS_TTL_SECONDS)
+        except Exception as e:
+            mark_redis_failed(e)
+    return entry
+
+
+def invalidate(*order_numbers: str) -> None:
+    """订单写入提交后调用，删除两级缓存"""
+    numbers = [n for n in order_numbers if n]
+    if not numbers:
+        return
+    _local.delete_many(numbers)
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.delete(*[DETAIL_KEY.format(n) for n in numbers])
+    except Exception as e:
+        mark_redis_failed(e)
+
+
+def invalidate_events(events: List[Dict[str, Any]]) -> None:
+    """状态流转事件处理：批量失效涉及的订单"""
+    invalidate(*{ev["order_number"] for ev in events})
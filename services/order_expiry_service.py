@@ -0,0 +1,247 @@
+# services/order_expiry_service.py - 待支付订单超时取消（延迟队列）
+"""
+待支付订单超时取消
+
+- 下单后把 (order_id, expire_at) 写入 Redis 有序集合，后台线程每秒弹出到期的一小批订单
+- 每批在一个短事务内用集合语句完成取消：批量回补库存（UPDATE … JOIN）、批量删除待发放奖励、
+  带状态条件批量改状态，持锁时间只与批大小有关
+- Redis 不可用、或订单在上线前创建未入队时，由数据库兜底扫描（status, expire_at 索引）处理
+"""
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from core.config import (
+    ORDER_EXPIRE_BATCH_SIZE, ORDER_EXPIRE_POLL_SECONDS, ORDER_EXPIRE_DB_SWEEP_SECONDS
+)
+from core.database import get_conn
+from core.logging import get_logger
+from core.redis_client import get_redis, mark_redis_failed
+from services.order_transitions import transition
+from services import catalog_cache
+
+logger = get_logger(__name__)
+
+QUEUE_KEY = "order:expire:queue"
+_RETRY_DELAY_SECONDS = 5
+
+# 原子弹出到期成员：多个进程同时轮询时同一订单只会被一个进程取到
+_POP_DUE_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #ids > 0 then
+    redis.call('ZREM', KEYS[1], unpack(ids))
+end
+return ids
+"""
+
+
+def _placeholders(ids: List[int]) -> str:
+    return ",".join(["%s"] * len(ids))
+
+
+class OrderExpiryQueue:
+    """待支付订单超时取消队列"""
+
+    _pop_script = None
+
+    # ------------------------------------------------------------------ #
+    # 入队 / 出队
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def schedule(order_id: int, expire_at: datetime) -> None:
+        """下单事务提交后调用；失败不影响下单，由数据库兜底扫描处理"""
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            client.zadd(QUEUE_KEY, {str(order_id): expire_at.timestamp()})
+        except Exception as e:
+            mark_redis_failed(e)
+
+    @staticmethod
+    def remove(order_id: int) -> None:
+        """订单已支付或已取消时移出队列（不移出也只会在到期时被状态条件过滤掉）"""
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            client.zrem(QUEUE_KEY, str(order_id))
+        except Exception as e:
+            mark_redis_failed(e)
+
+    @classmethod
+    def _pop_due(cls, limit: int) -> Optional[List[int]]:
+        """弹出到期订单ID；Redis 不可用时返回 None"""
+        client = get_redis()
+        if client is None:
+            return None
+        try:
+            if cls._pop_script is None:
+                cls._pop_script = client.register_script(_POP_DUE_SCRIPT)
+            ids = cls._pop_script(keys=[QUEUE_KEY], args=[time.time(), limit], client=client)
+            return [int(i) for i in ids]
+        except Exception as e:
+            cls._pop_script = None
+            mark_redis_failed(e)
+            return None
+
+    @staticmethod
+    def seed() -> int:
+        """把数据库中现有的待支付订单补入队列（启动时执行，按主键分页）"""
+        client = get_redis()
+        if client is None:
+            return 0
+        total, last_id = 0, 0
+        try:
+            with get_conn() as conn:
+                with conn.cursor() as cur:
+                    while True:
+                        cur.execute(
+                            """SELECT id, expire_at FROM orders
+                               WHERE id > %s AND status = 'pending_pay' AND expire_at IS NOT NULL
+                               ORDER BY id LIMIT 1000""",
+                            (last_id,)
+                        )
+                        rows = cur.fetchall()
+                        if not rows:
+                            break
+                        client.zadd(QUEUE_KEY, {str(r["id"]): r["expire_at"].timestamp() for r in rows})
+                        total += len(rows)
+                        last_id = rows[-1]["id"]
+        except Exception as e:
+            logger.warning(f"[expire] 待支付订单入队失败（由数据库扫描兜底）: {e}")
+        if total:
+            logger.info(f"[expire] 已将 {total} 个待支付订单加入超时队列")
+        return total
+
+    # ------------------------------------------------------------------ #
+    # 批量取消
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def cancel_batch(order_ids: List[int]) -> List[str]:
+        """
+        在一个事务内取消一批到期订单，返回实际取消的订单号
+
+        只处理仍为 pending_pay 且已到期的订单；已支付、已取消的订单直接跳过
+        """
+        if not order_ids:
+            return []
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""SELECT id, order_number FROM orders
+                        WHERE id IN ({_placeholders(order_ids)})
+                          AND status = 'pending_pay' AND expire_at IS NOT NULL AND expire_at <= NOW()
+                        FOR UPDATE""",
+                    tuple(order_ids)
+                )
+                rows = cur.fetchall()
+                if not rows:
+                    conn.commit()
+                    return []
+                ids = [r["id"] for r in rows]
+                ph = _placeholders(ids)
+
+                cur.execute(f"SELECT DISTINCT product_id FROM order_items WHERE order_id IN ({ph})", tuple(ids))
+                product_ids = [r["product_id"] for r in cur.fetchall()]
+
+                # 回补库存：按 SKU 汇总后一次更新；历史数据无 sku_id 的明细按商品回补
+                cur.execute(
+                    f"""UPDATE product_skus s
+                        JOIN (SELECT sku_id, SUM(quantity) AS qty FROM order_items
+                              WHERE order_id IN ({ph}) AND sku_id IS NOT NULL
+                              GROUP BY sku_id) x ON s.id = x.sku_id
+                        SET s.stock = s.stock + x.qty""",
+                    tuple(ids)
+                )
+                cur.execute(
+                    f"""UPDATE product_skus s
+                        JOIN (SELECT product_id, SUM(quantity) AS qty FROM order_items
+                              WHERE order_id IN ({ph}) AND sku_id IS NULL
+                              GROUP BY product_id) x ON s.product_id = x.product_id
+                        SET s.stock = s.stock + x.qty""",
+                    tuple(ids)
+                )
+
+                cur.execute(
+                    f"DELETE FROM pending_rewards WHERE order_id IN ({ph}) AND status = 'pending'",
+                    tuple(ids)
+                )
+                rewards_deleted = cur.rowcount
+
+                transition(cur, 'cancelled', ids, from_statuses=('pending_pay',),
+                           reason="超时未支付自动取消", source="expire")
+                conn.commit()
+        catalog_cache.bump(product_ids)  # 库存已回补
+
+        order_numbers = [r["order_number"] for r in rows]
+        logger.info(f"[expire] 已自动取消 {len(order_numbers)} 个订单，删除待发放奖励 {rewards_deleted} 条: "
+                    f"{', '.join(order_numbers)}")
+        return order_numbers
+
+    @staticmethod
+    def sweep_db(limit: int = ORDER_EXPIRE_BATCH_SIZE) -> int:
+        """数据库兜底扫描：按到期时间分批取消，直到没有到期订单"""
+        total = 0
+        while True:
+            with get_conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        """SELECT id FROM orders
+                           WHERE status = 'pending_pay' AND expire_at IS NOT NULL AND expire_at <= NOW()
+                           ORDER BY expire_at LIMIT %s""",
+                        (limit,)
+                    )
+                    ids = [r["id"] for r in cur.fetchall()]
+            if not ids:
+                break
+            total += len(OrderExpiryQueue.cancel_batch(ids))
+            if len(ids) < limit:
+                break
+        return total
+
+    # ------------------------------------------------------------------ #
+    # 后台线程
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def run_once(cls) -> int:
+        """处理队列中所有到期订单；返回取消数量，Redis 不可用时返回 -1"""
+        total = 0
+        while True:
+            ids = cls._pop_due(ORDER_EXPIRE_BATCH_SIZE)
+            if ids is None:
+                return -1
+            if not ids:
+                return total
+            try:
+                total += len(cls.cancel_batch(ids))
+            except Exception as e:
+                logger.error(f"[expire] 批量取消失败，{_RETRY_DELAY_SECONDS}秒后重试: {e}", exc_info=True)
+                client = get_redis()
+                if client is not None:
+                    retry_at = time.time() + _RETRY_DELAY_SECONDS
+                    try:
+                        client.zadd(QUEUE_KEY, {str(i): retry_at for i in ids})
+                    except Exception as re:
+                        mark_redis_failed(re)
+                return total
+            if len(ids) < ORDER_EXPIRE_BATCH_SIZE:
+                return total
+
+    @classmethod
+    def run_forever(cls, stop_event: Optional[threading.Event] = None) -> None:
+        stop_event = stop_event or threading.Event()
+        cls.seed()
+        last_sweep = 0.0
+        while not stop_event.is_set():
+            try:
+                redis_ok = cls.run_once() >= 0
+                if time.time() - last_sweep >= ORDER_EXPIRE_DB_SWEEP_SECONDS:
+                    cls.sweep_db()
+                    last_sweep = time.time()
+                    if not redis_ok:
+                        cls.seed()
+            except Exception as e:
+                logger.error(f"[expire] error: {e}", exc_info=True)
+            stop_event.wait(ORDER_EXPIRE_POLL_SECONDS)
@@ -0,0 +1,206 @@
+# services/order_transitions.py - 订单状态流转
+"""
+订单状态流转引擎
+
+- transition(cur, ...)：在调用方事务内把一批订单从预期状态改为目标状态
+  （SELECT … FOR UPDATE 取出实际会变更的订单，再一条带状态条件的 UPDATE … WHERE id IN … AND status IN …），
+  同一事务内维护商家日汇总与商品销量汇总，并用一条多行 INSERT 写入流转记录 order_status_history
+- apply_where(...)：按条件分批（每批一个短事务）执行批量流转，用于自动收货等周期任务
+- order_status_history 同时是流转事件队列：dispatched_at 为空的记录由事件分发线程按顺序取出，
+  交给 register_handler 注册的下游（通知、财务等），处理完一批用一条 UPDATE 标记
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Sequence, Callable
+
+from core.config import ORDER_TRANSITION_CHUNK_SIZE, ORDER_EVENT_POLL_SECONDS, ORDER_AUTO_RECEIVE_SECONDS
+from core.database import get_conn
+from core.logging import get_logger
+from services.merchant_order_stats import stats_moved
+from services.product_sales_stats import sales_changed
+
+logger = get_logger(__name__)
+
+# 进入某状态时顺带写入的时间字段
+_STATUS_TIMESTAMPS = {
+    "pending_ship": ["paid_at = COALESCE(paid_at, NOW())"],
+    "pending_recv": ["paid_at = COALESCE(paid_at, NOW())", "shipped_at = COALESCE(shipped_at, NOW())"],
+    "completed": ["completed_at = COALESCE(completed_at, NOW())"],
+}
+
+# 下游事件处理：to_status（'*' 表示全部）→ 处理函数列表，处理函数接收同一批事件列表
+_handlers: Dict[str, List[Callable[[List[Dict[str, Any]]], None]]] = defaultdict(list)
+
+
+def _placeholders(values: Sequence[Any]) -> str:
+    return ",".join(["%s"] * len(values))
+
+
+def register_handler(to_status: str, handler: Callable[[List[Dict[str, Any]]], None]) -> None:
+    """注册流转事件的下游处理（to_status='*' 接收全部事件）；处理函数应幂等"""
+    _handlers[to_status].append(handler)
+
+
+def transition(cur, to_status: str, order_ids: Optional[Sequence[int]] = None,
+               order_numbers: Optional[Sequence[str]] = None,
+               from_statuses: Optional[Sequence[str]] = None,
+               reason: Optional[str] = None, source: str = "manual",
+               extra_sets: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    在调用方事务内执行状态流转，返回实际变更的订单（id、order_number、from_status）
+
+    Args:
+        to_status: 目标状态
+        order_ids / order_numbers: 待流转订单
+        from_statuses: 允许的原状态（None 表示任意非目标状态）
+        reason: 写入 orders.status_reason 与流转记录
+        source: 触发来源（payment / ship / auto_receive / wx_sync / expire / confirm_receive / refund / manual …）
+        extra_sets: 同时更新的其他字段 {列名: 值}
+    """
+    if order_ids:
+        key_sql, keys = f"id IN ({_placeholders(order_ids)})", list(order_ids)
+    elif order_numbers:
+        key_sql, keys = f"order_number IN ({_placeholders(order_numbers)})", list(order_numbers)
+    else:
+        return []
+
+    guard_sql, guard = "status <> %s", [to_status]
+    if from_statuses:
+        guard_sql += f" AND status IN ({_placeholders(from_statuses)})"
+        guard += list(from_statuses)
+
+    cur.execute(
+        f"SELECT id, order_number, status FROM orders WHERE {key_sql} AND {guard_sql} FOR UPDATE",
+        tuple(keys + guard)
+    )
+    rows = cur.fetchall()
+    if not rows:
+        return []
+    ids = [r["id"] for r in rows]
+
+    stats_moved(cur, to_status, ids, from_statuses=from_statuses)
+    sales_changed(cur, ids, new_status=to_status)
+
+    sets = ["status = %s", "updated_at = NOW()"] + _STATUS_TIMESTAMPS.get(to_status, [])
+    params: List[Any] = [to_status]
+    if reason:
+        sets.append("status_reason = %s")
+        params.append(reason)
+    for column, value in (extra_sets or {}).items():
+        sets.append(f"{column} = %s")
+        params.append(value)
+    cur.execute(
+        f"UPDATE orders SET {', '.join(sets)} WHERE id IN ({_placeholders(ids)}) AND {guard_sql}",
+        tuple(params + ids + guard)
+    )
+
+    # VALUES 中全部为 %s 占位符时，pymysql 才会把 executemany 合并为一条多行 INSERT
+    now = datetime.now()
+    cur.executemany(
+        """INSERT INTO order_status_history
+           (order_id, order_number, from_status, to_status, source, reason, created_at)
+           VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+        [(r["id"], r["order_number"], r["status"], to_status, source, reason, now) for r in rows]
+    )
+    return [{"id": r["id"], "order_number": r["order_number"], "from_status": r["status"]} for r in rows]
+
+
+def apply_where(to_status: str, from_statuses: Sequence[str], where_sql: str, params: Sequence[Any] = (),
+                reason: Optional[str] = None, source: str = "batch",
+                chunk_size: int = ORDER_TRANSITION_CHUNK_SIZE) -> int:
+    """
+    按条件批量流转：每批取 chunk_size 个满足条件的订单，一个短事务内完成流转，直到没有满足条件的订单
+
+    where_sql 为附加条件（如 "auto_recv_time <= NOW()"），状态条件由 from_statuses 给出
+    """
+    status_sql = f"status IN ({_placeholders(from_statuses)})"
+    total, last_id = 0, 0
+    while True:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""SELECT id FROM orders
+                        WHERE id > %s AND {status_sql} AND ({where_sql})
+                        ORDER BY id LIMIT %s""",
+                    (last_id, *from_statuses, *params, chunk_size)
+                )
+                ids = [r["id"] for r in cur.fetchall()]
+                if not ids:
+                    break
+                last_id = ids[-1]
+                total += len(transition(cur, to_status, ids, from_statuses=from_statuses,
+                                        reason=reason, source=source))
+                conn.commit()
+        if len(ids) < chunk_size:
+            break
+    return total
+
+
+# ---------------------------------------------------------------------- #
+# 事件分发
+# ---------------------------------------------------------------------- #
+def dispatch_pending(limit: int = ORDER_TRANSITION_CHUNK_SIZE) -> int:
+    """把一批未分发的流转事件交给下游，返回处理数量"""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """SELECT h.id, h.order_id, h.order_number, h.from_status, h.to_status, h.source, h.reason,
+                          h.created_at, o.user_id, o.merchant_id, o.total_amount
+                   FROM order_status_history h
+                   LEFT JOIN orders o ON o.id = h.order_id
+                   WHERE h.dispatched_at IS NULL
+                   ORDER BY h.id LIMIT %s""",
+                (limit,)
+            )
+            events = cur.fetchall()
+    if not events:
+        return 0
+
+    by_status: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for ev in events:
+        by_status[ev["to_status"]].append(ev)
+    for status, batch in list(by_status.items()) + [("*", events)]:
+        for handler in _handlers.get(status, []):
+            try:
+                handler(batch)
+            except Exception as e:
+                # 下游失败不阻塞队列，由下游自行补偿（处理函数应幂等）
+                logger.error(f"[transition] 事件处理 {getattr(handler, '__name__', handler)} 失败: {e}",
+                             exc_info=True)
+
+    ids = [ev["id"] for ev in events]
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"UPDATE order_status_history SET dispatched_at = NOW() WHERE id IN ({_placeholders(ids)})",
+                tuple(ids)
+            )
+            conn.commit()
+    return len(events)
+
+
+def auto_receive_due() -> int:
+    """超过自动收货时间的待收货订单批量完成"""
+    done = apply_where("completed", ("pending_recv",), "auto_recv_time <= NOW()",
+                       reason="超时自动确认收货", source="auto_receive")
+    if done:
+        logger.info(f"[auto_receive] {done} 个订单已自动完成")
+    return done
+
+
+def run_forever(stop_event: Optional[threading.Event] = None) -> None:
+    """流转引擎后台线程：分发事件；按间隔执行自动收货"""
+    stop_event = stop_event or threading.Event()
+    last_auto_receive = 0.0
+    while not stop_event.is_set():
+        try:
+            if time.time() - last_auto_receive >= ORDER_AUTO_RECEIVE_SECONDS:
+                last_auto_receive = time.time()
+                auto_receive_due()
+            if dispatch_pending() >= ORDER_TRANSITION_CHUNK_SIZE:
+                continue  # 还有积压，立即处理下一批
+        except Exception as e:
+            logger.error(f"[transition] 流转引擎异常: {e}", exc_info=True)
+        stop_event.wait(ORDER_EVENT_POLL_SECONDS)
@@ -0,0 +1,228 @@
+# services/payout_simulator.py - 周补贴 / 联创分红参数模拟
+"""
+管理员调整积分值、每权重分红金额前的批量模拟
+
+- 一次性加载参与计算的用户向量（会员积分 / 联创权重），排序后计算前缀和，按数据版本缓存
+- 每个候选值的总额、触顶人数、资金池剩余、分位数都由 二分查找 + 前缀和 得到，
+  单个场景 O(log N)，一次请求可评估上百个候选值而不再逐个重查全部用户
+- 计算规则与 distribute_weekly_subsidy / distribute_unilevel_dividend 保持一致，结果为浮点估算
+"""
+import threading
+import time
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from core.config import MAX_POINTS_VALUE
+from core.database import get_conn
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+# 与 distribute_unilevel_dividend 中的单用户上限一致
+UNILEVEL_MAX_PER_USER = 10000.0
+MAX_SCENARIOS = 200
+PERCENTILES = (50, 90, 99)
+
+# 数据版本相同时复用向量；版本查询本身失效时的兜底过期时间
+_CACHE_TTL_SECONDS = 600
+_cache: Dict[str, Dict[str, Any]] = {}
+_cache_lock = threading.Lock()
+
+
+class _SortedVector:
+    """升序数组 + 前缀和，支持 O(log N) 的截断求和与分位数"""
+
+    def __init__(self, values: Sequence[float]):
+        self.values = sorted(values)
+        self.prefix = [0.0] + list(accumulate(self.values))
+        self.n = len(self.values)
+        self.total = self.prefix[-1]
+
+    def capped_sum(self, scale: float, cap: Optional[float]) -> Tuple[float, int]:
+        """sum(min(v * scale, cap))，返回 (合计, 触顶个数)"""
+        if cap is None or scale <= 0:
+            return self.total * scale, 0
+        idx = bisect_right(self.values, cap / scale)  # values[idx:] 触顶
+        capped = self.n - idx
+        return self.prefix[idx] * scale + capped * cap, capped
+
+    def percentile(self, p: float) -> float:
+        """最近秩法分位数"""
+        if not self.n:
+            return 0.0
+        rank = max(0, min(self.n - 1, int(round(p / 100 * (self.n - 1)))))
+        return self.values[rank]
+
+
+def _data_version(cur) -> tuple:
+    """用户积分、资金池、联创等级与订单的变化都会推进版本号"""
+    cur.execute(
+        """SELECT (SELECT COALESCE(MAX(id), 0) FROM points_log) AS points_log_id,
+                  (SELECT COALESCE(MAX(id), 0) FROM account_flow) AS account_flow_id,
+                  (SELECT COALESCE(MAX(id), 0) FROM orders) AS order_id,
+                  (SELECT COUNT(*) FROM user_unilevel) AS unilevel_count,
+                  (SELECT COALESCE(SUM(level), 0) FROM user_unilevel) AS unilevel_weight"""
+    )
+    row = cur.fetchone()
+    return tuple(int(v) for v in row.values())
+
+
+def _load_subsidy(cur) -> Dict[str, Any]:
+    cur.execute("SELECT member_points FROM users WHERE COALESCE(member_points, 0) > 0")
+    points = [float(r["member_points"]) for r in cur.fetchall()]
+    cur.execute("SELECT SUM(COALESCE(merchant_points, 0)) AS total FROM users WHERE COALESCE(merchant_points, 0) > 0")
+    merchant_points = float(cur.fetchone()["total"] or 0)
+    cur.execute(
+        "SELECT account_type, balance FROM finance_accounts WHERE account_type IN ('subsidy_pool', 'company_points')"
+    )
+    balances = {r["account_type"]: float(r["balance"] or 0) for r in cur.fetchall()}
+    vector = _SortedVector(points)
+    company_points = balances.get("company_points", 0.0)
+    return {
+        "vector": vector,
+        "pool_balance": balances.get("subsidy_pool", 0.0),
+        "merchant_points": merchant_points,
+        "company_points": company_points,
+        "total_system_points": vector.total + merchant_points + company_points,
+    }
+
+
+def _load_unilevel(cur) -> Dict[str, Any]:
+    # 与 distribute_unilevel_dividend 相同的资格条件：本月有有效订单的 1-3 星联创
+    cur.execute("""
+        SELECT uu.level
+        FROM user_unilevel uu
+        JOIN users u ON uu.user_id = u.id
+        INNER JOIN (
+            SELECT DISTINCT o.user_id
+            FROM orders o
+            WHERE o.status IN ('pending_ship','pending_recv','completed')
+              AND o.created_at >= DATE_FORMAT(CURDATE(), '%Y-%m-01')
+              AND o.created_at < DATE_ADD(DATE_FORMAT(CURDATE(), '%Y-%m-01'), INTERVAL 1 MONTH)
+        ) AS active_users ON uu.user_id = active_users.user_id
+        WHERE uu.level IN (1, 2, 3)
+    """)
+    weights = [float(r["level"]) for r in cur.fetchall()]
+    cur.execute("SELECT balance FROM finance_accounts WHERE account_type = 'director_pool'")
+    row = cur.fetchone()
+    return {
+        "vector": _SortedVector(weights),
+        "pool_balance": float(row["balance"] or 0) if row else 0.0,
+    }
+
+
+_LOADERS = {"subsidy": _load_subsidy, "unilevel": _load_unilevel}
+
+
+def _get_data(kind: str) -> Dict[str, Any]:
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            version = _data_version(cur)
+            with _cache_lock:
+                cached = _cache.get(kind)
+                if cached and cached["version"] == version and time.time() - cached["loaded_at"] < _CACHE_TTL_SECONDS:
+                    return cached
+            data = _LOADERS[kind](cur)
+
+    data.update(version=version, loaded_at=time.time())
+    with _cache_lock:
+        _cache[kind] = data
+    logger.debug(f"模拟数据已加载: {kind}, 版本={version}, 用户数={data['vector'].n}")
+    return data
+
+
+def _validate(candidates: List[float], upper: Optional[float] = None) -> None:
+    if not candidates:
+        raise ValueError("至少需要一个候选值")
+    if len(candidates) > MAX_SCENARIOS:
+        raise ValueError(f"候选值最多{MAX_SCENARIOS}个")
+    for v in candidates:
+        if v < 0 or (upper is not None and v > upper):
+            raise ValueError(f"候选值必须在0到{upper if upper is not None else '∞'}之间: {v}")
+
+
+def _round(v: float) -> float:
+    return round(v, 4)
+
+
+class PayoutSimulator:
+    """周补贴积分值 / 联创每权重金额 批量模拟"""
+
+    @staticmethod
+    def simulate_subsidy(points_values: List[float]) -> Dict[str, Any]:
+        """
+        模拟不同积分值下的周补贴发放
+
+        每个用户补贴 = member_points × 积分值，扣减积分 = min(补贴, member_points)；
+        平台积分池按同一积分值计入发放总额
+        """
+        _validate(points_values, float(MAX_POINTS_VALUE))
+        data = _get_data("subsidy")
+        vec: _SortedVector = data["vector"]
+        pool = data["pool_balance"]
+
+        scenarios = []
+        for pv in points_values:
+            user_total, _ = vec.capped_sum(pv, None)
+            platform_amount = data["company_points"] * pv
+            total = user_total + platform_amount
+            scenarios.append({
+                "points_value": pv,
+                "user_count": vec.n,
+                "user_total": _round(user_total),
+                "platform_amount": _round(platform_amount),
+                "total_required": _round(total),
+                "pool_remainder": _round(pool - total),
+                "sufficient": total <= pool,
+                "percentiles": {f"p{p}": _round(vec.percentile(p) * pv) for p in PERCENTILES},
+                "max_user_amount": _round(vec.values[-1] * pv) if vec.n else 0.0,
+            })
+
+        auto_value = min(pool / data["total_system_points"], float(MAX_POINTS_VALUE)) \
+            if data["total_system_points"] > 0 else 0.0
+        return {
+            "pool_balance": _round(pool),
+            "total_system_points": _round(data["total_system_points"]),
+            "auto_points_value": _round(auto_value),
+            "data_version": list(data["version"]),
+            "scenarios": scenarios,
+        }
+
+    @staticmethod
+    def simulate_unilevel(amounts_per_weight: List[float]) -> Dict[str, Any]:
+        """
+        模拟不同每权重金额下的联创分红发放
+
+        每个用户分红 = min(权重 × 每权重金额, 10000)；手动金额要求 每权重金额 × 总权重 不超过池余额
+        """
+        _validate(amounts_per_weight)
+        data = _get_data("unilevel")
+        vec: _SortedVector = data["vector"]
+        pool = data["pool_balance"]
+
+        scenarios = []
+        for apw in amounts_per_weight:
+            total, capped = vec.capped_sum(apw, UNILEVEL_MAX_PER_USER)
+            theoretical = vec.total * apw
+            scenarios.append({
+                "amount_per_weight": apw,
+                "user_count": vec.n,
+                "total_theoretical_required": _round(theoretical),
+                "total_payout": _round(total),
+                "capped_user_count": capped,
+                "pool_remainder": _round(pool - total),
+                "sufficient": theoretical <= pool,
+                "percentiles": {
+                    f"p{p}": _round(min(vec.percentile(p) * apw, UNILEVEL_MAX_PER_USER)) for p in PERCENTILES
+                },
+                "max_user_amount": _round(min(vec.values[-1] * apw, UNILEVEL_MAX_PER_USER)) if vec.n else 0.0,
+            })
+
+        return {
+            "pool_balance": _round(pool),
+            "total_weight": int(vec.total),
+            "auto_amount_per_weight": _round(pool / vec.total) if vec.total > 0 else 0.0,
+            "data_version": list(data["version"]),
+            "scenarios": scenarios,
+        }
@@ -0,0 +1,85 @@
+# services/pinyin_service.py - 拼音生成
+"""
+拼音生成：商品 pinyin 字段、搜索索引的全拼与首字母
+
+- pypinyin 导入时加载数 MB 的词典：改为首次用到时才导入，进程内只加载一份（加锁，多线程并发首次调用也只加载一次）；
+  不生成拼音的进程不再付出这部分启动开销
+- 商品名、分类名重复度高：按原文缓存分词结果（LRU，PINYIN_CACHE_SIZE 条）
+- backfill_missing：pinyin 为空的商品按 id 分段，每段一条 SELECT + 一条 UPDATE … JOIN 批量写回；
+  由定时任务在启动后执行，不在启动路径上
+"""
+import threading
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+
+from core.config import PINYIN_CACHE_SIZE, PINYIN_BACKFILL_CHUNK
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+_convert: Optional[Callable[[str], List[str]]] = None
+_load_lock = threading.Lock()
+
+
+def _converter() -> Callable[[str], List[str]]:
+    """首次调用时导入 pypinyin（加载词典），之后复用"""
+    global _convert
+    if _convert is None:
+        with _load_lock:
+            if _convert is None:
+                from pypinyin import lazy_pinyin, Style
+
+                def convert(text: str) -> List[str]:
+                    return lazy_pinyin(text, style=Style.NORMAL)
+
+                _convert = convert
+    return _convert
+
+
+@lru_cache(maxsize=PINYIN_CACHE_SIZE)
+def _syllables(text: str) -> Tuple[str, ...]:
+    """汉字逐字转为拼音，非汉字片段原样保留"""
+    return tuple(_converter()(text))
+
+
+def to_pinyin(text: Optional[str]) -> str:
+    """products.pinyin 的取值：音节以空格分隔并大写，如 "苹果手机" → "PING GUO SHOU JI" """
+    return " ".join(_syllables(text or "")).upper()
+
+
+def keywords(text: Optional[str]) -> Tuple[str, str]:
+    """搜索索引用的全拼（连写）与首字母，如 "苹果手机" → ("pingguoshouji", "pgsj")"""
+    syllables = [s for s in _syllables(text or "") if s.strip()]
+    return "".join(syllables).lower(), "".join(s[0] for s in syllables).lower()
+
+
+def backfill_missing(conn, chunk: int = PINYIN_BACKFILL_CHUNK) -> int:
+    """补全 pinyin 为空的商品，每 chunk 个商品一个事务，返回更新数量；可重复执行"""
+    total, last_id = 0, 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(
+                """SELECT id, name FROM products
+                   WHERE id > %s AND (pinyin IS NULL OR pinyin = '')
+                   ORDER BY id LIMIT %s""",
+                (last_id, chunk)
+            )
+            rows = cur.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            values = [v for r in rows for v in (r["id"], to_pinyin(r["name"]))]
+            derived = " UNION ALL ".join(["SELECT %s AS id, %s AS pinyin"] * len(rows))
+            cur.execute(
+                f"""UPDATE products p JOIN ({derived}) x ON p.id = x.id
+                    SET p.pinyin = x.pinyin
+                    WHERE p.pinyin IS NULL OR p.pinyin = ''""",
+                tuple(values)
+            )
+            total += cur.rowcount
+        conn.commit()
+        if len(rows) < chunk:
+            break
+    if total:
+        logger.info(f"商品拼音补全完成: {total} 条")
+    return total
@@ -0,0 +1,187 @@
+# services/points_ledger.py - 统一积分/点数账本
+"""
+points_ledger：所有积分、点数变动的统一账本，在写入业务流水的同一事务内同步写入
+
+字段均已规范化（用户、积分类型、变动值、变动后余额、来源类别、关联订单、时间），
+跨类型报表直接按 (user_id, points_type, created_at) / (points_type, created_at) 索引查询，
+无需再合并 points_log / account_flow / weekly_subsidy_records 或按备注文字识别类型。
+"""
+from decimal import Decimal
+from typing import Optional, Dict, Any, List, Iterable
+
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+# 积分 / 点数类型 → 对应 users 字段（company 为平台积分池，余额在 finance_accounts）
+POINTS_TYPES: Dict[str, str] = {
+    "member": "会员积分",
+    "merchant": "商家积分",
+    "company": "公司积分",
+    "subsidy": "周补贴点数",
+    "referral": "推荐奖励点数",
+    "team": "团队奖励点数",
+    "unilevel": "联创星级点数",
+    "true_total": "真实总点数",
+}
+
+# 来源类别
+SOURCE_KINDS: Dict[str, str] = {
+    "order_reward": "购物获得积分",
+    "points_deduction": "积分抵扣",
+    "company_income": "公司积分池入账",
+    "weekly_subsidy": "周补贴发放",
+    "subsidy_deduction": "周补贴扣减积分",
+    "referral_reward": "推荐奖励",
+    "team_reward": "团队奖励",
+    "unilevel_dividend": "联创星级分红",
+    "coupon_issue": "兑换优惠券",
+    "donation": "公益捐赠",
+    "refund": "退款回退",
+    "adjust": "人工调整",
+    "other": "其他",
+}
+
+_INSERT_SQL = """INSERT INTO points_ledger
+                     (user_id, points_type, delta, balance_after, source_kind, order_id, remark, created_at)
+                 VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())"""
+
+
+def record_points(cur, user_id: int, points_type: str, delta, balance_after=None,
+                  source_kind: str = "other", order_id: Optional[int] = None,
+                  remark: Optional[str] = None) -> None:
+    """
+    写入一条统一账本记录（必须使用业务流水所在事务的 cur）
+
+    Args:
+        cur: 数据库游标
+        user_id: 用户ID（公司积分池为平台ID）
+        points_type: POINTS_TYPES 中的类型
+        delta: 变动值（增加为正，扣减为负）
+        balance_after: 变动后余额（未知时为 None）
+        source_kind: SOURCE_KINDS 中的来源类别
+        order_id: 关联订单ID
+        remark: 备注
+    """
+    if points_type not in POINTS_TYPES:
+        raise ValueError(f"未知积分类型: {points_type}")
+    if source_kind not in SOURCE_KINDS:
+        raise ValueError(f"未知来源类别: {source_kind}")
+    cur.execute(_INSERT_SQL, (
+        user_id, points_type, Decimal(str(delta)),
+        Decimal(str(balance_after)) if balance_after is not None else None,
+        source_kind, order_id, (remark or "")[:255]
+    ))
+
+
+def record_points_many(cur, rows: Iterable[Dict[str, Any]]) -> int:
+    """批量写入统一账本，rows 的键与 record_points 参数一致"""
+    params: List[tuple] = []
+    for r in rows:
+        balance_after = r.get("balance_after")
+        params.append((
+            r["user_id"], r["points_type"], Decimal(str(r["delta"])),
+            Decimal(str(balance_after)) if balance_after is not None else None,
+            r.get("source_kind", "other"), r.get("order_id"), (r.get("remark") or "")[:255]
+        ))
+    if params:
+        cur.executemany(_INSERT_SQL, params)
+    return len(params)
+
+
+def mirror_points_log(cur, log_id: int, source_kind: str, points_type: Optional[str] = None) -> None:
+    """把刚写入的 points_log 记录同步到统一账本（log_id 取插入后的 cur.lastrowid）"""
+    if source_kind not in SOURCE_KINDS:
+        raise ValueError(f"未知来源类别: {source_kind}")
+    cur.execute(
+        """INSERT INTO points_ledger (user_id, points_type, delta, balance_after, source_kind, order_id, remark, created_at)
+           SELECT user_id, COALESCE(%s, type), change_amount, balance_after, %s, related_order, LEFT(reason, 255), created_at
+           FROM points_log WHERE id = %s""",
+        (points_type, source_kind, log_id)
+    )
+
+
+def mirror_account_flow(cur, flow_id: int, points_type: str, source_kind: str,
+                        order_id: Optional[int] = None, user_id: Optional[int] = None) -> None:
+    """把刚写入的 account_flow 点数流水同步到统一账本（flow_id 取插入后的 cur.lastrowid）"""
+    if points_type not in POINTS_TYPES:
+        raise ValueError(f"未知积分类型: {points_type}")
+    if source_kind not in SOURCE_KINDS:
+        raise ValueError(f"未知来源类别: {source_kind}")
+    cur.execute(
+        """INSERT INTO points_ledger (user_id, points_type, delta, balance_after, source_kind, order_id, remark, created_at)
+           SELECT COALESCE(%s, related_user), %s, change_amount, balance_after, %s, %s, LEFT(remark, 255), created_at
+           FROM account_flow WHERE id = %s""",
+        (user_id, points_type, source_kind, order_id, flow_id)
+    )
+
+
+# ==================== 历史数据回填 ====================
+# 上线前的历史记录：按原表的类型字段与备注一次性归类（仅回填时执行，报表查询不再做文字识别）
+_BACKFILL_SQL = [
+    # 会员 / 商家积分
+    """INSERT INTO points_ledger (user_id, points_type, delta, balance_after, source_kind, order_id, remark, created_at)
+       SELECT user_id, type, change_amount, balance_after,
+              CASE
+                  WHEN reason LIKE '%%抵扣%%' THEN 'points_deduction'
+                  WHEN reason LIKE '%%周补贴%%' THEN 'subsidy_deduction'
+                  WHEN reason LIKE '%%退款%%' THEN 'refund'
+                  WHEN related_order IS NOT NULL OR reason LIKE '%%购买%%' THEN 'order_reward'
+                  ELSE 'adjust'
+              END,
+              related_order, LEFT(reason, 255), created_at
+       FROM points_log WHERE type IN ('member', 'merchant')""",
+    # 公司积分池（以 account_flow 为准；points_log 中 company 类型为同一变动的镜像记录）
+    """INSERT INTO points_ledger (user_id, points_type, delta, balance_after, source_kind, order_id, remark, created_at)
+       SELECT COALESCE(related_user, %s), 'company', change_amount, balance_after,
+              CASE
+                  WHEN remark LIKE '%%抵扣%%' THEN 'points_deduction'
+                  WHEN remark LIKE '%%周补贴%%' THEN 'weekly_subsidy'
+                  WHEN remark LIKE '%%退款%%' THEN 'refund'
+                  WHEN remark LIKE '%%订单%%' THEN 'company_income'
+                  ELSE 'adjust'
+              END,
+              NULL, LEFT(remark, 255), created_at
+       FROM account_flow WHERE account_type = 'company_points'""",
+    # 推荐 / 团队 / 联创 / 真实总点数
+    """INSERT INTO points_ledger (user_id, points_type, delta, balance_after, source_kind, order_id, remark, created_at)
+       SELECT related_user,
+              CASE account_type
+                  WHEN 'referral_points' THEN 'referral'
+                  WHEN 'team_reward_points' THEN 'team'
+                  WHEN 'true_total_points' THEN 'true_total'
+                  ELSE 'unilevel'
+              END,
+              change_amount, NULLIF(balance_after, 0),
+              CASE
+                  WHEN account_type = 'referral_points' THEN 'referral_reward'
+                  WHEN account_type = 'team_reward_points' THEN 'team_reward'
+                  WHEN account_type = 'true_total_points' AND remark LIKE '%%捐赠%%' THEN 'donation'
+                  WHEN account_type = 'true_total_points' AND remark LIKE '%%优惠券%%' THEN 'coupon_issue'
+                  WHEN account_type = 'true_total_points' THEN 'adjust'
+                  ELSE 'unilevel_dividend'
+              END,
+              NULL, LEFT(remark, 255), created_at
+       FROM account_flow
+       WHERE related_user IS NOT NULL
+         AND (account_type IN ('referral_points', 'team_reward_points', 'true_total_points', 'honor_director')
+              OR (account_type = 'director_pool' AND flow_type = 'income' AND remark LIKE '联创%%'))""",
+    # 周补贴点数（发放记录在 weekly_subsidy_records）
+    """INSERT INTO points_ledger (user_id, points_type, delta, balance_after, source_kind, order_id, remark, created_at)
+       SELECT user_id, 'subsidy', subsidy_amount, NULL, 'weekly_subsidy', NULL,
+              LEFT(COALESCE(remark, '周补贴发放'), 255), COALESCE(created_at, week_start)
+       FROM weekly_subsidy_records""",
+]
+
+
+def backfill_points_ledger(cur, platform_user_id: int) -> int:
+    """账本为空时从历史流水回填（在建表后调用一次）"""
+    cur.execute("SELECT 1 FROM points_ledger LIMIT 1")
+    if cur.fetchone():
+        return 0
+    total = 0
+    for i, sql in enumerate(_BACKFILL_SQL):
+        cur.execute(sql, (platform_user_id,) if i == 1 else ())
+        total += cur.rowcount
+    logger.info(f"统一积分账本回填完成: {total} 条")
+    return total
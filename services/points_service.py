@@ -2,6 +2,7 @@ from decimal import Decimal
 from core.database import get_conn
 from core.table_access import build_dynamic_select, get_table_structure, clear_table_cache, _quote_identifier
 from core.logging import get_logger
+from services.points_ledger import mirror_points_log
 
 logger = get_logger(__name__)
 
@@ -79,4 +80,5 @@ def add_points(user_id: int, type: str, amount: Decimal, reason: str = "系统
                 "INSERT INTO points_log(user_id, type, change_amount, balance_after, reason) VALUES (%s,%s,%s,%s,%s)",
                 (user_id, type, amount, balance_after, reason)
             )
+            mirror_points_log(cur, cur.lastrowid, 'adjust')
             conn.commit()
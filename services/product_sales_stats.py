@@ -0,0 +1,160 @@
+# services/product_sales_stats.py - 商品销量汇总
+"""
+product_sales_stats：每个商品的已售数量、销售额与退款数量
+
+- 计入销量：订单处于 pending_ship / pending_recv / completed 且未退款成功（与原 /products/{id}/sales 口径一致）；
+  计入退款：refund_status = 'refund_success'
+- 订单状态或退款状态变更前调用 sales_changed（与 UPDATE 同一事务），按变更前后的差值增减，
+  读销量不再扫描 order_items
+- 商品列表与详情在组装时带上销量（随目录缓存一起缓存）；销量有变化的商品在事务提交后递增商品版本号，
+  详情缓存与条件请求随之刷新，列表页不为每笔订单整体失效，随缓存有效期刷新
+- 首次建表时从订单回填；定时任务每晚按商品ID分段重建一次，修正遗漏的写入点造成的偏差
+"""
+from typing import Dict, Any, List, Optional, Sequence
+
+from core.config import PRODUCT_SALES_REBUILD_CHUNK
+from core.database import after_commit
+from core.logging import get_logger
+from services import catalog_cache
+
+logger = get_logger(__name__)
+
+_SOLD_SQL = "({status} IN ('pending_ship', 'pending_recv', 'completed') AND COALESCE({refund}, '') <> 'refund_success')"
+_REFUNDED_SQL = "(COALESCE({refund}, '') = 'refund_success')"
+
+# 按订单当前状态汇总（回填 / 重建用）
+_AGGREGATE_SQL = f"""
+    SELECT oi.product_id,
+           COALESCE(SUM(CASE WHEN {_SOLD_SQL.format(status='o.status', refund='o.refund_status')}
+                             THEN oi.quantity ELSE 0 END), 0),
+           COALESCE(SUM(CASE WHEN {_SOLD_SQL.format(status='o.status', refund='o.refund_status')}
+                             THEN oi.total_price ELSE 0 END), 0),
+           COALESCE(SUM(CASE WHEN {_REFUNDED_SQL.format(refund='o.refund_status')}
+                             THEN oi.quantity ELSE 0 END), 0)
+    FROM order_items oi
+    JOIN orders o ON o.id = oi.order_id
+"""
+
+_INSERT_SQL = """
+    INSERT INTO product_sales_stats (product_id, sold_quantity, sold_amount, refunded_quantity)
+    VALUES (%s, %s, %s, %s)
+"""
+
+_UPSERT_SQL = """
+    ON DUPLICATE KEY UPDATE sold_quantity = sold_quantity + VALUES(sold_quantity),
+                            sold_amount = sold_amount + VALUES(sold_amount),
+                            refunded_quantity = refunded_quantity + VALUES(refunded_quantity)
+"""
+
+
+def _placeholders(values: Sequence[Any]) -> str:
+    return ",".join(["%s"] * len(values))
+
+
+def sales_changed(cur, order_ids: Optional[Sequence[int]] = None,
+                  order_numbers: Optional[Sequence[str]] = None,
+                  new_status: Optional[str] = None, new_refund_status: Optional[str] = None) -> None:
+    """
+    订单状态 / 退款状态变更：按变更前后是否计入销量、是否计入退款增减商品汇总
+
+    必须在 UPDATE 之前、同一事务内调用，order_ids / order_numbers 只传实际会被 UPDATE 的订单；
+    new_status / new_refund_status 为 None 表示该字段不变
+    """
+    if order_ids:
+        where, params = f"o.id IN ({_placeholders(order_ids)})", list(order_ids)
+    elif order_numbers:
+        where, params = f"o.order_number IN ({_placeholders(order_numbers)})", list(order_numbers)
+    else:
+        return
+    if new_status is None and new_refund_status is None:
+        return
+
+    status_sql = "%s" if new_status is not None else "o.status"
+    refund_sql = "%s" if new_refund_status is not None else "o.refund_status"
+    new_sold = _SOLD_SQL.format(status=status_sql, refund=refund_sql)
+    old_sold = _SOLD_SQL.format(status="o.status", refund="o.refund_status")
+    new_refunded = _REFUNDED_SQL.format(refund=refund_sql)
+    old_refunded = _REFUNDED_SQL.format(refund="o.refund_status")
+
+    # 占位符按 SQL 中出现的顺序：new_sold（状态、退款状态）→ new_refunded（退款状态）→ 订单条件
+    new_params: List[Any] = [v for v in (new_status, new_refund_status) if v is not None]
+    if new_refund_status is not None:
+        new_params.append(new_refund_status)
+
+    cur.execute(
+        f"""SELECT product_id, SUM(quantity * d_sold) AS sold_quantity, SUM(total_price * d_sold) AS sold_amount,
+                   SUM(quantity * d_refunded) AS refunded_quantity
+            FROM (SELECT oi.product_id, oi.quantity, oi.total_price,
+                         {new_sold} - {old_sold} AS d_sold,
+                         {new_refunded} - {old_refunded} AS d_refunded
+                  FROM order_items oi
+                  JOIN orders o ON o.id = oi.order_id
+                  WHERE {where}) x
+            WHERE d_sold <> 0 OR d_refunded <> 0
+            GROUP BY product_id""",
+        tuple(new_params + params)
+    )
+    deltas = [(r["product_id"], r["sold_quantity"], r["sold_amount"], r["refunded_quantity"])
+              for r in cur.fetchall()]
+    if not deltas:
+        return
+    cur.executemany(_INSERT_SQL + _UPSERT_SQL, deltas)
+    # 提交后递增这些商品的版本号：详情的条件请求只读版本号，缓存的销量随之刷新
+    product_ids = [d[0] for d in deltas]
+    after_commit(cur, lambda: catalog_cache.bump(product_ids, catalog=False))
+
+
+def get_sales(cur, product_ids: Sequence[int]) -> Dict[int, Dict[str, Any]]:
+    """批量读取销量汇总，没有记录的商品不在结果中"""
+    if not product_ids:
+        return {}
+    cur.execute(
+        f"""SELECT product_id, sold_quantity, sold_amount, refunded_quantity
+            FROM product_sales_stats WHERE product_id IN ({_placeholders(product_ids)})""",
+        tuple(product_ids)
+    )
+    return {r["product_id"]: r for r in cur.fetchall()}
+
+
+def rebuild_range(cur, start_id: int, end_id: int) -> int:
+    """按订单重建商品ID在 [start_id, end_id) 内的汇总"""
+    cur.execute("DELETE FROM product_sales_stats WHERE product_id >= %s AND product_id < %s", (start_id, end_id))
+    cur.execute(
+        f"""INSERT INTO product_sales_stats (product_id, sold_quantity, sold_amount, refunded_quantity)
+            {_AGGREGATE_SQL}
+            WHERE oi.product_id >= %s AND oi.product_id < %s
+            GROUP BY oi.product_id""",
+        (start_id, end_id)
+    )
+    return cur.rowcount
+
+
+def rebuild_all(conn, chunk: int = PRODUCT_SALES_REBUILD_CHUNK) -> int:
+    """全量重建（每 chunk 个商品ID一个事务，避免长时间锁住 order_items）"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT MIN(product_id) AS min_id, MAX(product_id) AS max_id FROM order_items")
+        row = cur.fetchone()
+    if row["max_id"] is None:
+        return 0
+    total, start, max_id = 0, row["min_id"], row["max_id"]
+    while start <= max_id:
+        with conn.cursor() as cur:
+            total += rebuild_range(cur, start, start + chunk)
+        conn.commit()
+        start += chunk
+    logger.info(f"商品销量汇总重建完成: {total} 行")
+    return total
+
+
+def backfill_product_sales_stats(cur) -> int:
+    """汇总表为空时从订单回填（在建表后调用一次）"""
+    cur.execute("SELECT 1 FROM product_sales_stats LIMIT 1")
+    if cur.fetchone():
+        return 0
+    cur.execute(
+        f"""INSERT INTO product_sales_stats (product_id, sold_quantity, sold_amount, refunded_quantity)
+            {_AGGREGATE_SQL}
+            GROUP BY oi.product_id"""
+    )
+    logger.info(f"商品销量汇总回填完成: {cur.rowcount} 行")
+    return cur.rowcount
@@ -0,0 +1,256 @@
+# services/product_search.py - 商品搜索索引
+"""
+商品搜索索引 product_search（每个商品一行检索文档）
+
+- title：商品名；keywords：分类、商家名、SKU 编码、商品名与分类的拼音全拼及首字母（services.pinyin_service）；body：描述
+- 建有 FULLTEXT … WITH PARSER ngram 索引（默认 ngram_token_size=2：中文按二元组切分，拼音 / 编码同样按二元组匹配），
+  每个关键词转成一个必须命中的短语（+"词"），按 标题相关度 × 3 + 全文相关度 排序；
+  单字关键词短于 ngram 切分长度、索引中没有对应词元，改为在 product_search 上 LIKE 匹配（"鞋" 命中 "运动鞋"）
+- 数据库不支持 ngram 解析器（如 MariaDB）时全文索引建不出来，退回到 product_search 单表 LIKE 扫描，
+  仍然省掉原来 products JOIN product_skus JOIN users 的 DISTINCT 扫描
+- SKU 编码保持精确匹配：与某个 SKU 编码完全相同的关键词，该 SKU 所属商品视为命中
+- 商品新增 / 修改 / 删除时在同一事务内 reindex / remove；商家改名等间接变更由每晚全量重建修正
+"""
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from core.config import PRODUCT_SEARCH_LIMIT, PRODUCT_SEARCH_REINDEX_CHUNK
+from core.logging import get_logger
+from services.pinyin_service import keywords as pinyin_keywords
+
+logger = get_logger(__name__)
+
+FULLTEXT_INDEX = "ft_product_search"
+FULLTEXT_TITLE_INDEX = "ft_product_search_title"
+
+# 与 MySQL ngram_token_size 一致；短于该长度的关键词无法经全文索引命中
+NGRAM_TOKEN_SIZE = 2
+
+# 布尔模式下有特殊含义的字符，关键词中一律去掉
+_BOOLEAN_OPERATORS = str.maketrans("", "", '+-<>()~*"@')
+
+_fulltext_ready: Optional[bool] = None
+
+
+def _placeholders(values: Sequence[Any]) -> str:
+    return ",".join(["%s"] * len(values))
+
+
+def build_document(product: Dict[str, Any], sku_codes: Sequence[str]) -> Tuple:
+    """product 需包含 id、name、description、category、status、user_id、merchant_name"""
+    full, initials = pinyin_keywords(product.get("name"))
+    category_full, category_initials = pinyin_keywords(product.get("category"))
+    keywords = " ".join(filter(None, [
+        product.get("category"), product.get("merchant_name"), *sku_codes, full, initials,
+        category_full, category_initials
+    ]))
+    return (product["id"], product.get("user_id"), product.get("status"),
+            product.get("name") or "", keywords, product.get("description") or "")
+
+
+# ---------------------------------------------------------------------- #
+# 索引维护
+# ---------------------------------------------------------------------- #
+def ensure_fulltext(cur) -> bool:
+    """补建全文索引（建表后调用），返回是否可用"""
+    global _fulltext_ready
+    cur.execute(f"SHOW INDEX FROM product_search WHERE Key_name IN ('{FULLTEXT_INDEX}', '{FULLTEXT_TITLE_INDEX}')")
+    existing = {r["Key_name"] for r in cur.fetchall()}
+    try:
+        if FULLTEXT_INDEX not in existing:
+            cur.execute(f"ALTER TABLE product_search ADD FULLTEXT INDEX {FULLTEXT_INDEX} "
+                        f"(title, keywords, body) WITH PARSER ngram")
+        if FULLTEXT_TITLE_INDEX not in existing:
+            cur.execute(f"ALTER TABLE product_search ADD FULLTEXT INDEX {FULLTEXT_TITLE_INDEX} "
+                        f"(title) WITH PARSER ngram")
+        _fulltext_ready = True
+    except Exception as e:
+        logger.warning(f"商品搜索全文索引创建失败，搜索退回 LIKE 扫描: {e}")
+        _fulltext_ready = False
+    return _fulltext_ready
+
+
+def fulltext_ready(cur) -> bool:
+    global _fulltext_ready
+    if _fulltext_ready is None:
+        cur.execute(f"SHOW INDEX FROM product_search WHERE Key_name = '{FULLTEXT_TITLE_INDEX}'")
+        _fulltext_ready = cur.fetchone() is not None
+    return _fulltext_ready
+
+
+def reindex(cur, product_ids: Sequence[int]) -> int:
+    """重建指定商品的检索文档（在写商品的同一事务内调用）；已删除的商品同时移出索引"""
+    ids = list(dict.fromkeys(product_ids))
+    if not ids:
+        return 0
+    cur.execute(
+        f"""SELECT p.id, p.name, p.description, p.category, p.status, p.user_id, u.name AS merchant_name
+            FROM products p LEFT JOIN users u ON u.id = p.user_id
+            WHERE p.id IN ({_placeholders(ids)})""",
+        tuple(ids)
+    )
+    products = cur.fetchall()
+    cur.execute(
+        f"SELECT product_id, sku_code FROM product_skus WHERE product_id IN ({_placeholders(ids)})",
+        tuple(ids)
+    )
+    sku_codes: Dict[int, List[str]] = {}
+    for r in cur.fetchall():
+        sku_codes.setdefault(r["product_id"], []).append(r["sku_code"])
+
+    if products:
+        cur.executemany(
+            """INSERT INTO product_search (product_id, user_id, status, title, keywords, body)
+               VALUES (%s, %s, %s, %s, %s, %s)
+               ON DUPLICATE KEY UPDATE user_id = VALUES(user_id), status = VALUES(status),
+                   title = VALUES(title), keywords = VALUES(keywords), body = VALUES(body)""",
+            [build_document(p, sku_codes.get(p["id"], [])) for p in products]
+        )
+    missing = set(ids) - {p["id"] for p in products}
+    if missing:
+        remove(cur, list(missing))
+    return len(products)
+
+
+def remove(cur, product_ids: Sequence[int]) -> None:
+    if product_ids:
+        cur.execute(f"DELETE FROM product_search WHERE product_id IN ({_placeholders(product_ids)})",
+                    tuple(product_ids))
+
+
+def rebuild_all(conn, chunk_size: int = PRODUCT_SEARCH_REINDEX_CHUNK) -> int:
+    """全量重建（按主键分批，每批一个事务），并清理已删除商品的残留文档"""
+    total, last_id = 0, 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM products WHERE id > %s ORDER BY id LIMIT %s", (last_id, chunk_size))
+            ids = [r["id"] for r in cur.fetchall()]
+            if not ids:
+                break
+            total += reindex(cur, ids)
+        conn.commit()
+        last_id = ids[-1]
+        if len(ids) < chunk_size:
+            break
+    with conn.cursor() as cur:
+        cur.execute("""DELETE s FROM product_search s
+                       LEFT JOIN products p ON p.id = s.product_id
+                       WHERE p.id IS NULL""")
+    conn.commit()
+    logger.info(f"商品搜索索引重建完成: {total} 个商品")
+    return total
+
+
+def backfill_product_search(conn) -> int:
+    """索引为空时全量构建（首次部署）"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM product_search LIMIT 1")
+        if cur.fetchone():
+            return 0
+    return rebuild_all(conn)
+
+
+# ---------------------------------------------------------------------- #
+# 查询
+# ---------------------------------------------------------------------- #
+def _clean(word: str) -> str:
+    return word.translate(_BOOLEAN_OPERATORS).strip()
+
+
+def _boolean_term(word: str) -> Optional[str]:
+    """必须命中的短语；空词及短于 ngram 切分长度的词返回 None（后者改走 LIKE）"""
+    word = _clean(word)
+    if len(word) < NGRAM_TOKEN_SIZE:
+        return None
+    return f'+"{word}"'
+
+
+def search(cur, keyword: str, limit: int = PRODUCT_SEARCH_LIMIT) -> List[int]:
+    """按相关度返回商品 id；空格分隔的关键词全部命中（AND）"""
+    words = [w for w in (keyword or "").split() if w]
+    if not words:
+        return []
+
+    cur.execute(f"SELECT sku_code, product_id FROM product_skus WHERE sku_code IN ({_placeholders(words)})",
+                tuple(words))
+    sku_hits: Dict[str, List[int]] = {}
+    for r in cur.fetchall():
+        sku_hits.setdefault(r["sku_code"], []).append(r["product_id"])
+
+    if fulltext_ready(cur):
+        return _search_fulltext(cur, words, sku_hits, limit)
+    return _search_like(cur, words, sku_hits, limit)
+
+
+def _search_fulltext(cur, words: List[str], sku_hits: Dict[str, List[int]], limit: int) -> List[int]:
+    terms = {w: _boolean_term(w) for w in words}
+    query = " ".join(t for t in terms.values() if t)
+    short_words = {w: _clean(w) for w in words if not terms[w] and _clean(w)}
+    if not query and not short_words and not sku_hits:
+        return []
+
+    match_all = "MATCH(title, keywords, body) AGAINST(%s IN BOOLEAN MODE)"
+    if not sku_hits and not short_words:
+        where_sql, where_params = match_all, [query]
+    else:
+        # 有单字关键词或关键词命中 SKU 编码时逐词组合：该词全文命中 / LIKE 命中，或是该 SKU 所属商品
+        conditions, where_params = [], []
+        for word in words:
+            parts, params = [], []
+            if terms[word]:
+                parts.append(match_all)
+                params.append(terms[word])
+            if word in short_words:
+                pattern = f"%{short_words[word]}%"
+                parts += ["title LIKE %s", "keywords LIKE %s", "body LIKE %s"]
+                params += [pattern, pattern, pattern]
+            if word in sku_hits:
+                parts.append(f"product_id IN ({_placeholders(sku_hits[word])})")
+                params.extend(sku_hits[word])
+            if parts:
+                conditions.append("(" + " OR ".join(parts) + ")")
+                where_params.extend(params)
+        where_sql = " AND ".join(conditions)
+
+    # 单字关键词不参与全文相关度，标题包含时按一次标题命中计分
+    score_sql, score_params = [], []
+    if query:
+        score_sql.append(f"MATCH(title) AGAINST(%s IN BOOLEAN MODE) * 3 + {match_all}")
+        score_params += [query, query]
+    for char in short_words.values():
+        score_sql.append("(title LIKE %s) * 3")
+        score_params.append(f"%{char}%")
+
+    cur.execute(
+        f"""SELECT product_id, {' + '.join(score_sql) or '0'} AS score
+            FROM product_search
+            WHERE {where_sql}
+            ORDER BY score DESC, product_id DESC
+            LIMIT %s""",
+        (*score_params, *where_params, limit)
+    )
+    return [r["product_id"] for r in cur.fetchall()]
+
+
+def _search_like(cur, words: List[str], sku_hits: Dict[str, List[int]], limit: int) -> List[int]:
+    conditions, params, title_hits, title_params = [], [], [], []
+    for word in words:
+        pattern = f"%{word}%"
+        parts = ["title LIKE %s", "keywords LIKE %s", "body LIKE %s"]
+        word_params: List[Any] = [pattern, pattern, pattern]
+        if word in sku_hits:
+            parts.append(f"product_id IN ({_placeholders(sku_hits[word])})")
+            word_params.extend(sku_hits[word])
+        conditions.append("(" + " OR ".join(parts) + ")")
+        params.extend(word_params)
+        title_hits.append("(title LIKE %s)")
+        title_params.append(pattern)
+
+    cur.execute(
+        f"""SELECT product_id, {' + '.join(title_hits)} AS score
+            FROM product_search
+            WHERE {' AND '.join(conditions)}
+            ORDER BY score DESC, product_id DESC
+            LIMIT %s""",
+        (*title_params, *params, limit)
+    )
+    return [r["product_id"] for r in cur.fetchall()]
@@ -0,0 +1,438 @@
+# services/reconciliation_service.py - 账本增量对账
+"""
+账户余额与流水的增量对账
+
+- 资金池：finance_accounts.balance  ⇔  account_flow（按 account_type 累计 change_amount）
+- 会员积分：users.member_points     ⇔  points_log(type='member')
+- 商家积分：users.merchant_points   ⇔  points_log(type='merchant')
+- 周补贴点数：users.subsidy_points  ⇔  points_ledger(points_type='subsidy')（points_log 的类型不含 subsidy）
+
+周补贴点数的账本早期只回填了发放记录（weekly_subsidy_records），此前的清零等变更没有流水，
+历史累计无法与余额对上：该范围首次对账（或 rebuild）时以当时的余额为起点写入各账户检查点
+（seed_from_balance），之后只核对新增流水。
+
+users.true_total_points 不参与对账：它的增加记在各来源的奖励类型下（推荐 / 团队 / 联创 / 周补贴），
+只有兑换优惠券、捐赠等扣减记为 true_total，没有一份流水的累计值等于该字段，无法逐账户核对。
+
+每个账户在 ledger_reconcile_checkpoints 中保存「已校验到的流水ID + 截至该ID的累计值」，
+每次只读取检查点之后的新流水，按账户聚合后与当前余额比对；不一致时沿流水逐行核对
+balance_after，定位第一条与累计不符的流水，写入 ledger_reconcile_mismatches。
+
+一致性：读取在 START TRANSACTION WITH CONSISTENT SNAPSHOT 内完成，余额与流水来自同一快照。
+检查点只推进到 RECONCILE_GRACE_SECONDS 之前的流水，ID 较小但提交较晚的事务在下一轮仍会被计入。
+"""
+import threading
+from decimal import Decimal
+from typing import Optional, Dict, Any, List
+
+from core.config import RECONCILE_GRACE_SECONDS, RECONCILE_TOLERANCE
+from core.database import get_conn
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+GLOBAL_KEY = "*"
+
+# account_flow 中这两类流水记的是用户个人余额（related_user），不对应单个资金池，不参与资金池对账
+USER_LEVEL_ACCOUNT_TYPES = ("merchant_balance", "promotion_balance")
+
+SCOPES: Dict[str, Dict[str, Any]] = {
+    "pool": {
+        "label": "资金池",
+        "flow_table": "account_flow",
+        "key_column": "account_type",
+        "flow_filter": "account_type IS NOT NULL AND account_type NOT IN ('merchant_balance','promotion_balance')",
+        "flow_params": (),
+    },
+    "member_points": {
+        "label": "会员积分",
+        "flow_table": "points_log",
+        "key_column": "user_id",
+        "flow_filter": "type = %s",
+        "flow_params": ("member",),
+        "balance_column": "member_points",
+    },
+    "merchant_points": {
+        "label": "商家积分",
+        "flow_table": "points_log",
+        "key_column": "user_id",
+        "flow_filter": "type = %s",
+        "flow_params": ("merchant",),
+        "balance_column": "merchant_points",
+    },
+    "subsidy_points": {
+        "label": "周补贴点数",
+        "flow_table": "points_ledger",
+        "key_column": "user_id",
+        "flow_filter": "points_type = %s",
+        "flow_params": ("subsidy",),
+        "balance_column": "subsidy_points",
+        "amount_column": "delta",
+        "seed_from_balance": True,
+    },
+}
+
+_SCAN_CHUNK = 1000
+_IN_CHUNK = 500
+
+# 同一进程内同一时间只跑一轮对账
+_run_lock = threading.Lock()
+
+
+def _dec(value) -> Decimal:
+    return Decimal(str(value)) if value is not None else Decimal("0")
+
+
+def _chunks(items: List, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class ReconciliationService:
+    """账本增量对账"""
+
+    @staticmethod
+    def run(scope: Optional[str] = None, rebuild: bool = False) -> Dict[str, Any]:
+        """
+        执行一轮对账
+
+        Args:
+            scope: pool / member_points / merchant_points / subsidy_points，None 表示全部
+            rebuild: True 时忽略已有检查点，从第一条流水重新累计（全量校验）；
+                     seed_from_balance 的范围改为以当前余额重新初始化检查点
+        """
+        scopes = [scope] if scope else list(SCOPES)
+        for s in scopes:
+            if s not in SCOPES:
+                raise ValueError(f"不支持的对账范围: {s}")
+
+        if not _run_lock.acquire(blocking=False):
+            raise RuntimeError("对账任务正在执行，请稍后再试")
+        try:
+            return {s: ReconciliationService._run_scope(s, rebuild) for s in scopes}
+        finally:
+            _run_lock.release()
+
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _run_scope(scope: str, rebuild: bool) -> Dict[str, Any]:
+        cfg = SCOPES[scope]
+        table, key_col = cfg["flow_table"], cfg["key_column"]
+        flow_filter, flow_params = cfg["flow_filter"], cfg["flow_params"]
+        amount = cfg.get("amount_column", "change_amount")
+
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                cur.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+
+                if rebuild:
+                    cur.execute("DELETE FROM ledger_reconcile_checkpoints WHERE scope = %s", (scope,))
+                    row = None
+                else:
+                    cur.execute(
+                        "SELECT last_flow_id FROM ledger_reconcile_checkpoints WHERE scope = %s AND subject_key = %s",
+                        (scope, GLOBAL_KEY)
+                    )
+                    row = cur.fetchone()
+                if row is None and cfg.get("seed_from_balance"):
+                    summary = ReconciliationService._seed_from_balance(cur, scope)
+                    conn.commit()
+                    return summary
+                since = int(row["last_flow_id"]) if row else 0
+
+                # 高水位：快照内可见的最大ID；安全水位：宽限期之前的最大ID（检查点只推进到这里）
+                cur.execute(
+                    f"""SELECT MAX(id) AS max_id,
+                               MAX(CASE WHEN created_at <= NOW() - INTERVAL %s SECOND THEN id END) AS safe_id
+                        FROM {table} WHERE id > %s AND {flow_filter}""",
+                    (RECONCILE_GRACE_SECONDS, since) + flow_params
+                )
+                row = cur.fetchone() or {}
+                max_id = int(row.get("max_id") or since)
+                safe_id = int(row.get("safe_id") or since)
+
+                deltas: Dict[str, Dict[str, Any]] = {}
+                if max_id > since:
+                    cur.execute(
+                        f"""SELECT {key_col} AS subject_key,
+                                   SUM({amount}) AS delta,
+                                   SUM(CASE WHEN id <= %s THEN {amount} ELSE 0 END) AS safe_delta,
+                                   MAX(CASE WHEN id <= %s THEN id END) AS safe_last_id,
+                                   COUNT(*) AS cnt
+                            FROM {table}
+                            WHERE id > %s AND id <= %s AND {flow_filter}
+                            GROUP BY {key_col}""",
+                        (safe_id, safe_id, since, max_id) + flow_params
+                    )
+                    deltas = {str(r["subject_key"]): r for r in cur.fetchall()}
+
+                # 本轮需要比对的账户：有新流水的 + 上一轮不一致的（余额修正后可自动恢复）
+                cur.execute(
+                    "SELECT subject_key FROM ledger_reconcile_checkpoints WHERE scope = %s AND status = 'mismatch'",
+                    (scope,)
+                )
+                subjects = set(deltas) | {r["subject_key"] for r in cur.fetchall()}
+
+                balances = ReconciliationService._load_balances(cur, scope, subjects, rebuild)
+                if scope == "pool" or rebuild:
+                    # 资金池数量很少，每轮都全部比对；全量校验时也覆盖没有任何流水但余额非零的账户
+                    subjects |= set(balances)
+
+                checkpoints = ReconciliationService._load_checkpoints(cur, scope, subjects)
+
+                results, mismatches = [], []
+                for key in sorted(subjects):
+                    cp = checkpoints.get(key, {"last_flow_id": 0, "running_sum": Decimal("0")})
+                    d = deltas.get(key)
+                    expected = _dec(cp["running_sum"]) + (_dec(d["delta"]) if d else Decimal("0"))
+                    actual = balances.get(key)
+                    if actual is None:
+                        # 流水指向的账户不存在（用户已删除 / 资金池未初始化）
+                        actual = Decimal("0")
+                    ok = abs(actual - expected) <= RECONCILE_TOLERANCE
+
+                    new_last_id = int(d["safe_last_id"]) if d and d["safe_last_id"] else int(cp["last_flow_id"])
+                    new_sum = _dec(cp["running_sum"]) + (_dec(d["safe_delta"]) if d else Decimal("0"))
+                    results.append((scope, key, new_last_id, new_sum, actual, "ok" if ok else "mismatch"))
+
+                    if not ok:
+                        first_bad = ReconciliationService._find_first_bad_row(
+                            cur, cfg, key, int(cp["last_flow_id"]), _dec(cp["running_sum"]), max_id
+                        )
+                        mismatches.append({
+                            "subject_key": key,
+                            "expected_balance": expected,
+                            "actual_balance": actual,
+                            "diff": actual - expected,
+                            "first_bad_flow_id": first_bad,
+                        })
+
+                ReconciliationService._save(cur, scope, results, mismatches, safe_id)
+                conn.commit()
+
+        if mismatches:
+            logger.warning(f"[对账] {SCOPES[scope]['label']} 发现 {len(mismatches)} 个账户余额与流水不符")
+        summary = {
+            "scope": scope,
+            "since_flow_id": since,
+            "max_flow_id": max_id,
+            "checkpoint_flow_id": safe_id,
+            "new_rows": sum(int(d["cnt"]) for d in deltas.values()),
+            "accounts_checked": len(results),
+            "mismatch_count": len(mismatches),
+            "mismatches": [
+                {k: (float(v) if isinstance(v, Decimal) else v) for k, v in m.items()}
+                for m in mismatches
+            ],
+        }
+        logger.info(
+            f"[对账] {SCOPES[scope]['label']}: 流水ID {since}→{max_id}，新增 {summary['new_rows']} 条，"
+            f"比对 {summary['accounts_checked']} 个账户，不一致 {summary['mismatch_count']} 个"
+        )
+        return summary
+
+    @staticmethod
+    def _seed_from_balance(cur, scope: str) -> Dict[str, Any]:
+        """以快照内的当前余额为起点写入检查点（历史流水不完整的范围），关闭该范围未处理的差异记录"""
+        cfg = SCOPES[scope]
+        column = cfg["balance_column"]
+        cur.execute(
+            f"SELECT MAX(id) AS max_id FROM {cfg['flow_table']} WHERE {cfg['flow_filter']}",
+            cfg["flow_params"]
+        )
+        seed_id = int((cur.fetchone() or {}).get("max_id") or 0)
+        cur.execute(
+            f"""INSERT INTO ledger_reconcile_checkpoints
+                    (scope, subject_key, last_flow_id, running_sum, last_balance, status, verified_at)
+                SELECT %s, CAST(id AS CHAR), %s, {column}, {column}, 'ok', NOW()
+                FROM users WHERE {column} <> 0
+                ON DUPLICATE KEY UPDATE last_flow_id = VALUES(last_flow_id), running_sum = VALUES(running_sum),
+                    last_balance = VALUES(last_balance), status = 'ok', verified_at = NOW()""",
+            (scope, seed_id)
+        )
+        accounts = cur.rowcount
+        ReconciliationService._save(cur, scope, [], [], seed_id)
+        cur.execute("UPDATE ledger_reconcile_mismatches SET resolved = 1 WHERE scope = %s AND resolved = 0", (scope,))
+        logger.info(f"[对账] {cfg['label']}: 以当前余额为起点初始化检查点，流水ID {seed_id}，账户 {accounts} 个")
+        return {
+            "scope": scope,
+            "since_flow_id": 0,
+            "max_flow_id": seed_id,
+            "checkpoint_flow_id": seed_id,
+            "new_rows": 0,
+            "accounts_checked": 0,
+            "mismatch_count": 0,
+            "mismatches": [],
+            "seeded": True,
+        }
+
+    @staticmethod
+    def _load_balances(cur, scope: str, subjects: set, rebuild: bool) -> Dict[str, Decimal]:
+        if scope == "pool":
+            cur.execute(
+                "SELECT account_type, balance FROM finance_accounts WHERE account_type NOT IN (%s, %s)",
+                USER_LEVEL_ACCOUNT_TYPES
+            )
+            return {r["account_type"]: _dec(r["balance"]) for r in cur.fetchall()}
+
+        column = SCOPES[scope]["balance_column"]
+        balances: Dict[str, Decimal] = {}
+        user_ids = [int(k) for k in subjects]
+        for chunk in _chunks(user_ids, _IN_CHUNK):
+            placeholders = ",".join(["%s"] * len(chunk))
+            cur.execute(f"SELECT id, {column} AS balance FROM users WHERE id IN ({placeholders})", tuple(chunk))
+            balances.update({str(r["id"]): _dec(r["balance"]) for r in cur.fetchall()})
+        if rebuild:
+            cur.execute(f"SELECT id, {column} AS balance FROM users WHERE {column} <> 0")
+            balances.update({str(r["id"]): _dec(r["balance"]) for r in cur.fetchall()})
+        return balances
+
+    @staticmethod
+    def _load_checkpoints(cur, scope: str, subjects: set) -> Dict[str, Dict[str, Any]]:
+        checkpoints: Dict[str, Dict[str, Any]] = {}
+        for chunk in _chunks(sorted(subjects), _IN_CHUNK):
+            placeholders = ",".join(["%s"] * len(chunk))
+            cur.execute(
+                f"""SELECT subject_key, last_flow_id, running_sum FROM ledger_reconcile_checkpoints
+                    WHERE scope = %s AND subject_key IN ({placeholders})""",
+                (scope, *chunk)
+            )
+            checkpoints.update({r["subject_key"]: r for r in cur.fetchall()})
+        return checkpoints
+
+    @staticmethod
+    def _find_first_bad_row(cur, cfg: Dict[str, Any], key: str, after_id: int,
+                            running: Decimal, max_id: int) -> Optional[int]:
+        """从检查点开始逐行累计，返回第一条 balance_after 与累计值不符的流水ID"""
+        table, key_col = cfg["flow_table"], cfg["key_column"]
+        amount = cfg.get("amount_column", "change_amount")
+        last_id = after_id
+        while True:
+            cur.execute(
+                f"""SELECT id, {amount} AS change_amount, balance_after FROM {table}
+                    WHERE {key_col} = %s AND id > %s AND id <= %s AND {cfg['flow_filter']}
+                    ORDER BY id LIMIT %s""",
+                (key, last_id, max_id) + cfg["flow_params"] + (_SCAN_CHUNK,)
+            )
+            rows = cur.fetchall()
+            if not rows:
+                return None
+            for r in rows:
+                running += _dec(r["change_amount"])
+                if r["balance_after"] is not None and abs(_dec(r["balance_after"]) - running) > RECONCILE_TOLERANCE:
+                    return int(r["id"])
+            last_id = int(rows[-1]["id"])
+
+    @staticmethod
+    def _save(cur, scope: str, results: List[tuple], mismatches: List[Dict[str, Any]], safe_id: int) -> None:
+        upsert = """INSERT INTO ledger_reconcile_checkpoints
+                        (scope, subject_key, last_flow_id, running_sum, last_balance, status, verified_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, NOW())
+                    ON DUPLICATE KEY UPDATE last_flow_id = VALUES(last_flow_id), running_sum = VALUES(running_sum),
+                        last_balance = VALUES(last_balance), status = VALUES(status), verified_at = NOW()"""
+        for chunk in _chunks(results, _IN_CHUNK):
+            cur.executemany(upsert, chunk)
+        cur.execute(upsert, (scope, GLOBAL_KEY, safe_id, 0, None, "ok"))
+
+        # 已恢复一致的账户：关闭未处理的差异记录
+        ok_keys = [r[1] for r in results if r[5] == "ok"]
+        for chunk in _chunks(ok_keys, _IN_CHUNK):
+            placeholders = ",".join(["%s"] * len(chunk))
+            cur.execute(
+                f"""UPDATE ledger_reconcile_mismatches SET resolved = 1
+                    WHERE scope = %s AND resolved = 0 AND subject_key IN ({placeholders})""",
+                (scope, *chunk)
+            )
+
+        # 仍不一致的账户：已有未处理记录则刷新差额（保留最早定位到的问题流水），否则新增
+        for m in mismatches:
+            cur.execute(
+                """UPDATE ledger_reconcile_mismatches
+                   SET expected_balance = %s, actual_balance = %s, diff = %s,
+                       first_bad_flow_id = COALESCE(first_bad_flow_id, %s)
+                   WHERE scope = %s AND subject_key = %s AND resolved = 0""",
+                (m["expected_balance"], m["actual_balance"], m["diff"], m["first_bad_flow_id"], scope, m["subject_key"])
+            )
+            if cur.rowcount == 0:
+                detail = (f"流水ID {m['first_bad_flow_id']} 的 balance_after 与累计值不符"
+                          if m["first_bad_flow_id"] else "流水 balance_after 连续，但账户余额与累计值不符（可能存在未记流水的余额变更）")
+                cur.execute(
+                    """INSERT INTO ledger_reconcile_mismatches
+                           (scope, subject_key, expected_balance, actual_balance, diff, first_bad_flow_id, detail)
+                       VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+                    (scope, m["subject_key"], m["expected_balance"], m["actual_balance"], m["diff"],
+                     m["first_bad_flow_id"], detail)
+                )
+
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def get_status() -> List[Dict[str, Any]]:
+        """各对账范围的游标位置与账户状态统计"""
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """SELECT scope,
+                              MAX(CASE WHEN subject_key = %s THEN last_flow_id END) AS checkpoint_flow_id,
+                              MAX(CASE WHEN subject_key = %s THEN verified_at END) AS last_run_at,
+                              SUM(subject_key <> %s) AS account_count,
+                              SUM(subject_key <> %s AND status = 'mismatch') AS mismatch_count
+                       FROM ledger_reconcile_checkpoints GROUP BY scope""",
+                    (GLOBAL_KEY, GLOBAL_KEY, GLOBAL_KEY, GLOBAL_KEY)
+                )
+                rows = {r["scope"]: r for r in cur.fetchall()}
+        return [
+            {
+                "scope": scope,
+                "label": cfg["label"],
+                "checkpoint_flow_id": int(rows[scope]["checkpoint_flow_id"] or 0) if scope in rows else 0,
+                "last_run_at": rows[scope]["last_run_at"].strftime("%Y-%m-%d %H:%M:%S")
+                if scope in rows and rows[scope]["last_run_at"] else None,
+                "account_count": int(rows[scope]["account_count"] or 0) if scope in rows else 0,
+                "mismatch_count": int(rows[scope]["mismatch_count"] or 0) if scope in rows else 0,
+            }
+            for scope, cfg in SCOPES.items()
+        ]
+
+    @staticmethod
+    def list_mismatches(scope: Optional[str] = None, resolved: Optional[bool] = False,
+                        page: int = 1, size: int = 20) -> Dict[str, Any]:
+        where, params = [], []
+        if scope:
+            where.append("scope = %s")
+            params.append(scope)
+        if resolved is not None:
+            where.append("resolved = %s")
+            params.append(1 if resolved else 0)
+        where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT COUNT(*) AS total FROM ledger_reconcile_mismatches {where_sql}", tuple(params))
+                total = int(cur.fetchone()["total"])
+                cur.execute(
+                    f"""SELECT id, scope, subject_key, expected_balance, actual_balance, diff,
+                               first_bad_flow_id, detail, resolved, detected_at, updated_at
+                        FROM ledger_reconcile_mismatches {where_sql}
+                        ORDER BY id DESC LIMIT %s OFFSET %s""",
+                    tuple(params) + (size, (page - 1) * size)
+                )
+                rows = cur.fetchall()
+
+        records = []
+        for r in rows:
+            records.append({
+                "id": r["id"],
+                "scope": r["scope"],
+                "scope_label": SCOPES.get(r["scope"], {}).get("label", r["scope"]),
+                "subject_key": r["subject_key"],
+                "expected_balance": float(r["expected_balance"]),
+                "actual_balance": float(r["actual_balance"]),
+                "diff": float(r["diff"]),
+                "first_bad_flow_id": r["first_bad_flow_id"],
+                "detail": r["detail"],
+                "resolved": bool(r["resolved"]),
+                "detected_at": r["detected_at"].strftime("%Y-%m-%d %H:%M:%S") if r["detected_at"] else None,
+                "updated_at": r["updated_at"].strftime("%Y-%m-%d %H:%M:%S") if r["updated_at"] else None,
+            })
+        return {"total": total, "page": page, "size": size, "records": records}
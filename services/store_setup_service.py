@@ -2,13 +2,12 @@ import logging
 import uuid
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from fastapi import UploadFile, HTTPException
 from core.database import get_conn
 from core.table_access import build_dynamic_select
 from core.exceptions import FinanceException
-from core.config import BASE_PIC_DIR
-from PIL import Image
+from services import image_pipeline, image_store
 from models.schemas.store_setup import (
     StoreInfoCreateReq, StoreInfoUpdateReq, StoreLogoUploadResp
 )
@@ -180,6 +179,14 @@ class StoreSetupService:
 
                 return store
 
+    def get_store_version(self, user_id: int) -> Optional[datetime]:
+        """店铺信息的最后修改时间（条件请求的版本号），没有店铺时返回 None"""
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT updated_at FROM merchant_stores WHERE user_id=%s", (user_id,))
+                row = cur.fetchone()
+                return row["updated_at"] if row else None
+
     def get_setup_status(self, user_id: int) -> Dict[str, Any]:
         """获取店铺设置状态（仅依赖is_merchant）"""
         with get_conn() as conn:
@@ -238,30 +245,15 @@ class StoreSetupService:
         # 3. 生成唯一文件名
         image_id = f"store_logo_{user_id}_{uuid.uuid4().hex}{ext}"
 
-        # 4. 确定存储路径
-        logo_dir = BASE_PIC_DIR / "store_logos"
-        logo_dir.mkdir(parents=True, exist_ok=True)
-        file_path = logo_dir / image_id
-
-        # 5. 图片处理（仿照头像压缩逻辑）
-        try:
-            with Image.open(file.file) as im:
-                im = im.convert("RGB")
-                # 保持宽高比缩放
-                im.thumbnail(self.logo_max_dimension, Image.LANCZOS)
-
-                # 保存为JPEG格式，确保兼容性
-                im.save(file_path, "JPEG", quality=85, optimize=True)
-
-                # 计算压缩后文件大小
-                file_size = file_path.stat().st_size
-        except Exception as e:
-            logger.error(f"LOGO图片处理失败: {str(e)}")
-            raise HTTPException(status_code=500, detail="图片处理失败")
-
-        # 6. 保存到数据库（仿照头像写库逻辑）
         with get_conn() as conn:
             with conn.cursor() as cur:
+                # 4. 原图按内容寻址落盘（重复上传不再存储）；压缩（最大 500×500，JPEG + WebP）在进程池中完成，
+                #    完成后 file_path / file_size 改为压缩后的文件
+                url, job = image_pipeline.ingest(cur, file, "store_logo", user_id)
+                file_path = image_store.blob_path(image_store.name_from_url(url))
+                file_size = file_path.stat().st_size
+
+                # 5. 保存到数据库（仿照头像写库逻辑）
                 # 先删除旧的LOGO记录（覆盖更新）
                 cur.execute(
                     "DELETE FROM store_logos WHERE user_id = %s",
@@ -281,12 +273,15 @@ class StoreSetupService:
                     "UPDATE merchant_stores SET store_logo_image_id = %s, updated_at = NOW() WHERE user_id = %s",
                     (image_id, user_id)
                 )
+                # 旧LOGO释放引用
+                image_pipeline.release(cur, ["store_logo"], user_id, keep=[url])
 
                 conn.commit()
+        image_pipeline.dispatch([job])
 
         logger.info(f"店铺LOGO上传成功: user_id={user_id}, image_id={image_id}")
 
-        # 7. 返回结果
+        # 6. 返回结果
         return StoreLogoUploadResp(
             image_id=image_id,
             image_url=f"/api/store/logo/preview/{image_id}",  # 使用相对路径
@@ -302,12 +297,15 @@ class StoreSetupService:
                 logo = cur.fetchone()
 
                 if logo:
-                    # 删除物理文件
-                    import os
-                    try:
-                        os.remove(logo['file_path'])
-                    except FileNotFoundError:
-                        pass
+                    # 内容寻址的文件只释放引用（可能与其他店铺共用），历史上传的文件直接删除
+                    if image_store.name_from_path(logo['file_path']):
+                        image_pipeline.release(cur, ["store_logo"], user_id)
+                    else:
+                        import os
+                        try:
+                            os.remove(logo['file_path'])
+                        except FileNotFoundError:
+                            pass
 
                     # 删除数据库记录
                     cur.execute("DELETE FROM store_logos WHERE user_id = %s", (user_id,))
@@ -321,6 +319,30 @@ class StoreSetupService:
                     conn.commit()
                     logger.info(f"店铺LOGO删除成功: user_id={user_id}")
 
+    def get_logo_file(self, image_id: str, size: Optional[str] = None) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        预览用：返回 (文件路径, 内容哈希)，找不到返回 None
+
+        内容哈希非空表示该地址的内容不会再变化（已处理完成的内容寻址文件），可以长期缓存；
+        size 为其他尺寸（thumb / thumb_webp / detail_webp），尚未处理完成时返回主图
+        """
+        file_path = self.get_logo_url(image_id)
+        if not file_path:
+            return None
+        name = image_store.name_from_path(file_path)
+        if not name:
+            return file_path, None  # 历史上传的文件
+
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                variants = image_pipeline.get_variants(cur, [image_store.blob_url(name)]).get(image_store.blob_url(name))
+        if not variants:
+            return file_path, None  # 处理中：处理完成后文件会换成压缩后的版本
+        if size and variants.get(size):
+            name = image_store.name_from_url(variants[size])
+            return str(image_store.blob_path(name)), Path(name).stem
+        return file_path, Path(name).stem
+
     def get_logo_url(self, image_id: str) -> Optional[str]:
         """根据 image_id 或者 numeric id 返回物理文件路径，找不到返回 None"""
         # 支持三种查询方式：
@@ -10,10 +10,10 @@ import random
 from core.logging import get_logger
 import os
 from core.config import AVATAR_UPLOAD_DIR
+from services.points_ledger import record_points
+from services import image_pipeline
 from fastapi import UploadFile, HTTPException
 from typing import List
-from pathlib import Path
-from PIL import Image
 import json
 
 
@@ -379,33 +379,27 @@ class UserService:
         if len(files) > 3:
             raise HTTPException(status_code=400, detail="头像最多3张")
 
-        urls = []
         for f in files:
-            if f.size > 2 * 1024 * 1024:
-                raise HTTPException(status_code=400, detail="单张头像不能超过2MB")
-            ext = Path(f.filename).suffix.lower()
-            if ext not in {".jpg", ".jpeg", ".png", ".webp"}:
-                raise HTTPException(status_code=400, detail="仅支持 JPG/PNG/WEBP")
+            image_pipeline.check_upload(f, 2 * 1024 * 1024, "头像")
 
-            name = f"avatar_{user_id}_{uuid.uuid4().hex}{ext}"
-            path = AVATAR_UPLOAD_DIR / name
-            path.parent.mkdir(parents=True, exist_ok=True)
-
-            with Image.open(f.file) as im:
-                im = im.convert("RGB")
-                im.thumbnail((300, 300), Image.LANCZOS)  # 头像统一 300×300
-                im.save(path, "JPEG", quality=85, optimize=True)
-
-            urls.append(f"/pic/avatars/{name}")
-
-        # 写库（仿照商品图更新 main_image）
+        # 原图按内容寻址落盘（重复上传不再存储），压缩为 300×300 及缩略图在进程池中完成
         with get_conn() as conn:
             with conn.cursor() as cur:
+                urls, jobs = [], []
+                for f in files:
+                    url, job = image_pipeline.ingest(cur, f, "avatar", user_id)
+                    urls.append(url)
+                    jobs.append(job)
+
+                # 写库（仿照商品图更新 main_image）
                 cur.execute(
                     "UPDATE users SET avatar_path = %s, updated_at = NOW() WHERE id = %s",
                     (json.dumps(urls, ensure_ascii=False), user_id)
                 )
+                # 不再使用的旧头像释放引用
+                image_pipeline.release(cur, ["avatar"], user_id, keep=urls)
                 conn.commit()
+        image_pipeline.dispatch(jobs)
 
         return urls
 
@@ -831,6 +825,10 @@ class UserService:
                     """,
                     (user_id,)
                 )
+                if old_team_points:
+                    record_points(cur, user_id, 'team', -old_team_points, 0, 'adjust', remark=f"清除团队奖励点数：{reason}")
+                if old_referral_points:
+                    record_points(cur, user_id, 'referral', -old_referral_points, 0, 'adjust', remark=f"清除推荐奖励点数：{reason}")
 
                 conn.commit()
 
@@ -894,6 +892,7 @@ class UserService:
                     """,
                     (user_id,)
                 )
+                record_points(cur, user_id, 'subsidy', -old_points, 0, 'adjust', remark=f"清除周补贴点数：{reason}")
 
                 conn.commit()
 
@@ -955,6 +954,7 @@ class UserService:
                     """,
                     (user_id,)
                 )
+                record_points(cur, user_id, 'unilevel', -old_points, 0, 'adjust', remark=f"清除联创星级点数：{reason}")
 
                 conn.commit()
 
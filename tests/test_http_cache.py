@@ -0,0 +1,39 @@
+# tests/test_http_cache.py - 文件响应缓存头
+import pytest
+
+pytest.importorskip("fastapi")
+
+from starlette.requests import Request  # noqa: E402
+
+from core.http_cache import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, file_response  # noqa: E402
+
+
+def _request(if_none_match=None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "query_string": b"", "headers": headers})
+
+
+@pytest.fixture
+def logo(tmp_path):
+    path = tmp_path / "logo.png"
+    path.write_bytes(b"\x89PNG logo")
+    return path
+
+
+def test_file_without_content_hash_gets_stat_etag(logo):
+    response = file_response(_request(), logo)
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+    assert response.headers["etag"]
+
+    cached = file_response(_request(response.headers["etag"]), logo)
+    assert cached.status_code == 304
+
+
+def test_file_with_content_hash_uses_hash_etag(logo):
+    response = file_response(_request(), logo, content_hash="abc123")
+    assert response.headers["etag"] == '"abc123"'
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+    assert file_response(_request('W/"abc123"'), logo, content_hash="abc123").status_code == 304
+    assert file_response(_request('"other"'), logo, content_hash="abc123").status_code == 200